@@ -0,0 +1,253 @@
+"""
+Cache Warm-up Module
+
+Precálculo offline de las respuestas a las consultas más frecuentes: se
+extraen de faq_analytics y del query_log (memoria y spill), se generan por
+lotes con el pipeline del orquestador, se evalúan sin LLM y las que superan
+la puntuación mínima se guardan en la caché de respuestas con un TTL largo.
+El resultado se escribe además en un snapshot etiquetado con la versión del
+índice que cada réplica precarga al arrancar, de modo que las preguntas más
+comunes no llegan al LLM en tiempo de petición.
+
+Uso: python -m agent.cache_warmup [--top-n 50] [--min-score 7]
+"""
+
+import os
+import json
+import argparse
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+import logging
+from dotenv import load_dotenv
+
+from agent.core.local_evaluator import LocalEvaluator
+from tools.metrics import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# stored: en caché; rejected: por debajo de la puntuación mínima; failed: error
+# o sin contexto; preloaded: cargada desde el snapshot al arrancar
+OUTCOMES = ("stored", "rejected", "failed", "preloaded")
+
+def _normalize(query: str) -> str:
+    return " ".join(query.lower().split())
+
+def mine_frequent_queries(faq_counts: Iterable[Tuple[str, int]],
+                          log_entries: Iterable[Dict[str, Any]],
+                          top_n: int = 50,
+                          min_count: int = 2) -> List[Tuple[str, int]]:
+    """
+    Consultas más frecuentes combinando analytics de FAQ y query_log
+    
+    Las consultas se agrupan normalizadas (minúsculas, espacios compactados,
+    como la clave de la caché) y se representan con su forma más habitual.
+    Del query_log solo cuentan las consultas respondidas con éxito.
+    
+    Args:
+        faq_counts: (consulta, veces) de faq_analytics
+        log_entries: Entradas del query_log
+        top_n: Número máximo de consultas
+        min_count: Apariciones mínimas para considerar una consulta frecuente
+    
+    Returns:
+        Lista de (consulta, veces) de la más a la menos frecuente
+    """
+    counts: Dict[str, int] = {}
+    forms: Dict[str, Dict[str, int]] = {}
+    
+    def add(query: Optional[str], count: int) -> None:
+        if not query or not query.strip():
+            return
+        key = _normalize(query)
+        counts[key] = counts.get(key, 0) + count
+        variants = forms.setdefault(key, {})
+        variants[query.strip()] = variants.get(query.strip(), 0) + count
+    
+    for query, count in faq_counts:
+        add(query, count)
+    for entry in log_entries:
+        if entry.get("success"):
+            add(entry.get("query"), 1)
+    
+    ranked = sorted(
+        ((key, count) for key, count in counts.items() if count >= min_count),
+        key=lambda item: (-item[1], item[0])
+    )[:top_n]
+    return [(max(forms[key].items(), key=lambda form: form[1])[0], count) for key, count in ranked]
+
+class CacheWarmer:
+    """Warm-up de la caché de respuestas del orquestador"""
+    
+    def __init__(self, orchestrator, evaluator: Optional[LocalEvaluator] = None,
+                 snapshot_path: Optional[str] = None, ttl: Optional[float] = None):
+        """
+        Inicializar
+        
+        Args:
+            orchestrator: CVOrchestrator (pipeline, caché, herramientas y logs)
+            evaluator: Evaluador de las respuestas (por defecto el local con los
+                embeddings del retriever)
+            snapshot_path: Archivo de respuestas precalculadas (WARMUP_PATH)
+            ttl: TTL de las respuestas precalculadas en la caché (WARMUP_CACHE_TTL)
+        """
+        self.orchestrator = orchestrator
+        self.evaluator = evaluator or LocalEvaluator(orchestrator.retriever.embedding_model.encode)
+        self.snapshot_path = snapshot_path or os.getenv("WARMUP_PATH", "./storage/warmup/answers.json")
+        self.ttl = ttl if ttl is not None else float(os.getenv("WARMUP_CACHE_TTL", "604800"))
+    
+    def frequent_queries(self, top_n: int, since_days: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Consultas más frecuentes de faq_analytics y del query_log (spill y memoria)"""
+        faq_counts = self.orchestrator.faq_tool.get_frequent_queries(limit=top_n * 4, since_days=since_days)
+        query_log = self.orchestrator.query_log
+        entries: List[Dict[str, Any]] = []
+        if query_log.spill is not None:
+            try:
+                entries.extend(query_log.spill.read())
+            except Exception as e:
+                logger.warning(f"No se pudo leer el query_log volcado: {e}")
+        entries.extend(query_log.to_list())
+        # Las consultas de ejecuciones anteriores del warm-up no cuentan como tráfico
+        entries = [entry for entry in entries if entry.get("session_id") != "warmup"]
+        return mine_frequent_queries(faq_counts, entries, top_n=top_n,
+                                     min_count=int(os.getenv("WARMUP_MIN_COUNT", "2")))
+    
+    def run(self, top_n: int = 50, min_score: float = 7.0, since_days: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Precalcular, evaluar y cachear las respuestas de las consultas más frecuentes
+        
+        Args:
+            top_n: Número de consultas a precalcular
+            min_score: Puntuación mínima (0-10) para guardar una respuesta
+            since_days: Solo consultas de los últimos N días en analytics
+        
+        Returns:
+            Informe con el resultado de cada consulta
+        """
+        queries = self.frequent_queries(top_n, since_days)
+        index_version = self.orchestrator.retriever.index_version
+        logger.info(f"Warm-up de {len(queries)} consultas frecuentes (índice {index_version})")
+        if not queries:
+            return {"index_version": index_version, "queries": 0, "entries": 0, "results": []}
+        
+        hits = dict(queries)
+        results = list(self.orchestrator.process_batch(list(hits), session_id="warmup", include_context=True))
+        
+        entries, report = [], []
+        for result in sorted(results, key=lambda r: r["index"]):
+            query = result["query"]
+            outcome, score = self._evaluate(query, result, min_score)
+            metrics.inc(metrics.cache_warmup, outcome=outcome)
+            report.append({"query": query, "hits": hits[query], "outcome": outcome, "score": score})
+            
+            if outcome != "stored":
+                # process_batch pudo cachearla con el TTL normal: no se sirve una respuesta rechazada
+                self.orchestrator.evict_cached_answer(query)
+                continue
+            
+            metadata = {
+                key: value for key, value in result["metadata"].items()
+                if key in ("classification", "tools_used", "context_length")
+            }
+            entry = {
+                "response": result["response"],
+                "metadata": {**metadata, "warmed": True, "index_version": index_version, "evaluation_score": score}
+            }
+            self.orchestrator.cache_answer(query, entry, self.ttl)
+            entries.append({"query": query, "hits": hits[query], **entry})
+        
+        self._write_snapshot(index_version, entries)
+        stored = sum(1 for item in report if item["outcome"] == "stored")
+        logger.info(f"Warm-up completado: {stored}/{len(report)} respuestas guardadas")
+        return {
+            "index_version": index_version,
+            "queries": len(report),
+            "entries": stored,
+            "snapshot": self.snapshot_path,
+            "results": report
+        }
+    
+    def _evaluate(self, query: str, result: Dict[str, Any], min_score: float) -> Tuple[str, Optional[float]]:
+        """Resultado y puntuación de una respuesta, evaluada con el contexto con el que se generó"""
+        context = result["metadata"].get("context")
+        if not result.get("success") or not context:
+            return "failed", None
+        try:
+            evaluation = self.evaluator.evaluate(query, result["response"], context, result["metadata"], min_score)
+        except Exception as e:
+            logger.warning(f"Error evaluando la respuesta de '{query[:50]}': {e}")
+            return "failed", None
+        score = evaluation["overall_score"]
+        return ("stored" if score >= min_score else "rejected"), score
+    
+    def _write_snapshot(self, index_version: str, entries: List[Dict[str, Any]]) -> None:
+        """Escribir el snapshot de forma atómica"""
+        os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({
+                "index_version": index_version,
+                "generated_at": datetime.now().isoformat(),
+                "entries": entries
+            }, file, ensure_ascii=False)
+        os.replace(tmp_path, self.snapshot_path)
+    
+    def preload(self) -> int:
+        """
+        Cargar en la caché las respuestas del snapshot (arranque de la API)
+        
+        Solo se cargan si el snapshot corresponde a la versión activa del
+        índice; las respuestas ya presentes en la caché no se sobrescriben.
+        
+        Returns:
+            Número de respuestas cargadas
+        """
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as file:
+                snapshot = json.load(file)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            logger.warning(f"Snapshot de warm-up ilegible ({self.snapshot_path}): {e}")
+            return 0
+        
+        index_version = self.orchestrator.retriever.index_version
+        if str(snapshot.get("index_version")) != index_version:
+            logger.info(f"Snapshot de warm-up del índice {snapshot.get('index_version')}, "
+                        f"activo {index_version}: no se precarga (re-ejecutar el warm-up)")
+            return 0
+        
+        loaded = 0
+        for entry in snapshot.get("entries", []):
+            if self.orchestrator.has_cached_answer(entry["query"]):
+                continue
+            self.orchestrator.cache_answer(
+                entry["query"], {"response": entry["response"], "metadata": entry["metadata"]}, self.ttl
+            )
+            loaded += 1
+        if loaded:
+            metrics.inc(metrics.cache_warmup, loaded, outcome="preloaded")
+        logger.info(f"Warm-up: {loaded} respuestas precargadas del índice {index_version}")
+        return loaded
+
+def main(argv: Optional[List[str]] = None):
+    """Ejecutar el warm-up como job offline"""
+    from agent.orchestrator import CVOrchestrator
+    
+    parser = argparse.ArgumentParser(description="Precalcular las respuestas de las consultas más frecuentes")
+    parser.add_argument("--top-n", type=int, default=int(os.getenv("WARMUP_TOP_N", "50")))
+    parser.add_argument("--min-score", type=float, default=float(os.getenv("WARMUP_MIN_SCORE", "7.0")))
+    parser.add_argument("--since-days", type=int, default=None, help="Solo consultas de los últimos N días")
+    args = parser.parse_args(argv)
+    
+    warmer = CacheWarmer(CVOrchestrator())
+    report = warmer.run(args.top_n, args.min_score, args.since_days)
+    for item in report["results"]:
+        score = f"{item['score']:.1f}" if item["score"] is not None else "-"
+        print(f"{item['outcome']:>8}  {score:>4}  x{item['hits']:<4} {item['query']}")
+    print(f"\n{report['entries']}/{report['queries']} respuestas en caché (índice {report['index_version']})")
+
+if __name__ == "__main__":
+    main()
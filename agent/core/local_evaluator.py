@@ -0,0 +1,242 @@
+"""
+Local Evaluator Module
+
+Evaluación de respuestas sin llamadas a la API: fundamentación por
+similitud de embeddings entre las frases de la respuesta y el contexto
+recuperado, relevancia por similitud consulta-respuesta y claridad,
+completitud y profesionalidad por estadísticas de texto. Sin modelo de
+embeddings se usa solapamiento léxico.
+"""
+
+import re
+from typing import Dict, Any, List, Optional, Callable, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy es opcional, sin él se usa solapamiento léxico
+    np = None
+
+
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+LIST_MARKER_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+EMOJI_RE = re.compile("[\U0001F300-\U0001FAFF☀-➿]")
+
+STOPWORDS = frozenset("""
+a al algo como con cual cuales cuando de del donde el ella en entre es esta este
+esto fue ha han hay la las le les lo los mas me mi mis muy no o para pero por que
+qué se sea ser si sin sobre son su sus tambien también te tiene tu un una uno unos
+y ya yo cuál cómo dónde cuándo the and of to in is
+""".split())
+
+INFORMAL_MARKERS = ("jaja", "jeje", "lol", "xd", "guay", "mola", "tío")
+
+# Máximo de frases/pasajes embebidos por evaluación (acota la latencia)
+MAX_SENTENCES = 20
+MAX_PASSAGES = 40
+
+# Similitud (coseno) a partir de la cual una frase se considera respaldada
+GROUNDED_SIMILARITY = 0.5
+
+Encoder = Callable[[List[str]], Any]
+
+
+def _clip(value: float, low: float = 0.0, high: float = 10.0) -> float:
+    return max(low, min(high, value))
+
+
+def _scale(value: float, low: float, high: float) -> float:
+    """Mapear linealmente [low, high] a [0, 10]"""
+    return _clip((value - low) / (high - low) * 10.0)
+
+
+def split_sentences(text: str, min_words: int = 3) -> List[str]:
+    """Frases de un texto (sin marcadores de lista ni fragmentos muy cortos)"""
+    sentences = []
+    for piece in SENTENCE_SPLIT_RE.split(text or ""):
+        piece = LIST_MARKER_RE.sub("", piece).strip()
+        if len(WORD_RE.findall(piece)) >= min_words:
+            sentences.append(piece)
+    return sentences
+
+
+def content_terms(text: str) -> List[str]:
+    """Términos con contenido (minúsculas, sin stopwords)"""
+    return [word for word in WORD_RE.findall(text.lower()) if word not in STOPWORDS and len(word) > 2]
+
+
+class LocalEvaluator:
+    """Evaluador heurístico con embeddings locales"""
+    
+    def __init__(self, encoder: Optional[Encoder] = None):
+        """
+        Inicializar evaluador
+        
+        Args:
+            encoder: Función que devuelve los embeddings de una lista de textos
+                (p. ej. SentenceTransformer.encode); sin ella se usa solapamiento léxico
+        """
+        self.encoder = encoder if np is not None else None
+    
+    @property
+    def method(self) -> str:
+        return "embeddings" if self.encoder else "lexical"
+    
+    def evaluate(self,
+                 query: str,
+                 response: str,
+                 context: str = "",
+                 metadata: Optional[Dict[str, Any]] = None,
+                 threshold: float = 7.0) -> Dict[str, Any]:
+        """
+        Evaluar una respuesta
+        
+        Args:
+            query: Consulta original
+            response: Respuesta a evaluar
+            context: Contexto recuperado usado para generarla
+            metadata: Metadatos (tools_used)
+            threshold: Puntuación mínima de calidad (la confianza crece al alejarse de ella)
+        
+        Returns:
+            Evaluación con la misma estructura que la del juez LLM
+            (scores, overall_score, confidence, strengths, weaknesses, suggestions)
+        """
+        metadata = metadata or {}
+        sentences = split_sentences(response)[:MAX_SENTENCES] or [response.strip() or "-"]
+        passages = split_sentences(context)[:MAX_PASSAGES]
+        strengths: List[str] = []
+        weaknesses: List[str] = []
+        suggestions: List[str] = []
+        
+        support, relevance_similarity = self._similarities(query, response, sentences, passages)
+        
+        # Precisión: proporción de frases respaldadas por el contexto
+        if passages:
+            grounded = sum(1 for value in support if value >= GROUNDED_SIMILARITY) / len(support)
+            precision = _clip(2.0 + 8.0 * grounded)
+            if grounded >= 0.8:
+                strengths.append("Respuesta basada en contexto específico")
+            elif grounded < 0.5:
+                weaknesses.append("Afirmaciones sin respaldo en el contexto")
+                suggestions.append("Mejorar precisión usando más contexto específico")
+        else:
+            precision = 5.0
+            weaknesses.append("Sin contexto recuperado para verificar la respuesta")
+        
+        # Relevancia: similitud consulta-respuesta y cobertura de términos de la consulta
+        query_terms = set(content_terms(query))
+        response_terms = set(content_terms(response))
+        coverage = len(query_terms & response_terms) / len(query_terms) if query_terms else 1.0
+        relevance = _clip(0.7 * relevance_similarity + 3.0 * coverage)
+        if relevance < 5.0:
+            weaknesses.append("Baja relevancia con la consulta")
+            suggestions.append("Mejorar relevancia enfocándose en palabras clave de la consulta")
+        
+        # Completitud: longitud y cobertura
+        words = WORD_RE.findall(response)
+        completeness = _clip(_scale(len(words), 5, 60) * 0.7 + 3.0 * coverage)
+        if len(words) < 20:
+            completeness = min(completeness, 6.0)
+            weaknesses.append("Respuesta muy breve")
+            suggestions.append("Proporcionar respuestas más detalladas")
+        tools_used = metadata.get("tools_used", [])
+        if "rag_search" in tools_used and "faq_query" in tools_used:
+            completeness = _clip(completeness + 0.5)
+        
+        clarity = self._clarity(response, sentences, words)
+        if clarity >= 8.0:
+            strengths.append("Respuesta clara y bien estructurada")
+        elif clarity < 6.0:
+            weaknesses.append("Frases demasiado largas o repetitivas")
+        
+        professionalism = self._professionalism(response, words)
+        if professionalism < 7.0:
+            weaknesses.append("Tono poco profesional")
+        
+        scores = {
+            "precision": round(precision, 2),
+            "completeness": round(completeness, 2),
+            "relevance": round(relevance, 2),
+            "clarity": round(clarity, 2),
+            "professionalism": round(professionalism, 2)
+        }
+        overall = (precision * 0.30 + completeness * 0.25 + relevance * 0.20 +
+                   clarity * 0.15 + professionalism * 0.10)
+        
+        # Confianza: menor con solapamiento léxico y cerca del umbral de calidad
+        base = 60.0 if self.encoder else 45.0
+        confidence = _clip(base + 10.0 * abs(overall - threshold), 0.0, 95.0)
+        
+        return {
+            "overall_score": round(overall, 2),
+            "scores": scores,
+            "confidence": round(confidence, 1),
+            "strengths": strengths,
+            "weaknesses": weaknesses,
+            "suggestions": suggestions
+        }
+    
+    def _similarities(self, query: str, response: str,
+                      sentences: Sequence[str], passages: Sequence[str]) -> Tuple[List[float], float]:
+        """
+        Similitud de cada frase con su pasaje más cercano y relevancia (0-10)
+        entre consulta y respuesta
+        """
+        if self.encoder:
+            try:
+                vectors = np.asarray(self.encoder([query, response, *sentences, *passages]), dtype=float)
+                norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+                vectors = vectors / np.where(norms == 0, 1.0, norms)
+                query_vector, response_vector = vectors[0], vectors[1]
+                sentence_vectors = vectors[2:2 + len(sentences)]
+                passage_vectors = vectors[2 + len(sentences):]
+                support = (sentence_vectors @ passage_vectors.T).max(axis=1).tolist() if len(passages) else []
+                # all-MiniLM: ~0.1 sin relación, ~0.6 respuesta directa
+                return support, _scale(float(query_vector @ response_vector), 0.1, 0.6)
+            except Exception:
+                # Fallo del modelo: se sigue con solapamiento léxico
+                pass
+        
+        passage_terms = set(term for passage in passages for term in content_terms(passage))
+        support = []
+        for sentence in sentences:
+            terms = set(content_terms(sentence))
+            # Escalado para comparar con GROUNDED_SIMILARITY (0.6 de términos cubiertos ~ respaldada)
+            support.append((len(terms & passage_terms) / len(terms)) * (GROUNDED_SIMILARITY / 0.6) if terms else 1.0)
+        query_terms = set(content_terms(query))
+        overlap = len(query_terms & set(content_terms(response))) / len(query_terms) if query_terms else 1.0
+        return (support if passages else []), _scale(overlap, 0.0, 0.6)
+    
+    @staticmethod
+    def _clarity(response: str, sentences: Sequence[str], words: Sequence[str]) -> float:
+        """Longitud media de frase, repetición y estructura"""
+        if not words:
+            return 0.0
+        average_length = len(words) / max(len(sentences), 1)
+        # Óptimo entre 10 y 25 palabras por frase
+        clarity = 9.0 - max(0.0, average_length - 25) * 0.15 - max(0.0, 10 - average_length) * 0.2
+        
+        lowered = [word.lower() for word in words]
+        diversity = len(set(lowered)) / len(lowered)
+        if len(lowered) >= 30 and diversity < 0.4:
+            clarity -= (0.4 - diversity) * 10
+        
+        # Las respuestas largas se leen mejor en párrafos o listas
+        if len(words) > 120 and "\n" in response.strip():
+            clarity += 0.5
+        return _clip(clarity)
+    
+    @staticmethod
+    def _professionalism(response: str, words: Sequence[str]) -> float:
+        """Tono: exclamaciones, emojis, mayúsculas e informalidad"""
+        score = 9.0
+        score -= min(2.0, response.count("!!") * 0.5)
+        score -= min(2.0, len(EMOJI_RE.findall(response)) * 0.5)
+        upper = [word for word in words if len(word) > 3 and word.isupper()]
+        if words and len(upper) / len(words) > 0.2:
+            score -= 2.0
+        lowered = response.lower()
+        score -= sum(1.0 for marker in INFORMAL_MARKERS if re.search(rf"\b{marker}\b", lowered))
+        return _clip(score)
@@ -5,6 +5,8 @@ Orquestador principal refactorizado que gestiona la lógica de negocio,
 coordina agentes especializados y proporciona respuestas inteligentes.
 """
 
+import os
+import json
 import time
 from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
@@ -14,16 +16,32 @@ from openai import OpenAI
 from rag.retriever import SemanticRetriever
 from tools.faq_sql import FAQSQLTool
 from tools.notify import NotificationManager
+from tools.tracing import traced, current_span
+from tools.metrics import metrics
+from tools.ring_log import RingLog
+from tools.state_backend import SharedCache, get_state_backend
+from tools.single_flight import SingleFlight
+from tools.speculative import SpeculativeRetrieval, Speculation
+from tools.deadline import Deadline, deadline_scope, current_deadline
 
 from ..utils.config import AgentConfig
 from ..utils.logger import AgentLogger
 from ..utils.prompts import PromptManager
 from ..utils.multi_llm_client import MultiLLMClient
+from ..utils.model_cascade import ModelCascade, STRONG
+from ..utils.context_packer import ContextPacker
 from .query_classifier import QueryClassifier, QueryClassification, RecommendedTool
 from .response_evaluator import ResponseEvaluator, EvaluationResult
 from ..specialists.clarifier import ClarifierAgent
 from ..specialists.email_handler import EmailAgent
 
+# Eventos contados en metrics.orchestrator_events que expone get_session_stats
+SESSION_EVENTS = (
+    "total_queries", "successful_queries", "failed_queries", "rag_searches", "faq_queries",
+    "combined_searches", "clarifications_requested", "emails_sent", "cache_hits",
+    "coalesced_requests"
+)
+
 
 class CVOrchestrator:
     """Orquestador principal del sistema de agentes de CV"""
@@ -44,36 +62,51 @@ class CVOrchestrator:
         
         # Managers
         self.prompt_manager = PromptManager()
+        self.context_packer = ContextPacker(token_budget=self.config.context_token_budget)
         
         # Cliente Multi-LLM (compatible con OpenAI y otros proveedores)
         self.llm_client = MultiLLMClient(self.config.openai, self.logger)
         # Mantener compatibilidad con código legacy
         self.openai_client = self.llm_client.client
         
+        # Cascada: modelo rápido primero, el principal solo si la calidad no alcanza el mínimo
+        self.cascade = ModelCascade(
+            self.llm_client,
+            MultiLLMClient(self.config.cascade, self.logger) if self.config.cascade else None
+        )
+        
         # Inicializar componentes principales
         self._initialize_tools()
         self._initialize_agents()
         
         # Estadísticas de sesión
-        self.session_stats = {
-            "total_queries": 0,
-            "successful_queries": 0,
-            "failed_queries": 0,
-            "rag_searches": 0,
-            "faq_queries": 0,
-            "combined_searches": 0,
-            "clarifications_requested": 0,
-            "emails_sent": 0,
-            "start_time": datetime.now(),
-            "average_response_time": 0.0
-        }
+        # Los contadores viven en el registro de métricas (agregado entre workers)
+        self.start_time = datetime.now()
+        
+        # Caché de respuestas compartida entre workers/réplicas
+        self.answer_cache = SharedCache(
+            get_state_backend(), "answer", ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+        )
+        
+        # Consultas idénticas concurrentes comparten una única ejecución
+        self.single_flight = SingleFlight.from_env("process_query")
         
-        # Log de consultas para análisis
-        self.query_log = []
+        # Búsquedas RAG y FAQ lanzadas en paralelo con la clasificación
+        self.speculative = SpeculativeRetrieval.from_env("process_query")
+        
+        # Log de consultas para análisis (buffer circular de capacidad fija)
+        self.query_log = RingLog.from_env(
+            "query_log",
+            fields=("timestamp", "query", "classification", "response_source",
+                    "evaluation_score", "execution_time", "success")
+        )
         
         # Metadata del último LLM usado (para incluir en respuestas)
         self._last_llm_metadata = {}
         
+        # Estadísticas del último contexto empaquetado
+        self._last_context_stats = {}
+        
         self.logger.info("CVOrchestrator initialized successfully")
     
     def _initialize_tools(self):
@@ -92,7 +125,9 @@ class CVOrchestrator:
         """Inicializar agentes especializados"""
         try:
             self.query_classifier = QueryClassifier(self.config, self.logger)
-            self.response_evaluator = ResponseEvaluator(self.config, self.logger)
+            self.response_evaluator = ResponseEvaluator(
+                self.config, self.logger, encoder=self.retriever.embedding_model.encode
+            )
             self.clarifier_agent = ClarifierAgent(self.config, self.logger)
             self.email_agent = EmailAgent(self.config, self.logger)
             
@@ -101,10 +136,12 @@ class CVOrchestrator:
             self.logger.error("Error initializing agents", exception=e)
             raise
     
+    @traced("process_query")
     def process_query(self, 
                      query: str, 
                      context: Optional[Dict[str, Any]] = None,
-                     user_preferences: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+                     user_preferences: Optional[Dict[str, Any]] = None,
+                     deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """
         Procesar consulta principal
         
@@ -112,6 +149,8 @@ class CVOrchestrator:
             query: Consulta del usuario
             context: Contexto adicional de la conversación
             user_preferences: Preferencias del usuario
+            deadline: Deadline de la petición; al agotarse o cancelarse las
+                etapas pendientes no llaman al LLM y se responde con lo disponible
             
         Returns:
             Respuesta completa con metadatos
@@ -119,19 +158,54 @@ class CVOrchestrator:
         start_time = time.time()
         context = context or {}
         user_preferences = user_preferences or {}
-        
+        self._last_context_stats = {}
+        
+        # 0. Respuesta ya generada para la misma consulta y preferencias
+        cache_key = self._answer_cache_key(query, user_preferences)
+        cached = self.answer_cache.get(cache_key)
+        current_span().record_cache(cached is not None)
+        if cached is not None:
+            return self._cached_response(cached, time.time() - start_time)
+        
+        # Consultas idénticas en curso esperan a la misma ejecución
+        flight_key = SharedCache.make_key(cache_key, json.dumps(context, sort_keys=True, default=str))
+        with deadline_scope(deadline or current_deadline()):
+            result, shared = self.single_flight.do(
+                flight_key,
+                lambda: self._execute_query(query, context, user_preferences, start_time, cache_key)
+            )
+        if shared:
+            return self._coalesced_response(result, time.time() - start_time)
+        return result
+    
+    def _execute_query(self,
+                       query: str,
+                       context: Dict[str, Any],
+                       user_preferences: Dict[str, Any],
+                       start_time: float,
+                       cache_key: str) -> Dict[str, Any]:
+        """Ejecutar el pipeline completo (clasificar, generar, evaluar) para una consulta"""
         try:
             self.logger.info(f"Processing query: {query[:100]}...")
             
-            # 1. Clasificar consulta
-            classification = self.query_classifier.classify(query, context)
-            self.logger.debug(f"Query classified as: {classification.category.value}")
-            
-            # 2. Determinar estrategia de respuesta
-            response_strategy = self._determine_response_strategy(classification, user_preferences)
-            
-            # 3. Ejecutar estrategia
-            response_data = self._execute_response_strategy(query, classification, response_strategy, context)
+            with self.speculative.begin() as speculation:
+                # 0. Búsquedas especulativas en paralelo con la clasificación
+                speculation.launch("rag", self.config.rag_top_k, self.retriever.search,
+                                   query=query, top_k=self.config.rag_top_k)
+                speculation.launch("faq", self.config.faq_limit, self.faq_tool.search_faqs,
+                                   query=query, limit=self.config.faq_limit, log_analytics=False)
+                
+                # 1. Clasificar consulta
+                classification = self.query_classifier.classify(query, context)
+                self.logger.debug(f"Query classified as: {classification.category.value}")
+                
+                # 2. Determinar estrategia de respuesta
+                response_strategy = self._determine_response_strategy(classification, user_preferences)
+                
+                # 3. Ejecutar estrategia (reutilizando las búsquedas especulativas que coincidan)
+                response_data = self._execute_response_strategy(
+                    query, classification, response_strategy, context, speculation
+                )
             
             # 4. Evaluar respuesta
             evaluation = self.response_evaluator.evaluate_response(
@@ -141,6 +215,9 @@ class CVOrchestrator:
                 metadata=response_data.get("metadata", {})
             )
             
+            # 4b. Cascada: regenerar con el modelo principal si la respuesta rápida no alcanza el mínimo
+            response_data, evaluation = self._apply_cascade(query, response_data, evaluation)
+            
             # 5. Post-procesamiento
             final_response = self._post_process_response(
                 query, response_data, evaluation, classification
@@ -155,6 +232,10 @@ class CVOrchestrator:
             
             self.logger.log_query(query, classification.category.value, execution_time, True)
             
+            # 8. Cachear respuestas de calidad que no requieren interacción
+            if self._is_cacheable(final_response, evaluation):
+                self.answer_cache.set(cache_key, final_response)
+            
             return final_response
             
         except Exception as e:
@@ -176,6 +257,7 @@ class CVOrchestrator:
             "fallback_tools": [],
             "needs_clarification": classification.needs_clarification(),
             "complexity": classification.expected_complexity,
+            "model_tier": self.cascade.initial_tier(classification.expected_complexity.value),
             "search_params": {
                 "terms": classification.search_terms,
                 "top_k": user_preferences.get("detail_level", self.config.rag_top_k),
@@ -195,7 +277,8 @@ class CVOrchestrator:
                                  query: str,
                                  classification: QueryClassification,
                                  strategy: Dict[str, Any],
-                                 context: Dict[str, Any]) -> Dict[str, Any]:
+                                 context: Dict[str, Any],
+                                 speculation: Optional[Speculation] = None) -> Dict[str, Any]:
         """Ejecutar la estrategia de respuesta seleccionada"""
         
         # Si necesita aclaración, generar preguntas
@@ -205,32 +288,47 @@ class CVOrchestrator:
         # Ejecutar herramienta principal
         primary_tool = strategy["primary_tool"]
         
+        tier = strategy["model_tier"]
+        
         if primary_tool == RecommendedTool.RAG:
-            return self._execute_rag_search(query, strategy["search_params"])
+            return self._execute_rag_search(query, strategy["search_params"], speculation, tier)
         elif primary_tool == RecommendedTool.FAQ:
-            return self._execute_faq_query(query)
+            return self._execute_faq_query(query, speculation)
         elif primary_tool == RecommendedTool.COMBINED:
-            return self._execute_combined_search(query, strategy["search_params"])
+            return self._execute_combined_search(query, strategy["search_params"], speculation, tier)
         else:
             # Fallback a búsqueda combinada
-            return self._execute_combined_search(query, strategy["search_params"])
+            return self._execute_combined_search(query, strategy["search_params"], speculation, tier)
     
-    def _execute_rag_search(self, query: str, search_params: Dict[str, Any]) -> Dict[str, Any]:
+    def _rag_lookup(self, query: str, top_k: int, speculation: Optional[Speculation] = None) -> List[Any]:
+        """Búsqueda RAG, reutilizando la especulativa si cubre top_k"""
+        results = speculation.take("rag", top_k) if speculation else None
+        if results is None:
+            results = self.retriever.search(query=query, top_k=top_k)
+        return results
+    
+    def _faq_lookup(self, query: str, limit: int, speculation: Optional[Speculation] = None) -> List[Any]:
+        """Búsqueda FAQ, reutilizando la especulativa si cubre limit"""
+        results = speculation.take("faq", limit) if speculation else None
+        if results is None:
+            return self.faq_tool.search_faqs(query=query, limit=limit)
+        self.faq_tool.record_analytics(query, results)
+        return results
+    
+    def _execute_rag_search(self, query: str, search_params: Dict[str, Any],
+                            speculation: Optional[Speculation] = None, tier: str = STRONG) -> Dict[str, Any]:
         """Ejecutar búsqueda RAG"""
         try:
-            results = self.retriever.search(
-                query=query,
-                top_k=search_params["top_k"]
-            )
+            results = self._rag_lookup(query, search_params["top_k"], speculation)
             
             if not results:
                 return self._handle_no_results(query, "RAG")
             
             # Generar respuesta con contexto
             context = self._format_rag_context(results)
-            response = self._generate_response_with_context(query, context, "RAG")
+            response = self._generate_response_with_context(query, context, "RAG", tier)
             
-            self.session_stats["rag_searches"] += 1
+            self._count_event("rag_searches")
             
             return {
                 "response": response,
@@ -249,10 +347,10 @@ class CVOrchestrator:
             self.logger.error("Error in RAG search", exception=e)
             return self._handle_tool_error(query, "RAG", str(e))
     
-    def _execute_faq_query(self, query: str) -> Dict[str, Any]:
+    def _execute_faq_query(self, query: str, speculation: Optional[Speculation] = None) -> Dict[str, Any]:
         """Ejecutar consulta FAQ"""
         try:
-            results = self.faq_tool.query(query, limit=self.config.faq_limit)
+            results = self._faq_lookup(query, self.config.faq_limit, speculation)
             
             if not results:
                 return self._handle_no_results(query, "FAQ")
@@ -260,7 +358,7 @@ class CVOrchestrator:
             # Formatear respuesta FAQ
             response = self._format_faq_response(results)
             
-            self.session_stats["faq_queries"] += 1
+            self._count_event("faq_queries")
             
             return {
                 "response": response,
@@ -278,16 +376,13 @@ class CVOrchestrator:
             self.logger.error("Error in FAQ query", exception=e)
             return self._handle_tool_error(query, "FAQ", str(e))
     
-    def _execute_combined_search(self, query: str, search_params: Dict[str, Any]) -> Dict[str, Any]:
+    def _execute_combined_search(self, query: str, search_params: Dict[str, Any],
+                                 speculation: Optional[Speculation] = None, tier: str = STRONG) -> Dict[str, Any]:
         """Ejecutar búsqueda combinada RAG + FAQ"""
         try:
-            # Ejecutar ambas búsquedas en paralelo
-            rag_results = self.retriever.search(
-                query=query,
-                top_k=search_params["top_k"] // 2  # Dividir espacio
-            )
-            
-            faq_results = self.faq_tool.query(query, limit=self.config.faq_limit // 2)
+            # Dividir espacio entre ambas búsquedas
+            rag_results = self._rag_lookup(query, search_params["top_k"] // 2, speculation)
+            faq_results = self._faq_lookup(query, self.config.faq_limit // 2, speculation)
             
             # Combinar resultados
             combined_context = self._combine_search_results(rag_results, faq_results)
@@ -296,9 +391,9 @@ class CVOrchestrator:
                 return self._handle_no_results(query, "COMBINED")
             
             # Generar respuesta combinada
-            response = self._generate_response_with_context(query, combined_context, "COMBINED")
+            response = self._generate_response_with_context(query, combined_context, "COMBINED", tier)
             
-            self.session_stats["combined_searches"] += 1
+            self._count_event("combined_searches")
             
             return {
                 "response": response,
@@ -322,7 +417,7 @@ class CVOrchestrator:
         try:
             clarification_questions = self.clarifier_agent.generate_clarifications(query)
             
-            self.session_stats["clarifications_requested"] += 1
+            self._count_event("clarifications_requested")
             
             return {
                 "response": "Para poder ayudarte mejor, me gustaría hacer algunas preguntas de aclaración:",
@@ -340,35 +435,48 @@ class CVOrchestrator:
             # Fallback a respuesta general
             return self._execute_combined_search(query, {"terms": [query], "top_k": 3, "similarity_threshold": 0.6})
     
-    def _generate_response_with_context(self, query: str, context: str, source: str) -> str:
-        """Generar respuesta usando contexto y LLM"""
+    def _generate_response_with_context(self, query: str, context: str, source: str, tier: str = STRONG) -> str:
+        """Generar respuesta usando contexto y LLM (modelo del nivel `tier` de la cascada)"""
         try:
             system_prompt = self.prompt_manager.format_system_prompt([source.lower()])
             
-            user_prompt = f"""
-            Consulta: {query}
-            
-            Contexto disponible:
-            {context}
+            user_prompt = (
+                f"Consulta: {query}\n\n"
+                f"Contexto disponible:\n{context}\n\n"
+                "Por favor, proporciona una respuesta completa y profesional basada en el contexto disponible. "
+                "Si el contexto no es suficiente para responder completamente, indícalo claramente."
+            )
             
-            Por favor, proporciona una respuesta completa y profesional basada en el contexto disponible.
-            Si el contexto no es suficiente para responder completamente, indícalo claramente.
-            """
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ]
+            
+            prompt_tokens = self.context_packer.counter.count(system_prompt) + \
+                self.context_packer.counter.count(user_prompt)
+            self.logger.info(
+                f"Prompt tokens: {prompt_tokens} (context: {self._last_context_stats.get('context_tokens', 0)})",
+                prompt_tokens=prompt_tokens,
+                source=source
+            )
             
             # Usar MultiLLMClient.generate() para capturar metadata
-            llm_response = self.llm_client.generate(
-                prompt=user_prompt,
-                system_prompt=system_prompt,
+            generation_start = time.time()
+            llm_response = self.cascade.client(tier).generate(
+                messages=messages,
                 temperature=self.config.openai.temperature,
                 max_tokens=self.config.openai.max_tokens
             )
+            self.cascade.record_generation(tier, time.time() - generation_start)
             
             # Guardar metadata de la generación para usarlo en respuesta
             self._last_llm_metadata = {
                 "provider": llm_response.provider,
                 "model": llm_response.model,
-                "tokens": llm_response.usage.total_tokens if llm_response.usage else None,
-                "cost": llm_response.cost
+                "model_tier": tier,
+                "tokens": llm_response.tokens_used,
+                "prompt_tokens": prompt_tokens,
+                **self._last_context_stats
             }
             
             return llm_response.content
@@ -377,47 +485,35 @@ class CVOrchestrator:
             self.logger.error("Error generating response with context", exception=e)
             return f"He encontrado información relevante pero tengo dificultades técnicas para procesarla completamente. Contexto disponible: {context[:200]}..."
     
-    def _format_rag_context(self, results: List[Dict[str, Any]]) -> str:
-        """Formatear resultados RAG en contexto"""
+    def _format_rag_context(self, results: List[Any]) -> str:
+        """Formatear resultados RAG en contexto dentro del presupuesto de tokens"""
         if not results:
             return ""
         
-        context_parts = []
-        for i, result in enumerate(results[:5], 1):  # Limitar a 5 resultados
-            content = result.get("content", "")
-            source = result.get("source", "documento")
-            similarity = result.get("similarity", 0)
-            
-            context_parts.append(f"[Fuente {i} - {source} (relevancia: {similarity:.2f})]:\n{content}\n")
+        packed = self.context_packer.pack(results)
+        self._last_context_stats = packed.to_dict()
         
-        return "\n".join(context_parts)
+        return packed.text
     
     def _format_faq_response(self, results: List[Dict[str, Any]]) -> str:
         """Formatear respuesta FAQ directa"""
         if not results:
             return "No encontré información específica en las preguntas frecuentes."
         
-        # Tomar la respuesta con mayor puntuación
-        best_result = max(results, key=lambda x: x.get("score", 0))
-        return best_result.get("answer", "Respuesta no disponible")
+        # Tomar la respuesta con mayor confianza
+        best_result = max(results, key=lambda x: x.confidence)
+        return best_result.answer or "Respuesta no disponible"
     
-    def _combine_search_results(self, rag_results: List[Dict], faq_results: List[Dict]) -> str:
-        """Combinar resultados de RAG y FAQ"""
-        context_parts = []
-        
-        # Agregar resultados FAQ primero (más directos)
-        if faq_results:
-            context_parts.append("=== INFORMACIÓN GENERAL ===")
-            for result in faq_results[:2]:
-                context_parts.append(f"P: {result.get('question', '')}")
-                context_parts.append(f"R: {result.get('answer', '')}\n")
+    def _combine_search_results(self, rag_results: List[Any], faq_results: List[Any]) -> str:
+        """Combinar resultados de RAG y FAQ en un único contexto empaquetado"""
+        items = list(faq_results[:2] if faq_results else []) + list(rag_results or [])
+        if not items:
+            return ""
         
-        # Agregar resultados RAG (más detallados)
-        if rag_results:
-            context_parts.append("=== INFORMACIÓN DETALLADA ===")
-            context_parts.append(self._format_rag_context(rag_results))
+        packed = self.context_packer.pack(items)
+        self._last_context_stats = packed.to_dict()
         
-        return "\n".join(context_parts)
+        return packed.text
     
     def _handle_no_results(self, query: str, source: str) -> Dict[str, Any]:
         """Manejar caso sin resultados"""
@@ -455,6 +551,51 @@ class CVOrchestrator:
             }
         }
     
+    @traced("cascade")
+    def _apply_cascade(self, query: str, response_data: Dict[str, Any],
+                       evaluation: EvaluationResult) -> Tuple[Dict[str, Any], EvaluationResult]:
+        """
+        Regenerar con el modelo principal una respuesta del modelo rápido
+        cuya evaluación no alcanza evaluation_min_score
+        """
+        metadata = response_data.get("metadata", {})
+        tier = metadata.get("model_tier")
+        
+        # Sin cascada o sin generación LLM (FAQ, aclaración, error)
+        if not self.cascade.enabled or tier is None:
+            return response_data, evaluation
+        current_span().set_attribute("model_tier", tier)
+        
+        if tier == STRONG:
+            self.cascade.record_outcome("direct")
+            return response_data, evaluation
+        
+        score = evaluation.scores.overall_score
+        if not self.cascade.should_escalate(tier, score, self.config.evaluation_min_score):
+            self.cascade.record_outcome("accepted")
+            return response_data, evaluation
+        
+        self.cascade.record_outcome("escalated")
+        current_span().set_attribute("escalated", True)
+        self.logger.info(f"Cascade escalation: fast answer scored {score:.1f}, regenerating with {self.cascade.strong.config.model}")
+        
+        context = response_data.get("context", "")
+        response = self._generate_response_with_context(query, context, response_data["source"], STRONG)
+        escalated_metadata = {
+            **metadata,
+            **self._last_llm_metadata,
+            "escalated_from": {"model": metadata.get("model"), "score": score}
+        }
+        escalated = {**response_data, "response": response, "metadata": escalated_metadata}
+        
+        evaluation = self.response_evaluator.evaluate_response(
+            query=query,
+            response=response,
+            context=context,
+            metadata=escalated_metadata
+        )
+        return escalated, evaluation
+    
     def _post_process_response(self, 
                              query: str,
                              response_data: Dict[str, Any],
@@ -469,19 +610,69 @@ class CVOrchestrator:
         # Enviar notificación si es necesario
         if self._should_send_notification(evaluation, classification):
             try:
-                self.notification_manager.send_notification(
+                self.notification_manager.send_custom_notification(
                     message=f"Consulta importante procesada: {query[:100]}",
                     title="Consulta CV Importante",
-                    priority="normal"
+                    priority=0
                 )
             except Exception as e:
                 self.logger.warning("Failed to send notification", exception=e)
         
-        # Agregar timestamp
+        # Agregar timestamp y traza
         response_data["timestamp"] = datetime.now().isoformat()
+        trace_id = current_span().trace_id
+        if trace_id:
+            response_data.setdefault("metadata", {})["trace_id"] = trace_id
         
         return response_data
     
+    def _is_cacheable(self, response_data: Dict[str, Any], evaluation: EvaluationResult) -> bool:
+        """Determinar si una respuesta puede reutilizarse para la misma consulta"""
+        return (
+            response_data.get("source") not in ("ERROR", "CLARIFICATION") and
+            not response_data.get("metadata", {}).get("error") and
+            evaluation.is_high_quality()
+        )
+    
+    def has_cached_answer(self, query: str, user_preferences: Optional[Dict[str, Any]] = None) -> bool:
+        """Indica si la consulta se responderá desde la caché (sin ejecutar el pipeline)"""
+        return self.answer_cache.contains(self._answer_cache_key(query, user_preferences or {}))
+    
+    def _answer_cache_key(self, query: str, user_preferences: Dict[str, Any]) -> str:
+        """Clave de la caché de respuestas: consulta normalizada, preferencias y versión del índice"""
+        return SharedCache.query_key(
+            query,
+            json.dumps(user_preferences, sort_keys=True, default=str),
+            self.retriever.index_version
+        )
+    
+    def _cached_response(self, cached: Dict[str, Any], execution_time: float) -> Dict[str, Any]:
+        """Construir la respuesta a partir de una entrada de la caché"""
+        self._count_event("cache_hits")
+        self._update_session_stats(None, execution_time, True)
+        
+        metadata = {**cached.get("metadata", {}), "cached": True}
+        trace_id = current_span().trace_id
+        if trace_id:
+            metadata["trace_id"] = trace_id
+        
+        return {**cached, "metadata": metadata, "timestamp": datetime.now().isoformat()}
+    
+    def _coalesced_response(self, result: Dict[str, Any], execution_time: float) -> Dict[str, Any]:
+        """Adaptar el resultado de otra ejecución idéntica a esta llamada"""
+        success = not result.get("metadata", {}).get("error")
+        self._count_event("coalesced_requests")
+        self._update_session_stats(None, execution_time, success)
+        metrics.inc(metrics.coalesced_requests)
+        current_span().set_attribute("coalesced", True)
+        
+        metadata = {**result.get("metadata", {}), "coalesced": True}
+        trace_id = current_span().trace_id
+        if trace_id:
+            metadata["trace_id"] = trace_id
+        
+        return {**result, "metadata": metadata}
+    
     def _should_send_notification(self, evaluation: EvaluationResult, classification: QueryClassification) -> bool:
         """Determinar si se debe enviar notificación"""
         return (
@@ -513,20 +704,22 @@ class CVOrchestrator:
             "timestamp": datetime.now().isoformat()
         }
     
+    def _count_event(self, event: str, amount: int = 1) -> None:
+        """Contar un evento del orquestador (alimenta las estadísticas y /metrics)"""
+        metrics.inc(metrics.orchestrator_events, amount, event=event)
+    
     def _update_session_stats(self, classification: Optional[QueryClassification], 
                             execution_time: float, success: bool):
         """Actualizar estadísticas de sesión"""
-        self.session_stats["total_queries"] += 1
+        self._count_event("total_queries")
         
         if success:
-            self.session_stats["successful_queries"] += 1
+            self._count_event("successful_queries")
         else:
-            self.session_stats["failed_queries"] += 1
+            self._count_event("failed_queries")
         
-        # Actualizar tiempo promedio de respuesta
-        total_queries = self.session_stats["total_queries"]
-        current_avg = self.session_stats["average_response_time"]
-        self.session_stats["average_response_time"] = ((current_avg * (total_queries - 1)) + execution_time) / total_queries
+        # Latencia al histograma; la media se deriva de él
+        metrics.observe_request(execution_time, success)
     
     def _log_query(self, query: str, response_data: Dict[str, Any], 
                   classification: QueryClassification, evaluation: EvaluationResult,
@@ -543,16 +736,20 @@ class CVOrchestrator:
         }
         
         self.query_log.append(log_entry)
-        
-        # Mantener solo las últimas 100 consultas
-        if len(self.query_log) > 100:
-            self.query_log = self.query_log[-100:]
     
     def get_session_stats(self) -> Dict[str, Any]:
         """Obtener estadísticas de la sesión"""
+        counts = metrics.totals(metrics.orchestrator_events, "event")
         return {
-            **self.session_stats,
-            "session_duration": str(datetime.now() - self.session_stats["start_time"]),
+            **{event: int(counts.get(event, 0)) for event in SESSION_EVENTS},
+            "start_time": self.start_time,
+            "average_response_time": metrics.request_latency.summary().get("mean", 0.0),
+            "session_duration": str(datetime.now() - self.start_time),
+            "latency": metrics.latency_summary(),
+            "answer_cache": self.answer_cache.get_stats(),
+            "single_flight": self.single_flight.get_stats(),
+            "speculative_retrieval": self.speculative.get_stats(),
+            "model_cascade": self.cascade.get_stats(),
             "classifier_stats": self.query_classifier.get_stats(),
             "evaluator_stats": self.response_evaluator.get_stats()
         }
@@ -571,7 +768,7 @@ class CVOrchestrator:
             
             # Generar resumen
             stats = self.get_session_stats()
-            recent_queries = self.query_log[-5:] if len(self.query_log) >= 5 else self.query_log
+            recent_queries = self.query_log[-5:]
             
             summary_content = f"""
             Resumen de Actividad del Agente CV
@@ -595,7 +792,7 @@ class CVOrchestrator:
             )
             
             if success:
-                self.session_stats["emails_sent"] += 1
+                self._count_event("emails_sent")
             
             return success
             
@@ -5,15 +5,16 @@ Sistema de clasificación inteligente de consultas para determinar
 la mejor estrategia de respuesta y herramientas a utilizar.
 """
 
-import json
 from typing import Dict, Any, List, Optional, Tuple
 from dataclasses import dataclass
 from enum import Enum
-from openai import OpenAI
+
+from tools.tracing import traced
 
 from ..utils.config import AgentConfig
 from ..utils.logger import AgentLogger
 from ..utils.prompts import PromptManager, PromptType
+from ..utils.multi_llm_client import MultiLLMClient
 
 
 class QueryCategory(Enum):
@@ -89,6 +90,26 @@ class QueryClassification:
                 self.expected_complexity == ComplexityLevel.HIGH)
 
 
+# Schema de la respuesta de clasificación (response_format y validación)
+CLASSIFICATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "category": {"type": "string", "enum": [category.value for category in QueryCategory]},
+        "confidence": {"type": "number", "minimum": 0, "maximum": 100},
+        "recommended_tool": {"type": "string", "enum": [tool.value for tool in RecommendedTool]},
+        "reasoning": {"type": "string"},
+        "search_terms": {"type": "array", "items": {"type": "string"}},
+        "expected_complexity": {"type": "string", "enum": [level.value for level in ComplexityLevel]}
+    },
+    "required": ["category", "confidence", "recommended_tool", "reasoning",
+                 "search_terms", "expected_complexity"],
+    "additionalProperties": False
+}
+
+# Campos sin los que la clasificación no sirve para enrutar (el resto tiene default)
+CLASSIFICATION_REQUIRED = ["category", "recommended_tool"]
+
+
 class QueryClassifier:
     """Clasificador inteligente de consultas"""
     
@@ -104,20 +125,28 @@ class QueryClassifier:
         self.logger = logger or AgentLogger("query_classifier")
         self.prompt_manager = PromptManager()
         
-        # Cliente OpenAI
-        self.openai_client = OpenAI(api_key=config.openai.api_key)
+        # Cliente LLM (salida JSON estructurada según el proveedor)
+        self.llm_client = MultiLLMClient(config.openai, self.logger)
+        self.openai_client = self.llm_client.client
         
         # Estadísticas
         self.stats = {
             "total_classifications": 0,
             "successful_classifications": 0,
             "failed_classifications": 0,
+            "invalid_responses": 0,
+            "retried_responses": 0,
             "category_distribution": {cat.value: 0 for cat in QueryCategory},
             "tool_recommendations": {tool.value: 0 for tool in RecommendedTool}
         }
         
         self.logger.info("QueryClassifier initialized successfully")
     
+    @traced("classify", result_attributes=lambda c: {
+        "category": c.category.value,
+        "recommended_tool": c.recommended_tool.value,
+        "confidence": c.confidence
+    })
     def classify(self, query: str, context: Dict[str, Any] = None) -> QueryClassification:
         """
         Clasificar consulta
@@ -138,28 +167,26 @@ class QueryClassifier:
             # Generar prompt de clasificación
             classification_prompt = self.prompt_manager.format_classification_prompt(query)
             
-            # Llamada a OpenAI
-            response = self.openai_client.chat.completions.create(
-                model=self.config.openai.model,
+            # Llamada al LLM con salida JSON validada (reintento limitado si no es válida)
+            result = self.llm_client.generate_json(
                 messages=[
                     {"role": "system", "content": "Eres un clasificador experto de consultas sobre CV profesional."},
                     {"role": "user", "content": classification_prompt}
                 ],
+                schema=CLASSIFICATION_SCHEMA,
+                name="classification",
                 temperature=0.3,  # Baja temperatura para consistencia
-                max_tokens=500
+                max_tokens=500,
+                required=CLASSIFICATION_REQUIRED
             )
-            
-            # Parsear respuesta
-            response_text = response.choices[0].message.content.strip()
-            
-            try:
-                classification_data = json.loads(response_text)
-            except json.JSONDecodeError:
-                # Intentar extraer JSON de la respuesta
-                classification_data = self._extract_json_from_response(response_text)
+            if result.attempts > 1:
+                self.stats["retried_responses"] += 1
+            if not result.ok:
+                self.stats["invalid_responses"] += 1
+                raise ValueError(f"Clasificación no válida tras {result.attempts} intentos: {result.errors[:3]}")
             
             # Crear clasificación
-            classification = QueryClassification.from_dict(classification_data)
+            classification = QueryClassification.from_dict(result.data)
             
             # Aplicar reglas de negocio
             classification = self._apply_business_rules(classification, query, context)
@@ -184,31 +211,6 @@ class QueryClassifier:
             # Clasificación por defecto en caso de error
             return self._get_default_classification(query)
     
-    def _extract_json_from_response(self, response_text: str) -> Dict[str, Any]:
-        """Extraer JSON de respuesta que puede contener texto adicional"""
-        try:
-            # Buscar JSON en la respuesta
-            start_idx = response_text.find('{')
-            end_idx = response_text.rfind('}') + 1
-            
-            if start_idx != -1 and end_idx != -1:
-                json_str = response_text[start_idx:end_idx]
-                return json.loads(json_str)
-            else:
-                raise ValueError("No JSON found in response")
-                
-        except Exception as e:
-            self.logger.warning(f"Failed to extract JSON from response: {e}")
-            # Clasificación básica por defecto
-            return {
-                "category": "COMPLEX",
-                "confidence": 50,
-                "recommended_tool": "COMBINED",
-                "reasoning": "Error parsing classification response",
-                "search_terms": [query],
-                "expected_complexity": "MEDIUM"
-            }
-    
     def _apply_business_rules(self, classification: QueryClassification, 
                             query: str, context: Dict[str, Any]) -> QueryClassification:
         """Aplicar reglas de negocio para mejorar la clasificación"""
@@ -280,7 +282,8 @@ class QueryClassifier:
         
         return {
             **self.stats,
-            "success_rate": round(success_rate, 2)
+            "success_rate": round(success_rate, 2),
+            "structured_output": self.llm_client.structured_output.get_stats()
         }
     
     def batch_classify(self, queries: List[str]) -> List[QueryClassification]:
@@ -303,6 +306,8 @@ class QueryClassifier:
             "total_classifications": 0,
             "successful_classifications": 0,
             "failed_classifications": 0,
+            "invalid_responses": 0,
+            "retried_responses": 0,
             "category_distribution": {cat.value: 0 for cat in QueryCategory},
             "tool_recommendations": {tool.value: 0 for tool in RecommendedTool}
         }
@@ -5,16 +5,18 @@ Sistema de evaluación inteligente de respuestas para medir calidad,
 precisión y completitud de las respuestas del agente de CV.
 """
 
-import json
 import time
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple, Callable
 from dataclasses import dataclass
 from enum import Enum
-from openai import OpenAI
+
+from tools.tracing import traced
 
 from ..utils.config import AgentConfig
 from ..utils.logger import AgentLogger
 from ..utils.prompts import PromptManager, PromptType
+from ..utils.multi_llm_client import MultiLLMClient
+from .local_evaluator import LocalEvaluator
 
 
 class EvaluationCriteria(Enum):
@@ -81,6 +83,7 @@ class EvaluationResult:
     strengths: List[str]
     weaknesses: List[str]
     suggestions: List[str]
+    evaluator: str = "llm"           # llm o local
     
     def __post_init__(self):
         """Validación post-inicialización"""
@@ -104,7 +107,8 @@ class EvaluationResult:
             confidence=float(data.get("confidence", 50)),
             strengths=data.get("strengths", []),
             weaknesses=data.get("weaknesses", []),
-            suggestions=data.get("suggestions", [])
+            suggestions=data.get("suggestions", []),
+            evaluator=data.get("evaluator", "llm")
         )
     
     def to_dict(self) -> Dict[str, Any]:
@@ -115,7 +119,8 @@ class EvaluationResult:
             "confidence": self.confidence,
             "strengths": self.strengths,
             "weaknesses": self.weaknesses,
-            "suggestions": self.suggestions
+            "suggestions": self.suggestions,
+            "evaluator": self.evaluator
         }
     
     def is_high_quality(self, threshold: float = 7.0) -> bool:
@@ -130,29 +135,68 @@ class EvaluationResult:
         return f"Calidad: {quality} (Score: {score:.1f}/10, Confianza: {self.confidence:.0f}%)"
 
 
+_SCORE = {"type": "number", "minimum": 0, "maximum": 10}
+_TEXT_LIST = {"type": "array", "items": {"type": "string"}}
+
+# Schema de la respuesta de evaluación (response_format y validación)
+EVALUATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "overall_score": _SCORE,
+        "scores": {
+            "type": "object",
+            "properties": {criterion.value: _SCORE for criterion in EvaluationCriteria},
+            "required": [criterion.value for criterion in EvaluationCriteria],
+            "additionalProperties": False
+        },
+        "confidence": {"type": "number", "minimum": 0, "maximum": 100},
+        "strengths": _TEXT_LIST,
+        "weaknesses": _TEXT_LIST,
+        "suggestions": _TEXT_LIST
+    },
+    "required": ["overall_score", "scores", "confidence", "strengths", "weaknesses", "suggestions"],
+    "additionalProperties": False
+}
+
+# Campos sin los que la evaluación no aporta nada (el resto tiene default)
+EVALUATION_REQUIRED = ["scores"]
+
+
 class ResponseEvaluator:
     """Evaluador inteligente de respuestas"""
     
-    def __init__(self, config: AgentConfig, logger: AgentLogger = None):
+    def __init__(self, config: AgentConfig, logger: AgentLogger = None,
+                 encoder: Optional[Callable[[List[str]], Any]] = None):
         """
         Inicializar evaluador
         
         Args:
             config: Configuración del agente
             logger: Logger para registrar actividad
+            encoder: Modelo de embeddings para la evaluación local (p. ej. el
+                del retriever); sin él la evaluación local usa solapamiento léxico
         """
         self.config = config
         self.logger = logger or AgentLogger("response_evaluator")
         self.prompt_manager = PromptManager()
         
-        # Cliente OpenAI
-        self.openai_client = OpenAI(api_key=config.openai.api_key)
+        # Cliente LLM (salida JSON estructurada según el proveedor)
+        self.llm_client = MultiLLMClient(config.openai, self.logger)
+        self.openai_client = self.llm_client.client
+        
+        # Evaluación local: modo local (solo local) o hybrid (LLM solo en casos dudosos)
+        self.mode = config.evaluation_mode
+        self.local_evaluator = LocalEvaluator(encoder)
         
         # Estadísticas
         self.stats = {
             "total_evaluations": 0,
             "successful_evaluations": 0,
             "failed_evaluations": 0,
+            "invalid_responses": 0,
+            "retried_responses": 0,
+            "local_evaluations": 0,
+            "escalations": 0,
             "average_score": 0.0,
             "high_quality_responses": 0,
             "score_distribution": {
@@ -165,6 +209,11 @@ class ResponseEvaluator:
         
         self.logger.info("ResponseEvaluator initialized successfully")
     
+    @traced("evaluate", result_attributes=lambda r: {
+        "overall_score": round(r.scores.overall_score, 2),
+        "confidence": r.confidence,
+        "evaluator": r.evaluator
+    })
     def evaluate_response(self, 
                          query: str, 
                          response: str, 
@@ -184,6 +233,24 @@ class ResponseEvaluator:
         """
         start_time = time.time()
         metadata = metadata or {}
+        local_result = None
+        
+        # Evaluación local: en modo hybrid solo se consulta al LLM si la
+        # puntuación queda cerca del umbral de calidad
+        if self.mode in ("local", "hybrid"):
+            local_result = self._evaluate_locally(query, response, context, metadata)
+            margin = abs(local_result.scores.overall_score - self.config.evaluation_min_score)
+            if self.mode == "local" or margin >= self.config.evaluation_escalation_margin:
+                self.stats["local_evaluations"] += 1
+                self._update_stats(local_result, True)
+                self.logger.log_tool_usage(
+                    "response_evaluation",
+                    {"score": local_result.scores.overall_score, "evaluator": "local"},
+                    True,
+                    time.time() - start_time
+                )
+                return local_result
+            self.stats["escalations"] += 1
         
         try:
             self.logger.debug(f"Evaluating response for query: {query[:100]}...")
@@ -195,28 +262,26 @@ class ResponseEvaluator:
                 context=context
             )
             
-            # Llamada a OpenAI
-            response_obj = self.openai_client.chat.completions.create(
-                model=self.config.openai.model,
+            # Llamada al LLM con salida JSON validada (reintento limitado si no es válida)
+            result = self.llm_client.generate_json(
                 messages=[
                     {"role": "system", "content": "Eres un evaluador experto de respuestas sobre CV profesional."},
                     {"role": "user", "content": evaluation_prompt}
                 ],
+                schema=EVALUATION_SCHEMA,
+                name="evaluation",
                 temperature=0.2,  # Baja temperatura para consistencia
-                max_tokens=800
+                max_tokens=800,
+                required=EVALUATION_REQUIRED
             )
-            
-            # Parsear respuesta
-            response_text = response_obj.choices[0].message.content.strip()
-            
-            try:
-                evaluation_data = json.loads(response_text)
-            except json.JSONDecodeError:
-                # Intentar extraer JSON de la respuesta
-                evaluation_data = self._extract_json_from_response(response_text)
+            if result.attempts > 1:
+                self.stats["retried_responses"] += 1
+            if not result.ok:
+                self.stats["invalid_responses"] += 1
+                raise ValueError(f"Evaluación no válida tras {result.attempts} intentos: {result.errors[:3]}")
             
             # Crear resultado de evaluación
-            evaluation_result = EvaluationResult.from_dict(evaluation_data)
+            evaluation_result = EvaluationResult.from_dict(result.data)
             
             # Aplicar reglas de validación
             evaluation_result = self._apply_validation_rules(
@@ -240,39 +305,19 @@ class ResponseEvaluator:
             self.logger.error("Error in response evaluation", exception=e)
             self._update_stats(success=False)
             
-            # Evaluación por defecto en caso de error
+            # Si ya hay evaluación local se usa en lugar de la evaluación por defecto
+            if local_result is not None:
+                return local_result
             return self._get_default_evaluation()
     
-    def _extract_json_from_response(self, response_text: str) -> Dict[str, Any]:
-        """Extraer JSON de respuesta que puede contener texto adicional"""
-        try:
-            # Buscar JSON en la respuesta
-            start_idx = response_text.find('{')
-            end_idx = response_text.rfind('}') + 1
-            
-            if start_idx != -1 and end_idx != -1:
-                json_str = response_text[start_idx:end_idx]
-                return json.loads(json_str)
-            else:
-                raise ValueError("No JSON found in response")
-                
-        except Exception as e:
-            self.logger.warning(f"Failed to extract JSON from response: {e}")
-            # Evaluación básica por defecto
-            return {
-                "overall_score": 6.0,
-                "scores": {
-                    "precision": 6.0,
-                    "completeness": 6.0,
-                    "relevance": 6.0,
-                    "clarity": 6.0,
-                    "professionalism": 6.0
-                },
-                "confidence": 60,
-                "strengths": ["Response provided"],
-                "weaknesses": ["Unable to properly evaluate"],
-                "suggestions": ["Improve evaluation system"]
-            }
+    @traced("evaluate_local")
+    def _evaluate_locally(self, query: str, response: str, context: str,
+                          metadata: Dict[str, Any]) -> EvaluationResult:
+        """Evaluación sin llamada al LLM (embeddings y estadísticas de texto)"""
+        data = self.local_evaluator.evaluate(
+            query, response, context, metadata, threshold=self.config.evaluation_min_score
+        )
+        return EvaluationResult.from_dict({**data, "evaluator": "local"})
     
     def _apply_validation_rules(self, 
                               evaluation: EvaluationResult,
@@ -477,7 +522,10 @@ class ResponseEvaluator:
         return {
             **self.stats,
             "success_rate": round(success_rate, 2),
-            "quality_rate": round(quality_rate, 2)
+            "quality_rate": round(quality_rate, 2),
+            "evaluation_mode": self.mode,
+            "local_method": self.local_evaluator.method,
+            "structured_output": self.llm_client.structured_output.get_stats()
         }
     
     def reset_stats(self):
@@ -486,6 +534,10 @@ class ResponseEvaluator:
             "total_evaluations": 0,
             "successful_evaluations": 0,
             "failed_evaluations": 0,
+            "invalid_responses": 0,
+            "retried_responses": 0,
+            "local_evaluations": 0,
+            "escalations": 0,
             "average_score": 0.0,
             "high_quality_responses": 0,
             "score_distribution": {
@@ -6,7 +6,6 @@ resúmenes de consultas y respuestas del agente de CV.
 """
 
 import os
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from typing import Dict, Any, Optional
@@ -14,6 +13,8 @@ import logging
 from datetime import datetime
 from dotenv import load_dotenv
 
+from tools.email_outbox import EmailOutbox, SMTPSettings
+
 load_dotenv()
 logger = logging.getLogger(__name__)
 
@@ -36,9 +37,17 @@ class EmailAgent:
         self.stats = {
             "emails_sent": 0,
             "emails_failed": 0,
+            "emails_queued": 0,
             "last_email_sent": None
         }
         
+        # Outbox persistente: el envío SMTP ocurre en background
+        self.outbox = EmailOutbox(
+            SMTPSettings.from_env(),
+            name="legacy_email_agent",
+            on_result=self._on_delivery
+        )
+        
         # Verificar configuración
         self._verify_config()
     
@@ -107,24 +116,19 @@ class EmailAgent:
             message.attach(text_part)
             message.attach(html_part)
             
-            # Enviar email
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.smtp_username, self.smtp_password)
-                server.send_message(message)
-            
-            # Actualizar estadísticas
-            self.stats["emails_sent"] += 1
-            self.stats["last_email_sent"] = datetime.now().isoformat()
+            # Encolar en la outbox (el envío se hace en background)
+            outbox_id = self.outbox.enqueue(message, to, self.from_email)
+            self.stats["emails_queued"] += 1
             
-            logger.info(f"Email enviado exitosamente a {to}")
+            logger.info(f"Email encolado para {to} (outbox {outbox_id})")
             
             return {
                 "success": True,
+                "queued": True,
                 "recipient": to,
                 "subject": subject,
-                "sent_at": self.stats["last_email_sent"],
-                "message_id": f"cv-agent-{datetime.now().timestamp()}",
+                "sent_at": datetime.now().isoformat(),
+                "message_id": f"cv-agent-outbox-{outbox_id}",
                 "metadata": metadata or {}
             }
             
@@ -300,6 +304,15 @@ class EmailAgent:
         
         return text
     
+    def _on_delivery(self, outbox_id: int, success: bool, error: Optional[str]) -> None:
+        """Actualizar estadísticas cuando la outbox entrega o descarta un email"""
+        if success:
+            self.stats["emails_sent"] += 1
+            self.stats["last_email_sent"] = datetime.now().isoformat()
+        else:
+            self.stats["emails_failed"] += 1
+            logger.error(f"Email {outbox_id} no entregado: {error}")
+    
     def get_stats(self) -> Dict[str, Any]:
         """Obtener estadísticas del agente de email"""
         total_attempts = self.stats["emails_sent"] + self.stats["emails_failed"]
@@ -309,7 +322,8 @@ class EmailAgent:
             **self.stats,
             "total_attempts": total_attempts,
             "success_rate": round(success_rate, 2),
-            "config_valid": self._verify_config()
+            "config_valid": self._verify_config(),
+            "outbox": self.outbox.get_stats()
         }
 
 # Instancia global
@@ -7,24 +7,50 @@ los resultados para proporcionar respuestas completas e inteligentes.
 
 import os
 import json
-from typing import Dict, Any, List, Optional, Tuple
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional, Tuple, Iterator
 import logging
 from datetime import datetime
 from dotenv import load_dotenv
 
 # Imports de los módulos locales
-from rag.retriever import SemanticRetriever
+from rag.retriever import SemanticRetriever, SearchResult
+from rag.extractive import ExtractiveAnswerer
 from tools.faq_sql import FAQSQLTool
 from tools.notify import NotificationManager
+from tools.tool_schemas import (
+    get_all_tool_schemas,
+    RAGSearchParams,
+    FAQQueryParams,
+    CombinedSearchParams
+)
 from agent.prompts import (
     format_system_prompt,
     format_planning_prompt,
     format_classification_prompt,
+    format_batch_classification_prompt,
+    format_tool_calling_prompt,
     format_error_response,
-    format_no_results_response
+    format_no_results_response,
+    format_extractive_response,
+    format_extractive_polish_prompt,
+    format_history_summary_prompt
 )
 from agent.clarifier import ClarifierAgent
 from agent.email_agent import EmailAgent
+from agent.utils.context_packer import ContextPacker
+from agent.utils.structured_output import StructuredOutput
+from agent.utils.session_memory import SessionMemory, SessionTurn
+from tools.tracing import traced, current_span, record_llm_usage
+from tools.metrics import metrics
+from tools.ring_log import RingLog
+from tools.state_backend import SharedCache, get_state_backend
+from tools.single_flight import SingleFlight
+from tools.speculative import SpeculativeRetrieval, Speculation
+from tools.deadline import Deadline, DeadlineExceeded, deadline_scope, current_deadline, bounded_call
+from tools.circuit_breaker import CircuitBreaker
 
 # Para LLM
 from openai import OpenAI
@@ -34,6 +60,34 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# Eventos contados en metrics.orchestrator_events que expone get_session_stats
+SESSION_EVENTS = (
+    "total_queries", "rag_searches", "faq_queries", "combined_searches", "errors",
+    "cache_hits", "coalesced_requests", "degraded_answers", "extractive_answers"
+)
+
+# Herramientas que el modelo puede invocar en modo tool calling (solo lectura)
+TOOL_CALLING_TOOLS = ("rag_search", "faq_query", "combined_search")
+
+# Schema de la respuesta de clasificación (response_format y validación)
+CLASSIFICATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "category": {"type": "string", "enum": [
+            "BASIC_INFO", "EXPERIENCE", "SKILLS", "PROJECTS", "EDUCATION",
+            "ACHIEVEMENTS", "METHODOLOGY", "INDUSTRY", "PERSONAL", "COMPLEX"
+        ]},
+        "confidence": {"type": "number", "minimum": 0, "maximum": 100},
+        "recommended_tool": {"type": "string", "enum": ["FAQ_ONLY", "RAG_ONLY", "COMBINED", "NOTIFICATION"]},
+        "reasoning": {"type": "string"},
+        "search_terms": {"type": "array", "items": {"type": "string"}},
+        "expected_complexity": {"type": "string", "enum": ["LOW", "MEDIUM", "HIGH"]}
+    },
+    "required": ["category", "confidence", "recommended_tool", "reasoning",
+                 "search_terms", "expected_complexity"],
+    "additionalProperties": False
+}
+
 class QueryClassification:
     """Resultado de clasificación de consulta"""
     def __init__(self, data: Dict[str, Any]):
@@ -59,9 +113,16 @@ class CVOrchestrator:
         
         # Cliente OpenAI inicializado arriba
         
+        # Empaquetador de contexto con presupuesto de tokens
+        self.context_packer = ContextPacker()
+        
+        # Salidas JSON de clasificación (response_format nativo según el proveedor)
+        self.structured_output = StructuredOutput(os.getenv("LLM_PROVIDER", "openai"))
+        
         # Inicializar herramientas
         try:
             self.retriever = SemanticRetriever()
+            self.extractive = ExtractiveAnswerer(self.retriever)
             self.faq_tool = FAQSQLTool()
             self.notification_manager = NotificationManager()
             
@@ -74,17 +135,77 @@ class CVOrchestrator:
             logger.error(f"Error inicializando herramientas: {e}")
             raise
         
-        # Stats y logs
-        self.query_log = []
-        self.session_stats = {
-            "total_queries": 0,
-            "rag_searches": 0,
-            "faq_queries": 0,
-            "combined_searches": 0,
-            "errors": 0,
-            "start_time": datetime.now()
-        }
+        # Caché de respuestas compartida entre workers/réplicas
+        self.answer_cache = SharedCache(
+            get_state_backend(), "answer", ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+        )
+        
+        # Consultas idénticas concurrentes comparten una única ejecución
+        self.single_flight = SingleFlight.from_env("process_query")
+        
+        # Búsquedas RAG y FAQ lanzadas en paralelo con la clasificación
+        self.speculative = SpeculativeRetrieval.from_env("process_query")
+        
+        # Con el proveedor LLM caído o lento se responde en modo degradado
+        # (FAQ o fragmentos de los documentos, sin LLM)
+        self.llm_circuit = CircuitBreaker.from_env("llm")
+        self.degraded_faq_min_confidence = float(os.getenv("DEGRADED_FAQ_MIN_CONFIDENCE", "0.5"))
+        
+        # Consultas factuales simples respondidas con fragmentos del CV; con
+        # EXTRACTIVE_POLISH el LLM reescribe la respuesta (sin buscar ni clasificar)
+        self.extractive_polish = os.getenv("EXTRACTIVE_POLISH", "false").lower() == "true"
+        
+        # Memoria por session_id: historial resumido dentro de un presupuesto de
+        # tokens y fragmentos ya recuperados para las consultas de seguimiento
+        self.session_memory = SessionMemory.from_env(self.context_packer.counter, self._summarize_history)
+        
+        # Modo de orquestación: "classify" (clasificación LLM y después búsqueda)
+        # o "tools" (el modelo elige las búsquedas por tool calling)
+        self.orchestration_mode = os.getenv("ORCHESTRATION_MODE", "classify").lower()
+        self.tool_schemas = [
+            schema for schema in get_all_tool_schemas()
+            if schema["function"]["name"] in TOOL_CALLING_TOOLS
+        ]
+        self.max_tool_calls = int(os.getenv("TOOL_CALLING_MAX_CALLS", "4"))
+        
+        # Stats y logs (buffer circular de capacidad fija)
+        self.query_log = RingLog.from_env(
+            "query_log",
+            fields=("timestamp", "session_id", "query", "classification", "processing_time",
+                    "context_length", "response_length", "error", "success")
+        )
+        # Los contadores de sesión viven en el registro de métricas (agregado entre workers)
+        self.start_time = datetime.now()
+    
+    def _count_event(self, event: str, amount: int = 1) -> None:
+        """Contar un evento del orquestador (alimenta /stats y /metrics)"""
+        metrics.inc(metrics.orchestrator_events, amount, event=event)
+    
+    def _chat_completion(self, stage: str, **kwargs: Any):
+        """
+        Llamada al LLM limitada al deadline de la etapa; el resultado (error,
+        latencia) alimenta el circuit breaker del proveedor, que descarta los
+        timeouts del deadline (DeadlineExceeded) más cortos que su umbral de lentitud
+        """
+        start = time.monotonic()
+        try:
+            with bounded_call(self.openai_client, stage) as client:
+                response = client.chat.completions.create(
+                    model=self.openai_model,
+                    **kwargs
+                )
+        except Exception as e:
+            self.llm_circuit.record_error(e, time.monotonic() - start)
+            raise
+        self.llm_circuit.record_success(time.monotonic() - start)
+        record_llm_usage(response)
+        return response
     
+    @traced("classify", result_attributes=lambda c: {
+        "category": c.category,
+        "recommended_tool": c.recommended_tool,
+        "confidence": c.confidence
+    })
     def classify_query(self, query: str) -> QueryClassification:
         """
         Clasificar consulta para determinar estrategia de respuesta
@@ -98,56 +219,120 @@ class CVOrchestrator:
         try:
             classification_prompt = format_classification_prompt(query)
             
-            response = self.openai_client.chat.completions.create(
-                model=self.openai_model,
-                messages=[
+            def call(messages: List[Dict[str, str]], response_format: Optional[Dict[str, Any]]):
+                kwargs = {"response_format": response_format} if response_format else {}
+                response = self._chat_completion(
+                    "classification",
+                    messages=messages,
+                    temperature=0.1,
+                    max_tokens=500,
+                    **kwargs
+                )
+                return response.choices[0].message.content, response.choices[0].finish_reason
+            
+            # JSON validado contra el schema, con reintento limitado si no es válido
+            result = self.structured_output.request(
+                call,
+                [
                     {"role": "system", "content": classification_prompt},
                     {"role": "user", "content": f"Clasifica esta consulta: {query}"}
                 ],
-                temperature=0.1,
-                max_tokens=500
+                CLASSIFICATION_SCHEMA,
+                "classification",
+                required=["category", "recommended_tool"]
             )
+            if result.ok:
+                return QueryClassification(result.data)
             
-            # Parsear respuesta JSON
-            content = response.choices[0].message.content
-            
-            # Extraer JSON de la respuesta
-            json_start = content.find('{')
-            json_end = content.rfind('}') + 1
-            
-            if json_start >= 0 and json_end > json_start:
-                json_str = content[json_start:json_end]
-                classification_data = json.loads(json_str)
-                return QueryClassification(classification_data)
-            else:
-                logger.warning("No se pudo parsear clasificación, usando default")
-                return QueryClassification({})
+            logger.warning("No se pudo parsear clasificación, usando default")
+            return QueryClassification({})
                 
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"Error en clasificación de consulta: {e}")
             return QueryClassification({})
     
+    @traced("classify_batch", result_attributes=lambda c: {"queries": len(c)})
+    def classify_queries(self, queries: List[str]) -> List[QueryClassification]:
+        """
+        Clasificar varias consultas con una llamada al LLM por bloque
+        
+        Args:
+            queries: Consultas del usuario
+            
+        Returns:
+            Clasificaciones en el mismo orden (las que el LLM no devuelva
+            se clasifican individualmente)
+        """
+        chunk_size = int(os.getenv("BATCH_CLASSIFY_SIZE", "20"))
+        classifications: List[Optional[QueryClassification]] = [None] * len(queries)
+        
+        for offset in range(0, len(queries), chunk_size):
+            chunk = queries[offset:offset + chunk_size]
+            try:
+                response = self._chat_completion(
+                    "classification",
+                    messages=[
+                        {"role": "system", "content": format_batch_classification_prompt(chunk)},
+                        {"role": "user", "content": f"Clasifica estas {len(chunk)} consultas"}
+                    ],
+                    temperature=0.1,
+                    max_tokens=min(4000, 150 * len(chunk) + 200)
+                )
+                
+                # Extraer la lista JSON de la respuesta
+                content = response.choices[0].message.content
+                items = json.loads(content[content.find('['):content.rfind(']') + 1])
+                for position, item in enumerate(items):
+                    index = int(item.get("index", position + 1)) - 1
+                    if 0 <= index < len(chunk):
+                        classifications[offset + index] = QueryClassification(item)
+                        
+            except Exception as e:
+                logger.warning(f"Error en clasificación por lotes, clasificando individualmente: {e}")
+        
+        return [
+            classification if classification is not None else self.classify_query(queries[i])
+            for i, classification in enumerate(classifications)
+        ]
+    
     def search_rag(
         self,
         query: str,
         top_k: int = 5,
-        document_type: Optional[str] = None
+        document_type: Optional[str] = None,
+        speculation: Optional[Speculation] = None,
+        reuse: Optional[List[Any]] = None
     ) -> Dict[str, Any]:
-        """Realizar búsqueda RAG"""
+        """
+        Realizar búsqueda RAG (reutiliza la búsqueda especulativa si la hay)
+        
+        Con reuse (fragmentos ya recuperados en la sesión) no se busca si
+        cubren los top_k pedidos.
+        """
         try:
-            results = self.retriever.search(
-                query=query,
-                top_k=top_k,
-                filter_metadata={"type": document_type} if document_type else None
-            )
+            reused = reuse is not None and not document_type and len(reuse) >= top_k
+            if reused:
+                results = list(reuse[:top_k])
+                self.session_memory.record_reuse()
+            else:
+                results = speculation.take("rag", top_k) if speculation and not document_type else None
+            if results is None:
+                results = self.retriever.search(
+                    query=query,
+                    top_k=top_k,
+                    filter_metadata={"type": document_type} if document_type else None
+                )
             
-            self.session_stats["rag_searches"] += 1
+            self._count_event("rag_searches")
             
             return {
                 "success": True,
                 "results": results,
                 "total_found": len(results),
-                "formatted_context": self.retriever.format_results_for_context(results)
+                "formatted_context": self.context_packer.pack(results).text,
+                "reused": reused
             }
             
         except Exception as e:
@@ -164,17 +349,22 @@ class CVOrchestrator:
         self,
         query: str,
         category: Optional[str] = None,
-        limit: int = 5
+        limit: int = 5,
+        speculation: Optional[Speculation] = None
     ) -> Dict[str, Any]:
-        """Realizar búsqueda FAQ"""
+        """Realizar búsqueda FAQ (reutiliza la búsqueda especulativa si la hay)"""
         try:
-            results = self.faq_tool.search_faqs(
-                query=query,
-                category=category,
-                limit=limit
-            )
+            results = speculation.take("faq", limit) if speculation and not category else None
+            if results is None:
+                results = self.faq_tool.search_faqs(
+                    query=query,
+                    category=category,
+                    limit=limit
+                )
+            else:
+                self.faq_tool.record_analytics(query, results)
             
-            self.session_stats["faq_queries"] += 1
+            self._count_event("faq_queries")
             
             return {
                 "success": True,
@@ -198,7 +388,9 @@ class CVOrchestrator:
         query: str,
         include_rag: bool = True,
         include_faq: bool = True,
-        merge_strategy: str = "relevance"
+        merge_strategy: str = "relevance",
+        speculation: Optional[Speculation] = None,
+        reuse: Optional[List[Any]] = None
     ) -> Dict[str, Any]:
         """Realizar búsqueda combinada RAG + FAQ"""
         try:
@@ -211,14 +403,14 @@ class CVOrchestrator:
             
             # Búsqueda RAG
             if include_rag:
-                rag_results = self.search_rag(query, top_k=3)
+                rag_results = self.search_rag(query, top_k=3, speculation=speculation, reuse=reuse)
                 results["rag_results"] = rag_results
                 if rag_results["success"]:
                     results["total_sources"] += rag_results["total_found"]
             
             # Búsqueda FAQ
             if include_faq:
-                faq_results = self.search_faq(query, limit=3)
+                faq_results = self.search_faq(query, limit=3, speculation=speculation)
                 results["faq_results"] = faq_results
                 if faq_results["success"]:
                     results["total_sources"] += faq_results["total_found"]
@@ -230,7 +422,7 @@ class CVOrchestrator:
                 merge_strategy
             )
             
-            self.session_stats["combined_searches"] += 1
+            self._count_event("combined_searches")
             
             return {
                 "success": True,
@@ -336,37 +528,18 @@ class CVOrchestrator:
         combined_content = []
         
         if strategy == "relevance":
-            # Priorizar por relevancia/score
+            # Priorizar por relevancia/score dentro del presupuesto de tokens
             all_results = []
             
             if rag_results and rag_results.get("success") and rag_results["results"]:
-                for result in rag_results["results"][:2]:  # Top 2 RAG
-                    all_results.append({
-                        "content": result.content,
-                        "score": result.score,
-                        "type": "RAG",
-                        "source": result.metadata.get("filename", "Unknown")
-                    })
+                all_results.extend(rag_results["results"])
             
             if faq_results and faq_results.get("success") and faq_results["results"]:
-                for result in faq_results["results"][:2]:  # Top 2 FAQ
-                    all_results.append({
-                        "content": f"Q: {result.question}\nA: {result.answer}",
-                        "score": result.confidence,
-                        "type": "FAQ",
-                        "source": result.category
-                    })
-            
-            # Ordenar por score y tomar los mejores
-            all_results.sort(key=lambda x: x["score"], reverse=True)
-            
-            for i, result in enumerate(all_results[:3], 1):
-                combined_content.append(
-                    f"=== Fuente {i} ({result['type']}) ===\n"
-                    f"Score: {result['score']:.2f}\n"
-                    f"Origen: {result['source']}\n\n"
-                    f"{result['content']}\n"
-                )
+                all_results.extend(faq_results["results"][:2])  # Top 2 FAQ
+            
+            packed = self.context_packer.pack(all_results)
+            if packed.text:
+                combined_content.append(packed.text)
         
         elif strategy == "type":
             # Separar por tipo
@@ -418,21 +591,20 @@ class CVOrchestrator:
         formatted = []
         for i, result in enumerate(results, 1):
             formatted.append(
-                f"--- FAQ {i} ---\n"
-                f"Categoría: {result.category}\n"
-                f"Confianza: {result.confidence:.2f}\n"
-                f"Pregunta: {result.question}\n"
-                f"Respuesta: {result.answer}\n"
-                f"{'='*50}\n"
+                f"[{i}] FAQ {result.category} ({result.confidence:.2f})\n"
+                f"P: {result.question}\n"
+                f"R: {result.answer}"
             )
         
         return "\n".join(formatted)
     
+    @traced("llm_generate")
     def generate_response(
         self,
         query: str,
         context: str,
-        classification: Optional[QueryClassification] = None
+        classification: Optional[QueryClassification] = None,
+        history: str = ""
     ) -> str:
         """
         Generar respuesta final usando LLM con contexto
@@ -441,6 +613,7 @@ class CVOrchestrator:
             query: Consulta del usuario
             context: Contexto obtenido de las herramientas
             classification: Clasificación de la consulta
+            history: Historial de la sesión (ya dentro de su presupuesto de tokens)
         """
         try:
             system_prompt = format_system_prompt(include_tools=False)
@@ -452,6 +625,9 @@ class CVOrchestrator:
                 system_prompt += f"Complejidad: {classification.expected_complexity}\n"
                 system_prompt += f"Razonamiento: {classification.reasoning}\n"
             
+            # Limitar el contexto al presupuesto de tokens configurado
+            context = self.context_packer.fit(context)
+            
             user_message = f"""
 Consulta del usuario: {query}
 
@@ -460,9 +636,15 @@ Contexto disponible:
 
 Por favor, proporciona una respuesta completa, precisa y profesional basada únicamente en el contexto proporcionado.
             """.strip()
+            if history:
+                user_message = f"Conversación previa (para interpretar la consulta):\n{history}\n\n{user_message}"
+            
+            prompt_tokens = self.context_packer.counter.count(system_prompt) + \
+                self.context_packer.counter.count(user_message)
+            logger.info(f"Prompt tokens: {prompt_tokens}")
             
-            response = self.openai_client.chat.completions.create(
-                model=self.openai_model,
+            response = self._chat_completion(
+                "generation",
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_message}
@@ -473,6 +655,8 @@ Por favor, proporciona una respuesta completa, precisa y profesional basada úni
             
             return response.choices[0].message.content
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"Error generando respuesta LLM: {e}")
             return format_error_response("LLM Error", str(e))
@@ -525,11 +709,14 @@ Por favor, proporciona una respuesta completa, precisa y profesional basada úni
                 "needs_clarification": False
             }
 
+    @traced("process_query")
     def process_query(
         self,
         query: str,
         session_id: str = "anonymous",
-        notify_important: bool = True
+        notify_important: bool = True,
+        deadline: Optional[Deadline] = None,
+        degraded: bool = False
     ) -> Dict[str, Any]:
         """
         Procesar consulta completa del usuario
@@ -538,58 +725,99 @@ Por favor, proporciona una respuesta completa, precisa y profesional basada úni
             query: Consulta del usuario
             session_id: ID de sesión del usuario
             notify_important: Si enviar notificaciones para consultas importantes
+            deadline: Deadline de la petición; las etapas y llamadas LLM se
+                limitan a su presupuesto y se detienen si se cancela
+            degraded: Responder sin LLM (FAQ o fragmentos de los documentos),
+                p. ej. con el servicio sobrecargado. También se activa solo
+                con el circuit breaker del proveedor abierto
             
         Returns:
             Respuesta completa con metadata
+        
+        Raises:
+            DeadlineExceeded: Si el deadline se agota o se cancela antes de terminar
         """
         start_time = datetime.now()
-        self.session_stats["total_queries"] += 1
+        self._count_event("total_queries")
+        
+        # Historial de la sesión; un seguimiento depende de él, así que no se
+        # sirve desde la caché ni se comparte con la misma consulta de otra sesión
+        turn = self.session_memory.begin(session_id, query)
+        follow_up = turn is not None and turn.follow_up
         
+        # 0. Respuesta ya generada para la misma consulta
+        cache_key = self._answer_cache_key(query)
+        cached = self.answer_cache.get(cache_key) if not follow_up else None
+        current_span().record_cache(cached is not None)
+        if cached is not None:
+            result = self._cached_response(cached, session_id, start_time)
+            self.session_memory.record(turn, result["response"])
+            return result
+        
+        with deadline_scope(deadline or current_deadline()):
+            # Consultas idénticas en curso esperan a la misma ejecución
+            flight_key = SharedCache.query_key(query, notify_important, degraded, session_id if follow_up else "")
+            execute = lambda: self._execute_query(
+                query, session_id, notify_important, start_time, cache_key, degraded, turn
+            )
+            try:
+                result, shared = self.single_flight.do(flight_key, execute)
+            except DeadlineExceeded:
+                # La ejecución compartida era de otra petición (desconectada o
+                # sin tiempo): esta la repite si aún tiene presupuesto
+                own = current_deadline()
+                if own is None or own.done:
+                    raise
+                result, shared = execute(), False
+        
+        if shared:
+            result = self._coalesced_response(result, session_id, start_time)
+        if result and result.get("success"):
+            self.session_memory.record(turn, result["response"])
+        return result
+    
+    def _execute_query(
+        self,
+        query: str,
+        session_id: str,
+        notify_important: bool,
+        start_time: datetime,
+        cache_key: str,
+        degraded: bool = False,
+        turn: Optional[SessionTurn] = None
+    ) -> Dict[str, Any]:
+        """Ejecutar el pipeline completo (buscar y generar) para una consulta"""
         try:
-            # 1. Clasificar consulta
+            # 1-4. Elegir herramientas, buscar y generar la respuesta
             logger.info(f"Procesando consulta: {query[:50]}...")
-            classification = self.classify_query(query)
-            logger.info(f"Clasificación: {classification.category} ({classification.confidence}%)")
+            follow_up = turn is not None and turn.follow_up
+            search_query = turn.retrieval_query if turn is not None else query
+            # Consultas factuales simples: fragmentos del CV, sin clasificar ni generar
+            # (no los seguimientos, que dependen del turno anterior)
+            extractive = self._answer_extractive(query, polish=not degraded) if not follow_up else None
+            degraded_reason = degraded_source = None
+            if extractive is None:
+                degraded_reason = "load" if degraded else ("circuit_open" if not self.llm_circuit.allow() else None)
             
-            # 2. Ejecutar estrategia según clasificación
-            context = ""
-            tool_results = {}
-            
-            if classification.recommended_tool == "FAQ_ONLY":
-                faq_results = self.search_faq(query)
-                context = faq_results.get("formatted_results", "")
-                tool_results["faq"] = faq_results
-                
-            elif classification.recommended_tool == "RAG_ONLY":
-                rag_results = self.search_rag(query)
-                context = rag_results.get("formatted_context", "")
-                tool_results["rag"] = rag_results
-                
-            else:  # COMBINED or default
-                combined_results = self.combined_search(query)
-                context = combined_results.get("combined_summary", "")
-                tool_results["combined"] = combined_results
-            
-            # 3. Verificar si tenemos contexto útil
-            if not context or context.strip() == "" or "No se encontraron" in context:
-                # Intentar búsqueda más amplia
-                logger.warning("Contexto vacío, intentando búsqueda amplia")
-                backup_results = self.combined_search(query, merge_strategy="balanced")
-                context = backup_results.get("combined_summary", "")
-                tool_results["backup"] = backup_results
-            
-            # 4. Generar respuesta final
-            if context and context.strip():
-                response_text = self.generate_response(query, context, classification)
+            if extractive is not None:
+                classification, context, tool_results, response_text = extractive
+            elif degraded_reason:
+                # Sin LLM; el contexto vacío evita cachear la respuesta degradada
+                classification = QueryClassification({"category": "DEGRADED", "reasoning": degraded_reason})
+                response_text, degraded_source, tool_results = self._degraded_answer(search_query)
+                context = ""
+                self._count_event("degraded_answers")
+                metrics.inc(metrics.degraded_answers, reason=degraded_reason, source=degraded_source)
+                current_span().set_attributes({"degraded": degraded_reason, "degraded_source": degraded_source})
+            elif self.orchestration_mode == "tools":
+                classification, context, tool_results, response_text = self._answer_with_tools(query, turn)
             else:
-                response_text = format_no_results_response(
-                    query,
-                    alternatives=["Reformula tu pregunta de manera más específica"],
-                    related_topics=["Experiencia técnica", "Proyectos destacados", "Competencias"]
-                )
+                classification, context, tool_results, response_text = self._answer_with_classification(query, turn)
+            self._remember_retrieval(turn, tool_results)
             
             # 5. Calcular métricas
             processing_time = (datetime.now() - start_time).total_seconds()
+            metrics.observe_request(processing_time, success=True)
             
             # 6. Enviar notificación si es importante
             if notify_important and classification.confidence > 80:
@@ -619,6 +847,17 @@ Por favor, proporciona una respuesta completa, precisa y profesional basada úni
             }
             self.query_log.append(query_log_entry)
             
+            # Cachear solo respuestas basadas en contexto (y que no dependan del historial)
+            if context and context.strip() and not follow_up:
+                self.answer_cache.set(cache_key, {
+                    "response": response_text,
+                    "metadata": {
+                        "classification": classification.__dict__,
+                        "tools_used": list(tool_results.keys()),
+                        "context_length": len(context)
+                    }
+                })
+            
             return {
                 "success": True,
                 "response": response_text,
@@ -626,16 +865,31 @@ Por favor, proporciona una respuesta completa, precisa y profesional basada úni
                     "classification": classification.__dict__,
                     "processing_time": processing_time,
                     "tools_used": list(tool_results.keys()),
+                    "orchestration_mode": self.orchestration_mode,
                     "context_length": len(context),
-                    "session_id": session_id
+                    "session_id": session_id,
+                    "trace_id": current_span().trace_id,
+                    "follow_up": follow_up,
+                    "history_tokens": turn.history_tokens if turn is not None else 0,
+                    "degraded": degraded_reason is not None,
+                    "degraded_reason": degraded_reason,
+                    "degraded_source": degraded_source
                 },
                 "tool_results": tool_results
             }
             
+        except DeadlineExceeded as e:
+            # Petición abandonada o sin tiempo: no tiene sentido generar una respuesta de error
+            logger.warning(f"Consulta interrumpida: {e}")
+            self._count_event("errors")
+            metrics.observe_request((datetime.now() - start_time).total_seconds(), success=False)
+            raise
+            
         except Exception as e:
             # Manejo de errores
             logger.error(f"Error procesando consulta: {e}")
-            self.session_stats["errors"] += 1
+            self._count_event("errors")
+            metrics.observe_request((datetime.now() - start_time).total_seconds(), success=False)
             
             error_response = format_error_response("Processing Error", str(e))
             
@@ -648,6 +902,739 @@ Por favor, proporciona una respuesta completa, precisa y profesional basada úni
                 "processing_time": (datetime.now() - start_time).total_seconds(),
                 "success": False
             }
+            self.query_log.append(error_log_entry)
+            
+            # Notificar error crítico
+            try:
+                self.notification_manager.send_error_notification(
+                    error_message=str(e),
+                    context={"query": query, "session_id": session_id}
+                )
+            except:
+                pass  # No fallar si la notificación falla
+            
+            return {
+                "success": False,
+                "response": error_response,
+                "error": str(e),
+                "metadata": {
+                    "processing_time": (datetime.now() - start_time).total_seconds(),
+                    "session_id": session_id
+                }
+            }
+    
+    def _answer_with_classification(
+        self,
+        query: str,
+        turn: Optional[SessionTurn] = None
+    ) -> Tuple[QueryClassification, str, Dict[str, Any], str]:
+        """
+        Modo "classify": clasificar con el LLM, buscar según la herramienta recomendada y generar
+        
+        Con SPECULATIVE_RETRIEVAL las búsquedas RAG y FAQ con la consulta
+        original arrancan a la vez que la clasificación y la estrategia
+        elegida reutiliza sus resultados; las que no usa se descartan.
+        
+        En una sesión, los seguimientos se clasifican y buscan junto con la
+        consulta que abrió el tema, reutilizan los fragmentos de la sesión si siguen
+        siendo relevantes y la respuesta se genera con el historial.
+        
+        Returns:
+            (clasificación, contexto, resultados por herramienta, respuesta)
+        """
+        search_query = turn.retrieval_query if turn is not None else query
+        reuse = self._session_results(turn)
+        
+        with self.speculative.begin() as speculation:
+            # 0. Búsquedas especulativas con los tamaños por defecto de search_rag/search_faq
+            if reuse is None:
+                speculation.launch("rag", 5, self.retriever.search, query=search_query, top_k=5)
+            speculation.launch("faq", 5, self.faq_tool.search_faqs, query=search_query, limit=5, log_analytics=False)
+            
+            # 1. Clasificar consulta
+            classification = self.classify_query(search_query)
+            logger.info(f"Clasificación: {classification.category} ({classification.confidence}%)")
+            
+            # 2. Ejecutar estrategia según clasificación
+            context = ""
+            tool_results = {}
+            
+            if classification.recommended_tool == "FAQ_ONLY":
+                faq_results = self.search_faq(search_query, speculation=speculation)
+                context = faq_results.get("formatted_results", "")
+                tool_results["faq"] = faq_results
+                
+            elif classification.recommended_tool == "RAG_ONLY":
+                rag_results = self.search_rag(search_query, speculation=speculation, reuse=reuse)
+                context = rag_results.get("formatted_context", "")
+                tool_results["rag"] = rag_results
+                
+            else:  # COMBINED or default
+                combined_results = self.combined_search(search_query, speculation=speculation, reuse=reuse)
+                context = combined_results.get("combined_summary", "")
+                tool_results["combined"] = combined_results
+            
+            # 3. Verificar si tenemos contexto útil
+            if not self._has_useful_context(context):
+                # Intentar búsqueda más amplia
+                logger.warning("Contexto vacío, intentando búsqueda amplia")
+                backup_results = self.combined_search(search_query, merge_strategy="balanced", speculation=speculation)
+                context = backup_results.get("combined_summary", "")
+                tool_results["backup"] = backup_results
+        
+        # 4. Generar respuesta final
+        if context and context.strip():
+            response_text = self.generate_response(
+                query, context, classification, history=turn.history if turn is not None else ""
+            )
+        else:
+            response_text = self._no_results_response(query)
+        
+        return classification, context, tool_results, response_text
+    
+    @traced("tool_calling", result_attributes=lambda r: {
+        "tools_used": ",".join(r[2].keys()),
+        "context_length": len(r[1])
+    })
+    def _answer_with_tools(
+        self,
+        query: str,
+        turn: Optional[SessionTurn] = None
+    ) -> Tuple[QueryClassification, str, Dict[str, Any], str]:
+        """
+        Modo "tools": el modelo recibe los schemas de las herramientas y decide las búsquedas
+        
+        Sustituye la llamada de clasificación: la primera llamada devuelve las
+        herramientas a invocar (o la respuesta directa si no necesita datos),
+        las herramientas se ejecutan en paralelo y sus resultados vuelven al
+        modelo como mensajes "tool" para generar la respuesta.
+        
+        En una sesión el historial va en el system prompt, de modo que el
+        modelo formula búsquedas completas para las consultas de seguimiento.
+        
+        Returns:
+            (clasificación derivada, contexto, resultados por herramienta, respuesta)
+        """
+        history = turn.history if turn is not None else ""
+        system_prompt = format_tool_calling_prompt()
+        if history:
+            system_prompt += f"\n\n## Conversación previa\n{history}"
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": query}
+        ]
+        message = self._request_tool_calls(messages)
+        tool_calls = list(message.tool_calls or [])[:self.max_tool_calls]
+        
+        if not tool_calls:
+            # Respuesta directa (saludos, consultas sin datos del CV)
+            classification = QueryClassification({"category": "DIRECT", "recommended_tool": "NONE"})
+            return classification, "", {}, message.content or self._no_results_response(query)
+        
+        executed = self._run_tool_calls(tool_calls)
+        tool_results = {}
+        for _, key, result, _ in executed:
+            name = key if key not in tool_results else f"{key}_{len(tool_results) + 1}"
+            tool_results[name] = result
+        context = "\n\n".join(content for _, _, _, content in executed if self._has_useful_context(content))
+        classification = self._classification_from_tools(
+            [key for _, key, result, _ in executed if result.get("success")], tool_calls
+        )
+        
+        # Sin contexto útil: búsqueda amplia y generación directa, como en el modo con clasificación
+        if not context:
+            logger.warning("Contexto vacío, intentando búsqueda amplia")
+            search_query = turn.retrieval_query if turn is not None else query
+            backup_results = self.combined_search(search_query, merge_strategy="balanced")
+            tool_results["backup"] = backup_results
+            context = backup_results.get("combined_summary", "")
+            if context and context.strip():
+                return classification, context, tool_results, self.generate_response(
+                    query, context, classification, history=history
+                )
+            return classification, "", tool_results, self._no_results_response(query)
+        
+        # Devolver los resultados al modelo, repartiendo el presupuesto de contexto
+        budget = max(1, self.context_packer.token_budget // len(executed))
+        messages.append({
+            "role": "assistant",
+            "content": message.content,
+            "tool_calls": [
+                {
+                    "id": call.id,
+                    "type": "function",
+                    "function": {"name": call.function.name, "arguments": call.function.arguments}
+                }
+                for call in tool_calls
+            ]
+        })
+        for call, _, result, content in executed:
+            if not result.get("success"):
+                content = f"Error: {result.get('error', 'herramienta no disponible')}"
+            messages.append({
+                "role": "tool",
+                "tool_call_id": call.id,
+                "content": self.context_packer.fit(content, budget) if content else "Sin resultados."
+            })
+        
+        return classification, context, tool_results, self._generate_from_tool_results(messages)
+    
+    @traced("llm_tool_calls", result_attributes=lambda m: {"tool_calls": len(m.tool_calls or [])})
+    def _request_tool_calls(self, messages: List[Dict[str, Any]]):
+        """Primera llamada del modo tools: el modelo elige herramientas o responde"""
+        response = self._chat_completion(
+            "classification",
+            messages=messages,
+            tools=self.tool_schemas,
+            tool_choice="auto",
+            temperature=0.1,
+            max_tokens=300
+        )
+        return response.choices[0].message
+    
+    @traced("llm_generate")
+    def _generate_from_tool_results(self, messages: List[Dict[str, Any]]) -> str:
+        """Segunda llamada del modo tools: respuesta final con los resultados de las herramientas"""
+        try:
+            response = self._chat_completion(
+                "generation",
+                messages=messages,
+                tools=self.tool_schemas,
+                tool_choice="none",
+                temperature=0.3,
+                max_tokens=1500
+            )
+            return response.choices[0].message.content
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.error(f"Error generando respuesta LLM: {e}")
+            return format_error_response("LLM Error", str(e))
+    
+    def _run_tool_calls(self, tool_calls: List[Any]) -> List[Tuple[Any, str, Dict[str, Any], str]]:
+        """
+        Ejecutar en paralelo las herramientas pedidas por el modelo
+        
+        Returns:
+            Lista (tool_call, clave de resultado, resultado, contexto) en el orden de las llamadas
+        """
+        if len(tool_calls) == 1:
+            return [self._run_tool_call(tool_calls[0])]
+        
+        with ThreadPoolExecutor(max_workers=len(tool_calls), thread_name_prefix="tool-call") as pool:
+            futures = [
+                pool.submit(contextvars.copy_context().run, self._run_tool_call, call)
+                for call in tool_calls
+            ]
+            return [future.result() for future in futures]
+    
+    def _run_tool_call(self, call: Any) -> Tuple[Any, str, Dict[str, Any], str]:
+        """Validar los argumentos de una llamada y ejecutar la herramienta"""
+        name = call.function.name
+        try:
+            arguments = json.loads(call.function.arguments or "{}")
+            
+            if name == "rag_search":
+                params = RAGSearchParams(**arguments)
+                result = self.search_rag(params.query, top_k=params.top_k or 5, document_type=params.document_type)
+                return call, "rag", result, result.get("formatted_context", "")
+            
+            if name == "faq_query":
+                params = FAQQueryParams(**arguments)
+                result = self.search_faq(params.query, category=params.category, limit=params.limit or 5)
+                return call, "faq", result, result.get("formatted_results", "")
+            
+            if name == "combined_search":
+                params = CombinedSearchParams(**arguments)
+                result = self.combined_search(
+                    params.query,
+                    include_rag=params.include_rag is not False,
+                    include_faq=params.include_faq is not False,
+                    merge_strategy=params.merge_strategy or "relevance"
+                )
+                return call, "combined", result, result.get("combined_summary", "")
+            
+            raise ValueError(f"Herramienta no disponible: {name}")
+        
+        except Exception as e:
+            logger.warning(f"Llamada a herramienta inválida ({name}): {e}")
+            return call, name, {"success": False, "error": str(e)}, ""
+    
+    def _classification_from_tools(self, keys: List[str], tool_calls: List[Any]) -> QueryClassification:
+        """Clasificación equivalente a las herramientas elegidas (para logs y métricas)"""
+        used = set(keys)
+        if used == {"faq"}:
+            tool = "FAQ_ONLY"
+        elif used == {"rag"}:
+            tool = "RAG_ONLY"
+        else:
+            tool = "COMBINED"
+        
+        search_terms = []
+        for call in tool_calls:
+            try:
+                search_terms.append(json.loads(call.function.arguments or "{}").get("query", ""))
+            except ValueError:
+                continue
+        
+        return QueryClassification({
+            "category": "TOOL_CALLING",
+            "recommended_tool": tool,
+            "reasoning": "Herramientas elegidas por el modelo",
+            "search_terms": [term for term in search_terms if term]
+        })
+    
+    @traced("degraded_answer", result_attributes=lambda r: {"source": r[1]})
+    def _degraded_answer(self, query: str) -> Tuple[str, str, Dict[str, Any]]:
+        """
+        Respuesta sin LLM: la FAQ más parecida si supera el umbral de confianza,
+        los fragmentos del índice extractivo que mejor encajan (sin umbral) o,
+        sin índice extractivo, extractos de los chunks más relevantes
+        
+        Returns:
+            (respuesta, origen, resultados de herramientas) con origen
+            "faq", "extractive", "snippets" o "none"
+        """
+        faq_result = self.search_faq(query, limit=3)
+        faqs = sorted(faq_result["results"], key=lambda r: r.confidence, reverse=True)
+        if faqs and faqs[0].confidence >= self.degraded_faq_min_confidence:
+            return faqs[0].answer, "faq", {"faq_query": faq_result}
+        
+        answer = self.extractive.answer(query, min_confidence=0.0, fallback=True)
+        if answer is not None:
+            response = format_extractive_response(answer.section, answer.lines, answer.sources)
+            return response, "extractive", {"extractive_qa": answer.to_dict()}
+        
+        rag_result = self.search_rag(query, top_k=3)
+        if rag_result["results"]:
+            return self._snippet_answer(rag_result["results"]), "snippets", {"rag_search": rag_result}
+        
+        return self._no_results_response(query), "none", {"faq_query": faq_result, "rag_search": rag_result}
+    
+    def _answer_extractive(
+        self,
+        query: str,
+        polish: bool = True
+    ) -> Optional[Tuple[QueryClassification, str, Dict[str, Any], str]]:
+        """
+        Respuesta extractiva para consultas factuales simples (None si ningún
+        fragmento del CV encaja con suficiente confianza o si una FAQ responde
+        a la consulta, que entonces resuelve el pipeline completo)
+        
+        Args:
+            query: Consulta del usuario
+            polish: Permitir que el LLM la reescriba (si EXTRACTIVE_POLISH está
+                activo y el circuito del proveedor lo permite)
+        """
+        try:
+            answer = self.extractive.answer(query)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.warning(f"Error en respuesta extractiva, se sigue con el pipeline completo: {e}")
+            return None
+        if answer is None:
+            return None
+        
+        # Una FAQ curada (mismo umbral que el modo degradado) gana a los fragmentos
+        faqs = self.faq_tool.search_faqs(query=query, limit=3, log_analytics=False)
+        if faqs and max(faq.confidence for faq in faqs) >= self.degraded_faq_min_confidence:
+            metrics.inc(metrics.extractive_answers, outcome="faq_preferred")
+            current_span().set_attribute("extractive_skipped", "faq")
+            return None
+        
+        response_text = format_extractive_response(answer.section, answer.lines, answer.sources)
+        tool_result = {**answer.to_dict(), "polished": False}
+        if polish and self.extractive_polish and self.llm_circuit.allow():
+            polished = self._polish_extractive(query, response_text)
+            if polished:
+                response_text, tool_result["polished"] = polished, True
+        
+        self._count_event("extractive_answers")
+        classification = QueryClassification({
+            "category": "EXTRACTIVE",
+            "recommended_tool": "EXTRACTIVE",
+            "reasoning": f"Fragmentos del CV con confianza {answer.confidence:.2f}",
+            "expected_complexity": "LOW"
+        })
+        return classification, answer.context, {"extractive_qa": tool_result}, response_text
+    
+    @traced("llm_polish")
+    def _polish_extractive(self, query: str, response_text: str) -> Optional[str]:
+        """Reescribir con el LLM una respuesta extractiva (None si falla)"""
+        try:
+            response = self._chat_completion(
+                "generation",
+                messages=[
+                    {"role": "system", "content": format_extractive_polish_prompt()},
+                    {"role": "user", "content": f"Consulta: {query}\n\nRespuesta:\n{response_text}"}
+                ],
+                temperature=0.3,
+                max_tokens=400
+            )
+            return response.choices[0].message.content
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.warning(f"Error puliendo respuesta extractiva, se usa la plantilla: {e}")
+            return None
+    
+    def _session_results(self, turn: Optional[SessionTurn]) -> Optional[List[SearchResult]]:
+        """Fragmentos ya recuperados en la sesión que siguen siendo relevantes para un seguimiento"""
+        if turn is None or not turn.follow_up or not turn.retrieval:
+            return None
+        try:
+            results = self.session_memory.reusable_results(
+                turn, self.retriever.embed_query(turn.retrieval_query), self.retriever.index_version
+            )
+        except Exception as e:
+            logger.warning(f"No se pudieron comparar los fragmentos de la sesión: {e}")
+            return None
+        return [SearchResult(**item) for item in results] if results else None
+    
+    def _remember_retrieval(self, turn: Optional[SessionTurn], tool_results: Dict[str, Any]) -> None:
+        """Guardar en la sesión los fragmentos RAG recuperados para esta consulta"""
+        if turn is None:
+            return
+        for key in ("rag", "combined", "backup"):
+            rag_results = tool_results.get(key) or {}
+            if key != "rag":
+                rag_results = rag_results.get("rag_results") or {}
+            if rag_results.get("success") and rag_results.get("results") and not rag_results.get("reused"):
+                try:
+                    embedding = self.retriever.embed_query(turn.retrieval_query)
+                except Exception as e:
+                    logger.warning(f"No se guardan los fragmentos en la sesión: {e}")
+                    return
+                self.session_memory.set_retrieval(
+                    turn, embedding, rag_results["results"], self.retriever.index_version
+                )
+                return
+    
+    @traced("llm_summarize_history")
+    def _summarize_history(self, summary: str, turns: List[Tuple[str, str]]) -> Optional[str]:
+        """
+        Resumen incremental del historial de una sesión con el LLM (None si el
+        circuito del proveedor está abierto; la memoria usa entonces un resumen compacto)
+        """
+        if not self.llm_circuit.allow():
+            return None
+        max_tokens = self.session_memory.summary_tokens
+        content = f"Resumen actual:\n{summary or '(vacío)'}\n\nTurnos nuevos:\n" + "\n\n".join(
+            f"Usuario: {question}\nAsistente: {self.context_packer.counter.truncate(answer, 400)}"
+            for question, answer in turns
+        )
+        response = self._chat_completion(
+            "summary",
+            messages=[
+                {"role": "system", "content": format_history_summary_prompt(max_words=int(max_tokens * 0.6))},
+                {"role": "user", "content": content}
+            ],
+            temperature=0.1,
+            max_tokens=max_tokens
+        )
+        return response.choices[0].message.content
+    
+    @staticmethod
+    def _snippet_answer(results: List[Any], max_chars: int = 400) -> str:
+        """Fragmentos de los documentos recuperados, recortados en fin de frase"""
+        snippets = []
+        for result in results:
+            text = " ".join(result.content.split())
+            if len(text) > max_chars:
+                cut = text.rfind(". ", 0, max_chars)
+                text = text[:cut + 1] if cut > 0 else text[:max_chars].rstrip() + "…"
+            source = os.path.basename(str(result.metadata.get("filename", "documento")))
+            snippets.append(f"- {text} ({source})")
+        return (
+            "Ahora mismo solo puedo ofrecer una respuesta resumida. "
+            "Esto es lo más relevante que he encontrado en el CV:\n\n" + "\n".join(snippets)
+        )
+    
+    @staticmethod
+    def _has_useful_context(context: str) -> bool:
+        """Indica si el contexto de una búsqueda tiene resultados"""
+        return bool(context and context.strip()) and "No se encontraron" not in context
+    
+    @staticmethod
+    def _no_results_response(query: str) -> str:
+        return format_no_results_response(
+            query,
+            alternatives=["Reformula tu pregunta de manera más específica"],
+            related_topics=["Experiencia técnica", "Proyectos destacados", "Competencias"]
+        )
+    
+    def has_cached_answer(self, query: str, session_id: Optional[str] = None) -> bool:
+        """
+        Indica si la consulta se responderá desde la caché (sin ejecutar el pipeline)
+        
+        Args:
+            query: Consulta del usuario
+            session_id: Sesión de la consulta; un seguimiento con historial no
+                se sirve desde la caché
+        """
+        if session_id and self.session_memory.would_follow_up(session_id, query):
+            return False
+        return self.answer_cache.contains(self._answer_cache_key(query))
+    
+    def cache_answer(self, query: str, entry: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        """Guardar una respuesta ({"response", "metadata"}) en la caché para la versión actual del índice"""
+        self.answer_cache.set(self._answer_cache_key(query), entry, ttl)
+    
+    def evict_cached_answer(self, query: str) -> None:
+        """Quitar de la caché la respuesta de una consulta"""
+        self.answer_cache.delete(self._answer_cache_key(query))
+    
+    def _answer_cache_key(self, query: str) -> str:
+        """Clave de la caché de respuestas: consulta normalizada y versión del índice"""
+        return SharedCache.query_key(query, self.retriever.index_version)
+    
+    def _cached_response(self, cached: Dict[str, Any], session_id: str, start_time: datetime) -> Dict[str, Any]:
+        """Construir la respuesta a partir de una entrada de la caché"""
+        processing_time = (datetime.now() - start_time).total_seconds()
+        self._count_event("cache_hits")
+        metrics.observe_request(processing_time, success=True)
+        
+        return {
+            "success": True,
+            "response": cached["response"],
+            "metadata": {
+                **cached.get("metadata", {}),
+                "processing_time": processing_time,
+                "session_id": session_id,
+                "trace_id": current_span().trace_id,
+                "cached": True
+            },
+            "tool_results": {}
+        }
+    
+    def process_batch(
+        self,
+        queries: List[str],
+        session_id: str = "batch",
+        max_concurrency: Optional[int] = None,
+        include_context: bool = False
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Procesar un lote de consultas
+        
+        Las consultas repetidas se procesan una sola vez; la clasificación,
+        los embeddings y la búsqueda vectorial se hacen por lotes y las
+        generaciones LLM se ejecutan en paralelo con concurrencia acotada.
+        
+        Args:
+            queries: Consultas del usuario
+            session_id: ID de sesión del lote
+            max_concurrency: Generaciones simultáneas (por defecto BATCH_MAX_CONCURRENCY)
+            include_context: Añadir a los metadatos el contexto con el que se
+                generó cada respuesta (las cacheadas no lo conservan, así que
+                se regeneran)
+            
+        Yields:
+            Un resultado por consulta, con su índice original, en orden de finalización
+        """
+        start_time = datetime.now()
+        self._count_event("total_queries", len(queries))
+        
+        # 1. Deduplicar por consulta normalizada
+        groups: Dict[str, List[int]] = {}
+        for index, query in enumerate(queries):
+            groups.setdefault(self._answer_cache_key(query), []).append(index)
+        
+        # 2. Respuestas ya cacheadas
+        pending = []
+        for cache_key, indices in groups.items():
+            cached = None if include_context else self.answer_cache.get(cache_key)
+            if cached is None:
+                pending.append((cache_key, indices))
+                continue
+            self._count_event("cache_hits")
+            result = {
+                "success": True,
+                "response": cached["response"],
+                "metadata": {**cached.get("metadata", {}), "cached": True}
+            }
+            yield from self._batch_results(queries, indices, result, session_id, start_time)
+        
+        if not pending:
+            return
+        
+        # 3. Clasificación y recuperación por lotes
+        prepared = self._prepare_batch([queries[indices[0]] for _, indices in pending])
+        
+        # 4. Generación en paralelo, resultados en orden de finalización
+        max_workers = max_concurrency or int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+        pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch-generate")
+        try:
+            futures = {
+                pool.submit(
+                    contextvars.copy_context().run, self._generate_batch_item, cache_key, *item, include_context
+                ): indices
+                for (cache_key, indices), item in zip(pending, prepared)
+            }
+            for future in as_completed(futures):
+                yield from self._batch_results(queries, futures[future], future.result(), session_id, start_time)
+        finally:
+            # Si el consumidor abandona el stream no se lanzan más generaciones
+            pool.shutdown(wait=False, cancel_futures=True)
+    
+    @traced("batch_prepare", result_attributes=lambda p: {"queries": len(p)})
+    def _prepare_batch(self, queries: List[str]) -> List[Tuple[str, QueryClassification, str, List[str]]]:
+        """Clasificar y recuperar contexto para un lote de consultas únicas"""
+        classifications = self.classify_queries(queries)
+        
+        # Una sola consulta a la vector DB para todas las que usan RAG
+        rag_positions = [i for i, c in enumerate(classifications) if c.recommended_tool != "FAQ_ONLY"]
+        hits: Dict[int, List[Any]] = {}
+        if rag_positions:
+            try:
+                batch_hits = self.retriever.search_batch([queries[i] for i in rag_positions])
+                hits = dict(zip(rag_positions, batch_hits))
+            except Exception as e:
+                logger.error(f"Error en búsqueda RAG por lotes: {e}")
+        
+        prepared = []
+        for i, (query, classification) in enumerate(zip(queries, classifications)):
+            context, tools_used = self._batch_context(query, classification, hits.get(i, []))
+            prepared.append((query, classification, context, tools_used))
+        return prepared
+    
+    def _batch_context(
+        self,
+        query: str,
+        classification: QueryClassification,
+        rag_hits: List[Any]
+    ) -> Tuple[str, List[str]]:
+        """Construir el contexto de una consulta del lote (misma estrategia que process_query)"""
+        if classification.recommended_tool == "FAQ_ONLY":
+            context = self.search_faq(query).get("formatted_results", "")
+            tools_used = ["faq"]
+        elif classification.recommended_tool == "RAG_ONLY":
+            self._count_event("rag_searches")
+            context = self.context_packer.pack(rag_hits).text
+            tools_used = ["rag"]
+        else:
+            self._count_event("rag_searches")
+            self._count_event("combined_searches")
+            context = self._merge_results(
+                {"success": True, "results": rag_hits[:3]},
+                self.search_faq(query, limit=3),
+                "relevance"
+            )
+            tools_used = ["combined"]
+        
+        if not context or context.strip() == "" or "No se encontraron" in context:
+            backup_results = self.combined_search(query, merge_strategy="balanced")
+            context = backup_results.get("combined_summary", "")
+            tools_used.append("backup")
+        
+        return context, tools_used
+    
+    def _generate_batch_item(
+        self,
+        cache_key: str,
+        query: str,
+        classification: QueryClassification,
+        context: str,
+        tools_used: List[str],
+        include_context: bool = False
+    ) -> Dict[str, Any]:
+        """Generar la respuesta de una consulta del lote"""
+        try:
+            if context and context.strip():
+                response_text = self.generate_response(query, context, classification)
+            else:
+                response_text = format_no_results_response(
+                    query,
+                    alternatives=["Reformula tu pregunta de manera más específica"],
+                    related_topics=["Experiencia técnica", "Proyectos destacados", "Competencias"]
+                )
+            
+            metadata = {
+                "classification": classification.__dict__,
+                "tools_used": tools_used,
+                "context_length": len(context)
+            }
+            if context and context.strip():
+                self.answer_cache.set(cache_key, {"response": response_text, "metadata": metadata})
+            if include_context:
+                # El que vio el LLM, ya dentro del presupuesto de tokens
+                metadata = {**metadata, "context": self.context_packer.fit(context) if context.strip() else context}
+            
+            return {"success": True, "response": response_text, "metadata": metadata}
+            
+        except Exception as e:
+            logger.error(f"Error procesando consulta del lote: {e}")
+            self._count_event("errors")
+            return {
+                "success": False,
+                "response": format_error_response("Processing Error", str(e)),
+                "error": str(e),
+                "metadata": {}
+            }
+    
+    def _batch_results(
+        self,
+        queries: List[str],
+        indices: List[int],
+        result: Dict[str, Any],
+        session_id: str,
+        start_time: datetime
+    ) -> Iterator[Dict[str, Any]]:
+        """Emitir el resultado de una consulta única para cada posición del lote"""
+        processing_time = (datetime.now() - start_time).total_seconds()
+        metadata = result.get("metadata", {})
+        source = "cached" if metadata.get("cached") else "generated"
+        metrics.inc(metrics.batch_queries, source=source)
+        if len(indices) > 1:
+            metrics.inc(metrics.batch_queries, len(indices) - 1, source="deduplicated")
+        
+        self.query_log.append({
+            "timestamp": datetime.now(),
+            "session_id": session_id,
+            "query": queries[indices[0]],
+            "classification": metadata.get("classification"),
+            "processing_time": processing_time,
+            "context_length": metadata.get("context_length"),
+            "response_length": len(result.get("response", "")),
+            "error": result.get("error"),
+            "success": result["success"]
+        })
+        
+        for position, index in enumerate(indices):
+            yield {
+                **result,
+                "index": index,
+                "query": queries[index],
+                "metadata": {
+                    **metadata,
+                    "session_id": session_id,
+                    "processing_time": processing_time,
+                    "deduplicated": position > 0
+                }
+            }
+    
+    def _coalesced_response(self, result: Dict[str, Any], session_id: str, start_time: datetime) -> Dict[str, Any]:
+        """Adaptar el resultado de otra ejecución idéntica a esta sesión"""
+        if not result:
+            return result
+        
+        processing_time = (datetime.now() - start_time).total_seconds()
+        self._count_event("coalesced_requests")
+        metrics.inc(metrics.coalesced_requests)
+        metrics.observe_request(processing_time, success=result.get("success", False))
+        current_span().set_attribute("coalesced", True)
+        
+        return {
+            **result,
+            "metadata": {
+                **result.get("metadata", {}),
+                "processing_time": processing_time,
+                "session_id": session_id,
+                "trace_id": current_span().trace_id,
+                "coalesced": True
+            }
+        }
     
     def handoff_to_email(
         self,
@@ -687,42 +1674,29 @@ Por favor, proporciona una respuesta completa, precisa y profesional basada úni
                 "error": str(e),
                 "handoff_completed": False
             }
-            self.query_log.append(error_log_entry)
-            
-            # Notificar error crítico
-            try:
-                self.notification_manager.send_error_notification(
-                    error_message=str(e),
-                    context={"query": query, "session_id": session_id}
-                )
-            except:
-                pass  # No fallar si la notificación falla
-            
-            return {
-                "success": False,
-                "response": error_response,
-                "error": str(e),
-                "metadata": {
-                    "processing_time": (datetime.now() - start_time).total_seconds(),
-                    "session_id": session_id
-                }
-            }
     
     def get_session_stats(self) -> Dict[str, Any]:
         """Obtener estadísticas de la sesión"""
-        uptime = (datetime.now() - self.session_stats["start_time"]).total_seconds()
+        uptime = (datetime.now() - self.start_time).total_seconds()
+        counts = metrics.totals(metrics.orchestrator_events, "event")
+        session_stats = {event: int(counts.get(event, 0)) for event in SESSION_EVENTS}
         
         return {
-            **self.session_stats,
+            **session_stats,
+            "start_time": self.start_time,
             "uptime_seconds": uptime,
             "success_rate": (
-                (self.session_stats["total_queries"] - self.session_stats["errors"]) 
-                / max(self.session_stats["total_queries"], 1)
+                (session_stats["total_queries"] - session_stats["errors"]) 
+                / max(session_stats["total_queries"], 1)
             ) * 100,
-            "avg_processing_time": (
-                sum(log["processing_time"] for log in self.query_log if log.get("success"))
-                / max(len([log for log in self.query_log if log.get("success")]), 1)
-            ),
+            "avg_processing_time": metrics.request_latency.summary().get("mean", 0.0),
+            "answer_cache": self.answer_cache.get_stats(),
+            "single_flight": self.single_flight.get_stats(),
+            "speculative_retrieval": self.speculative.get_stats(),
+            "structured_output": self.structured_output.get_stats(),
+            "llm_circuit": self.llm_circuit.get_stats(),
+            "extractive_qa": self.extractive.get_stats(),
+            "session_memory": self.session_memory.get_stats(),
             "recent_queries": [
                 {
                     "query": log["query"],
@@ -730,7 +1704,8 @@ Por favor, proporciona una respuesta completa, precisa y profesional basada úni
                     "success": log["success"]
                 }
                 for log in self.query_log[-5:]
-            ]
+            ],
+            "latency": metrics.latency_summary()
         }
 
 def main():
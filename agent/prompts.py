@@ -80,6 +80,25 @@ Tienes acceso a las siguientes herramientas para responder consultas:
 Siempre evalúa qué herramienta es más apropiada antes de usarla.
 """.format(base_prompt=SYSTEM_PROMPT_BASE)
 
+# Prompt para orquestación por tool calling: el modelo elige las búsquedas
+# en la misma llamada que después genera la respuesta (sin clasificación previa)
+TOOL_CALLING_PROMPT = """
+{base_prompt}
+
+## Búsqueda de Información
+
+Para responder sobre el perfil profesional usa las herramientas de búsqueda
+antes de contestar. Puedes llamar a varias a la vez si la consulta lo requiere:
+
+- **rag_search**: detalles de proyectos, experiencia técnica y logros (documentos del CV)
+- **faq_query**: datos básicos y preguntas habituales (contacto, idiomas, certificaciones)
+- **combined_search**: consultas amplias que necesitan documentos y FAQs
+
+Usa como `query` términos concretos de la consulta. Si es un saludo o no
+necesita datos del CV, responde directamente sin llamar a ninguna herramienta.
+Cuando recibas los resultados, responde basándote únicamente en ellos.
+""".format(base_prompt=SYSTEM_PROMPT_BASE)
+
 # ==================== Evaluator Prompts ====================
 
 EVALUATOR_PROMPT = """
@@ -231,14 +250,46 @@ Consulta: "{query}"
 ## Respuesta Esperada
 
 ```json
-{
+{{
     "category": "CATEGORY_NAME",
     "confidence": 0-100,
     "recommended_tool": "TOOL_NAME",
     "reasoning": "Explicación de la clasificación",
     "search_terms": ["términos", "clave", "sugeridos"],
     "expected_complexity": "LOW|MEDIUM|HIGH"
-}
+}}
+```
+"""
+
+BATCH_QUERY_CLASSIFICATION_PROMPT = """
+Clasifica cada una de las siguientes consultas del usuario para determinar la mejor estrategia de respuesta:
+
+{queries}
+
+## Categorías Posibles
+
+BASIC_INFO, EXPERIENCE, SKILLS, PROJECTS, EDUCATION, ACHIEVEMENTS, METHODOLOGY, INDUSTRY, PERSONAL, COMPLEX
+
+## Herramienta Recomendada
+
+FAQ_ONLY, RAG_ONLY, COMBINED
+
+## Respuesta Esperada
+
+Una lista JSON con un objeto por consulta, en el mismo orden y con su número:
+
+```json
+[
+    {{
+        "index": 1,
+        "category": "CATEGORY_NAME",
+        "confidence": 0-100,
+        "recommended_tool": "TOOL_NAME",
+        "reasoning": "Explicación breve",
+        "search_terms": ["términos", "clave"],
+        "expected_complexity": "LOW|MEDIUM|HIGH"
+    }}
+]
 ```
 """
 
@@ -343,6 +394,31 @@ Encontré información parcial sobre tu consulta:
 ¿Te gustaría que profundice en algún aspecto específico?
 """
 
+EXTRACTIVE_RESPONSE_TEMPLATE = """
+Esto es lo que recoge mi CV sobre **{section}**:
+
+{content}
+
+*Fuente: {sources}*
+"""
+
+EXTRACTIVE_POLISH_PROMPT = """
+Reescribe la respuesta que se te proporciona para que conteste de forma natural y breve a la consulta del usuario, en primera persona y con tono profesional.
+
+- Usa únicamente la información de la respuesta, sin añadir datos
+- Conserva fechas, nombres y cifras tal cual
+- Mantén al final la línea de fuente
+"""
+
+HISTORY_SUMMARY_PROMPT = """
+Actualiza el resumen de una conversación entre un usuario y el asistente del CV incorporando los turnos nuevos.
+
+- Escribe un único párrafo breve en español, de como máximo {max_words} palabras
+- Conserva los temas consultados y los datos concretos de las respuestas (empresas, fechas, tecnologías, cifras)
+- Omite saludos, fórmulas de cortesía y repeticiones
+- Responde solo con el resumen
+"""
+
 # ==================== Utility Functions ====================
 
 def format_system_prompt(
@@ -367,6 +443,10 @@ def format_system_prompt(
     
     return base_prompt
 
+def format_tool_calling_prompt() -> str:
+    """System prompt para el modo de orquestación por tool calling"""
+    return TOOL_CALLING_PROMPT
+
 def format_planning_prompt(user_query: str) -> str:
     """Formatear prompt de planning con la consulta del usuario"""
     return PLANNING_PROMPT.format(user_query=user_query)
@@ -375,6 +455,11 @@ def format_classification_prompt(query: str) -> str:
     """Formatear prompt de clasificación de consultas"""
     return QUERY_CLASSIFICATION_PROMPT.format(query=query)
 
+def format_batch_classification_prompt(queries: List[str]) -> str:
+    """Formatear prompt de clasificación de varias consultas"""
+    numbered = "\n".join(f'{i}. "{query}"' for i, query in enumerate(queries, 1))
+    return BATCH_QUERY_CLASSIFICATION_PROMPT.format(queries=numbered)
+
 def format_error_response(error_type: str, error_message: str) -> str:
     """Formatear respuesta de error"""
     return ERROR_RESPONSE_TEMPLATE.format(
@@ -397,6 +482,23 @@ def format_no_results_response(
         related_topics=related_text or "Ninguna disponible"
     )
 
+def format_extractive_response(section: str, lines: List[str], sources: List[str]) -> str:
+    """Formatear respuesta extractiva con los fragmentos del CV y sus fuentes"""
+    content = "\n".join(line if line.startswith(("- ", "**")) else f"- {line}" for line in lines)
+    return EXTRACTIVE_RESPONSE_TEMPLATE.format(
+        section=section,
+        content=content,
+        sources=", ".join(sources)
+    ).strip()
+
+def format_extractive_polish_prompt() -> str:
+    """System prompt para pulir con el LLM una respuesta extractiva"""
+    return EXTRACTIVE_POLISH_PROMPT
+
+def format_history_summary_prompt(max_words: int) -> str:
+    """System prompt para el resumen incremental del historial de una sesión"""
+    return HISTORY_SUMMARY_PROMPT.format(max_words=max_words).strip()
+
 def get_prompt_for_category(category: str) -> str:
     """Obtener prompt especializado según categoría de consulta"""
     prompts_by_category = {
@@ -12,6 +12,8 @@ from email.mime.multipart import MIMEMultipart
 from typing import Dict, Any, Optional
 from datetime import datetime
 
+from tools.email_outbox import EmailOutbox, SMTPSettings
+
 from ..utils.config import AgentConfig, EmailConfig
 from ..utils.logger import AgentLogger
 from ..utils.prompts import PromptManager, PromptType
@@ -37,6 +39,7 @@ class EmailAgent:
         self.stats = {
             "emails_sent": 0,
             "emails_failed": 0,
+            "emails_queued": 0,
             "last_email_sent": None,
             "total_recipients": set(),
             "email_types": {
@@ -49,6 +52,19 @@ class EmailAgent:
         # Verificar configuración
         self.is_configured = self._verify_configuration()
         
+        # Outbox persistente con sesión SMTP reutilizada
+        self.outbox = EmailOutbox(
+            SMTPSettings(
+                server=self.email_config.smtp_server,
+                port=self.email_config.smtp_port,
+                username=self.email_config.username,
+                password=self.email_config.password,
+                starttls=self.email_config.starttls
+            ),
+            name="email_agent",
+            on_result=self._on_delivery
+        )
+        
         if self.is_configured:
             self.logger.info("EmailAgent initialized successfully")
         else:
@@ -115,10 +131,9 @@ class EmailAgent:
             success = self._send_email(msg, recipient)
             
             if success:
-                self.stats["emails_sent"] += 1
+                self.stats["emails_queued"] += 1
                 self.stats["email_types"]["summary"] += 1
                 self.stats["total_recipients"].add(recipient)
-                self.stats["last_email_sent"] = datetime.now().isoformat()
             else:
                 self.stats["emails_failed"] += 1
             
@@ -191,10 +206,9 @@ class EmailAgent:
             success = self._send_email(msg, recipient)
             
             if success:
-                self.stats["emails_sent"] += 1
+                self.stats["emails_queued"] += 1
                 self.stats["email_types"]["notification"] += 1
                 self.stats["total_recipients"].add(recipient)
-                self.stats["last_email_sent"] = datetime.now().isoformat()
             else:
                 self.stats["emails_failed"] += 1
             
@@ -267,10 +281,9 @@ class EmailAgent:
             success = self._send_email(msg, recipient)
             
             if success:
-                self.stats["emails_sent"] += 1
+                self.stats["emails_queued"] += 1
                 self.stats["email_types"]["error"] += 1
                 self.stats["total_recipients"].add(recipient)
-                self.stats["last_email_sent"] = datetime.now().isoformat()
             else:
                 self.stats["emails_failed"] += 1
             
@@ -395,31 +408,36 @@ class EmailAgent:
         return text.strip()
     
     def _send_email(self, msg: MIMEMultipart, recipient: str) -> bool:
-        """Enviar email usando SMTP"""
+        """
+        Enviar email a través de la outbox
+        
+        Con la outbox activa el mensaje se encola y se envía en background
+        (True indica que quedó encolado); si no, se envía en el momento
+        reutilizando la sesión SMTP.
+        """
         try:
-            with smtplib.SMTP(self.email_config.smtp_server, self.email_config.smtp_port) as server:
-                server.starttls()
-                server.login(self.email_config.username, self.email_config.password)
-                
-                text = msg.as_string()
-                server.sendmail(self.email_config.from_email, recipient, text)
-                
-                self.logger.info(f"Email sent successfully to {recipient}")
-                return True
-                
-        except smtplib.SMTPAuthenticationError as e:
-            self.logger.error(f"SMTP authentication failed: {e}")
-            return False
-        except smtplib.SMTPRecipientsRefused as e:
-            self.logger.error(f"Recipients refused: {e}")
-            return False
-        except smtplib.SMTPException as e:
-            self.logger.error(f"SMTP error occurred: {e}")
-            return False
+            if not self.email_config.use_outbox:
+                sent = self.outbox.send_now(msg, recipient, self.email_config.from_email)
+                self._on_delivery(None, sent, None if sent else "SMTP error")
+                return sent
+            
+            message_id = self.outbox.enqueue(msg, recipient, self.email_config.from_email)
+            self.logger.info(f"Email queued for {recipient} (outbox id {message_id})")
+            return True
+            
         except Exception as e:
-            self.logger.error(f"Unexpected error sending email: {e}")
+            self.logger.error(f"Unexpected error queuing email: {e}")
             return False
     
+    def _on_delivery(self, message_id: Optional[int], success: bool, error: Optional[str]) -> None:
+        """Actualizar estadísticas cuando la outbox entrega o descarta un email"""
+        if success:
+            self.stats["emails_sent"] += 1
+            self.stats["last_email_sent"] = datetime.now().isoformat()
+        else:
+            self.stats["emails_failed"] += 1
+            self.logger.error(f"Email delivery failed (outbox id {message_id}): {error}")
+    
     def test_email_configuration(self, test_recipient: Optional[str] = None) -> Dict[str, Any]:
         """
         Probar configuración de email
@@ -463,7 +481,7 @@ class EmailAgent:
                         email_type="test"
                     )
                     
-                    success = self._send_email(test_msg, test_recipient)
+                    success = self.outbox.send_now(test_msg, test_recipient, self.email_config.from_email)
                     test_result["test_email_sent"] = success
                     
                     if success:
@@ -488,7 +506,8 @@ class EmailAgent:
             **{k: v for k, v in self.stats.items() if k != "total_recipients"},
             "total_unique_recipients": len(self.stats["total_recipients"]),
             "success_rate": round(success_rate, 2),
-            "is_configured": self.is_configured
+            "is_configured": self.is_configured,
+            "outbox": self.outbox.get_stats()
         }
     
     def reset_stats(self):
@@ -496,6 +515,7 @@ class EmailAgent:
         self.stats = {
             "emails_sent": 0,
             "emails_failed": 0,
+            "emails_queued": 0,
             "last_email_sent": None,
             "total_recipients": set(),
             "email_types": {
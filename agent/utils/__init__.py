@@ -7,21 +7,32 @@ Utilidades y helpers del sistema de agentes.
 from .config import AgentConfig
 from .logger import AgentLogger
 from .prompts import PromptManager
+from .context_packer import ContextPacker, PackedContext, TokenCounter
 from .multi_llm_client import (
     MultiLLMClient,
     MultiLLMEnsemble,
+    EnsembleMode,
     LLMProvider,
     LLMResponse,
     create_multi_llm_client
 )
+from .model_cascade import ModelCascade
+from .session_memory import SessionMemory, SessionTurn
 
 __all__ = [
     "AgentConfig",
     "AgentLogger",
     "PromptManager",
+    "ContextPacker",
+    "PackedContext",
+    "TokenCounter",
     "MultiLLMClient",
     "MultiLLMEnsemble",
+    "EnsembleMode",
     "LLMProvider",
     "LLMResponse",
-    "create_multi_llm_client"
+    "create_multi_llm_client",
+    "ModelCascade",
+    "SessionMemory",
+    "SessionTurn"
 ]
\ No newline at end of file
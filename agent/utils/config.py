@@ -46,6 +46,8 @@ class EmailConfig:
     password: str = ""
     from_email: str = ""
     default_recipient: str = ""
+    starttls: bool = True
+    use_outbox: bool = True
     
     def is_configured(self) -> bool:
         """Verificar si email está configurado"""
@@ -61,16 +63,22 @@ class AgentConfig:
     # Email
     email: EmailConfig
     
+    # Modelo rápido de la cascada (None = siempre el modelo principal)
+    cascade: Optional[OpenAIConfig] = None
+    
     # Configuraciones de búsqueda
     rag_similarity_threshold: float = 0.7
     rag_top_k: int = 5
     faq_limit: int = 10
+    context_token_budget: int = 1500
     
     # Configuraciones de clasificación
     classification_confidence_threshold: float = 0.8
     
     # Configuraciones de evaluación
     evaluation_min_score: float = 7.0
+    evaluation_mode: str = "hybrid"              # llm, local o hybrid
+    evaluation_escalation_margin: float = 1.0    # hybrid: LLM si |score - min_score| < margen
     
     # Configuraciones de logging
     log_level: str = "INFO"
@@ -98,17 +106,38 @@ class AgentConfig:
             username=os.getenv("SMTP_USERNAME", ""),
             password=os.getenv("SMTP_PASSWORD", ""),
             from_email=os.getenv("FROM_EMAIL", ""),
-            default_recipient=os.getenv("DEFAULT_EMAIL_RECIPIENT", "")
+            default_recipient=os.getenv("DEFAULT_EMAIL_RECIPIENT", ""),
+            starttls=os.getenv("SMTP_STARTTLS", "true").lower() == "true",
+            use_outbox=os.getenv("EMAIL_ASYNC", "true").lower() == "true"
         )
         
+        # Cascada: modelo rápido/barato o local que responde primero
+        cascade_config = None
+        if os.getenv("CASCADE_MODEL"):
+            cascade_provider = os.getenv("CASCADE_PROVIDER", openai_config.provider)
+            cascade_config = OpenAIConfig(
+                api_key=os.getenv("CASCADE_API_KEY") or openai_config.api_key,
+                model=os.getenv("CASCADE_MODEL"),
+                temperature=openai_config.temperature,
+                max_tokens=openai_config.max_tokens,
+                base_url=os.getenv("CASCADE_BASE_URL") or (
+                    openai_config.base_url if cascade_provider == openai_config.provider else None
+                ),
+                provider=cascade_provider
+            )
+        
         return cls(
             openai=openai_config,
             email=email_config,
+            cascade=cascade_config,
             rag_similarity_threshold=float(os.getenv("RAG_SIMILARITY_THRESHOLD", "0.7")),
             rag_top_k=int(os.getenv("RAG_TOP_K", "5")),
             faq_limit=int(os.getenv("FAQ_LIMIT", "10")),
+            context_token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500")),
             classification_confidence_threshold=float(os.getenv("CLASSIFICATION_CONFIDENCE_THRESHOLD", "0.8")),
             evaluation_min_score=float(os.getenv("EVALUATION_MIN_SCORE", "7.0")),
+            evaluation_mode=os.getenv("EVALUATION_MODE", "hybrid").lower(),
+            evaluation_escalation_margin=float(os.getenv("EVALUATION_ESCALATION_MARGIN", "1.0")),
             log_level=os.getenv("LOG_LEVEL", "INFO"),
             log_to_file=os.getenv("LOG_TO_FILE", "true").lower() == "true",
             log_file_path=os.getenv("LOG_FILE_PATH", "logs/agent.log")
@@ -125,13 +154,21 @@ class AgentConfig:
             "email": {
                 "smtp_server": self.email.smtp_server,
                 "smtp_port": self.email.smtp_port,
+                "use_outbox": self.email.use_outbox,
                 "is_configured": self.email.is_configured()
             },
+            "cascade": {
+                "provider": self.cascade.provider,
+                "model": self.cascade.model
+            } if self.cascade else None,
             "rag_similarity_threshold": self.rag_similarity_threshold,
             "rag_top_k": self.rag_top_k,
             "faq_limit": self.faq_limit,
+            "context_token_budget": self.context_token_budget,
             "classification_confidence_threshold": self.classification_confidence_threshold,
             "evaluation_min_score": self.evaluation_min_score,
+            "evaluation_mode": self.evaluation_mode,
+            "evaluation_escalation_margin": self.evaluation_escalation_margin,
             "log_level": self.log_level,
             "log_to_file": self.log_to_file,
             "log_file_path": self.log_file_path
@@ -0,0 +1,250 @@
+"""
+Context Packer Module
+
+Empaquetado de contexto RAG/FAQ dentro de un presupuesto de tokens:
+cuenta tokens con un tokenizer local, elimina el solapamiento entre chunks
+contiguos y selecciona los fragmentos de mayor score con formato compacto.
+"""
+
+import os
+import re
+from typing import Dict, Any, List, Optional
+from dataclasses import dataclass
+
+try:
+    import tiktoken
+except ImportError:
+    # tiktoken es opcional, se usa una estimación por caracteres
+    tiktoken = None
+
+
+@dataclass
+class ContextChunk:
+    """Fragmento de contexto normalizado"""
+    content: str
+    source: str
+    score: float
+    kind: str = "RAG"
+
+
+@dataclass
+class PackedContext:
+    """Resultado del empaquetado de contexto"""
+    text: str
+    tokens: int
+    chunks_included: int
+    chunks_dropped: int
+    chunks_deduplicated: int
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convertir a diccionario"""
+        return {
+            "context_tokens": self.tokens,
+            "chunks_included": self.chunks_included,
+            "chunks_dropped": self.chunks_dropped,
+            "chunks_deduplicated": self.chunks_deduplicated
+        }
+
+
+class TokenCounter:
+    """Contador de tokens con tokenizer local"""
+    
+    def __init__(self, model: str = "gpt-4"):
+        """
+        Inicializar contador
+        
+        Args:
+            model: Modelo cuyo tokenizer se usa (si tiktoken está disponible)
+        """
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except Exception:
+                try:
+                    self.encoding = tiktoken.get_encoding("cl100k_base")
+                except Exception:
+                    self.encoding = None
+    
+    def count(self, text: str) -> int:
+        """Contar tokens de un texto"""
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        # Estimación: ~4 caracteres por token
+        return max(1, (len(text) + 3) // 4)
+    
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Recortar un texto a un máximo de tokens"""
+        if max_tokens <= 0:
+            return ""
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text)
+            if len(tokens) <= max_tokens:
+                return text
+            return self.encoding.decode(tokens[:max_tokens])
+        return text[:max_tokens * 4]
+
+
+class ContextPacker:
+    """Empaquetador de contexto con presupuesto de tokens"""
+    
+    def __init__(self,
+                 token_budget: Optional[int] = None,
+                 max_overlap: Optional[int] = None,
+                 min_overlap: int = 40,
+                 counter: Optional[TokenCounter] = None):
+        """
+        Inicializar empaquetador
+        
+        Args:
+            token_budget: Máximo de tokens de contexto (CONTEXT_TOKEN_BUDGET)
+            max_overlap: Máximo solapamiento a buscar entre chunks (CHUNK_OVERLAP)
+            min_overlap: Solapamiento mínimo para considerarlo duplicado
+            counter: Contador de tokens a reutilizar
+        """
+        self.token_budget = token_budget or int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+        self.max_overlap = max_overlap or int(os.getenv("CHUNK_OVERLAP", "200"))
+        self.min_overlap = min_overlap
+        self.counter = counter or TokenCounter(os.getenv("OPENAI_MODEL", "gpt-4"))
+    
+    @staticmethod
+    def to_chunk(item: Any, kind: str = "RAG") -> ContextChunk:
+        """
+        Normalizar un resultado de búsqueda a ContextChunk
+        
+        Acepta SearchResult, FAQResult o diccionarios con las claves
+        usadas por el orquestador.
+        """
+        if isinstance(item, ContextChunk):
+            return item
+        
+        get = item.get if isinstance(item, dict) else lambda key, default=None: getattr(item, key, default)
+        
+        question = get("question")
+        if question:
+            answer = get("answer", "")
+            return ContextChunk(
+                content=f"P: {question}\nR: {answer}",
+                source=get("category") or "faq",
+                score=float(get("confidence", None) or get("score", 0) or 0),
+                kind="FAQ"
+            )
+        
+        metadata = get("metadata") or {}
+        source = get("source") or metadata.get("filename") or metadata.get("source") or "documento"
+        score = get("score", None)
+        if score is None:
+            score = get("similarity", 0)
+        
+        return ContextChunk(
+            content=get("content", "") or "",
+            source=os.path.basename(str(source)),
+            score=float(score or 0),
+            kind=kind
+        )
+    
+    def pack(self, items: List[Any], token_budget: Optional[int] = None) -> PackedContext:
+        """
+        Empaquetar resultados dentro del presupuesto
+        
+        Args:
+            items: Resultados de búsqueda (RAG y/o FAQ)
+            token_budget: Override del presupuesto configurado
+        
+        Returns:
+            Contexto empaquetado con estadísticas
+        """
+        budget = token_budget or self.token_budget
+        chunks = sorted(
+            (self.to_chunk(item) for item in items if item is not None),
+            key=lambda c: c.score,
+            reverse=True
+        )
+        
+        selected: List[ContextChunk] = []
+        blocks: List[str] = []
+        used_tokens = 0
+        dropped = 0
+        deduplicated = 0
+        
+        for chunk in chunks:
+            content = self._compress(chunk.content)
+            content = self._remove_overlap(content, chunk.source, selected)
+            if not content:
+                deduplicated += 1
+                continue
+            
+            block = f"[{len(blocks) + 1}] {chunk.kind} {chunk.source} ({chunk.score:.2f})\n{content}"
+            block_tokens = self.counter.count(block) + 1  # salto de línea separador
+            
+            if used_tokens + block_tokens > budget:
+                # Si nada cabe todavía, recortar el mejor fragmento
+                if not blocks:
+                    block = self.counter.truncate(block, budget)
+                    block_tokens = self.counter.count(block)
+                else:
+                    dropped += 1
+                    continue
+            
+            selected.append(ContextChunk(content, chunk.source, chunk.score, chunk.kind))
+            blocks.append(block)
+            used_tokens += block_tokens
+        
+        return PackedContext(
+            text="\n".join(blocks),
+            tokens=used_tokens,
+            chunks_included=len(blocks),
+            chunks_dropped=dropped,
+            chunks_deduplicated=deduplicated
+        )
+    
+    def fit(self, text: str, token_budget: Optional[int] = None) -> str:
+        """Recortar un contexto ya formateado al presupuesto"""
+        budget = token_budget or self.token_budget
+        return self.counter.truncate(self._compress(text), budget)
+    
+    def _compress(self, text: str) -> str:
+        """Compactar espacios y líneas vacías"""
+        text = re.sub(r"[ \t]+", " ", text or "")
+        text = re.sub(r"\n\s*\n+", "\n", text)
+        return text.strip()
+    
+    def _remove_overlap(self, content: str, source: str, selected: List[ContextChunk]) -> Optional[str]:
+        """
+        Eliminar el texto ya incluido por otro chunk del mismo documento
+        
+        Los chunks contiguos comparten hasta CHUNK_OVERLAP caracteres, por lo
+        que se recorta el prefijo/sufijo solapado o se descarta el chunk
+        si está contenido por completo.
+        
+        Returns:
+            Contenido sin solapamiento, o None si es un duplicado
+        """
+        for other in selected:
+            if other.source != source:
+                continue
+            if content in other.content:
+                return None
+            
+            overlap = self._overlap_length(other.content, content)
+            if overlap:
+                content = content[overlap:].strip()
+            
+            overlap = self._overlap_length(content, other.content)
+            if overlap:
+                content = content[:-overlap].strip()
+            
+            if not content:
+                return None
+        
+        return content
+    
+    def _overlap_length(self, head: str, tail: str) -> int:
+        """Longitud del sufijo de head que coincide con el prefijo de tail"""
+        limit = min(len(head), len(tail), self.max_overlap)
+        for size in range(limit, self.min_overlap - 1, -1):
+            if head.endswith(tail[:size]):
+                return size
+        return 0
@@ -0,0 +1,102 @@
+"""
+Model Cascade Module
+
+Cascada de modelos para la generación de respuestas: se genera primero con
+un modelo rápido/barato (o un proveedor local) y solo se regenera con el
+modelo principal cuando la evaluación queda por debajo del mínimo de
+calidad. Las consultas de complejidad alta van directamente al principal.
+"""
+
+import threading
+from typing import Dict, Any, Optional
+
+from tools.metrics import metrics
+
+from .multi_llm_client import MultiLLMClient
+
+
+FAST = "fast"
+STRONG = "strong"
+
+# accepted: respuesta rápida aceptada; escalated: regenerada con el modelo
+# principal; direct: complejidad alta, directamente al modelo principal
+OUTCOMES = ("accepted", "escalated", "direct")
+
+
+class ModelCascade:
+    """Selección de modelo por consulta y estadísticas de escalado (thread-safe)"""
+    
+    def __init__(self, strong: MultiLLMClient, fast: Optional[MultiLLMClient] = None):
+        """
+        Inicializar cascada
+        
+        Args:
+            strong: Cliente del modelo principal
+            fast: Cliente del modelo rápido; sin él la cascada está desactivada
+        """
+        self.strong = strong
+        self.fast = fast
+        self.counts = {outcome: 0 for outcome in OUTCOMES}
+        self.latency = {FAST: [0, 0.0], STRONG: [0, 0.0]}  # generaciones, segundos
+        self._lock = threading.Lock()
+    
+    @property
+    def enabled(self) -> bool:
+        return self.fast is not None
+    
+    def initial_tier(self, complexity: str) -> str:
+        """Modelo con el que se genera la primera respuesta"""
+        if not self.enabled or complexity == "HIGH":
+            return STRONG
+        return FAST
+    
+    def client(self, tier: str) -> MultiLLMClient:
+        """Cliente LLM de un nivel"""
+        return self.fast if tier == FAST and self.fast is not None else self.strong
+    
+    def should_escalate(self, tier: str, score: float, min_score: float) -> bool:
+        """Una respuesta rápida por debajo del mínimo se regenera con el modelo principal"""
+        return tier == FAST and score < min_score
+    
+    def record_generation(self, tier: str, latency: float) -> None:
+        """Registrar la latencia de una generación"""
+        with self._lock:
+            entry = self.latency[tier]
+            entry[0] += 1
+            entry[1] += latency
+    
+    def record_outcome(self, outcome: str) -> None:
+        """Registrar el resultado de la cascada para una consulta"""
+        with self._lock:
+            self.counts[outcome] += 1
+        metrics.inc(metrics.model_cascade, outcome=outcome)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Estadísticas de la cascada
+        
+        El ahorro estimado compara cada respuesta rápida aceptada con la
+        latencia media del modelo principal y descuenta el tiempo perdido en
+        las respuestas rápidas que hubo que regenerar.
+        """
+        with self._lock:
+            counts = dict(self.counts)
+            means = {
+                tier: (total / count if count else None)
+                for tier, (count, total) in self.latency.items()
+            }
+        
+        cascaded = counts["accepted"] + counts["escalated"]
+        saved = None
+        if means[FAST] is not None and means[STRONG] is not None:
+            saved = counts["accepted"] * (means[STRONG] - means[FAST]) - counts["escalated"] * means[FAST]
+        
+        return {
+            "enabled": self.enabled,
+            "fast_model": self.fast.config.model if self.fast else None,
+            "strong_model": self.strong.config.model,
+            **counts,
+            "escalation_rate": (counts["escalated"] / cascaded) * 100 if cascaded else 0.0,
+            "mean_latency_s": {tier: round(mean, 4) if mean is not None else None for tier, mean in means.items()},
+            "estimated_latency_saved_s": round(saved, 4) if saved is not None else None
+        }
@@ -14,13 +14,18 @@ Soporta:
 """
 
 import asyncio
+import time
 from typing import Dict, Any, List, Optional, Union
 from dataclasses import dataclass
 from enum import Enum
 from openai import OpenAI, AsyncOpenAI
 
+from tools.tracing import traced
+from tools.deadline import DeadlineExceeded, bounded_call
+
 from .config import OpenAIConfig
 from .logger import AgentLogger
+from .structured_output import StructuredOutput, StructuredResult
 
 
 class LLMProvider(Enum):
@@ -34,6 +39,14 @@ class LLMProvider(Enum):
     CUSTOM = "custom"
 
 
+class EnsembleMode(Enum):
+    """Modos de espera del ensemble"""
+    ALL = "all"                       # Esperar a todos los modelos
+    FIRST_SUCCESS = "first_success"   # Retornar con la primera respuesta válida
+    QUORUM = "quorum"                 # Retornar al alcanzar k respuestas válidas
+    DEADLINE = "deadline"             # Retornar lo disponible al vencer el plazo
+
+
 # Configuraciones predefinidas de proveedores
 PROVIDER_ENDPOINTS = {
     "openai": "https://api.openai.com/v1",
@@ -65,6 +78,16 @@ class LLMResponse:
             "metadata": self.metadata or {}
         }
 
+    def trace_attributes(self) -> Dict[str, Any]:
+        """Atributos para el span de generación"""
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "tokens": self.tokens_used,
+            "prompt_tokens": (self.metadata or {}).get("prompt_tokens"),
+            "finish_reason": self.finish_reason
+        }
+
 
 class MultiLLMClient:
     """
@@ -102,6 +125,9 @@ class MultiLLMClient:
             base_url=base_url if config.provider != "openai" else None
         )
         
+        # Salidas JSON (response_format nativo si el proveedor lo soporta)
+        self.structured_output = StructuredOutput(config.provider)
+        
         self.logger.info(
             f"MultiLLMClient initialized",
             extra={
@@ -111,11 +137,13 @@ class MultiLLMClient:
             }
         )
     
+    @traced("llm_generate", result_attributes=lambda r: r.trace_attributes())
     def generate(
         self,
         messages: List[Dict[str, str]],
         temperature: Optional[float] = None,
         max_tokens: Optional[int] = None,
+        stage: str = "generation",
         **kwargs
     ) -> LLMResponse:
         """
@@ -125,24 +153,27 @@ class MultiLLMClient:
             messages: Lista de mensajes (formato OpenAI)
             temperature: Temperatura de generación (override)
             max_tokens: Máximo de tokens (override)
+            stage: Etapa del pipeline (timeout dentro del deadline de la petición)
             **kwargs: Parámetros adicionales
             
         Returns:
             Respuesta del LLM
         """
         try:
-            response = self.client.chat.completions.create(
-                model=self.config.model,
-                messages=messages,
-                temperature=temperature or self.config.temperature,
-                max_tokens=max_tokens or self.config.max_tokens,
-                **kwargs
-            )
+            with bounded_call(self.client, stage) as client:
+                response = client.chat.completions.create(
+                    model=self.config.model,
+                    messages=messages,
+                    temperature=temperature or self.config.temperature,
+                    max_tokens=max_tokens or self.config.max_tokens,
+                    **kwargs
+                )
             
             # Extraer información
             content = response.choices[0].message.content
             finish_reason = response.choices[0].finish_reason
             tokens_used = response.usage.total_tokens if response.usage else None
+            prompt_tokens = response.usage.prompt_tokens if response.usage else None
             
             return LLMResponse(
                 content=content,
@@ -152,10 +183,13 @@ class MultiLLMClient:
                 finish_reason=finish_reason,
                 metadata={
                     "temperature": temperature or self.config.temperature,
-                    "max_tokens": max_tokens or self.config.max_tokens
+                    "max_tokens": max_tokens or self.config.max_tokens,
+                    "prompt_tokens": prompt_tokens
                 }
             )
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             self.logger.error(
                 f"Error generating response",
@@ -164,11 +198,47 @@ class MultiLLMClient:
             )
             raise
     
+    def generate_json(
+        self,
+        messages: List[Dict[str, str]],
+        schema: Dict[str, Any],
+        name: str,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        required: Optional[List[str]] = None
+    ) -> StructuredResult:
+        """
+        Generar un objeto JSON validado contra un schema
+        
+        Usa el response_format nativo del proveedor (json_schema u objeto
+        JSON) cuando está disponible y el parser tolerante en otro caso,
+        reintentando un número limitado de veces si la respuesta no es válida.
+        
+        Args:
+            messages: Lista de mensajes (formato OpenAI)
+            schema: JSON Schema del objeto esperado
+            name: Nombre de la tarea (schema y métricas)
+            temperature: Temperatura de generación (override)
+            max_tokens: Máximo de tokens (override)
+            required: Claves obligatorias al validar (por defecto las del schema)
+            
+        Returns:
+            Resultado con el objeto (None si ninguna respuesta fue válida)
+        """
+        def call(request_messages: List[Dict[str, str]], response_format: Optional[Dict[str, Any]]):
+            kwargs = {"response_format": response_format} if response_format else {}
+            response = self.generate(request_messages, temperature, max_tokens, stage=name, **kwargs)
+            return response.content, response.finish_reason
+        
+        return self.structured_output.request(call, messages, schema, name, required)
+    
+    @traced("llm_generate", result_attributes=lambda r: r.trace_attributes())
     async def generate_async(
         self,
         messages: List[Dict[str, str]],
         temperature: Optional[float] = None,
         max_tokens: Optional[int] = None,
+        stage: str = "generation",
         **kwargs
     ) -> LLMResponse:
         """
@@ -178,23 +248,26 @@ class MultiLLMClient:
             messages: Lista de mensajes (formato OpenAI)
             temperature: Temperatura de generación (override)
             max_tokens: Máximo de tokens (override)
+            stage: Etapa del pipeline (timeout dentro del deadline de la petición)
             **kwargs: Parámetros adicionales
             
         Returns:
             Respuesta del LLM
         """
         try:
-            response = await self.async_client.chat.completions.create(
-                model=self.config.model,
-                messages=messages,
-                temperature=temperature or self.config.temperature,
-                max_tokens=max_tokens or self.config.max_tokens,
-                **kwargs
-            )
+            with bounded_call(self.async_client, stage) as client:
+                response = await client.chat.completions.create(
+                    model=self.config.model,
+                    messages=messages,
+                    temperature=temperature or self.config.temperature,
+                    max_tokens=max_tokens or self.config.max_tokens,
+                    **kwargs
+                )
             
             content = response.choices[0].message.content
             finish_reason = response.choices[0].finish_reason
             tokens_used = response.usage.total_tokens if response.usage else None
+            prompt_tokens = response.usage.prompt_tokens if response.usage else None
             
             return LLMResponse(
                 content=content,
@@ -204,10 +277,13 @@ class MultiLLMClient:
                 finish_reason=finish_reason,
                 metadata={
                     "temperature": temperature or self.config.temperature,
-                    "max_tokens": max_tokens or self.config.max_tokens
+                    "max_tokens": max_tokens or self.config.max_tokens,
+                    "prompt_tokens": prompt_tokens
                 }
             )
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             self.logger.error(
                 f"Error in async generation",
@@ -236,6 +312,9 @@ class MultiLLMEnsemble:
         self.logger = logger or AgentLogger("multi_llm_ensemble")
         self.clients = [MultiLLMClient(config, logger) for config in configs]
         
+        # Estadísticas por miembro (provider:model)
+        self.member_stats: Dict[str, Dict[str, Any]] = {}
+        
         self.logger.info(
             f"MultiLLMEnsemble initialized with {len(self.clients)} clients",
             extra={
@@ -248,41 +327,100 @@ class MultiLLMEnsemble:
         self,
         messages: List[Dict[str, str]],
         temperature: Optional[float] = None,
-        max_tokens: Optional[int] = None
+        max_tokens: Optional[int] = None,
+        mode: Union[EnsembleMode, str] = EnsembleMode.ALL,
+        quorum: int = 2,
+        deadline: Optional[float] = None,
+        member_timeout: Optional[float] = None
     ) -> List[LLMResponse]:
         """
-        Generar respuestas de todos los LLMs en paralelo
+        Generar respuestas de los LLMs en paralelo
+        
+        Según el modo, retorna en cuanto hay suficientes respuestas válidas
+        y cancela las llamadas que siguen en curso.
         
         Args:
             messages: Lista de mensajes
             temperature: Temperatura override
             max_tokens: Max tokens override
+            mode: Modo de espera (all, first_success, quorum, deadline)
+            quorum: Número de respuestas válidas requeridas en modo quorum
+            deadline: Plazo total en segundos (obligatorio en modo deadline)
+            member_timeout: Timeout individual por modelo en segundos
             
         Returns:
-            Lista de respuestas de todos los modelos
+            Lista de respuestas válidas en orden de llegada
         """
+        mode = EnsembleMode(mode)
+        if mode == EnsembleMode.DEADLINE and deadline is None:
+            raise ValueError("deadline es obligatorio en modo deadline")
+        
+        required = len(self.clients)
+        if mode == EnsembleMode.FIRST_SUCCESS:
+            required = 1
+        elif mode == EnsembleMode.QUORUM:
+            required = max(1, min(quorum, len(self.clients)))
+        
         try:
-            # Generar todas las respuestas en paralelo
-            tasks = [
-                client.generate_async(messages, temperature, max_tokens)
+            # Lanzar todas las llamadas en paralelo
+            tasks = {
+                asyncio.ensure_future(
+                    self._timed_generate(client, messages, temperature, max_tokens, member_timeout)
+                ): client
                 for client in self.clients
-            ]
-            
-            responses = await asyncio.gather(*tasks, return_exceptions=True)
+            }
             
-            # Filtrar errores
             valid_responses = []
-            for i, response in enumerate(responses):
-                if isinstance(response, Exception):
-                    self.logger.error(
-                        f"Error from provider {self.clients[i].config.provider}",
-                        exception=response
-                    )
-                else:
-                    valid_responses.append(response)
+            pending = set(tasks)
+            loop = asyncio.get_running_loop()
+            deadline_at = loop.time() + deadline if deadline is not None else None
+            
+            while pending and len(valid_responses) < required:
+                remaining = None
+                if deadline_at is not None:
+                    remaining = deadline_at - loop.time()
+                    if remaining <= 0:
+                        break
+                
+                done, pending = await asyncio.wait(
+                    pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    break  # Plazo vencido
+                
+                for task in done:
+                    client = tasks[task]
+                    try:
+                        response = task.result()
+                    except asyncio.TimeoutError:
+                        self._record_member(client, "timeouts")
+                        self.logger.warning(
+                            f"Timeout from provider {client.config.provider}",
+                            extra={"member_timeout": member_timeout}
+                        )
+                        continue
+                    except Exception as e:
+                        self._record_member(client, "failures")
+                        self.logger.error(
+                            f"Error from provider {client.config.provider}",
+                            exception=e
+                        )
+                        continue
+                    
+                    if self._is_valid_response(response):
+                        valid_responses.append(response)
+                    else:
+                        self._record_member(client, "invalid")
+            
+            # Cancelar las llamadas que siguen en curso
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
             
             self.logger.info(
-                f"Ensemble generated {len(valid_responses)}/{len(self.clients)} successful responses"
+                f"Ensemble generated {len(valid_responses)}/{len(self.clients)} successful responses",
+                extra={"mode": mode.value, "cancelled": len(pending)}
             )
             
             return valid_responses
@@ -291,6 +429,71 @@ class MultiLLMEnsemble:
             self.logger.error("Error in ensemble generation", exception=e)
             raise
     
+    async def _timed_generate(
+        self,
+        client: MultiLLMClient,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        member_timeout: Optional[float]
+    ) -> LLMResponse:
+        """Invocar un modelo midiendo su latencia"""
+        start_time = time.perf_counter()
+        try:
+            call = client.generate_async(messages, temperature, max_tokens)
+            if member_timeout is not None:
+                response = await asyncio.wait_for(call, timeout=member_timeout)
+            else:
+                response = await call
+        except asyncio.CancelledError:
+            # Cancelada por salida anticipada: no cuenta como latencia observada
+            self._record_member(client, "cancelled")
+            raise
+        except Exception:
+            self._record_member(client, "calls", time.perf_counter() - start_time)
+            raise
+        
+        latency = time.perf_counter() - start_time
+        self._record_member(client, "calls", latency)
+        response.metadata = {**(response.metadata or {}), "latency": latency}
+        self._record_member(client, "successes")
+        return response
+    
+    def _is_valid_response(self, response: LLMResponse) -> bool:
+        """Verificar que una respuesta sea utilizable"""
+        return bool(response and response.content and response.content.strip())
+    
+    def _record_member(self, client: MultiLLMClient, field: str, latency: Optional[float] = None):
+        """Registrar estadísticas de un miembro del ensemble"""
+        key = f"{client.config.provider}:{client.config.model}"
+        stats = self.member_stats.setdefault(key, {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "timeouts": 0,
+            "invalid": 0,
+            "cancelled": 0,
+            "total_latency": 0.0,
+            "max_latency": 0.0,
+            "last_latency": None
+        })
+        
+        if field == "calls" and latency is not None:
+            stats["total_latency"] += latency
+            stats["max_latency"] = max(stats["max_latency"], latency)
+            stats["last_latency"] = latency
+        stats[field] += 1
+    
+    def get_member_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Obtener estadísticas de latencia por miembro del ensemble"""
+        result = {}
+        for key, stats in self.member_stats.items():
+            result[key] = {
+                **stats,
+                "average_latency": stats["total_latency"] / stats["calls"] if stats["calls"] else 0.0
+            }
+        return result
+    
     def select_best_response(
         self,
         responses: List[LLMResponse],
@@ -83,14 +83,14 @@ class PromptManager:
         - **COMBINED**: Para consultas complejas o multifacéticas
 
         Responde en JSON con la estructura:
-        {
+        {{
             "category": "CATEGORIA",
             "confidence": 85,
             "recommended_tool": "HERRAMIENTA",
             "reasoning": "explicación breve",
             "search_terms": ["término1", "término2"],
             "expected_complexity": "LOW|MEDIUM|HIGH"
-        }
+        }}
 
         Consulta a clasificar: {query}
         """
@@ -127,20 +127,20 @@ class PromptManager:
         5. **Profesionalismo** (10%): Tono y presentación apropiados
 
         ## Responde en JSON:
-        {
+        {{
             "overall_score": 8.5,
-            "scores": {
+            "scores": {{
                 "precision": 9.0,
                 "completeness": 8.0,
                 "relevance": 9.0,
                 "clarity": 8.5,
                 "professionalism": 8.0
-            },
+            }},
             "confidence": 85,
             "strengths": ["punto fuerte 1", "punto fuerte 2"],
             "weaknesses": ["área de mejora 1"],
             "suggestions": ["sugerencia 1", "sugerencia 2"]
-        }
+        }}
 
         Consulta original: {query}
         Respuesta a evaluar: {response}
@@ -0,0 +1,367 @@
+"""
+Session Memory Module
+
+Memoria conversacional por session_id: turnos recientes, un resumen
+acumulado de los anteriores y la última recuperación RAG. Las consultas de
+seguimiento ("¿y en qué año?") se clasifican y buscan junto con la consulta
+que abrió el tema, reutilizan los fragmentos ya recuperados mientras sigan
+siendo relevantes y se generan con el historial, que se mantiene por debajo de un
+presupuesto de tokens resumiendo de forma incremental los turnos antiguos.
+"""
+
+import os
+import re
+import math
+import logging
+import threading
+from dataclasses import dataclass, asdict, is_dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Callable, Set, Tuple
+
+from tools.metrics import metrics
+from tools.session_store import SessionStore, InMemorySessionStore, create_session_store
+
+from .context_packer import TokenCounter
+
+
+logger = logging.getLogger(__name__)
+
+# Sesiones sin identidad propia (o de procesos internos): no se guarda memoria
+ANONYMOUS_SESSIONS = ("", "anonymous", "batch", "warmup")
+
+# Consultas que dependen del turno anterior: conector al inicio o referencia a lo ya dicho
+FOLLOW_UP_START = re.compile(
+    r"^\W*(y|e|pero|entonces|también|tambien|además|ademas|más|mas|otro|otra|otros|otras)\b",
+    re.IGNORECASE
+)
+FOLLOW_UP_REFERENCE = re.compile(
+    r"\b(eso|esa|ese|esos|esas|esto|ello|ellos|ellas|ahí|allí|dicho|dicha|lo anterior|"
+    r"mencionaste|comentaste|el mismo|la misma)\b",
+    re.IGNORECASE
+)
+
+# Función de resumen: (resumen anterior, [(consulta, respuesta)]) -> nuevo resumen o None
+Summarizer = Callable[[str, List[Tuple[str, str]]], Optional[str]]
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    if not a or not b or len(a) != len(b):
+        return 0.0
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def _first_sentence(text: str, max_chars: int = 160) -> str:
+    text = " ".join(text.replace("*", "").split())
+    match = re.search(r"(?<=[.!?])\s", text)
+    sentence = text[:match.start()] if match else text
+    return sentence if len(sentence) <= max_chars else sentence[:max_chars].rstrip() + "…"
+
+
+@dataclass
+class SessionTurn:
+    """Consulta en curso dentro de una sesión"""
+    session_id: str
+    query: str
+    follow_up: bool
+    topic: str  # consulta que abrió el tema (la última que no era un seguimiento)
+    retrieval_query: str  # consulta para clasificar y buscar (con el tema si es seguimiento)
+    history: str  # historial para el prompt, dentro del presupuesto de tokens
+    history_tokens: int
+    retrieval: Optional[Dict[str, Any]] = None  # última recuperación guardada en la sesión
+    new_retrieval: Optional[Dict[str, Any]] = None  # recuperación de esta consulta
+
+
+class SessionMemory:
+    """Memoria de las sesiones de chat (thread-safe dentro del proceso)"""
+    
+    def __init__(self,
+                 store: SessionStore,
+                 counter: TokenCounter,
+                 summarize: Optional[Summarizer] = None,
+                 history_tokens: int = 800,
+                 summary_tokens: int = 300,
+                 reuse_similarity: float = 0.8,
+                 max_turns: int = 20,
+                 background: bool = True,
+                 enabled: bool = True):
+        """
+        Inicializar memoria
+        
+        Args:
+            store: Almacén de sesiones (memoria LRU o SQLite)
+            counter: Contador de tokens del prompt
+            summarize: Resumen con LLM de los turnos antiguos; sin él (o si
+                falla) se usa un resumen compacto sin LLM
+            history_tokens: Presupuesto de tokens del historial en el prompt
+            summary_tokens: Parte del presupuesto reservada al resumen
+            reuse_similarity: Similitud mínima (coseno) entre la búsqueda del
+                seguimiento y la anterior para reutilizar sus fragmentos
+            max_turns: Turnos literales máximos antes de resumir
+            background: Resumir en un thread aparte, fuera de la petición
+            enabled: Si False, begin() devuelve None y no se guarda nada
+        """
+        self.store = store
+        self.counter = counter
+        self.summarize = summarize
+        self.history_tokens = history_tokens
+        self.summary_tokens = min(summary_tokens, history_tokens // 2)
+        self.reuse_similarity = reuse_similarity
+        self.max_turns = max(1, max_turns)
+        self.background = background
+        self.enabled = enabled
+        self.counts = {"turns": 0, "follow_ups": 0, "chunks_reused": 0, "summarized": 0, "summarized_fallback": 0}
+        self._locks = [threading.Lock() for _ in range(32)]
+        self._stats_lock = threading.Lock()
+        self._pending: Set[str] = set()
+        self._executor: Optional[ThreadPoolExecutor] = None
+    
+    @classmethod
+    def from_env(cls, counter: TokenCounter, summarize: Optional[Summarizer] = None) -> 'SessionMemory':
+        """Crear memoria desde variables de entorno"""
+        enabled = os.getenv("SESSION_MEMORY", "true").lower() == "true"
+        return cls(
+            create_session_store() if enabled else InMemorySessionStore(),
+            counter,
+            summarize,
+            history_tokens=int(os.getenv("SESSION_HISTORY_TOKENS", "800")),
+            summary_tokens=int(os.getenv("SESSION_SUMMARY_TOKENS", "300")),
+            reuse_similarity=float(os.getenv("SESSION_REUSE_SIMILARITY", "0.8")),
+            max_turns=int(os.getenv("SESSION_MAX_TURNS", "20")),
+            enabled=enabled
+        )
+    
+    @staticmethod
+    def is_follow_up(query: str) -> bool:
+        """La consulta se apoya en el turno anterior (conector inicial o referencia)"""
+        return bool(FOLLOW_UP_START.search(query) or FOLLOW_UP_REFERENCE.search(query))
+    
+    def would_follow_up(self, session_id: str, query: str) -> bool:
+        """
+        Indica si begin() trataría la consulta como seguimiento (sin contarlo);
+        solo consulta el almacén si la consulta tiene forma de seguimiento
+        """
+        if not self.enabled or session_id in ANONYMOUS_SESSIONS or not self.is_follow_up(query):
+            return False
+        state = self.store.get(session_id) or {}
+        return bool(state.get("turns"))
+    
+    def begin(self, session_id: str, query: str) -> Optional[SessionTurn]:
+        """
+        Preparar una consulta de la sesión
+        
+        Returns:
+            Turno con el historial y la consulta de búsqueda, o None si la
+            memoria está desactivada o la sesión es anónima
+        """
+        if not self.enabled or session_id in ANONYMOUS_SESSIONS:
+            return None
+        
+        state = self.store.get(session_id) or {}
+        turns = state.get("turns", [])
+        follow_up = bool(turns) and self.is_follow_up(query)
+        topic, retrieval_query = query, query
+        if follow_up:
+            # Los seguimientos encadenados conservan el tema de la primera consulta
+            topic = turns[-1].get("topic") or turns[-1]["query"]
+            retrieval_query = f"{topic} {query}"
+            with self._stats_lock:
+                self.counts["follow_ups"] += 1
+            metrics.inc(metrics.session_memory, event="follow_up")
+        
+        history = self.render_history(state)
+        return SessionTurn(
+            session_id=session_id,
+            query=query,
+            follow_up=follow_up,
+            topic=topic,
+            retrieval_query=retrieval_query,
+            history=history,
+            history_tokens=self.counter.count(history),
+            retrieval=state.get("retrieval")
+        )
+    
+    def reusable_results(self, turn: Optional[SessionTurn], embedding: List[float],
+                         index_version: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Fragmentos de la última recuperación de la sesión si siguen siendo relevantes
+        
+        Solo para seguimientos, con el mismo índice y una búsqueda parecida a
+        la que los recuperó.
+        """
+        retrieval = turn.retrieval if turn is not None and turn.follow_up else None
+        if not retrieval or retrieval.get("index_version") != index_version:
+            return None
+        if _cosine(embedding, retrieval.get("embedding") or []) < self.reuse_similarity:
+            return None
+        return retrieval.get("results") or None
+    
+    def record_reuse(self) -> None:
+        """Registrar una búsqueda resuelta con los fragmentos de la sesión"""
+        with self._stats_lock:
+            self.counts["chunks_reused"] += 1
+        metrics.inc(metrics.session_memory, event="chunks_reused")
+    
+    def set_retrieval(self, turn: Optional[SessionTurn], embedding: List[float],
+                      results: List[Any], index_version: str) -> None:
+        """Guardar la recuperación de esta consulta para los seguimientos"""
+        if turn is None:
+            return
+        turn.new_retrieval = {
+            "query": turn.retrieval_query,
+            "embedding": [round(float(value), 6) for value in embedding],
+            "results": [asdict(result) if is_dataclass(result) else dict(result) for result in results],
+            "index_version": index_version
+        }
+    
+    def record(self, turn: Optional[SessionTurn], response: str) -> None:
+        """Añadir el turno a la sesión y resumir los antiguos si se supera el presupuesto"""
+        if turn is None:
+            return
+        with self._lock_for(turn.session_id):
+            state = self.store.get(turn.session_id) or {}
+            turns = state.setdefault("turns", [])
+            next_id = state.get("next_id", 0)
+            turns.append({"id": next_id, "query": turn.query, "response": response, "topic": turn.topic})
+            state["next_id"] = next_id + 1
+            if turn.new_retrieval is not None:
+                state["retrieval"] = turn.new_retrieval
+            self.store.set(turn.session_id, state)
+            fold = self._fold_count(state) > 0
+        
+        with self._stats_lock:
+            self.counts["turns"] += 1
+            fold = fold and turn.session_id not in self._pending
+            if fold:
+                self._pending.add(turn.session_id)
+        if not fold:
+            return
+        if not self.background:
+            self._fold(turn.session_id)
+            return
+        with self._stats_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-summary")
+        self._executor.submit(self._fold, turn.session_id)
+    
+    def render_history(self, state: Dict[str, Any]) -> str:
+        """
+        Historial para el prompt dentro del presupuesto: resumen de los turnos
+        antiguos y los turnos recientes más nuevos que quepan (el último
+        siempre aparece, recortado si hace falta)
+        """
+        summary = state.get("summary", "")
+        turns = state.get("turns", [])
+        if not summary and not turns:
+            return ""
+        
+        parts = []
+        budget = self.history_tokens
+        if summary:
+            parts.append(f"Resumen de la conversación:\n{self.counter.truncate(summary, self.summary_tokens)}")
+            budget -= self.counter.count(parts[0])
+        
+        header = "Últimos turnos:"
+        budget -= self.counter.count(header)
+        recent: List[str] = []
+        for item in reversed(turns):
+            text = self._format_turn(item)
+            tokens = self.counter.count(text)
+            if tokens > budget:
+                if not recent and budget > 0:
+                    recent.append(self.counter.truncate(text, budget))
+                break
+            recent.append(text)
+            budget -= tokens
+        if recent:
+            parts.append(header + "\n" + "\n\n".join(reversed(recent)))
+        return "\n\n".join(parts)
+    
+    @staticmethod
+    def _format_turn(turn: Dict[str, Any]) -> str:
+        return f"Usuario: {turn['query']}\nAsistente: {turn['response']}"
+    
+    def _lock_for(self, session_id: str) -> threading.Lock:
+        return self._locks[hash(session_id) % len(self._locks)]
+    
+    def _fold_count(self, state: Dict[str, Any]) -> int:
+        """Turnos más antiguos que no caben junto al resumen (siempre queda el último)"""
+        turns = state.get("turns", [])
+        available = self.history_tokens - self.summary_tokens
+        keep, used = 0, 0
+        for item in reversed(turns):
+            used += self.counter.count(self._format_turn(item))
+            if keep and (used > available or keep >= self.max_turns):
+                break
+            keep += 1
+        return len(turns) - keep
+    
+    def _fold(self, session_id: str) -> None:
+        """Resumir los turnos antiguos de una sesión dentro del resumen acumulado"""
+        try:
+            with self._lock_for(session_id):
+                state = self.store.get(session_id)
+                count = self._fold_count(state) if state else 0
+                if not count:
+                    return
+                folded = state["turns"][:count]
+                summary = state.get("summary", "")
+            
+            # La llamada al LLM no bloquea la sesión
+            new_summary = self._summarize(summary, folded)
+            
+            with self._lock_for(session_id):
+                state = self.store.get(session_id)
+                # Descartar si la sesión caducó o cambió mientras se resumía
+                if not state or [item["id"] for item in state["turns"][:count]] != [item["id"] for item in folded]:
+                    return
+                state["summary"] = new_summary
+                state["turns"] = state["turns"][count:]
+                state["summarized_turns"] = state.get("summarized_turns", 0) + count
+                self.store.set(session_id, state)
+        except Exception as e:
+            logger.warning(f"Error resumiendo la sesión {session_id}: {e}")
+        finally:
+            with self._stats_lock:
+                self._pending.discard(session_id)
+    
+    def _summarize(self, summary: str, turns: List[Dict[str, Any]]) -> str:
+        """Nuevo resumen con el LLM o, si no está disponible, compacto sin LLM"""
+        text = None
+        if self.summarize is not None:
+            try:
+                text = self.summarize(summary, [(item["query"], item["response"]) for item in turns])
+            except Exception as e:
+                logger.warning(f"Error en el resumen con LLM, usando resumen compacto: {e}")
+        
+        if text and text.strip():
+            event, result = "summarized", self.counter.truncate(text.strip(), self.summary_tokens)
+        else:
+            event, result = "summarized_fallback", self._compact_summary(summary, turns)
+        with self._stats_lock:
+            self.counts[event] += 1
+        metrics.inc(metrics.session_memory, event=event)
+        return result
+    
+    def _compact_summary(self, summary: str, turns: List[Dict[str, Any]]) -> str:
+        """Resumen sin LLM: una línea por turno (consulta y primera frase de la respuesta)"""
+        lines = [line for line in summary.splitlines() if line.strip()]
+        for item in turns:
+            lines.append(f"- {' '.join(item['query'].split())} → {_first_sentence(item['response'])}")
+        # Se descartan primero las líneas más antiguas
+        while len(lines) > 1 and self.counter.count("\n".join(lines)) > self.summary_tokens:
+            lines.pop(0)
+        return self.counter.truncate("\n".join(lines), self.summary_tokens)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas de la memoria de sesión"""
+        with self._stats_lock:
+            counts = dict(self.counts)
+        return {
+            "enabled": self.enabled,
+            "history_tokens": self.history_tokens,
+            "summary_tokens": self.summary_tokens,
+            **counts,
+            "store": self.store.get_stats()
+        }
@@ -0,0 +1,313 @@
+"""
+Structured Output Module
+
+Salidas JSON estrictas para las llamadas de clasificación y evaluación:
+response_format nativo cuando el proveedor lo soporta (JSON Schema u objeto
+JSON), parser tolerante en el resto de casos (bloques de código, texto
+alrededor, JSON truncado por max_tokens), validación contra el mismo schema
+y un número limitado de reintentos cuando la respuesta no es válida.
+"""
+
+import os
+import re
+import json
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Sequence, Tuple, Callable
+from dataclasses import dataclass, field
+
+from tools.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# Modo de salida estructurada nativa por proveedor (el resto usa solo el parser)
+NATIVE_MODES = {
+    "openai": "json_schema",
+    "deepseek": "json_object",
+    "groq": "json_object",
+    "gemini": "json_object",
+    "ollama": "json_object",
+}
+
+# Degradación cuando el proveedor rechaza el response_format
+MODE_FALLBACK = {"json_schema": "json_object", "json_object": "off"}
+
+# Cortes hacia atrás que se prueban al reparar JSON truncado
+MAX_REPAIR_CUTS = 50
+
+FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL | re.IGNORECASE)
+
+# (content, finish_reason) de una llamada al LLM con un response_format opcional
+CompletionCall = Callable[[List[Dict[str, str]], Optional[Dict[str, Any]]], Tuple[str, Optional[str]]]
+
+
+def _close_fragment(fragment: str) -> str:
+    """Cerrar la cadena y los objetos/listas abiertos de un fragmento JSON"""
+    closers: List[str] = []
+    in_string = False
+    escape = False
+    for ch in fragment:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            closers.append("}" if ch == "{" else "]")
+        elif ch in "}]" and closers:
+            closers.pop()
+    
+    if in_string:
+        fragment += "\\" * escape + '"'
+    fragment = fragment.rstrip().rstrip(",").rstrip()
+    return fragment + "".join(reversed(closers))
+
+
+def repair_truncated(fragment: str) -> Optional[Any]:
+    """
+    Recuperar el JSON de una respuesta cortada a mitad
+    
+    Cierra lo que quedó abierto y, si aún no es válido (p. ej. una clave sin
+    valor), retrocede hasta la coma anterior y vuelve a intentarlo.
+    """
+    cut = len(fragment)
+    for _ in range(MAX_REPAIR_CUTS):
+        try:
+            return json.loads(_close_fragment(fragment[:cut]))
+        except ValueError:
+            pass
+        cut = fragment.rfind(",", 0, cut)
+        if cut <= 0:
+            return None
+    return None
+
+
+def parse_json(text: str, expected: type = dict) -> Tuple[Optional[Any], str]:
+    """
+    Parser JSON tolerante
+    
+    Args:
+        text: Respuesta del modelo
+        expected: Tipo esperado del valor raíz (dict o list)
+    
+    Returns:
+        (valor, método) con método "direct", "extracted", "repaired" o "invalid"
+    """
+    text = (text or "").strip()
+    try:
+        data = json.loads(text)
+        if isinstance(data, expected):
+            return data, "direct"
+    except ValueError:
+        pass
+    
+    fence = FENCE_RE.search(text)
+    body = fence.group(1) if fence else text
+    opener = "{" if expected is dict else "["
+    
+    # Primer valor JSON completo del tipo esperado dentro del texto
+    decoder = json.JSONDecoder()
+    for match in re.finditer(re.escape(opener), body):
+        try:
+            data, _ = decoder.raw_decode(body, match.start())
+        except ValueError:
+            continue
+        if isinstance(data, expected):
+            return data, "extracted"
+    
+    # Respuesta truncada (max_tokens, stream cortado)
+    start = body.find(opener)
+    if start >= 0:
+        data = repair_truncated(body[start:])
+        if isinstance(data, expected):
+            return data, "repaired"
+    
+    return None, "invalid"
+
+
+def validate_json(data: Any, schema: Dict[str, Any],
+                  required: Optional[Sequence[str]] = None, path: str = "$") -> List[str]:
+    """
+    Validar un valor contra un JSON Schema (subconjunto: type, required,
+    properties, items, enum, minimum, maximum)
+    
+    Args:
+        data: Valor a validar
+        schema: Schema
+        required: Claves obligatorias en la raíz (por defecto las del schema);
+            las propiedades ausentes no se validan
+        path: Ruta para los mensajes de error
+    
+    Returns:
+        Lista de errores (vacía si es válido)
+    """
+    errors: List[str] = []
+    kind = schema.get("type")
+    
+    if kind == "object":
+        if not isinstance(data, dict):
+            return [f"{path}: se esperaba un objeto"]
+        for key in (schema.get("required", []) if required is None else required):
+            if key not in data:
+                errors.append(f"{path}.{key}: falta")
+        for key, subschema in schema.get("properties", {}).items():
+            if key in data:
+                errors.extend(validate_json(data[key], subschema, path=f"{path}.{key}"))
+        return errors
+    
+    if kind == "array":
+        if not isinstance(data, list):
+            return [f"{path}: se esperaba una lista"]
+        for i, item in enumerate(data):
+            errors.extend(validate_json(item, schema.get("items", {}), path=f"{path}[{i}]"))
+        return errors
+    
+    if kind == "string" and not isinstance(data, str):
+        return [f"{path}: se esperaba texto"]
+    if kind in ("number", "integer"):
+        if isinstance(data, bool) or not isinstance(data, (int, float)):
+            return [f"{path}: se esperaba un número"]
+        if "minimum" in schema and data < schema["minimum"]:
+            errors.append(f"{path}: menor que {schema['minimum']}")
+        if "maximum" in schema and data > schema["maximum"]:
+            errors.append(f"{path}: mayor que {schema['maximum']}")
+    if "enum" in schema and data not in schema["enum"]:
+        errors.append(f"{path}: {data!r} no es uno de {schema['enum']}")
+    
+    return errors
+
+
+def response_format(mode: str, name: str, schema: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Parámetro response_format de la API compatible con OpenAI para un modo"""
+    if mode == "json_schema":
+        return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": True}}
+    if mode == "json_object":
+        return {"type": "json_object"}
+    return None
+
+
+def native_mode(provider: str) -> str:
+    """Modo nativo de un proveedor (LLM_STRUCTURED_OUTPUT fuerza uno: json_schema, json_object, off)"""
+    configured = os.getenv("LLM_STRUCTURED_OUTPUT", "auto").lower()
+    if configured != "auto":
+        return configured
+    return NATIVE_MODES.get(provider, "off")
+
+
+def _is_format_rejection(error: Exception) -> bool:
+    """El proveedor rechazó la petición por el response_format"""
+    message = str(error).lower()
+    return "response_format" in message or (getattr(error, "status_code", None) == 400 and "json" in message)
+
+
+@dataclass
+class StructuredResult:
+    """Resultado de una llamada con salida estructurada"""
+    data: Optional[Any]
+    outcome: str                 # valid, repaired, retried, failed
+    attempts: int
+    mode: str
+    errors: List[str] = field(default_factory=list)
+    
+    @property
+    def ok(self) -> bool:
+        return self.data is not None
+
+
+class StructuredOutput:
+    """Llamadas LLM cuya respuesta debe ser JSON válido según un schema"""
+    
+    def __init__(self, provider: str = "openai", mode: Optional[str] = None,
+                 max_retries: Optional[int] = None):
+        """
+        Inicializar
+        
+        Args:
+            provider: Proveedor LLM (determina el modo nativo)
+            mode: json_schema, json_object u off (por defecto según proveedor)
+            max_retries: Reintentos con respuesta inválida (STRUCTURED_OUTPUT_MAX_RETRIES)
+        """
+        self.provider = provider
+        self.mode = mode or native_mode(provider)
+        self.max_retries = max_retries if max_retries is not None else \
+            int(os.getenv("STRUCTURED_OUTPUT_MAX_RETRIES", "1"))
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+    
+    def request(self,
+                call: CompletionCall,
+                messages: List[Dict[str, str]],
+                schema: Dict[str, Any],
+                name: str,
+                required: Optional[Sequence[str]] = None) -> StructuredResult:
+        """
+        Llamar al LLM hasta obtener JSON válido (máximo 1 + max_retries llamadas)
+        
+        Args:
+            call: Función que hace la llamada y devuelve (content, finish_reason)
+            messages: Mensajes de la conversación
+            schema: JSON Schema del objeto esperado
+            name: Nombre de la tarea (schema, métricas)
+            required: Claves obligatorias al validar (por defecto las del schema)
+        
+        Returns:
+            Resultado; data es None si ninguna respuesta fue válida. Los errores
+            de la llamada que no se deben al response_format se propagan.
+        """
+        messages = list(messages)
+        expected = list if schema.get("type") == "array" else dict
+        errors: List[str] = []
+        attempts = 0
+        
+        while attempts <= self.max_retries:
+            try:
+                content, finish_reason = call(messages, response_format(self.mode, name, schema))
+            except Exception as e:
+                if self.mode != "off" and _is_format_rejection(e):
+                    self._downgrade(e)
+                    continue
+                self._record(name, "error")
+                raise
+            attempts += 1
+            
+            data, method = parse_json(content, expected)
+            problems = validate_json(data, schema, required) if data is not None else \
+                [f"respuesta no es JSON (finish_reason={finish_reason})"]
+            if not problems:
+                outcome = "retried" if attempts > 1 else ("valid" if method == "direct" else "repaired")
+                self._record(name, outcome)
+                return StructuredResult(data, outcome, attempts, self.mode, errors)
+            
+            errors.extend(problems)
+            logger.warning(f"Salida estructurada inválida ({name}, intento {attempts}): {problems[:3]}")
+            messages = messages + [
+                {"role": "assistant", "content": content or ""},
+                {"role": "user", "content": (
+                    "La respuesta anterior no es válida: " + "; ".join(problems[:5]) +
+                    ". Responde únicamente con el objeto JSON con la estructura pedida."
+                )}
+            ]
+        
+        self._record(name, "failed")
+        return StructuredResult(None, "failed", attempts, self.mode, errors)
+    
+    def _downgrade(self, error: Exception) -> None:
+        """Pasar al siguiente modo cuando el proveedor no acepta el actual"""
+        previous, self.mode = self.mode, MODE_FALLBACK.get(self.mode, "off")
+        logger.warning(f"response_format '{previous}' rechazado por {self.provider} ({error}), usando '{self.mode}'")
+    
+    def _record(self, name: str, outcome: str) -> None:
+        with self._lock:
+            task = self.stats.setdefault(name, {})
+            task[outcome] = task.get(outcome, 0) + 1
+        metrics.inc(metrics.structured_outputs, task=name, outcome=outcome)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Resultados por tarea y modo actual"""
+        with self._lock:
+            return {"mode": self.mode, "tasks": {name: dict(counts) for name, counts in self.stats.items()}}
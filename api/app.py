@@ -16,11 +16,15 @@ from dotenv import load_dotenv
 from agent.orchestrator import CVOrchestrator
 from agent.evaluator import ResponseEvaluator
 from tools.notify import notification_manager
+from tools.metrics import metrics
+from rag.watcher import watch_in_process
+from agent.cache_warmup import CacheWarmer
 
 # Imports de módulos refactorizados
 from api.dependencies import set_orchestrator, set_evaluator
 from api.exceptions import http_exception_handler, general_exception_handler
-from api.routes import chat_router, health_router, stats_router, notifications_router
+from api.middleware import AdmissionController, AdmissionControlMiddleware, chat_cache_probe
+from api.routes import chat_router, health_router, stats_router, notifications_router, metrics_router
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -33,6 +37,7 @@ async def lifespan(app: FastAPI):
     """Gestión del ciclo de vida de la aplicación"""
     # Startup
     logger.info("Inicializando CV Agent API...")
+    index_watcher = None
     try:
         orchestrator = CVOrchestrator()
         evaluator = ResponseEvaluator()
@@ -43,6 +48,17 @@ async def lifespan(app: FastAPI):
         
         logger.info("✅ Orquestador y evaluador inicializados correctamente")
         
+        # Respuestas precalculadas por el job de warm-up (python -m agent.cache_warmup)
+        if os.getenv("WARMUP_PRELOAD", "true").lower() == "true":
+            try:
+                CacheWarmer(orchestrator).preload()
+            except Exception as e:
+                logger.warning(f"No se pudieron precargar las respuestas del warm-up: {e}")
+        
+        # Re-indexación en vivo de data/ (con varios workers usar `python -m rag.watcher`)
+        if os.getenv("INDEX_WATCH", "false").lower() == "true":
+            index_watcher = watch_in_process(orchestrator.retriever)
+        
         notification_manager.send_custom_notification(
             message="CV Agent API iniciada correctamente",
             title="🚀 API Status",
@@ -57,8 +73,12 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Cerrando CV Agent API...")
+    if index_watcher:
+        index_watcher.stop()
+    metrics.flush()
     try:
         if orchestrator:
+            orchestrator.query_log.flush()
             stats = orchestrator.get_session_stats()
             notification_manager.send_custom_notification(
                 message=f"API cerrada. Total consultas: {stats['total_queries']}, Éxito: {stats['success_rate']:.1f}%",
@@ -66,6 +86,9 @@ async def lifespan(app: FastAPI):
             )
     except Exception as e:
         logger.warning(f"Error en shutdown: {e}")
+    finally:
+        # Entregar notificaciones encoladas antes de salir
+        notification_manager.shutdown(timeout=5.0)
 
 app = FastAPI(
     title="CV Agent API",
@@ -74,13 +97,23 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-# Configurar CORS
+# Control de admisión: límite de concurrencia por worker y cola con prioridades.
+# Se registra antes que CORS para quedar por dentro: los 429 llevan cabeceras CORS
+admission_controller = AdmissionController()
+app.add_middleware(
+    AdmissionControlMiddleware,
+    controller=admission_controller,
+    cache_probe=chat_cache_probe
+)
+
+# Configurar CORS (Retry-After visible para los clientes de navegador)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
 # Registrar rutas
@@ -88,6 +121,7 @@ app.include_router(health_router)
 app.include_router(chat_router)
 app.include_router(stats_router)
 app.include_router(notifications_router)
+app.include_router(metrics_router)
 
 # Registrar handlers de excepciones
 app.add_exception_handler(HTTPException, http_exception_handler)
@@ -0,0 +1,353 @@
+"""
+Control de admisión para la API
+
+Limita las peticiones concurrentes por worker, mantiene una cola de espera
+acotada con carriles de prioridad y rechaza con 429 (Retry-After) las
+peticiones que no podrían empezar antes de su deadline.
+"""
+
+import os
+import json
+import math
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from tools.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Carriles de prioridad (menor valor, mayor prioridad)
+PRIORITY_BYPASS = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BACKGROUND = 2
+
+LANE_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_BACKGROUND: "background"
+}
+
+
+def _parse_paths(value: str) -> Tuple[str, ...]:
+    """Lista de prefijos separada por comas"""
+    return tuple(path.strip() for path in value.split(",") if path.strip())
+
+
+class AdmissionRejected(Exception):
+    """Petición rechazada por sobrecarga"""
+    
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class AdmissionConfig:
+    """Configuración del control de admisión"""
+    max_concurrency: int = 8
+    max_queue: int = 32
+    queue_timeout: float = 10.0
+    controlled_paths: Tuple[str, ...] = ("/chat",)
+    bypass_paths: Tuple[str, ...] = ("/health", "/metrics")
+    background_paths: Tuple[str, ...] = ("/chat/batch",)
+    
+    @classmethod
+    def from_env(cls) -> 'AdmissionConfig':
+        """Crear configuración desde variables de entorno"""
+        return cls(
+            max_concurrency=int(os.getenv("ADMISSION_MAX_CONCURRENCY", "8")),
+            max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "32")),
+            queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10")),
+            controlled_paths=_parse_paths(os.getenv("ADMISSION_PATHS", "/chat")),
+            bypass_paths=_parse_paths(os.getenv("ADMISSION_BYPASS_PATHS", "/health,/metrics")),
+            background_paths=_parse_paths(os.getenv("ADMISSION_BACKGROUND_PATHS", "/chat/batch"))
+        )
+
+
+class AdmissionController:
+    """
+    Semáforo con cola de prioridad y deadline para un event loop
+    
+    Cuando hay huecos la petición entra directamente; si no, espera en el
+    carril de su prioridad. La espera estimada (posición en cola por tiempo
+    medio de servicio) se compara con el deadline: si no se alcanzaría, se
+    rechaza al momento en lugar de ocupar la cola hasta expirar.
+    """
+    
+    def __init__(self, config: Optional[AdmissionConfig] = None):
+        """
+        Inicializar controlador
+        
+        Args:
+            config: Configuración, por defecto desde variables de entorno
+        """
+        self.config = config or AdmissionConfig.from_env()
+        self.active = 0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {}
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._queued: Dict[int, int] = {lane: 0 for lane in LANE_NAMES}
+        self._sequence = itertools.count()
+        self._service_time = 1.0  # media móvil exponencial en segundos
+    
+    def priority_for(self, path: str) -> Optional[int]:
+        """Carril de una ruta (None si no está bajo control de admisión)"""
+        if any(path.startswith(prefix) for prefix in self.config.bypass_paths):
+            return PRIORITY_BYPASS
+        if not any(path.startswith(prefix) for prefix in self.config.controlled_paths):
+            return None
+        if any(path.startswith(prefix) for prefix in self.config.background_paths):
+            return PRIORITY_BACKGROUND
+        return PRIORITY_INTERACTIVE
+    
+    def queue_depth(self) -> int:
+        """Peticiones esperando en todos los carriles"""
+        return sum(self._queued.values())
+    
+    def estimated_wait(self, position: int) -> float:
+        """Espera estimada para la posición dada en la cola"""
+        rounds = math.ceil(position / max(1, self.config.max_concurrency))
+        return rounds * self._service_time
+    
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None) -> float:
+        """
+        Esperar un hueco de ejecución
+        
+        Args:
+            priority: Carril de prioridad
+            timeout: Deadline de la espera en segundos (por defecto queue_timeout)
+        
+        Returns:
+            Segundos esperados en cola
+        
+        Raises:
+            AdmissionRejected: Si la cola está llena o el deadline no se alcanzaría
+        """
+        timeout = self.config.queue_timeout if timeout is None else timeout
+        
+        if self.active < self.config.max_concurrency and not self.queue_depth():
+            self._admit(0.0)
+            return 0.0
+        
+        # Posición efectiva: los carriles de mayor prioridad van delante
+        position = sum(count for lane, count in self._queued.items() if lane <= priority) + 1
+        estimate = self.estimated_wait(position)
+        if self.queue_depth() >= self.config.max_queue:
+            self._reject("queue_full", estimate)
+        if estimate > timeout:
+            self._reject("deadline", estimate)
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._queued[priority] += 1
+        self._export_queue()
+        start = time.monotonic()
+        
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            if not (future.done() and not future.cancelled()):
+                self._reject("timeout", self.estimated_wait(self.queue_depth()))
+        except asyncio.CancelledError:
+            # El cliente se fue; si ya se le había cedido el hueco, devolverlo
+            if future.done() and not future.cancelled():
+                self.release(None)
+            raise
+        finally:
+            self._queued[priority] -= 1
+            self._export_queue()
+        
+        waited = time.monotonic() - start
+        self._admit(waited, transferred=True)
+        return waited
+    
+    def release(self, service_time: Optional[float]) -> None:
+        """
+        Liberar un hueco, cediéndolo a la siguiente petición en cola
+        
+        Args:
+            service_time: Duración de la petición (para estimar esperas)
+        """
+        if service_time is not None:
+            self._service_time = 0.8 * self._service_time + 0.2 * service_time
+        
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        
+        self.active -= 1
+        metrics.set_gauge(metrics.admission_in_flight, self.active)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas del controlador"""
+        return {
+            "active": self.active,
+            "max_concurrency": self.config.max_concurrency,
+            "queue_depth": self.queue_depth(),
+            "queued_by_lane": {LANE_NAMES[lane]: count for lane, count in self._queued.items()},
+            "max_queue": self.config.max_queue,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_service_time": self._service_time
+        }
+    
+    def _admit(self, waited: float, transferred: bool = False) -> None:
+        # Un hueco cedido por release() ya está contado en active
+        if not transferred:
+            self.active += 1
+        self.admitted += 1
+        metrics.observe(metrics.admission_wait, waited)
+        metrics.set_gauge(metrics.admission_in_flight, self.active)
+    
+    def _reject(self, reason: str, retry_after: float) -> None:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        metrics.inc(metrics.admission_rejected, reason=reason)
+        raise AdmissionRejected(reason, retry_after)
+    
+    def _export_queue(self) -> None:
+        for lane, count in self._queued.items():
+            metrics.set_gauge(metrics.admission_queue_depth, count, lane=LANE_NAMES[lane])
+
+
+class AdmissionControlMiddleware:
+    """
+    Middleware ASGI de control de admisión
+    
+    Las rutas de bypass (health, métricas) y las consultas que se
+    responderán desde la caché no pasan por la cola.
+    """
+    
+    def __init__(self,
+                 app,
+                 controller: Optional[AdmissionController] = None,
+                 cache_probe: Optional[Callable[[str, Dict[str, Any]], bool]] = None):
+        """
+        Inicializar middleware
+        
+        Args:
+            app: Aplicación ASGI
+            controller: Controlador de admisión (uno por worker)
+            cache_probe: Función (ruta, cuerpo JSON) -> bool que indica si la
+                petición se responderá desde la caché; hace I/O síncrona
+                (backend de estado), así que se ejecuta en el threadpool
+        """
+        self.app = app
+        self.controller = controller or AdmissionController()
+        self.cache_probe = cache_probe
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        # Llegada de la petición: el deadline de la ruta incluye la espera en cola
+        # y la cola encontrada decide si la ruta responde en modo degradado
+        state = scope.setdefault("state", {})
+        state["request_start"] = time.monotonic()
+        state["queue_depth"] = self.controller.queue_depth()
+        
+        path = scope["path"]
+        priority = self.controller.priority_for(path)
+        if priority is None:
+            await self.app(scope, receive, send)
+            return
+        
+        if priority != PRIORITY_BYPASS and self.cache_probe and scope["method"] == "POST":
+            body, receive = await self._buffer_body(receive)
+            if await self._is_cached(path, body):
+                metrics.inc(metrics.admission_bypassed, reason="cached")
+                priority = PRIORITY_BYPASS
+        
+        if priority == PRIORITY_BYPASS:
+            await self.app(scope, receive, send)
+            return
+        
+        try:
+            await self.controller.acquire(priority)
+        except AdmissionRejected as e:
+            logger.warning(f"Petición rechazada en {path} ({e.reason}), retry en {e.retry_after:.1f}s")
+            await self._send_rejection(send, e)
+            return
+        
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(time.monotonic() - start)
+    
+    async def _buffer_body(self, receive) -> Tuple[bytes, Callable]:
+        """Leer el cuerpo completo y devolver un receive que lo reproduce"""
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        body = b"".join(chunks)
+        
+        replayed = False
+        
+        async def replay():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+        
+        return body, replay
+    
+    async def _is_cached(self, path: str, body: bytes) -> bool:
+        try:
+            return bool(await run_in_threadpool(self.cache_probe, path, json.loads(body or b"{}")))
+        except Exception:
+            return False
+    
+    async def _send_rejection(self, send, rejection: AdmissionRejected) -> None:
+        retry_after = max(1, math.ceil(rejection.retry_after))
+        payload = json.dumps({
+            "error": True,
+            "message": "Servidor saturado, intenta de nuevo más tarde",
+            "reason": rejection.reason,
+            "status_code": 429,
+            "retry_after": retry_after,
+            "timestamp": datetime.now().isoformat()
+        }).encode("utf-8")
+        
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(payload)).encode()),
+                (b"retry-after", str(retry_after).encode())
+            ]
+        })
+        await send({"type": "http.response.body", "body": payload})
+
+
+def chat_cache_probe(path: str, body: Dict[str, Any]) -> bool:
+    """
+    Indica si una petición de chat tiene su respuesta en la caché (un
+    seguimiento dentro de una sesión con historial nunca la tiene)
+    """
+    from api import dependencies
+    
+    orchestrator = dependencies.orchestrator
+    message = body.get("message")
+    session_id = body.get("session_id")
+    if orchestrator is None or not isinstance(message, str):
+        return False
+    return orchestrator.has_cached_answer(message, session_id if isinstance(session_id, str) else None)
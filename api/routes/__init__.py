@@ -6,5 +6,6 @@ from .chat import router as chat_router
 from .health import router as health_router
 from .stats import router as stats_router
 from .notifications import router as notifications_router
+from .metrics import router as metrics_router
 
-__all__ = ["chat_router", "health_router", "stats_router", "notifications_router"]
\ No newline at end of file
+__all__ = ["chat_router", "health_router", "stats_router", "notifications_router", "metrics_router"]
\ No newline at end of file
@@ -2,25 +2,54 @@
 Endpoints relacionados con chat
 """
 
+import json
+import os
+import asyncio
 import logging
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from api.models import ChatRequest, ChatResponse, ClarificationRequest, ClarificationResponse, MultiQueryRequest
 from api.dependencies import get_orchestrator, get_evaluator
 from api.background_tasks import perform_self_critique
 from agent.orchestrator import CVOrchestrator
 from agent.evaluator import ResponseEvaluator
 from tools.notify import notification_manager
+from tools.deadline import Deadline, DeadlineExceeded
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "1000"))
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
+# Peticiones en cola a partir de las que se responde sin LLM (0 = desactivado)
+DEGRADED_QUEUE_DEPTH = int(os.getenv("DEGRADED_QUEUE_DEPTH", "0"))
+
+
+async def cancel_on_disconnect(http_request: Request, deadline: Deadline) -> None:
+    """Cancelar el deadline de la petición cuando el cliente HTTP se desconecta"""
+    while not deadline.done:
+        if await http_request.is_disconnected():
+            deadline.cancel("disconnected")
+            return
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+class BatchChatRequest(BaseModel):
+    """Petición de chat por lotes"""
+    questions: List[str] = Field(..., min_length=1, max_length=BATCH_MAX_QUESTIONS)
+    session_id: str = "batch"
+    max_concurrency: Optional[int] = Field(None, ge=1, le=32)
+
 
 @router.post("", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
+    http_request: Request,
     background_tasks: BackgroundTasks,
     orchestrator: CVOrchestrator = Depends(get_orchestrator),
     evaluator: ResponseEvaluator = Depends(get_evaluator)
@@ -31,14 +60,26 @@ async def chat(
     Procesa consultas del usuario y retorna respuestas inteligentes
     usando RAG, FAQ y otras herramientas disponibles.
     """
+    # Presupuesto de la petición desde su llegada (incluye la espera en cola)
+    deadline = Deadline.from_env(start=getattr(http_request.state, "request_start", None))
+    watcher = asyncio.create_task(cancel_on_disconnect(http_request, deadline)) if deadline else None
+    
+    # Con la cola por encima del umbral, respuesta rápida sin LLM
+    queue_depth = getattr(http_request.state, "queue_depth", 0)
+    degraded = DEGRADED_QUEUE_DEPTH > 0 and queue_depth >= DEGRADED_QUEUE_DEPTH
+    
     try:
         logger.info(f"Nueva consulta de {request.session_id}: {request.message[:50]}...")
         
-        # Procesar consulta con el orquestador
-        result = orchestrator.process_query(
+        # Procesar consulta con el orquestador (en el threadpool, para que las
+        # consultas concurrentes no bloqueen el event loop y puedan agruparse)
+        result = await run_in_threadpool(
+            orchestrator.process_query,
             query=request.message,
             session_id=request.session_id,
-            notify_important=request.notify_important
+            notify_important=request.notify_important,
+            deadline=deadline,
+            degraded=degraded
         )
         
         response_data = {
@@ -48,9 +89,9 @@ async def chat(
             "timestamp": datetime.now().isoformat()
         }
         
-        # Evaluación opcional
+        # Evaluación opcional (no en modo degradado: necesitaría el LLM)
         evaluation_result = None
-        if request.evaluate_response and result["success"]:
+        if request.evaluate_response and result["success"] and not result["metadata"].get("degraded"):
             try:
                 evaluation = evaluator.evaluate_response(
                     original_query=request.message,
@@ -77,6 +118,13 @@ async def chat(
         
         return ChatResponse(**response_data)
         
+    except DeadlineExceeded as e:
+        logger.warning(f"Consulta de {request.session_id} interrumpida: {e}")
+        raise HTTPException(
+            status_code=504,
+            detail=f"Tiempo de respuesta agotado en la etapa '{e.stage}'"
+        )
+        
     except Exception as e:
         logger.error(f"Error en endpoint /chat: {e}")
         
@@ -97,6 +145,39 @@ async def chat(
             status_code=500,
             detail=f"Error procesando consulta: {str(e)}"
         )
+    
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+
+
+@router.post("/batch")
+async def chat_batch(
+    request: BatchChatRequest,
+    orchestrator: CVOrchestrator = Depends(get_orchestrator)
+):
+    """
+    Endpoint de chat por lotes
+    
+    Procesa muchas consultas en una sola petición (deduplicadas, clasificadas
+    y recuperadas por lotes) y devuelve los resultados en NDJSON, una línea
+    por consulta en orden de finalización.
+    """
+    logger.info(f"Lote de {len(request.questions)} consultas de {request.session_id}")
+    
+    def stream():
+        try:
+            for item in orchestrator.process_batch(
+                queries=request.questions,
+                session_id=request.session_id,
+                max_concurrency=request.max_concurrency
+            ):
+                yield json.dumps(item, ensure_ascii=False, default=str) + "\n"
+        except Exception as e:
+            logger.error(f"Error en endpoint /chat/batch: {e}")
+            yield json.dumps({"error": True, "message": f"Error procesando lote: {str(e)}"}) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 
 @router.post("/clarify", response_model=ClarificationResponse)
@@ -0,0 +1,28 @@
+"""
+Endpoint de métricas en formato Prometheus
+"""
+
+import logging
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from tools.metrics import metrics
+
+logger = logging.getLogger(__name__)
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Métricas de latencia y uso (agregadas entre workers)"""
+    return PlainTextResponse(
+        metrics.render_prometheus(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@router.get("/metrics/latency")
+async def latency_percentiles():
+    """Percentiles p50/p95/p99 por etapa del pipeline"""
+    return metrics.latency_summary()
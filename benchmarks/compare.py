@@ -0,0 +1,88 @@
+"""
+Benchmark Comparison
+
+Compara dos informes de benchmarks/run.py (por ejemplo, el de la rama
+principal y el del commit actual) y señala las regresiones que superan el
+umbral. Sale con código 1 si hay alguna, para poder usarlo en CI.
+
+Uso:
+    python -m benchmarks.compare base.json actual.json --threshold 0.10
+"""
+
+import sys
+import json
+import argparse
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+# Métricas comparadas: True si un valor mayor es mejor
+METRICS = {
+    "throughput_qps": True,
+    "documents_per_second": True,
+    "chunks_per_second": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "errors": False
+}
+
+def compare(base: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """
+    Comparar dos informes
+    
+    Args:
+        base: Informe de referencia
+        current: Informe a evaluar
+        threshold: Empeoramiento relativo tolerado (0.10 = 10%)
+    
+    Returns:
+        Filas con etapa, métrica, valores, cambio relativo y si es regresión
+    """
+    rows = []
+    for stage, current_result in current.get("results", {}).items():
+        base_result = base.get("results", {}).get(stage)
+        if not base_result or "error" in base_result or "error" in current_result:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            if metric not in current_result or metric not in base_result:
+                continue
+            old, new = base_result[metric], current_result[metric]
+            change = (new - old) / old if old else (0.0 if new == old else float("inf"))
+            worse = -change if higher_is_better else change
+            rows.append({
+                "stage": stage,
+                "metric": metric,
+                "base": old,
+                "current": new,
+                "change": change,
+                "regression": worse > threshold
+            })
+    return rows
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Punto de entrada"""
+    parser = argparse.ArgumentParser(description="Comparar informes de benchmarks")
+    parser.add_argument("base", help="Informe de referencia (JSON)")
+    parser.add_argument("current", help="Informe a evaluar (JSON)")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Empeoramiento relativo tolerado")
+    args = parser.parse_args(argv)
+    
+    base = json.loads(Path(args.base).read_text(encoding="utf-8"))
+    current = json.loads(Path(args.current).read_text(encoding="utf-8"))
+    rows = compare(base, current, args.threshold)
+    
+    print(f"{base.get('commit', '?')} -> {current.get('commit', '?')} (umbral {args.threshold:.0%})")
+    for row in rows:
+        flag = "REGRESIÓN" if row["regression"] else ""
+        print(f"{row['stage']:<10} {row['metric']:<22} {row['base']:>12} -> {row['current']:>12} "
+              f"{row['change']:>+8.1%} {flag}")
+    
+    regressions = [row for row in rows if row["regression"]]
+    if regressions:
+        print(f"\n{len(regressions)} regresiones por encima del umbral")
+        return 1
+    print("\nSin regresiones")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Synthetic Corpus
+
+Generación de un corpus sintético de documentos markdown con la misma
+estructura de directorios que data/ (cv.md, proyectos/, recortes/) y de
+un conjunto de consultas de carga, deterministas a partir de una semilla.
+"""
+
+import random
+from pathlib import Path
+from typing import List
+
+TOPICS = [
+    "Python", "FastAPI", "Kubernetes", "PostgreSQL", "machine learning",
+    "arquitectura de datos", "microservicios", "AWS", "Spark", "React",
+    "liderazgo técnico", "MLOps", "observabilidad", "seguridad", "Terraform"
+]
+
+SECTORS = ["banca", "retail", "salud", "energía", "logística", "telecomunicaciones"]
+
+VERBS = ["diseñé", "implementé", "lideré", "optimicé", "migré", "automaticé", "escalé"]
+
+QUERY_TEMPLATES = [
+    "¿Qué experiencia tiene con {topic}?",
+    "¿Ha trabajado en el sector {sector}?",
+    "Háblame de proyectos con {topic}",
+    "¿Qué resultados obtuvo usando {topic} en {sector}?",
+    "¿Cuál es su nivel de {topic}?",
+    "¿Cómo contactar con el candidato?",
+    "Resume su trayectoria profesional"
+]
+
+def _paragraph(rng: random.Random, sentences: int = 5) -> str:
+    parts = []
+    for _ in range(sentences):
+        parts.append(
+            f"En un proyecto de {rng.choice(SECTORS)} {rng.choice(VERBS)} una solución de "
+            f"{rng.choice(TOPICS)} integrada con {rng.choice(TOPICS)}, reduciendo costes un "
+            f"{rng.randint(5, 60)}% y mejorando la latencia en {rng.randint(10, 900)} ms."
+        )
+    return " ".join(parts)
+
+def _document(rng: random.Random, title: str, sections: int) -> str:
+    lines = [f"# {title}", ""]
+    for i in range(sections):
+        lines += [f"## {rng.choice(TOPICS).title()} ({i + 1})", "", _paragraph(rng), ""]
+        lines += [f"- {rng.choice(VERBS).capitalize()} {rng.choice(TOPICS)}" for _ in range(3)]
+        lines.append("")
+    return "\n".join(lines)
+
+def build_corpus(data_dir: str, documents: int = 50, sections: int = 6, seed: int = 7) -> List[Path]:
+    """
+    Escribir un corpus sintético
+    
+    Args:
+        data_dir: Directorio destino (estructura compatible con DocumentIngestor)
+        documents: Número total de documentos
+        sections: Secciones por documento
+        seed: Semilla para reproducibilidad
+    
+    Returns:
+        Rutas de los archivos creados
+    """
+    rng = random.Random(seed)
+    root = Path(data_dir)
+    (root / "proyectos").mkdir(parents=True, exist_ok=True)
+    (root / "recortes").mkdir(parents=True, exist_ok=True)
+    
+    paths = [root / "cv.md"]
+    paths[0].write_text(_document(rng, "Curriculum Vitae", sections * 2), encoding="utf-8")
+    
+    for i in range(1, documents):
+        folder = "proyectos" if i % 3 else "recortes"
+        path = root / folder / f"documento_{i:04d}.md"
+        path.write_text(_document(rng, f"Proyecto {i}: {rng.choice(TOPICS)}", sections), encoding="utf-8")
+        paths.append(path)
+    
+    return paths
+
+def build_queries(count: int, unique: int = 50, seed: int = 11) -> List[str]:
+    """
+    Conjunto de consultas de carga
+    
+    Args:
+        count: Número de consultas
+        unique: Consultas distintas (el resto son repeticiones, como en tráfico real)
+        seed: Semilla para reproducibilidad
+    """
+    rng = random.Random(seed)
+    pool = [
+        rng.choice(QUERY_TEMPLATES).format(topic=rng.choice(TOPICS), sector=rng.choice(SECTORS))
+        for _ in range(unique)
+    ]
+    return [rng.choice(pool) for _ in range(count)]
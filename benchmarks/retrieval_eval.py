@@ -0,0 +1,450 @@
+"""
+Retrieval Evaluation
+
+Evaluación calidad-vs-latencia de la recuperación sobre un conjunto dorado
+de consultas (benchmarks/golden/retrieval.jsonl) y los documentos de data/.
+Barre configuraciones de chunking (CHUNK_SIZE, CHUNK_OVERLAP), de búsqueda
+(TOP_K_RESULTS, SIMILARITY_THRESHOLD) y backends de índice, y para cada
+combinación reporta recall@k, MRR y nDCG@k junto con la latencia p50/p95,
+el tamaño del índice y el contexto que recibiría el LLM. Recomienda la
+configuración más barata cuya calidad no cae más de una tolerancia respecto
+a la mejor.
+
+Uso:
+    python -m benchmarks.retrieval_eval --chunk-sizes 500,1000 --top-k 3,5,8
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.run import percentile, git_revision
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+BACKENDS = ("chroma", "exact", "faiss-flat", "faiss-hnsw")
+QUALITY_METRICS = ("recall", "ndcg", "mrr")
+
+@dataclass
+class Judgment:
+    """Fragmento relevante para una consulta"""
+    source: str                 # ruta relativa dentro de data/
+    text: Optional[str] = None  # texto que debe contener el chunk (opcional)
+    
+    def matches(self, chunk: Dict[str, Any]) -> bool:
+        if chunk["source"] != self.source:
+            return False
+        return self.text is None or self.text.lower() in chunk["content"].lower()
+
+@dataclass
+class GoldenQuery:
+    """Consulta del conjunto dorado"""
+    query: str
+    relevant: List[Judgment] = field(default_factory=list)
+
+def load_golden(path: str) -> List[GoldenQuery]:
+    """Cargar el conjunto dorado (una consulta JSON por línea)"""
+    golden = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            golden.append(GoldenQuery(
+                query=item["query"],
+                relevant=[Judgment(r["source"], r.get("text")) for r in item["relevant"]]
+            ))
+    return golden
+
+# ---------------------------------------------------------------------------
+# Métricas
+# ---------------------------------------------------------------------------
+
+def score_ranking(ranking: List[Dict[str, Any]], golden: GoldenQuery, relevant_in_index: int, k: int) -> Dict[str, float]:
+    """
+    Métricas de una lista de resultados
+    
+    Args:
+        ranking: Chunks recuperados en orden (ya cortados a k y filtrados por umbral)
+        golden: Consulta con sus juicios de relevancia
+        relevant_in_index: Chunks relevantes que existen en el índice (para el nDCG ideal)
+        k: Corte de la evaluación
+    """
+    gains = [1.0 if any(j.matches(chunk) for j in golden.relevant) else 0.0 for chunk in ranking]
+    
+    found = sum(1 for j in golden.relevant if any(j.matches(chunk) for chunk in ranking))
+    recall = found / len(golden.relevant) if golden.relevant else 0.0
+    
+    first_hit = next((rank for rank, gain in enumerate(gains, start=1) if gain), None)
+    mrr = 1.0 / first_hit if first_hit else 0.0
+    
+    dcg = sum(gain / math.log2(rank + 1) for rank, gain in enumerate(gains, start=1))
+    ideal = sum(1.0 / math.log2(rank + 1) for rank in range(1, min(k, relevant_in_index) + 1))
+    ndcg = dcg / ideal if ideal else 0.0
+    
+    return {
+        "recall": recall,
+        "mrr": mrr,
+        "ndcg": ndcg,
+        "results": len(ranking),
+        "context_chars": sum(len(chunk["content"]) for chunk in ranking)
+    }
+
+# ---------------------------------------------------------------------------
+# Backends de índice
+# ---------------------------------------------------------------------------
+
+class VectorIndex:
+    """Índice de vectores con búsqueda por distancia L2 al cuadrado (como ChromaDB)"""
+    
+    name = "base"
+    
+    def build(self, embeddings: np.ndarray, work_dir: Path) -> None:
+        raise NotImplementedError
+    
+    def search(self, vector: np.ndarray, k: int) -> Tuple[List[int], List[float]]:
+        """Índices de los k vecinos más cercanos y sus distancias"""
+        raise NotImplementedError
+    
+    def size_bytes(self) -> int:
+        raise NotImplementedError
+
+class ExactIndex(VectorIndex):
+    """Búsqueda exacta por fuerza bruta con numpy"""
+    
+    name = "exact"
+    
+    def build(self, embeddings: np.ndarray, work_dir: Path) -> None:
+        self.embeddings = embeddings
+    
+    def search(self, vector: np.ndarray, k: int) -> Tuple[List[int], List[float]]:
+        distances = ((self.embeddings - vector) ** 2).sum(axis=1)
+        k = min(k, len(distances))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return top.tolist(), distances[top].tolist()
+    
+    def size_bytes(self) -> int:
+        return int(self.embeddings.nbytes)
+
+class FaissIndex(VectorIndex):
+    """Índice FAISS plano (exacto) o HNSW (aproximado)"""
+    
+    def __init__(self, kind: str = "flat", hnsw_m: int = 32):
+        self.kind = kind
+        self.hnsw_m = hnsw_m
+        self.name = f"faiss-{kind}"
+    
+    def build(self, embeddings: np.ndarray, work_dir: Path) -> None:
+        dim = embeddings.shape[1]
+        self.index = faiss.IndexFlatL2(dim) if self.kind == "flat" else faiss.IndexHNSWFlat(dim, self.hnsw_m)
+        self.index.add(embeddings)
+    
+    def search(self, vector: np.ndarray, k: int) -> Tuple[List[int], List[float]]:
+        distances, indices = self.index.search(vector.reshape(1, -1), k)
+        pairs = [(int(i), float(d)) for i, d in zip(indices[0], distances[0]) if i >= 0]
+        return [i for i, _ in pairs], [d for _, d in pairs]
+    
+    def size_bytes(self) -> int:
+        return int(faiss.serialize_index(self.index).size)
+
+class ChromaIndex(VectorIndex):
+    """Colección ChromaDB persistente, el backend de producción"""
+    
+    name = "chroma"
+    
+    def build(self, embeddings: np.ndarray, work_dir: Path) -> None:
+        import chromadb
+        from chromadb.config import Settings
+        
+        # Un directorio por índice: ChromaDB mantiene abierto el cliente de cada ruta
+        self.path = Path(tempfile.mkdtemp(prefix="chroma-", dir=work_dir))
+        self.client = chromadb.PersistentClient(
+            path=str(self.path),
+            settings=Settings(anonymized_telemetry=False, allow_reset=True)
+        )
+        self.collection = self.client.create_collection(name="retrieval_eval")
+        
+        batch_size = 100
+        vectors = embeddings.tolist()
+        for i in range(0, len(vectors), batch_size):
+            batch = vectors[i:i + batch_size]
+            self.collection.add(
+                embeddings=batch,
+                ids=[str(i + offset) for offset in range(len(batch))]
+            )
+    
+    def search(self, vector: np.ndarray, k: int) -> Tuple[List[int], List[float]]:
+        results = self.collection.query(
+            query_embeddings=[vector.tolist()],
+            n_results=k,
+            include=["distances"]
+        )
+        return [int(i) for i in results["ids"][0]], list(results["distances"][0])
+    
+    def size_bytes(self) -> int:
+        return sum(p.stat().st_size for p in self.path.rglob("*") if p.is_file())
+
+def make_index(name: str) -> Optional[VectorIndex]:
+    """Crear un backend por nombre (None si su dependencia no está instalada)"""
+    if name == "exact":
+        return ExactIndex()
+    if name.startswith("faiss-"):
+        return FaissIndex(name.split("-", 1)[1]) if faiss is not None else None
+    if name == "chroma":
+        try:
+            import chromadb  # noqa: F401
+        except ImportError:
+            return None
+        return ChromaIndex()
+    raise ValueError(f"Backend desconocido: {name}")
+
+# ---------------------------------------------------------------------------
+# Evaluación
+# ---------------------------------------------------------------------------
+
+def build_chunks(ingestor, data_dir: str, chunk_size: int, chunk_overlap: int) -> List[Dict[str, Any]]:
+    """Chunks de data/ con la configuración dada, usando el mismo pipeline que la ingesta"""
+    ingestor.configure_chunking(chunk_size, chunk_overlap)
+    documents = ingestor.load_markdown_files(data_dir)
+    return [
+        {"source": chunk.metadata["relative_path"], "content": chunk.page_content}
+        for chunk in ingestor.chunk_documents(documents)
+    ]
+
+def evaluate_index(index: VectorIndex,
+                   chunks: List[Dict[str, Any]],
+                   golden: List[GoldenQuery],
+                   query_vectors: np.ndarray,
+                   embed_seconds: List[float],
+                   top_ks: List[int],
+                   thresholds: List[float],
+                   repeats: int) -> List[Dict[str, Any]]:
+    """
+    Evaluar un índice ya construido para todas las combinaciones (k, umbral)
+    
+    Cada k se busca por separado para medir su latencia; los umbrales se
+    aplican después sobre la misma lista de resultados.
+    """
+    relevant_in_index = [
+        sum(1 for chunk in chunks if any(j.matches(chunk) for j in item.relevant))
+        for item in golden
+    ]
+    
+    rows = []
+    for k in top_ks:
+        search_seconds: List[float] = []
+        rankings: List[List[Tuple[int, float]]] = []
+        for q, vector in enumerate(query_vectors):
+            for _ in range(repeats):
+                start = time.perf_counter()
+                indices, distances = index.search(vector, k)
+                search_seconds.append(time.perf_counter() - start)
+            rankings.append(list(zip(indices, distances)))
+        
+        total_seconds = sorted(
+            embed_seconds[q] + search_seconds[q * repeats + r]
+            for q in range(len(query_vectors)) for r in range(repeats)
+        )
+        search_sorted = sorted(search_seconds)
+        
+        for threshold in thresholds:
+            per_query = []
+            for item, ranking, relevant in zip(golden, rankings, relevant_in_index):
+                # Mismo filtro que SemanticRetriever.search
+                kept = [chunks[i] for i, distance in ranking if 1 / (1 + distance) >= threshold]
+                per_query.append(score_ranking(kept, item, relevant, k))
+            
+            count = len(per_query)
+            rows.append({
+                "top_k": k,
+                "similarity_threshold": threshold,
+                "recall": round(sum(s["recall"] for s in per_query) / count, 4),
+                "mrr": round(sum(s["mrr"] for s in per_query) / count, 4),
+                "ndcg": round(sum(s["ndcg"] for s in per_query) / count, 4),
+                "empty_results": sum(1 for s in per_query if not s["results"]),
+                "avg_results": round(sum(s["results"] for s in per_query) / count, 2),
+                "avg_context_chars": round(sum(s["context_chars"] for s in per_query) / count, 1),
+                "search_p50_ms": round(percentile(search_sorted, 0.50) * 1000, 3),
+                "search_p95_ms": round(percentile(search_sorted, 0.95) * 1000, 3),
+                "p50_ms": round(percentile(total_seconds, 0.50) * 1000, 3),
+                "p95_ms": round(percentile(total_seconds, 0.95) * 1000, 3)
+            })
+    return rows
+
+def recommend(rows: List[Dict[str, Any]], metric: str, tolerance: float) -> Optional[Dict[str, Any]]:
+    """
+    Configuración más barata que mantiene la calidad
+    
+    Entre las filas cuya métrica de calidad está a menos de `tolerance` de la
+    mejor, elige la de menor contexto enviado al LLM (el coste dominante por
+    consulta), después menor p95 y menor índice.
+    """
+    if not rows:
+        return None
+    best = max(row[metric] for row in rows)
+    candidates = [row for row in rows if row[metric] >= best - tolerance]
+    return min(candidates, key=lambda row: (row["avg_context_chars"], row["p95_ms"], row["index_bytes"], row["top_k"]))
+
+def _parse_list(value: str, cast) -> List:
+    return [cast(item) for item in value.split(",") if item.strip()]
+
+def run_evaluation(args: argparse.Namespace) -> Dict[str, Any]:
+    """Barrer todas las configuraciones y devolver el informe"""
+    work_dir = Path(args.work_dir or tempfile.mkdtemp(prefix="agente-cv-retrieval-eval-"))
+    work_dir.mkdir(parents=True, exist_ok=True)
+    # El ingestor abre una vector DB propia: no tocar la del proyecto
+    os.environ["VECTORDB_PATH"] = str(work_dir / "ingestor")
+    
+    from rag.ingest import DocumentIngestor
+    
+    golden = load_golden(args.golden)
+    top_ks = sorted(set(_parse_list(args.top_k, int)))
+    thresholds = sorted(set(_parse_list(args.thresholds, float)))
+    backends = _parse_list(args.backends, str)
+    
+    ingestor = DocumentIngestor()
+    model = ingestor.embedding_model
+    
+    # Las consultas se embeben una vez; su coste se suma a cada búsqueda
+    embed_seconds = []
+    vectors = []
+    for item in golden:
+        start = time.perf_counter()
+        vectors.append(model.encode([item.query])[0])
+        embed_seconds.append(time.perf_counter() - start)
+    query_vectors = np.asarray(vectors, dtype="float32")
+    
+    rows: List[Dict[str, Any]] = []
+    skipped: Dict[str, str] = {}
+    try:
+        for chunk_size in _parse_list(args.chunk_sizes, int):
+            for chunk_overlap in _parse_list(args.chunk_overlaps, int):
+                if chunk_overlap >= chunk_size:
+                    continue
+                print(f"▶ chunk_size={chunk_size} chunk_overlap={chunk_overlap}", flush=True)
+                chunks = build_chunks(ingestor, args.data_dir, chunk_size, chunk_overlap)
+                
+                start = time.perf_counter()
+                embeddings = np.asarray(model.encode([c["content"] for c in chunks]), dtype="float32")
+                embed_build_s = time.perf_counter() - start
+                
+                for backend in backends:
+                    index = make_index(backend)
+                    if index is None:
+                        skipped[backend] = "dependencia no instalada"
+                        continue
+                    start = time.perf_counter()
+                    index.build(embeddings, work_dir)
+                    build_s = time.perf_counter() - start
+                    
+                    for row in evaluate_index(index, chunks, golden, query_vectors, embed_seconds,
+                                              top_ks, thresholds, args.repeats):
+                        rows.append({
+                            "backend": backend,
+                            "chunk_size": chunk_size,
+                            "chunk_overlap": chunk_overlap,
+                            "chunks": len(chunks),
+                            "index_bytes": index.size_bytes(),
+                            "embed_build_s": round(embed_build_s, 3),
+                            "index_build_s": round(build_s, 4),
+                            **row
+                        })
+    finally:
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    commit, dirty = git_revision()
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "commit": commit,
+        "dirty": dirty,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "work_dir", "keep")},
+        "golden_queries": len(golden),
+        "skipped_backends": skipped,
+        "recommended": recommend(rows, args.quality_metric, args.tolerance),
+        "results": rows
+    }
+
+def print_report(report: Dict[str, Any], limit: int = 15) -> None:
+    """Tabla con las mejores configuraciones y la recomendada"""
+    metric = report["config"]["quality_metric"]
+    rows = sorted(report["results"], key=lambda r: (-r[metric], r["p95_ms"]))
+    
+    header = (f"{'backend':<11} {'size':>5} {'ovl':>4} {'k':>3} {'thr':>5} {'recall':>7} {'mrr':>6} "
+              f"{'ndcg':>6} {'ctx':>7} {'p50 ms':>8} {'p95 ms':>8} {'índice':>10}")
+    print("\n" + "=" * len(header))
+    print(f"RETRIEVAL EVAL  commit {report['commit']}{' (dirty)' if report['dirty'] else ''}  "
+          f"{report['golden_queries']} consultas, {len(rows)} configuraciones")
+    print("=" * len(header))
+    print(header)
+    for row in rows[:limit]:
+        print(f"{row['backend']:<11} {row['chunk_size']:>5} {row['chunk_overlap']:>4} {row['top_k']:>3} "
+              f"{row['similarity_threshold']:>5} {row['recall']:>7} {row['mrr']:>6} {row['ndcg']:>6} "
+              f"{row['avg_context_chars']:>7} {row['p50_ms']:>8} {row['p95_ms']:>8} {row['index_bytes']:>10}")
+    for backend, reason in report["skipped_backends"].items():
+        print(f"{backend:<11} omitido: {reason}")
+    
+    best = report["recommended"]
+    if best:
+        print("-" * len(header))
+        print(f"Recomendada ({metric} a ≤{report['config']['tolerance']} de la mejor, menor coste):")
+        print(f"  backend {best['backend']}: CHUNK_SIZE={best['chunk_size']} CHUNK_OVERLAP={best['chunk_overlap']} "
+              f"TOP_K_RESULTS={best['top_k']} SIMILARITY_THRESHOLD={best['similarity_threshold']}")
+        print(f"  recall {best['recall']}  mrr {best['mrr']}  ndcg {best['ndcg']}  "
+              f"p95 {best['p95_ms']} ms  contexto {best['avg_context_chars']} caracteres")
+    print("=" * len(header))
+
+def main(argv: Optional[List[str]] = None):
+    """Punto de entrada"""
+    parser = argparse.ArgumentParser(description="Evaluación calidad-vs-latencia de la recuperación")
+    parser.add_argument("--golden", default=str(ROOT / "benchmarks" / "golden" / "retrieval.jsonl"),
+                        help="Conjunto dorado (JSONL)")
+    parser.add_argument("--data-dir", default=str(ROOT / "data"), help="Documentos a indexar")
+    parser.add_argument("--chunk-sizes", default="500,1000,1500", help="Valores de CHUNK_SIZE")
+    parser.add_argument("--chunk-overlaps", default="100,200", help="Valores de CHUNK_OVERLAP")
+    parser.add_argument("--top-k", default="3,5,8", help="Valores de TOP_K_RESULTS")
+    parser.add_argument("--thresholds", default="0.0,0.4,0.5,0.7", help="Valores de SIMILARITY_THRESHOLD")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help=f"Backends de índice ({','.join(BACKENDS)})")
+    parser.add_argument("--repeats", type=int, default=5, help="Repeticiones de cada búsqueda para medir latencia")
+    parser.add_argument("--quality-metric", choices=QUALITY_METRICS, default="recall",
+                        help="Métrica que debe mantenerse al elegir la configuración")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="Pérdida de calidad admitida")
+    parser.add_argument("--output", help="Archivo JSON de resultados (por defecto benchmarks/results/)")
+    parser.add_argument("--work-dir", help="Directorio de trabajo (por defecto temporal)")
+    parser.add_argument("--keep", action="store_true", help="No borrar el directorio temporal")
+    args = parser.parse_args(argv)
+    
+    report = run_evaluation(args)
+    print_report(report)
+    
+    output = Path(args.output) if args.output else (
+        ROOT / "benchmarks" / "results" / f"retrieval-{datetime.now():%Y%m%d-%H%M%S}_{report['commit']}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Resultados guardados en {output}")
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+Benchmark Runner
+
+Benchmarks offline del sistema completo contra un LLM stub local:
+throughput de ingesta, QPS de recuperación y de FAQ, y percentiles de
+latencia del pipeline y del endpoint /chat bajo carga concurrente. Los
+resultados se guardan en JSON para comparar entre commits
+(ver benchmarks/compare.py).
+
+Uso:
+    python -m benchmarks.run --documents 200 --requests 300 --concurrency 16
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Callable, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.stub_llm_server import StubLLMServer, StubConfig
+from benchmarks.corpus import build_corpus, build_queries
+
+STAGES = ("ingest", "retrieval", "faq", "pipeline", "pipeline_tools", "chat")
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Percentil por rango más cercano sobre valores ordenados"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    """Resumen de una carga: throughput y percentiles en milisegundos"""
+    values = sorted(latencies)
+    count = len(values)
+    return {
+        "requests": count + errors,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_qps": round(count / elapsed, 2) if elapsed > 0 else 0.0,
+        "mean_ms": round(sum(values) / count * 1000, 3) if count else 0.0,
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0
+    }
+
+def run_load(fn: Callable[[str], bool], items: List[str], concurrency: int) -> Dict[str, Any]:
+    """
+    Ejecutar fn sobre todos los items con concurrencia fija
+    
+    Args:
+        fn: Función por petición; devuelve False (o lanza) si la petición falla
+        items: Entradas de la carga
+        concurrency: Peticiones simultáneas
+    """
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+    
+    def timed(item: str) -> None:
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            ok = fn(item) is not False
+        except Exception:
+            ok = False
+        duration = time.perf_counter() - start
+        with lock:
+            if ok:
+                latencies.append(duration)
+            else:
+                errors += 1
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, items))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+def configure_environment(work_dir: Path, llm_url: str, use_caches: bool) -> None:
+    """Aislar el benchmark: almacenamiento temporal, LLM stub y sin notificaciones"""
+    os.environ.update({
+        "VECTORDB_PATH": str(work_dir / "vectordb"),
+        "SQLITE_DB_PATH": str(work_dir / "sqlite" / "faq.db"),
+        "OPENAI_API_KEY": "stub-key",
+        "OPENAI_BASE_URL": llm_url,
+        "OPENAI_MODEL": "stub-model",
+        "TRACING_EXPORTER": "none",
+        "LOG_SPILL": "none",
+        "STATE_BACKEND": "memory",
+        "ANSWER_CACHE_TTL": "3600" if use_caches else "0",
+        "EMBEDDING_CACHE_TTL": "86400" if use_caches else "0",
+        "PUSHOVER_USER": "",
+        "PUSHOVER_TOKEN": "",
+        "SMTP_USERNAME": "",
+        "SMTP_PASSWORD": "",
+        "LOG_TO_FILE": "false"
+    })
+
+def bench_ingest(data_dir: Path) -> Dict[str, Any]:
+    """Throughput de ingesta completa (carga, chunking, embeddings, vector DB)"""
+    from rag.ingest import DocumentIngestor
+    
+    start = time.perf_counter()
+    ingestor = DocumentIngestor()
+    setup = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    result = ingestor.ingest_all(str(data_dir))
+    elapsed = time.perf_counter() - start
+    return {
+        "documents": result["documents_processed"],
+        "chunks": result["chunks_created"],
+        "setup_s": round(setup, 4),
+        "elapsed_s": round(elapsed, 4),
+        "documents_per_second": round(result["documents_processed"] / elapsed, 2),
+        "chunks_per_second": round(result["chunks_created"] / elapsed, 2)
+    }
+
+def bench_retrieval(queries: List[str], concurrency: int) -> Dict[str, Any]:
+    """QPS de búsqueda semántica"""
+    from rag.retriever import SemanticRetriever
+    
+    retriever = SemanticRetriever()
+    return run_load(lambda query: retriever.search(query) is not None, queries, concurrency)
+
+def bench_faq(queries: List[str], concurrency: int) -> Dict[str, Any]:
+    """QPS de búsqueda FAQ en SQLite"""
+    from tools.faq_sql import FAQSQLTool
+    
+    faq_tool = FAQSQLTool()
+    return run_load(lambda query: faq_tool.search_faqs(query) is not None, queries, concurrency)
+
+def bench_pipeline(queries: List[str], concurrency: int, mode: str = "classify") -> Dict[str, Any]:
+    """
+    Latencia del pipeline completo en proceso (sin HTTP)
+    
+    Args:
+        mode: Modo de orquestación ("classify" o "tools", ver ORCHESTRATION_MODE)
+    """
+    from agent.orchestrator import CVOrchestrator
+    
+    orchestrator = CVOrchestrator()
+    orchestrator.orchestration_mode = mode
+    return run_load(
+        lambda query: orchestrator.process_query(query, session_id="bench", notify_important=False)["success"],
+        queries,
+        concurrency
+    )
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def bench_chat(queries: List[str], concurrency: int) -> Dict[str, Any]:
+    """Latencia extremo a extremo de POST /chat con la API servida por uvicorn"""
+    import requests
+    import uvicorn
+    
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config("api.app:app", host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="bench-api", daemon=True)
+    thread.start()
+    
+    deadline = time.monotonic() + 120
+    while not server.started:
+        if not thread.is_alive() or time.monotonic() > deadline:
+            raise RuntimeError("La API no arrancó")
+        time.sleep(0.1)
+    
+    url = f"http://127.0.0.1:{port}/chat"
+    local = threading.local()
+    status_counts: Dict[str, int] = {}
+    lock = threading.Lock()
+    
+    def post(query: str) -> bool:
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        response = session.post(url, json={
+            "message": query,
+            "session_id": "bench",
+            "notify_important": False,
+            "evaluate_response": False
+        }, timeout=120)
+        with lock:
+            status_counts[str(response.status_code)] = status_counts.get(str(response.status_code), 0) + 1
+        return response.status_code == 200
+    
+    try:
+        result = run_load(post, queries, concurrency)
+    finally:
+        server.should_exit = True
+        thread.join(timeout=15)
+    
+    result["status_codes"] = status_counts
+    return result
+
+def git_revision() -> Tuple[str, bool]:
+    """Commit actual y si hay cambios sin commitear"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except Exception:
+        return "unknown", False
+
+def run_benchmarks(args: argparse.Namespace) -> Dict[str, Any]:
+    """Ejecutar las etapas seleccionadas y devolver el informe"""
+    work_dir = Path(args.work_dir or tempfile.mkdtemp(prefix="agente-cv-bench-"))
+    work_dir.mkdir(parents=True, exist_ok=True)
+    stages = [stage for stage in args.stages.split(",") if stage]
+    queries = build_queries(args.requests, unique=args.unique_queries)
+    
+    stub = StubLLMServer(StubConfig(
+        latency=args.llm_latency,
+        tokens_per_second=args.llm_tokens_per_second,
+        completion_tokens=args.llm_completion_tokens
+    )).start()
+    configure_environment(work_dir, stub.base_url, args.with_caches)
+    
+    results: Dict[str, Any] = {}
+    try:
+        build_corpus(str(work_dir / "data"), documents=args.documents, sections=args.sections)
+        
+        # La ingesta siempre se ejecuta: recuperación, pipeline y chat necesitan el índice
+        runners = {
+            "retrieval": lambda: bench_retrieval(queries, args.concurrency),
+            "faq": lambda: bench_faq(queries, args.concurrency),
+            "pipeline": lambda: bench_pipeline(queries, args.concurrency),
+            "pipeline_tools": lambda: bench_pipeline(queries, args.concurrency, mode="tools"),
+            "chat": lambda: bench_chat(queries, args.concurrency)
+        }
+        for stage in ["ingest"] + [s for s in stages if s != "ingest"]:
+            print(f"▶ {stage}...", flush=True)
+            llm_requests = stub.requests_served
+            try:
+                if stage == "ingest":
+                    results[stage] = bench_ingest(work_dir / "data")
+                else:
+                    results[stage] = runners[stage]()
+                    results[stage]["llm_requests"] = stub.requests_served - llm_requests
+            except Exception as e:
+                results[stage] = {"error": f"{type(e).__name__}: {e}"}
+    finally:
+        stub.stop()
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    commit, dirty = git_revision()
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "commit": commit,
+        "dirty": dirty,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "work_dir", "keep")},
+        "stub_llm_requests": stub.requests_served,
+        "results": results
+    }
+
+def print_report(report: Dict[str, Any]) -> None:
+    """Resumen legible del informe"""
+    print("\n" + "=" * 72)
+    print(f"BENCHMARKS  commit {report['commit']}{' (dirty)' if report['dirty'] else ''}")
+    print("=" * 72)
+    for stage, result in report["results"].items():
+        if "error" in result:
+            print(f"{stage:<10} ERROR {result['error']}")
+        elif stage == "ingest":
+            print(f"{stage:<10} {result['documents_per_second']:>9} docs/s  {result['chunks_per_second']:>9} chunks/s")
+        else:
+            print(f"{stage:<10} {result['throughput_qps']:>9} qps  p50 {result['p50_ms']:>9} ms  "
+                  f"p95 {result['p95_ms']:>9} ms  p99 {result['p99_ms']:>9} ms  errores {result['errors']}")
+    print("=" * 72)
+
+def main(argv: Optional[List[str]] = None):
+    """Punto de entrada"""
+    parser = argparse.ArgumentParser(description="Benchmarks offline de agente-cv")
+    parser.add_argument("--documents", type=int, default=50, help="Documentos del corpus sintético")
+    parser.add_argument("--sections", type=int, default=6, help="Secciones por documento")
+    parser.add_argument("--requests", type=int, default=200, help="Peticiones por etapa de carga")
+    parser.add_argument("--unique-queries", type=int, default=50, help="Consultas distintas en la carga")
+    parser.add_argument("--concurrency", type=int, default=8, help="Peticiones simultáneas")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Etapas separadas por comas ({','.join(STAGES)})")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Latencia base del LLM stub (s)")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=200.0, help="Ritmo de tokens del LLM stub")
+    parser.add_argument("--llm-completion-tokens", type=int, default=120, help="Tokens por respuesta del LLM stub")
+    parser.add_argument("--with-caches", action="store_true", help="Mantener activas las cachés de respuestas y embeddings")
+    parser.add_argument("--output", help="Archivo JSON de resultados (por defecto benchmarks/results/)")
+    parser.add_argument("--work-dir", help="Directorio de trabajo (por defecto temporal)")
+    parser.add_argument("--keep", action="store_true", help="No borrar el directorio temporal")
+    args = parser.parse_args(argv)
+    
+    report = run_benchmarks(args)
+    print_report(report)
+    
+    output = Path(args.output) if args.output else (
+        ROOT / "benchmarks" / "results" / f"{datetime.now():%Y%m%d-%H%M%S}_{report['commit']}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Resultados guardados en {output}")
+    return report
+
+if __name__ == "__main__":
+    main()
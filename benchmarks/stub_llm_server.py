@@ -0,0 +1,254 @@
+"""
+Stub LLM Server
+
+Servidor local compatible con la API de OpenAI (/v1/chat/completions y
+/v1/models) para ejecutar el pipeline completo sin claves ni red. La
+latencia de cada respuesta es la latencia base más el tiempo de emitir los
+tokens de la respuesta al ritmo configurado, de modo que los benchmarks
+reproducen el coste dominante de las llamadas reales.
+"""
+
+import re
+import json
+import time
+import zlib
+import uuid
+import random
+import argparse
+import threading
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WORDS = (
+    "experiencia proyecto python arquitectura datos equipo cliente diseño "
+    "plataforma despliegue métricas rendimiento liderazgo análisis modelo "
+    "servicio integración calidad producto resultados tecnologías"
+).split()
+
+CATEGORIES = ["EXPERIENCE", "SKILLS", "PROJECTS", "EDUCATION", "BASIC_INFO"]
+TOOLS = ["RAG_ONLY", "FAQ_ONLY", "COMBINED"]
+TOOL_CALL_PLANS = [["rag_search"], ["faq_query"], ["rag_search", "faq_query"], ["combined_search"]]
+
+@dataclass
+class StubConfig:
+    """Perfil de latencia del stub"""
+    latency: float = 0.05            # segundos antes del primer token
+    tokens_per_second: float = 200.0  # ritmo de generación
+    completion_tokens: int = 120     # tokens por respuesta de texto
+    seed: int = 42
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """Handler HTTP con las rutas mínimas de la API de OpenAI"""
+    
+    server_version = "StubLLM/1.0"
+    protocol_version = "HTTP/1.1"
+    
+    def log_message(self, format, *args):
+        # Silenciar el log de acceso por petición
+        pass
+    
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json({"object": "list", "data": [{"id": "stub-model", "object": "model"}]})
+        else:
+            self._send_json({"error": {"message": "not found"}}, status=404)
+    
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", "0"))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json({"error": {"message": "invalid JSON"}}, status=400)
+            return
+        
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json({"error": {"message": "not found"}}, status=404)
+            return
+        
+        self.server.stats["requests"] += 1
+        message = self._completion_message(body)
+        content = message["content"] or ""
+        completion_tokens = len(content.split()) + sum(
+            len(call["function"]["arguments"].split()) + 5 for call in message.get("tool_calls", [])
+        )
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in body.get("messages", []))
+        
+        config: StubConfig = self.server.config
+        time.sleep(config.latency + completion_tokens / config.tokens_per_second)
+        
+        self._send_json({
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub-model"),
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        })
+    
+    def _completion_message(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Mensaje del asistente: llamadas a herramientas si se ofrecen y aún no hay resultados"""
+        messages: List[Dict[str, Any]] = body.get("messages", [])
+        offered = {tool["function"]["name"] for tool in body.get("tools", [])}
+        has_results = any(m.get("role") == "tool" for m in messages)
+        
+        if offered and body.get("tool_choice") != "none" and not has_results:
+            query = next((str(m.get("content", "")) for m in reversed(messages) if m.get("role") == "user"), "")
+            rng = random.Random(zlib.crc32(query.encode("utf-8")) ^ self.server.config.seed)
+            plan = [name for name in rng.choice(TOOL_CALL_PLANS) if name in offered] or sorted(offered)[:1]
+            return {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "id": f"call_{uuid.uuid4().hex[:12]}",
+                        "type": "function",
+                        "function": {"name": name, "arguments": json.dumps({"query": query}, ensure_ascii=False)}
+                    }
+                    for name in plan
+                ]
+            }
+        
+        return {"role": "assistant", "content": self._completion_text(body)}
+    
+    def _completion_text(self, body: Dict[str, Any]) -> str:
+        """Texto de respuesta según el tipo de prompt"""
+        messages: List[Dict[str, Any]] = body.get("messages", [])
+        prompt = " ".join(str(m.get("content", "")) for m in messages)
+        rng = random.Random(zlib.crc32(prompt.encode("utf-8")) ^ self.server.config.seed)
+        
+        # Salida estructurada con JSON Schema: objeto que cumple el schema
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            return json.dumps(self._from_schema(response_format["json_schema"]["schema"], rng))
+        
+        # Clasificación (individual o por lotes): JSON válido
+        if "Clasifica cada una" in prompt:
+            count = len(re.findall(r'^\d+\. "', prompt, re.MULTILINE))
+            return json.dumps([self._classification(rng, i + 1) for i in range(count)])
+        if "Clasifica" in prompt:
+            return json.dumps(self._classification(rng))
+        
+        # Evaluación: puntuaciones en JSON
+        if "evalú" in prompt.lower() or "evaluate" in prompt.lower():
+            scores = {key: rng.randint(6, 10) for key in ("relevance", "accuracy", "completeness", "clarity")}
+            return json.dumps({**scores, "overall_score": sum(scores.values()) / 4, "feedback": "ok"})
+        
+        tokens = self.server.config.completion_tokens
+        return " ".join(rng.choice(WORDS) for _ in range(tokens))
+    
+    @classmethod
+    def _from_schema(cls, schema: Dict[str, Any], rng: random.Random) -> Any:
+        """Valor aleatorio válido para un JSON Schema (subconjunto usado por el agente)"""
+        if "enum" in schema:
+            return rng.choice(schema["enum"])
+        kind = schema.get("type")
+        if kind == "object":
+            return {key: cls._from_schema(sub, rng) for key, sub in schema.get("properties", {}).items()}
+        if kind == "array":
+            return [cls._from_schema(schema.get("items", {}), rng) for _ in range(rng.randint(1, 3))]
+        if kind in ("number", "integer"):
+            low, high = schema.get("minimum", 0), schema.get("maximum", 100)
+            return rng.randint(int(low + (high - low) * 0.6), int(high))
+        return rng.choice(WORDS)
+    
+    @staticmethod
+    def _classification(rng: random.Random, index: Optional[int] = None) -> Dict[str, Any]:
+        data = {
+            "category": rng.choice(CATEGORIES),
+            "confidence": rng.randint(60, 95),
+            "recommended_tool": rng.choice(TOOLS),
+            "reasoning": "stub",
+            "search_terms": rng.sample(WORDS, 3),
+            "expected_complexity": rng.choice(["LOW", "MEDIUM"])
+        }
+        if index is not None:
+            data["index"] = index
+        return data
+    
+    def _send_json(self, payload: Dict[str, Any], status: int = 200) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class StubLLMServer:
+    """Servidor stub ejecutándose en un thread de fondo"""
+    
+    def __init__(self, config: Optional[StubConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        """
+        Inicializar servidor
+        
+        Args:
+            config: Perfil de latencia
+            host: Interfaz de escucha
+            port: Puerto (0 = libre aleatorio)
+        """
+        self.httpd = ThreadingHTTPServer((host, port), StubLLMHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.config = config or StubConfig()
+        self.httpd.stats = {"requests": 0}
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def base_url(self) -> str:
+        """URL base para OPENAI_BASE_URL"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+    
+    @property
+    def requests_served(self) -> int:
+        return self.httpd.stats["requests"]
+    
+    def start(self) -> 'StubLLMServer':
+        """Arrancar en segundo plano"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="stub-llm", daemon=True)
+        self._thread.start()
+        logger.info(f"Stub LLM escuchando en {self.base_url}")
+        return self
+    
+    def stop(self) -> None:
+        """Detener el servidor"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+    
+    def __enter__(self) -> 'StubLLMServer':
+        return self.start()
+    
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+def main():
+    """Ejecutar el stub de forma independiente"""
+    parser = argparse.ArgumentParser(description="Servidor LLM stub compatible con OpenAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.05, help="Latencia base en segundos")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    args = parser.parse_args()
+    
+    config = StubConfig(args.latency, args.tokens_per_second, args.completion_tokens)
+    server = StubLLMServer(config, args.host, args.port)
+    print(f"OPENAI_BASE_URL={server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Markdown Chunker
+
+División de documentos markdown siguiendo su estructura: cada chunk
+pertenece a una sección (o a varias secciones hermanas pequeñas), conserva
+la ruta de encabezados como metadata y tiene un ID derivado de su contenido,
+de modo que editar un párrafo solo cambia los IDs de los chunks afectados.
+"""
+
+import re
+import hashlib
+from dataclasses import dataclass
+from typing import List, Dict, Tuple
+import logging
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.docstore.document import Document
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+FENCE_RE = re.compile(r"^\s*(```|~~~)")
+PATH_SEPARATOR = " > "
+
+@dataclass
+class Section:
+    """Sección markdown: encabezado y cuerpo hasta el siguiente encabezado"""
+    path: Tuple[str, ...]  # encabezados desde la raíz del documento
+    text: str              # incluye la línea del propio encabezado
+    has_body: bool
+
+def content_hash(text: str) -> str:
+    """Hash estable del contenido de un chunk"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def _common_prefix(a: Tuple[str, ...], b: Tuple[str, ...]) -> Tuple[str, ...]:
+    prefix = []
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        prefix.append(x)
+    return tuple(prefix)
+
+class MarkdownChunker:
+    """Chunker consciente de encabezados con IDs direccionados por contenido"""
+    
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+        """
+        Inicializar chunker
+        
+        Args:
+            chunk_size: Tamaño máximo orientativo de un chunk en caracteres
+            chunk_overlap: Solapamiento al partir secciones más largas que chunk_size
+        """
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separators=["\n\n", "\n", ". ", " ", ""],
+            length_function=len,
+        )
+    
+    def split_sections(self, content: str) -> List[Section]:
+        """Dividir un documento en secciones por encabezados (ignorando bloques de código)"""
+        sections: List[Section] = []
+        stack: List[Tuple[int, str]] = []
+        lines: List[str] = []
+        in_fence = False
+        
+        def flush():
+            text = "\n".join(lines).strip()
+            if text:
+                body = lines[1:] if stack and HEADING_RE.match(lines[0]) else lines
+                sections.append(Section(
+                    path=tuple(title for _, title in stack),
+                    text=text,
+                    has_body=any(line.strip() for line in body)
+                ))
+        
+        for line in content.splitlines():
+            if FENCE_RE.match(line):
+                in_fence = not in_fence
+            match = None if in_fence else HEADING_RE.match(line)
+            if match:
+                flush()
+                level = len(match.group(1))
+                while stack and stack[-1][0] >= level:
+                    stack.pop()
+                stack.append((level, match.group(2).strip()))
+                lines = [line]
+            else:
+                lines.append(line)
+        flush()
+        
+        return sections
+    
+    def split_text(self, content: str) -> List[Tuple[str, Tuple[str, ...]]]:
+        """
+        Chunks de un documento
+        
+        Las secciones hermanas pequeñas se agrupan mientras quepan en
+        chunk_size, los encabezados sin cuerpo se anteponen a su primera
+        subsección y las secciones grandes se parten y cada trozo que no
+        empieza por su encabezado lleva la ruta de encabezados como primera
+        línea, para no perder el contexto en el embedding.
+        
+        Returns:
+            Lista de (texto, ruta de encabezados)
+        """
+        chunks: List[Tuple[str, Tuple[str, ...]]] = []
+        buffer: List[str] = []
+        buffer_path: Tuple[str, ...] = ()
+        parent_depth = 0
+        
+        def flush():
+            if buffer:
+                chunks.append(("\n\n".join(buffer), buffer_path))
+                buffer.clear()
+        
+        pending: List[str] = []
+        sections = self.split_sections(content)
+        for i, section in enumerate(sections):
+            # Un encabezado sin cuerpo abre grupo y se antepone a su primera subsección
+            if not section.has_body and i + 1 < len(sections) and \
+                    sections[i + 1].path[:len(section.path)] == section.path:
+                flush()
+                pending.append(section.text)
+                continue
+            
+            text = "\n\n".join(pending + [section.text])
+            pending.clear()
+            
+            if len(text) > self.chunk_size:
+                flush()
+                breadcrumb = PATH_SEPARATOR.join(section.path)
+                for j, piece in enumerate(self.splitter.split_text(text)):
+                    if j and breadcrumb:
+                        piece = f"{breadcrumb}\n\n{piece}"
+                    chunks.append((piece, section.path))
+                continue
+            
+            if buffer:
+                prefix = _common_prefix(buffer_path, section.path)
+                size = sum(len(item) + 2 for item in buffer) + len(text)
+                if size <= self.chunk_size and len(prefix) >= parent_depth:
+                    buffer.append(text)
+                    buffer_path = prefix
+                    continue
+                flush()
+            
+            buffer.append(text)
+            buffer_path, parent_depth = section.path, max(0, len(section.path) - 1)
+        flush()
+        
+        return chunks
+    
+    def chunk_document(self, document: Document) -> List[Document]:
+        """
+        Dividir un documento en chunks con metadata de sección e ID estable
+        
+        El ID combina el nombre del archivo con el hash de (ruta relativa,
+        contenido); los chunks idénticos dentro del mismo documento se
+        distinguen por su número de aparición.
+        """
+        source = document.metadata.get("relative_path", document.metadata.get("source", ""))
+        stem = document.metadata.get("filename", source)
+        pieces = self.split_text(document.page_content)
+        
+        seen: Dict[str, int] = {}
+        chunks = []
+        for i, (text, path) in enumerate(pieces):
+            digest = content_hash(f"{source}\n{text}")[:16]
+            seen[digest] = seen.get(digest, 0) + 1
+            chunk_id = f"{stem}_{digest}" if seen[digest] == 1 else f"{stem}_{digest}_{seen[digest]}"
+            
+            metadata = dict(document.metadata)
+            metadata.update({
+                "chunk_id": chunk_id,
+                "content_hash": content_hash(text),
+                "heading_path": PATH_SEPARATOR.join(path),
+                "section": path[-1] if path else "",
+                "chunk_index": i,
+                "total_chunks": len(pieces)
+            })
+            chunks.append(Document(page_content=text, metadata=metadata))
+        
+        return chunks
+    
+    def chunk_documents(self, documents: List[Document]) -> List[Document]:
+        """Dividir una lista de documentos"""
+        chunks = []
+        for document in documents:
+            chunks.extend(self.chunk_document(document))
+        return chunks
@@ -0,0 +1,453 @@
+"""
+Extractive QA Module
+
+Respuestas extractivas para consultas factuales simples ("¿Qué
+certificaciones tienes?", "¿Dónde estudiaste?"): en la ingesta se indexan
+las frases, elementos de lista y secciones de cada chunk con sus embeddings
+(un archivo por versión del índice, junto al puntero al índice activo) y en
+la consulta se eligen los fragmentos que mejor encajan combinando similitud
+de embeddings y coincidencia léxica ponderada por IDF. Con confianza
+suficiente la respuesta se construye con esos fragmentos, sin LLM.
+"""
+
+import os
+import re
+import json
+import math
+import threading
+import unicodedata
+from dataclasses import dataclass, field, asdict
+from typing import List, Dict, Any, Optional, Callable, Sequence, Tuple
+import logging
+from dotenv import load_dotenv
+
+import numpy as np
+from langchain.docstore.document import Document
+
+from rag.chunker import HEADING_RE, PATH_SEPARATOR, content_hash
+from tools.metrics import metrics
+from tools.tracing import traced
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+INDEX_FILE_PREFIX = "extractive"
+
+SENTENCE = "sentence"
+SECTION = "section"
+
+# answered: respuesta extractiva; low_confidence: ningún fragmento supera el
+# umbral; skipped: consulta demasiado larga; not_factual: la consulta no pide un
+# dato concreto; unavailable: sin índice de frases
+OUTCOMES = ("answered", "low_confidence", "skipped", "not_factual", "unavailable")
+
+# Peso de la similitud de embeddings frente a la coincidencia léxica
+SEMANTIC_WEIGHT = 0.6
+
+# Frases de la misma sección que acompañan a la mejor (proporción de su puntuación)
+SUPPORT_RATIO = 0.85
+MAX_ANSWER_SENTENCES = 3
+MAX_SECTION_LINES = 8
+
+# Prefijo con el que se comparan los términos (aproxima la raíz: certificación/certificaciones)
+STEM_LENGTH = 6
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+LIST_ITEM_RE = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+")
+MARKUP_RE = re.compile(r"\*\*|__|`")
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+(?=[A-ZÁÉÍÓÚÑ¿¡\"“])")
+
+# Intención factual (sobre el texto normalizado): preguntas qué/cuál/dónde/cuándo/
+# cuánto/quién o peticiones de enumerar; se excluyen las de opinión, motivo o modo
+FACTUAL_RE = re.compile(
+    r"\b(?:que|cual(?:es)?|donde|cuando|cuant[oa]s?|quien(?:es)?|"
+    r"what|which|where|when|who|how (?:many|much|long)|"
+    r"lista|enumera|dime|list|name)\b"
+)
+NON_FACTUAL_RE = re.compile(
+    r"\b(?:por ?que|para que|como|opin\w*|crees|piensas|consideras|recomienda\w*|"
+    r"deberia\w*|mejor|peor|why|how|think|opinion|should|better)\b"
+)
+
+STOPWORDS = frozenset("""
+al algo como con cual cuales cuando del donde el ella en entre es esta este esto fue
+ha han hay la las le les lo los mas me mi mis muy no para pero por que se sea ser si
+sin sobre son su sus tambien te tu un una uno unos ya yo the and of to in is
+""".split())
+
+Encoder = Callable[[List[str]], Any]
+
+def _normalize(text: str) -> str:
+    """Minúsculas y sin tildes"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+def is_factual(query: str) -> bool:
+    """Indica si la consulta pide un dato concreto del CV (no opinión, motivo o modo)"""
+    text = _normalize(query)
+    if not FACTUAL_RE.search(text):
+        return False
+    # "how many" es factual aunque contenga "how"
+    return not NON_FACTUAL_RE.search(re.sub(r"\bhow (?:many|much|long)\b", "", text))
+
+def terms(text: str) -> List[str]:
+    """Términos para la coincidencia léxica (sin stopwords, recortados a STEM_LENGTH)"""
+    return [
+        word[:STEM_LENGTH] for word in WORD_RE.findall(_normalize(text))
+        if len(word) > 2 and word not in STOPWORDS
+    ]
+
+def _clean(line: str) -> str:
+    """Texto de una línea markdown sin marcador de lista ni énfasis"""
+    return " ".join(MARKUP_RE.sub("", LIST_ITEM_RE.sub("", line)).split())
+
+def index_file_path(vectordb_path: str, version: str) -> str:
+    """Ruta del índice de frases de una versión del índice"""
+    return os.path.join(vectordb_path, f"{INDEX_FILE_PREFIX}_{version}.json")
+
+@dataclass
+class Span:
+    """Fragmento indexado: una frase (o elemento de lista) o una sección completa"""
+    kind: str
+    text: str
+    source: str
+    section: str
+    heading_path: str
+    lines: List[str] = field(default_factory=list)  # solo secciones: contenido en markdown
+    
+    @property
+    def embed_text(self) -> str:
+        """Texto que se embebe: el fragmento con su sección como contexto"""
+        if self.kind == SECTION:
+            return f"{self.heading_path}\n{self.text}"
+        return f"{self.section}: {self.text}" if self.section else self.text
+    
+    @property
+    def key(self) -> str:
+        return content_hash(f"{self.kind}\n{self.embed_text}")
+
+def split_spans(chunks: Sequence[Document]) -> List[Span]:
+    """
+    Frases y secciones de los chunks de la ingesta
+    
+    Cada elemento de lista o línea "**Clave:** valor" es una frase; los
+    párrafos se dividen en frases. Cada chunk aporta además una sección con
+    todo su contenido. Los fragmentos repetidos por el solapamiento entre
+    chunks se indexan una sola vez.
+    """
+    spans: List[Span] = []
+    seen = set()
+    
+    def add(span: Span) -> None:
+        key = (span.kind, span.source, span.heading_path, span.text)
+        if key not in seen:
+            seen.add(key)
+            spans.append(span)
+    
+    for chunk in chunks:
+        metadata = chunk.metadata
+        source = metadata.get("filename") or os.path.basename(str(metadata.get("source", "documento")))
+        heading_path = metadata.get("heading_path", "")
+        section = metadata.get("section", "")
+        current, current_path = section, heading_path
+        lines: List[str] = []
+        plain: List[str] = []
+        
+        for raw in chunk.page_content.splitlines():
+            heading = HEADING_RE.match(raw)
+            if heading:
+                current = _clean(heading.group(2))
+                current_path = heading_path if current == section else f"{heading_path}{PATH_SEPARATOR}{current}"
+                if current != section:
+                    lines.append(f"**{current}**")
+                    plain.append(current)
+                continue
+            text = _clean(raw)
+            if len(WORD_RE.findall(text)) < 2:
+                continue
+            is_item = bool(LIST_ITEM_RE.match(raw)) or raw.lstrip().startswith("**")
+            lines.append(f"- {text}" if LIST_ITEM_RE.match(raw) else text)
+            plain.append(text)
+            for sentence in ([text] if is_item else SENTENCE_SPLIT_RE.split(text)):
+                if len(WORD_RE.findall(sentence)) >= 2:
+                    add(Span(SENTENCE, sentence.strip(), source, current, current_path))
+        
+        if plain:
+            add(Span(SECTION, " ".join(plain)[:1000], source, section, heading_path,
+                     lines=lines[:MAX_SECTION_LINES]))
+    
+    return spans
+
+def build_extractive_index(chunks: Sequence[Document],
+                           encode: Encoder,
+                           vectordb_path: str,
+                           version: str,
+                           previous_version: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Construir y guardar el índice de frases de una versión del índice
+    
+    Los fragmentos que ya estaban en el índice de la versión anterior
+    reutilizan su embedding; solo se embeben los nuevos o cambiados.
+    
+    Args:
+        chunks: Chunks de la ingesta
+        encode: Función que devuelve los embeddings de una lista de textos
+        vectordb_path: Directorio del índice
+        version: Versión del índice que se está construyendo
+        previous_version: Versión activa hasta ahora
+    """
+    spans = split_spans(chunks)
+    known: Dict[str, List[float]] = {}
+    if previous_version:
+        try:
+            with open(index_file_path(vectordb_path, previous_version), 'r', encoding='utf-8') as file:
+                known = {entry["key"]: entry["embedding"] for entry in json.load(file)["spans"]}
+        except (OSError, ValueError, KeyError):
+            pass
+    
+    missing = [span for span in spans if span.key not in known]
+    if missing:
+        for span, embedding in zip(missing, encode([span.embed_text for span in missing])):
+            known[span.key] = [round(float(x), 6) for x in embedding]
+    
+    path = index_file_path(vectordb_path, version)
+    os.makedirs(vectordb_path, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump({
+            "version": version,
+            "spans": [{**asdict(span), "key": span.key, "embedding": known[span.key]} for span in spans]
+        }, file, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    
+    logger.info(f"Índice extractivo {version}: {len(spans)} fragmentos, {len(missing)} embeddings generados")
+    return {
+        "spans": len(spans),
+        "embeddings_reused": len(spans) - len(missing),
+        "embeddings_generated": len(missing)
+    }
+
+def remove_extractive_index(vectordb_path: str, version: str) -> None:
+    """Borrar el índice de frases de una versión retirada"""
+    try:
+        os.remove(index_file_path(vectordb_path, version))
+    except FileNotFoundError:
+        pass
+
+class ExtractiveIndex:
+    """Fragmentos de una versión del índice con sus embeddings normalizados"""
+    
+    def __init__(self, spans: List[Span], embeddings: Any):
+        self.spans = spans
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(spans), -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.matrix = matrix / np.where(norms == 0, 1.0, norms)
+        self.terms = [set(terms(span.embed_text)) for span in spans]
+        
+        document_frequency: Dict[str, int] = {}
+        for span_terms in self.terms:
+            for term in span_terms:
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+        self.idf = {
+            term: math.log(1 + len(spans) / count) for term, count in document_frequency.items()
+        }
+    
+    @classmethod
+    def load(cls, vectordb_path: str, version: str) -> Optional['ExtractiveIndex']:
+        """Cargar el índice de frases de una versión (None si no existe)"""
+        try:
+            with open(index_file_path(vectordb_path, version), 'r', encoding='utf-8') as file:
+                entries = json.load(file)["spans"]
+        except FileNotFoundError:
+            return None
+        spans = [Span(**{name: entry[name] for name in Span.__dataclass_fields__}) for entry in entries]
+        return cls(spans, [entry["embedding"] for entry in entries])
+    
+    def rank(self, query: str, query_embedding: Sequence[float], limit: int = 10) -> List[Tuple[float, Span]]:
+        """
+        Fragmentos ordenados por puntuación combinada (0-1)
+        
+        La parte léxica es la proporción (ponderada por IDF) de términos de la
+        consulta presentes en el fragmento; los términos que no aparecen en
+        ningún documento no cuentan.
+        """
+        if not self.spans:
+            return []
+        vector = np.asarray(query_embedding, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        semantic = np.clip(self.matrix @ vector, 0.0, 1.0)
+        
+        query_terms = [term for term in set(terms(query)) if term in self.idf]
+        total = sum(self.idf[term] for term in query_terms)
+        lexical = np.array([
+            sum(self.idf[term] for term in query_terms if term in span_terms) / total if total else 0.0
+            for span_terms in self.terms
+        ], dtype=np.float32)
+        
+        scores = SEMANTIC_WEIGHT * semantic + (1 - SEMANTIC_WEIGHT) * lexical
+        order = np.argsort(-scores)[:limit]
+        return [(float(scores[i]), self.spans[i]) for i in order]
+
+@dataclass
+class ExtractiveAnswer:
+    """Respuesta extractiva: fragmentos elegidos y sus fuentes"""
+    kind: str
+    section: str
+    lines: List[str]
+    sources: List[str]
+    confidence: float
+    
+    @property
+    def context(self) -> str:
+        """Fragmentos como texto (contexto de la respuesta)"""
+        return "\n".join(self.lines)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+class ExtractiveAnswerer:
+    """Respuestas extractivas sobre el índice activo del retriever (thread-safe)"""
+    
+    def __init__(self, retriever, min_confidence: Optional[float] = None, max_query_words: Optional[int] = None):
+        """
+        Inicializar
+        
+        Args:
+            retriever: SemanticRetriever (índice activo y embeddings de consultas)
+            min_confidence: Puntuación mínima para responder (EXTRACTIVE_MIN_CONFIDENCE)
+            max_query_words: Consultas más largas no se consideran factuales
+                simples (EXTRACTIVE_MAX_QUERY_WORDS)
+        """
+        self.retriever = retriever
+        # Opcional hasta medir su precisión frente al pipeline completo
+        self.enabled = os.getenv("EXTRACTIVE_QA", "false").lower() == "true"
+        self.min_confidence = min_confidence if min_confidence is not None else \
+            float(os.getenv("EXTRACTIVE_MIN_CONFIDENCE", "0.6"))
+        self.max_query_words = max_query_words if max_query_words is not None else \
+            int(os.getenv("EXTRACTIVE_MAX_QUERY_WORDS", "12"))
+        self.counts = {outcome: 0 for outcome in OUTCOMES}
+        self._index: Optional[ExtractiveIndex] = None
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+    
+    def index(self) -> Optional[ExtractiveIndex]:
+        """Índice de frases de la versión activa (se recarga al cambiar de versión)"""
+        version = self.retriever.index_version
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    try:
+                        self._index = ExtractiveIndex.load(self.retriever.vectordb_path, version)
+                    except Exception as e:
+                        logger.error(f"Error cargando el índice extractivo {version}: {e}")
+                        self._index = None
+                    if self._index is None:
+                        logger.info(f"Sin índice extractivo para la versión {version}")
+                    self._version = version
+        return self._index
+    
+    @traced("extractive_qa", result_attributes=lambda a: {
+        "answered": a is not None,
+        "confidence": a.confidence if a else None
+    })
+    def answer(self, query: str, min_confidence: Optional[float] = None,
+               fallback: bool = False) -> Optional[ExtractiveAnswer]:
+        """
+        Responder con fragmentos del índice si alguno encaja con suficiente confianza
+        
+        Args:
+            query: Consulta del usuario
+            min_confidence: Umbral para esta consulta (por defecto el configurado)
+            fallback: Respuesta de último recurso sin LLM (modo degradado): se
+                intenta aunque EXTRACTIVE_QA esté desactivado o la consulta no
+                sea factual
+        
+        Returns:
+            Respuesta extractiva o None
+        """
+        if not self.enabled and not fallback:
+            return None
+        if len(WORD_RE.findall(query)) > self.max_query_words:
+            self._record("skipped")
+            return None
+        if not fallback and not is_factual(query):
+            self._record("not_factual")
+            return None
+        index = self.index()
+        if index is None:
+            self._record("unavailable")
+            return None
+        
+        threshold = self.min_confidence if min_confidence is None else min_confidence
+        ranked = index.rank(query, self.retriever.embed_query(query))
+        if not ranked or ranked[0][0] < threshold or ranked[0][0] <= 0:
+            self._record("low_confidence")
+            return None
+        
+        score, best = ranked[0]
+        if best.kind == SECTION:
+            lines = best.lines
+        elif set(terms(query)) & set(terms(best.section)):
+            # La consulta nombra la sección ("¿qué certificaciones...?"): se responde con toda ella
+            lines = [
+                span.text for span in index.spans
+                if span.kind == SENTENCE and span.source == best.source and span.heading_path == best.heading_path
+            ][:MAX_SECTION_LINES]
+        else:
+            # Frases de la misma sección casi tan relevantes como la mejor
+            lines = [
+                span.text for span_score, span in ranked
+                if span.kind == SENTENCE and span.source == best.source and span.section == best.section
+                and span_score >= score * SUPPORT_RATIO
+            ][:MAX_ANSWER_SENTENCES]
+        
+        self._record("answered")
+        return ExtractiveAnswer(
+            kind=best.kind,
+            section=best.section or best.source,
+            lines=lines,
+            sources=[f"{best.source} › {best.heading_path}" if best.heading_path else best.source],
+            confidence=round(score, 3)
+        )
+    
+    def _record(self, outcome: str) -> None:
+        with self._lock:
+            self.counts[outcome] += 1
+        metrics.inc(metrics.extractive_answers, outcome=outcome)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Resultados por tipo e índice cargado"""
+        with self._lock:
+            counts = dict(self.counts)
+        considered = sum(counts.values())
+        return {
+            "enabled": self.enabled,
+            "index_version": self._version,
+            "spans": len(self._index.spans) if self._index else 0,
+            "min_confidence": self.min_confidence,
+            **counts,
+            "answer_rate": (counts["answered"] / considered) * 100 if considered else 0.0
+        }
+
+def main():
+    """Función principal para testing"""
+    from rag.chunker import MarkdownChunker
+    from rag.retriever import SemanticRetriever
+    
+    with open("./data/cv.md", 'r', encoding='utf-8') as file:
+        document = Document(page_content=file.read(), metadata={"filename": "cv.md", "source": "./data/cv.md"})
+    spans = split_spans(MarkdownChunker().chunk_document(document))
+    print(f"Fragmentos en cv.md: {len(spans)} ({sum(1 for s in spans if s.kind == SECTION)} secciones)")
+    
+    answerer = ExtractiveAnswerer(SemanticRetriever())
+    for query in ["¿Qué certificaciones tienes?", "¿Dónde estudiaste?", "¿Qué idiomas hablas?"]:
+        answer = answerer.answer(query)
+        print(f"\n{query}\n{answer.context if answer else 'Sin respuesta extractiva'}")
+        if answer:
+            print(f"Confianza: {answer.confidence} | Fuente: {', '.join(answer.sources)}")
+    print(f"\nEstadísticas: {answerer.get_stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -7,64 +7,105 @@ del CV y proyectos para crear un índice de búsqueda semántica.
 
 import os
 import glob
+import json
+from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Set
 import logging
 from dotenv import load_dotenv
 
 import chromadb
 from chromadb.config import Settings
 from sentence_transformers import SentenceTransformer
-import markdown
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.docstore.document import Document
 
+from rag.chunker import MarkdownChunker
+from rag.extractive import build_extractive_index, remove_extractive_index
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# Las versiones del índice son colecciones "cv_documents_<versión>"; el
+# puntero active_index.json indica cuál sirve las búsquedas
+COLLECTION_PREFIX = "cv_documents"
+ACTIVE_INDEX_FILE = "active_index.json"
+
+def active_index_path(vectordb_path: str) -> str:
+    """Ruta del puntero al índice activo"""
+    return os.path.join(vectordb_path, ACTIVE_INDEX_FILE)
+
+def read_active_index(vectordb_path: str) -> Dict[str, str]:
+    """Colección y versión del índice activo (la colección clásica si no hay puntero)"""
+    try:
+        with open(active_index_path(vectordb_path), 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        return {"collection": data["collection"], "version": str(data["version"])}
+    except (OSError, ValueError, KeyError):
+        return {"collection": COLLECTION_PREFIX, "version": "0"}
+
+def write_active_index(vectordb_path: str, collection: str, version: str) -> None:
+    """Activar un índice reemplazando el puntero de forma atómica"""
+    path = active_index_path(vectordb_path)
+    os.makedirs(vectordb_path, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump({
+            "collection": collection,
+            "version": version,
+            "activated_at": datetime.now().isoformat()
+        }, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
 class DocumentIngestor:
     """Clase para ingestar y vectorizar documentos markdown"""
     
-    def __init__(self):
-        """Inicializar el ingestor con configuraciones por defecto"""
+    def __init__(self, chroma_client=None, embedding_model=None):
+        """
+        Inicializar el ingestor con configuraciones por defecto
+        
+        Args:
+            chroma_client: Cliente ChromaDB ya abierto (para compartirlo con el retriever)
+            embedding_model: Modelo de embeddings ya cargado
+        """
         self.vectordb_path = os.getenv("VECTORDB_PATH", "./storage/vectordb")
         self.chunk_size = int(os.getenv("CHUNK_SIZE", "1000"))
         self.chunk_overlap = int(os.getenv("CHUNK_OVERLAP", "200"))
         
         # Inicializar componentes
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap,
-            length_function=len,
-        )
+        self.configure_chunking(self.chunk_size, self.chunk_overlap)
         
         # Inicializar ChromaDB
-        self.chroma_client = chromadb.PersistentClient(
+        self.chroma_client = chroma_client or chromadb.PersistentClient(
             path=self.vectordb_path,
             settings=Settings(
-                anonymized_telemetry=False,
-                allow_reset=True
+                anonymized_telemetry=False
             )
         )
         
-        # Crear colección
+        # Colección activa (punto de partida para reutilizar embeddings)
+        active = read_active_index(self.vectordb_path)
         try:
-            self.collection = self.chroma_client.get_collection("cv_documents")
-            logger.info("Colección existente encontrada")
+            self.collection = self.chroma_client.get_collection(active["collection"])
+            logger.info(f"Colección existente encontrada: {active['collection']}")
         except Exception:
-            self.collection = self.chroma_client.create_collection(
-                name="cv_documents",
-                metadata={"description": "CV and projects documents"}
-            )
-            logger.info("Nueva colección creada")
+            self.collection = None
+            logger.info("No hay colección activa")
         
         # Inicializar modelo de embeddings
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.embedding_model = embedding_model or SentenceTransformer('all-MiniLM-L6-v2')
         logger.info("Modelo de embeddings cargado")
     
+    def configure_chunking(self, chunk_size: int, chunk_overlap: int) -> None:
+        """Cambiar el tamaño y el solapamiento de los chunks"""
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.chunker = MarkdownChunker(chunk_size, chunk_overlap)
+    
     def load_markdown_files(self, data_dir: str = "./data") -> List[Document]:
         """Cargar todos los archivos markdown del directorio de datos"""
         documents = []
@@ -81,10 +122,6 @@ class DocumentIngestor:
                 try:
                     with open(file_path, 'r', encoding='utf-8') as file:
                         content = file.read()
-                        
-                    # Convertir markdown a texto plano
-                    html = markdown.markdown(content)
-                    # Para simplificar, usamos el contenido markdown directamente
                     
                     # Crear documento con metadata
                     relative_path = os.path.relpath(file_path, data_dir)
@@ -120,20 +157,8 @@ class DocumentIngestor:
             return "general"
     
     def chunk_documents(self, documents: List[Document]) -> List[Document]:
-        """Dividir documentos en chunks más pequeños"""
-        all_chunks = []
-        
-        for doc in documents:
-            chunks = self.text_splitter.split_documents([doc])
-            
-            # Agregar metadata adicional a cada chunk
-            for i, chunk in enumerate(chunks):
-                chunk.metadata.update({
-                    "chunk_id": f"{doc.metadata['filename']}_{i}",
-                    "chunk_index": i,
-                    "total_chunks": len(chunks)
-                })
-                all_chunks.append(chunk)
+        """Dividir documentos en chunks por secciones markdown (ver rag.chunker)"""
+        all_chunks = self.chunker.chunk_documents(documents)
         
         logger.info(f"Total chunks creados: {len(all_chunks)}")
         return all_chunks
@@ -147,30 +172,44 @@ class DocumentIngestor:
             logger.error(f"Error generando embeddings: {e}")
             raise
     
-    def store_in_vectordb(self, chunks: List[Document]) -> None:
-        """Almacenar chunks con sus embeddings en ChromaDB"""
-        # Limpiar colección existente
-        try:
-            self.collection.delete()
-            logger.info("Colección limpiada")
-        except Exception:
-            pass
+    def store_in_vectordb(self, chunks: List[Document]) -> Dict[str, Any]:
+        """
+        Almacenar chunks en una versión nueva del índice y activarla
         
-        # Preparar datos para inserción
+        La colección nueva se construye completa antes de mover el puntero,
+        así las búsquedas en curso nunca ven un índice a medio construir.
+        Los chunks cuyo ID (direccionado por contenido) ya existe en el índice
+        activo reutilizan su embedding; solo se embeben los nuevos o cambiados.
+        La versión anterior se conserva hasta el siguiente cambio para las
+        búsquedas que aún la estén usando.
+        """
         texts = [chunk.page_content for chunk in chunks]
         metadatas = [chunk.metadata for chunk in chunks]
         ids = [chunk.metadata["chunk_id"] for chunk in chunks]
         
-        # Generar embeddings
-        logger.info("Generando embeddings...")
-        embeddings = self.generate_embeddings(texts)
+        # Reutilizar embeddings del índice activo
+        known = self._existing_embeddings(ids)
+        missing = [i for i, chunk_id in enumerate(ids) if chunk_id not in known]
+        if missing:
+            logger.info(f"Generando embeddings de {len(missing)} chunks nuevos o modificados...")
+            for i, embedding in zip(missing, self.generate_embeddings([texts[i] for i in missing])):
+                known[ids[i]] = embedding
+        embeddings = [known[chunk_id] for chunk_id in ids]
+        
+        version = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        previous_version = read_active_index(self.vectordb_path)["version"] if self.collection is not None else None
+        name = f"{COLLECTION_PREFIX}_{version}"
+        collection = self.chroma_client.create_collection(
+            name=name,
+            metadata={"description": "CV and projects documents", "version": version}
+        )
         
         # Insertar en ChromaDB en batches
         batch_size = 100
         for i in range(0, len(chunks), batch_size):
             batch_end = min(i + batch_size, len(chunks))
             
-            self.collection.add(
+            collection.add(
                 embeddings=embeddings[i:batch_end],
                 documents=texts[i:batch_end],
                 metadatas=metadatas[i:batch_end],
@@ -179,10 +218,64 @@ class DocumentIngestor:
             
             logger.info(f"Batch {i//batch_size + 1} insertado ({batch_end}/{len(chunks)})")
         
-        logger.info("Todos los documentos almacenados en vector DB")
+        # Índice de frases y secciones para respuestas extractivas (misma versión);
+        # sin él la versión sigue siendo válida, solo que sin respuestas extractivas
+        try:
+            extractive = build_extractive_index(
+                chunks, self.generate_embeddings, self.vectordb_path, version, previous_version
+            )
+        except Exception as e:
+            logger.warning(f"No se pudo construir el índice extractivo: {e}")
+            extractive = None
+        
+        # Activar la versión nueva y retirar las anteriores a la previa
+        previous = self.collection.name if self.collection is not None else None
+        write_active_index(self.vectordb_path, name, version)
+        self.collection = collection
+        self._drop_collections(keep={name, previous})
+        
+        logger.info(f"Índice {version} activado: {len(ids) - len(missing)} embeddings reutilizados, "
+                    f"{len(missing)} generados")
+        return {
+            "collection": name,
+            "version": version,
+            "chunks": len(ids),
+            "embeddings_reused": len(ids) - len(missing),
+            "embeddings_generated": len(missing),
+            "extractive": extractive
+        }
+    
+    def _existing_embeddings(self, ids: List[str]) -> Dict[str, Any]:
+        """Embeddings del índice activo para los IDs dados"""
+        if self.collection is None or not ids:
+            return {}
+        try:
+            existing = self.collection.get(ids=ids, include=["embeddings"])
+        except Exception as e:
+            logger.warning(f"No se pudieron reutilizar embeddings: {e}")
+            return {}
+        embeddings = existing.get("embeddings")
+        if embeddings is None:
+            return {}
+        return {chunk_id: [float(x) for x in embedding] for chunk_id, embedding in zip(existing["ids"], embeddings)}
+    
+    def _drop_collections(self, keep: Set[Optional[str]]) -> None:
+        """Borrar versiones del índice que ya no sirven búsquedas"""
+        for collection in self.chroma_client.list_collections():
+            name = getattr(collection, "name", collection)
+            is_index = name == COLLECTION_PREFIX or name.startswith(f"{COLLECTION_PREFIX}_")
+            if is_index and name not in keep:
+                try:
+                    self.chroma_client.delete_collection(name)
+                    remove_extractive_index(self.vectordb_path, name[len(COLLECTION_PREFIX) + 1:] or "0")
+                    logger.info(f"Versión de índice retirada: {name}")
+                except Exception as e:
+                    logger.warning(f"No se pudo borrar la colección {name}: {e}")
     
     def get_collection_stats(self) -> Dict[str, Any]:
         """Obtener estadísticas de la colección"""
+        if self.collection is None:
+            return {"total_documents": 0, "sample_metadata": []}
         count = self.collection.count()
         
         # Obtener algunos documentos para análisis
@@ -206,7 +299,7 @@ class DocumentIngestor:
         chunks = self.chunk_documents(documents)
         
         # 3. Almacenar en vector DB
-        self.store_in_vectordb(chunks)
+        index = self.store_in_vectordb(chunks)
         
         # 4. Obtener estadísticas
         stats = self.get_collection_stats()
@@ -216,6 +309,7 @@ class DocumentIngestor:
             "status": "success",
             "documents_processed": len(documents),
             "chunks_created": len(chunks),
+            "index": index,
             "vector_db_stats": stats
         }
 
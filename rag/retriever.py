@@ -6,6 +6,8 @@ de documentos del CV y proyectos.
 """
 
 import os
+import time
+import threading
 from typing import List, Dict, Any, Optional
 import logging
 from dotenv import load_dotenv
@@ -15,6 +17,11 @@ from chromadb.config import Settings
 from sentence_transformers import SentenceTransformer
 from dataclasses import dataclass
 
+from tools.tracing import traced, current_span
+from tools.deadline import check_deadline
+from tools.state_backend import SharedCache, get_state_backend
+from rag.ingest import active_index_path, read_active_index
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -37,6 +44,7 @@ class SemanticRetriever:
         self.vectordb_path = os.getenv("VECTORDB_PATH", "./storage/vectordb")
         self.top_k = int(os.getenv("TOP_K_RESULTS", "5"))
         self.similarity_threshold = float(os.getenv("SIMILARITY_THRESHOLD", "0.7"))
+        self.index_refresh_interval = float(os.getenv("INDEX_REFRESH_INTERVAL", "2"))
         
         # Inicializar ChromaDB
         try:
@@ -46,16 +54,93 @@ class SemanticRetriever:
                     anonymized_telemetry=False
                 )
             )
-            self.collection = self.chroma_client.get_collection("cv_documents")
+            self._refresh_lock = threading.Lock()
+            self._next_refresh = 0.0
+            self._pointer_mtime = None
+            self._load_active_index()
             logger.info("Conexión a vector DB establecida")
         except Exception as e:
             logger.error(f"Error conectando a vector DB: {e}")
             raise
         
         # Inicializar modelo de embeddings (mismo que en ingesta)
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.embedding_model_name = 'all-MiniLM-L6-v2'
+        self.embedding_model = SentenceTransformer(self.embedding_model_name)
         logger.info("Modelo de embeddings cargado")
     
+        # Caché de embeddings de consultas compartida entre workers/réplicas
+        self.embedding_cache = SharedCache(
+            get_state_backend(), "embedding", ttl=float(os.getenv("EMBEDDING_CACHE_TTL", "86400"))
+        )
+    
+    @property
+    def collection(self):
+        """Colección del índice activo (detecta los cambios de versión publicados por la ingesta)"""
+        self.refresh_index()
+        return self._collection
+    
+    @property
+    def index_version(self) -> str:
+        """Versión del índice activo (forma parte de las claves de caché que dependen de él)"""
+        self.refresh_index()
+        return self._index_version
+    
+    def refresh_index(self, force: bool = False) -> bool:
+        """
+        Cambiar al índice activo si el puntero ha cambiado
+        
+        Se comprueba como mucho cada INDEX_REFRESH_INTERVAL segundos. El
+        cambio es una sola asignación: las búsquedas en curso terminan sobre
+        la colección que ya tenían.
+        
+        Returns:
+            True si se activó una versión nueva
+        """
+        now = time.monotonic()
+        if not force and now < self._next_refresh:
+            return False
+        with self._refresh_lock:
+            self._next_refresh = now + self.index_refresh_interval
+            try:
+                mtime = os.stat(active_index_path(self.vectordb_path)).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime == self._pointer_mtime:
+                return False
+            previous = self._index_version
+            try:
+                self._load_active_index()
+            except Exception as e:
+                logger.error(f"Error cargando el índice activo, se mantiene la versión {previous}: {e}")
+                return False
+            if self._index_version != previous:
+                logger.info(f"Índice activo actualizado: {previous} -> {self._index_version}")
+                return True
+            return False
+    
+    def _load_active_index(self) -> None:
+        """Abrir la colección indicada por el puntero al índice activo"""
+        path = active_index_path(self.vectordb_path)
+        mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+        active = read_active_index(self.vectordb_path)
+        self._collection = self.chroma_client.get_collection(active["collection"])
+        self._index_version = active["version"]
+        self._pointer_mtime = mtime
+    
+    def embed_query(self, query: str) -> List[float]:
+        """Embedding de una consulta (reutiliza la caché compartida)"""
+        cache_key = SharedCache.make_key(self.embedding_model_name, query)
+        embedding = self.embedding_cache.get(cache_key)
+        current_span().record_cache(embedding is not None)
+        if embedding is None:
+            embedding = self.embedding_model.encode([query]).tolist()[0]
+            self.embedding_cache.set(cache_key, embedding)
+        return embedding
+    
+    @traced("retrieve", result_attributes=lambda r: {
+        "results": len(r),
+        "top_score": round(r[0].score, 4) if r else None
+    })
     def search(
         self, 
         query: str, 
@@ -75,10 +160,11 @@ class SemanticRetriever:
         """
         if top_k is None:
             top_k = self.top_k
+        check_deadline("retrieval")
             
         try:
             # Generar embedding de la consulta
-            query_embedding = self.embedding_model.encode([query]).tolist()[0]
+            query_embedding = self.embed_query(query)
             
             # Preparar filtros
             where_clause = {}
@@ -94,22 +180,7 @@ class SemanticRetriever:
             )
             
             # Convertir resultados al formato interno
-            search_results = []
-            if results['documents'] and results['documents'][0]:
-                for i in range(len(results['documents'][0])):
-                    # ChromaDB retorna distancias, convertir a similarity score
-                    distance = results['distances'][0][i]
-                    similarity_score = 1 / (1 + distance)  # Convertir distancia a similarity
-                    
-                    # Filtrar por threshold si está configurado
-                    if similarity_score >= self.similarity_threshold:
-                        result = SearchResult(
-                            content=results['documents'][0][i],
-                            metadata=results['metadatas'][0][i],
-                            score=similarity_score,
-                            chunk_id=results['ids'][0][i] if 'ids' in results else f"chunk_{i}"
-                        )
-                        search_results.append(result)
+            search_results = self._to_search_results(results, 0)
             
             logger.info(f"Búsqueda realizada: {len(search_results)} resultados encontrados")
             return search_results
@@ -118,6 +189,86 @@ class SemanticRetriever:
             logger.error(f"Error en búsqueda semántica: {e}")
             raise
     
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embeddings de varias consultas en una sola pasada del modelo
+        
+        Las consultas ya presentes en la caché no se recalculan.
+        """
+        keys = [SharedCache.make_key(self.embedding_model_name, query) for query in queries]
+        embeddings = [self.embedding_cache.get(key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        
+        if missing:
+            encoded = self.embedding_model.encode([queries[i] for i in missing]).tolist()
+            for i, embedding in zip(missing, encoded):
+                embeddings[i] = embedding
+                self.embedding_cache.set(keys[i], embedding)
+        
+        current_span().set_attributes({
+            "embedding_cache_hits": len(queries) - len(missing),
+            "embedding_cache_misses": len(missing)
+        })
+        return embeddings
+    
+    @traced("retrieve_batch", result_attributes=lambda r: {
+        "queries": len(r),
+        "results": sum(len(hits) for hits in r)
+    })
+    def search_batch(
+        self,
+        queries: List[str],
+        top_k: Optional[int] = None,
+        filter_metadata: Optional[Dict[str, Any]] = None
+    ) -> List[List[SearchResult]]:
+        """
+        Búsqueda semántica de varias consultas con una única consulta a la vector DB
+        
+        Args:
+            queries: Consultas de búsqueda
+            top_k: Número de resultados por consulta
+            filter_metadata: Filtros de metadata comunes a todas las consultas
+        
+        Returns:
+            Lista de resultados por consulta, en el mismo orden
+        """
+        if not queries:
+            return []
+        if top_k is None:
+            top_k = self.top_k
+        
+        results = self.collection.query(
+            query_embeddings=self.embed_queries(queries),
+            n_results=top_k,
+            where=filter_metadata or None,
+            include=["documents", "metadatas", "distances"]
+        )
+        
+        search_results = [self._to_search_results(results, row) for row in range(len(queries))]
+        logger.info(f"Búsqueda por lotes: {len(queries)} consultas, "
+                    f"{sum(len(hits) for hits in search_results)} resultados")
+        return search_results
+    
+    def _to_search_results(self, results: Dict[str, Any], row: int) -> List[SearchResult]:
+        """Convertir la fila de una respuesta de ChromaDB al formato interno"""
+        search_results = []
+        if results['documents'] and results['documents'][row]:
+            for i in range(len(results['documents'][row])):
+                # ChromaDB retorna distancias, convertir a similarity score
+                distance = results['distances'][row][i]
+                similarity_score = 1 / (1 + distance)  # Convertir distancia a similarity
+                
+                # Filtrar por threshold si está configurado
+                if similarity_score >= self.similarity_threshold:
+                    result = SearchResult(
+                        content=results['documents'][row][i],
+                        metadata=results['metadatas'][row][i],
+                        score=similarity_score,
+                        chunk_id=results['ids'][row][i] if 'ids' in results else f"chunk_{i}"
+                    )
+                    search_results.append(result)
+        return search_results
+    
     def search_by_document_type(
         self, 
         query: str, 
@@ -297,6 +448,7 @@ class SemanticRetriever:
             
             return {
                 "total_documents": total_count,
+                "index_version": self._index_version,
                 "document_types": doc_types,
                 "sample_size": len(sample['metadatas']) if sample else 0
             }
@@ -326,16 +478,16 @@ class SemanticRetriever:
         formatted_context = []
         
         for i, result in enumerate(results, 1):
-            context_block = f"--- Documento {i} ---\n"
-            
+            # Cabecera compacta en una sola línea para no gastar tokens
             if include_metadata:
-                context_block += f"Fuente: {result.metadata.get('filename', 'Unknown')}\n"
-                context_block += f"Tipo: {result.metadata.get('type', 'Unknown')}\n"
-                context_block += f"Relevancia: {result.score:.2f}\n\n"
-            
-            context_block += result.content
-            context_block += f"\n{'='*50}\n"
+                context_block = (
+                    f"[{i}] {result.metadata.get('filename', 'Unknown')} "
+                    f"({result.metadata.get('type', 'Unknown')}, {result.score:.2f})\n"
+                )
+            else:
+                context_block = f"[{i}]\n"
             
+            context_block += result.content.strip()
             formatted_context.append(context_block)
         
         return "\n".join(formatted_context)
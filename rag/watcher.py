@@ -0,0 +1,240 @@
+"""
+RAG Index Watcher
+
+Re-indexación en vivo del directorio de datos: vigila data/cv.md,
+data/proyectos y data/recortes (inotify vía watchdog si está instalado,
+sondeo periódico si no), agrupa las ráfagas de cambios y publica una
+versión nueva del índice en la que solo se re-embeben los chunks afectados.
+"""
+
+import os
+import glob
+import time
+import argparse
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+import logging
+from dotenv import load_dotenv
+
+from rag.ingest import DocumentIngestor
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    WATCHDOG_AVAILABLE = False
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+WATCHED_PATTERNS = ("*.md", os.path.join("proyectos", "*.md"), os.path.join("recortes", "*.md"))
+
+class IndexWatcher:
+    """Vigilante del directorio de datos que mantiene el índice al día"""
+    
+    def __init__(self,
+                 data_dir: Optional[str] = None,
+                 ingestor: Optional[DocumentIngestor] = None,
+                 debounce: Optional[float] = None,
+                 poll_interval: Optional[float] = None,
+                 on_reindex=None):
+        """
+        Inicializar vigilante
+        
+        Args:
+            data_dir: Directorio de documentos (por defecto DATA_DIR o ./data)
+            ingestor: Ingestor a usar (por defecto uno nuevo)
+            debounce: Segundos sin cambios antes de re-indexar (INDEX_WATCH_DEBOUNCE)
+            poll_interval: Intervalo de sondeo en segundos (INDEX_WATCH_POLL_INTERVAL)
+            on_reindex: Callback opcional con el resultado de cada re-indexación
+        """
+        self.data_dir = data_dir or os.getenv("DATA_DIR", "./data")
+        self.ingestor = ingestor
+        self.debounce = debounce if debounce is not None else float(os.getenv("INDEX_WATCH_DEBOUNCE", "2"))
+        self.poll_interval = poll_interval if poll_interval is not None else \
+            float(os.getenv("INDEX_WATCH_POLL_INTERVAL", "1"))
+        self.on_reindex = on_reindex
+        
+        self.reindexes = 0
+        self.errors = 0
+        self.last_result: Optional[Dict[str, Any]] = None
+        self.last_reindex_at: Optional[str] = None
+        
+        self._snapshot = self._scan()
+        self._last_event: Optional[float] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._observer = None
+    
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        """Estado (mtime, tamaño) de los archivos vigilados"""
+        snapshot = {}
+        for pattern in WATCHED_PATTERNS:
+            for path in glob.glob(os.path.join(self.data_dir, pattern)):
+                try:
+                    stat = os.stat(path)
+                    snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+                except OSError:
+                    continue
+        return snapshot
+    
+    def notify(self) -> None:
+        """Registrar un evento del sistema de archivos (reinicia el debounce)"""
+        self._last_event = time.monotonic()
+        self._wake.set()
+    
+    def poll(self) -> bool:
+        """Comparar el estado actual con el último conocido; True si hubo cambios"""
+        snapshot = self._scan()
+        if snapshot == self._snapshot:
+            return False
+        self._snapshot = snapshot
+        self.notify()
+        return True
+    
+    def reindex(self) -> Optional[Dict[str, Any]]:
+        """Re-indexar ahora (solo se embeben los chunks nuevos o modificados)"""
+        if self.ingestor is None:
+            self.ingestor = DocumentIngestor()
+        
+        start = time.monotonic()
+        try:
+            documents = self.ingestor.load_markdown_files(self.data_dir)
+            if not documents:
+                logger.warning("Sin documentos en el directorio de datos, se mantiene el índice actual")
+                return None
+            chunks = self.ingestor.chunk_documents(documents)
+            result = self.ingestor.store_in_vectordb(chunks)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error re-indexando: {e}")
+            return None
+        
+        result["duration_s"] = round(time.monotonic() - start, 3)
+        self.reindexes += 1
+        self.last_result = result
+        self.last_reindex_at = datetime.now().isoformat()
+        logger.info(f"Re-indexación completada en {result['duration_s']}s "
+                    f"({result['embeddings_generated']} embeddings nuevos)")
+        
+        if self.on_reindex:
+            try:
+                self.on_reindex(result)
+            except Exception as e:
+                logger.warning(f"Error en callback de re-indexación: {e}")
+        return result
+    
+    def run(self) -> None:
+        """Bucle principal (bloqueante) hasta stop()"""
+        self._start_observer()
+        logger.info(f"Vigilando {os.path.abspath(self.data_dir)} "
+                    f"({'inotify' if self._observer else 'sondeo'}, debounce {self.debounce}s)")
+        
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            if self._observer is None:
+                self.poll()
+            
+            # Esperar a que termine la ráfaga de cambios
+            if self._last_event is not None and time.monotonic() - self._last_event >= self.debounce:
+                self._last_event = None
+                self._snapshot = self._scan()
+                self.reindex()
+        
+        self._stop_observer()
+    
+    def start(self) -> 'IndexWatcher':
+        """Ejecutar el bucle en un thread de fondo"""
+        self._thread = threading.Thread(target=self.run, name="index-watcher", daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self, timeout: float = 5.0) -> None:
+        """Detener el vigilante"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas del vigilante"""
+        return {
+            "data_dir": self.data_dir,
+            "mode": "inotify" if self._observer else "polling",
+            "watched_files": len(self._snapshot),
+            "reindexes": self.reindexes,
+            "errors": self.errors,
+            "last_reindex_at": self.last_reindex_at,
+            "last_result": self.last_result
+        }
+    
+    def _start_observer(self) -> None:
+        if not WATCHDOG_AVAILABLE or not os.path.isdir(self.data_dir):
+            return
+        watcher = self
+        
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    return
+                paths = (getattr(event, "src_path", ""), getattr(event, "dest_path", ""))
+                if any(str(path).endswith(".md") for path in paths):
+                    watcher.notify()
+        
+        try:
+            self._observer = Observer()
+            self._observer.schedule(_Handler(), self.data_dir, recursive=True)
+            self._observer.start()
+        except Exception as e:
+            logger.warning(f"watchdog no disponible ({e}), usando sondeo")
+            self._observer = None
+    
+    def _stop_observer(self) -> None:
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=5)
+            self._observer = None
+
+def watch_in_process(retriever) -> IndexWatcher:
+    """
+    Arrancar el vigilante dentro del proceso que sirve búsquedas
+    
+    Comparte el cliente ChromaDB y el modelo de embeddings del retriever y le
+    hace cambiar de versión en cuanto termina cada re-indexación.
+    """
+    ingestor = DocumentIngestor(
+        chroma_client=retriever.chroma_client,
+        embedding_model=retriever.embedding_model
+    )
+    return IndexWatcher(
+        ingestor=ingestor,
+        on_reindex=lambda result: retriever.refresh_index(force=True)
+    ).start()
+
+def main(argv: Optional[List[str]] = None):
+    """Ejecutar el vigilante como proceso independiente"""
+    parser = argparse.ArgumentParser(description="Re-indexación en vivo del directorio de datos")
+    parser.add_argument("--data-dir", default=os.getenv("DATA_DIR", "./data"))
+    parser.add_argument("--debounce", type=float, default=None, help="Segundos sin cambios antes de re-indexar")
+    parser.add_argument("--once", action="store_true", help="Re-indexar una vez y salir")
+    args = parser.parse_args(argv)
+    
+    watcher = IndexWatcher(args.data_dir, debounce=args.debounce)
+    if args.once:
+        print(watcher.reindex())
+        return
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        watcher.stop()
+
+if __name__ == "__main__":
+    main()
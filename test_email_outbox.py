@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Tests de la outbox de emails (tools/email_outbox.py) con un transporte SMTP
+simulado: entrega, reintento con backoff, descarte definitivo, reclamo
+atómico de lotes entre workers y recuperación de lotes abandonados.
+"""
+
+import sys
+import os
+import time
+import sqlite3
+import smtplib
+import threading
+from email.mime.text import MIMEText
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from tools.email_outbox import EmailOutbox, SMTPSettings
+
+
+class FakeSMTP:
+    """Sesión SMTP simulada: registra los envíos o lanza los errores programados"""
+    
+    def __init__(self, server: "FakeSMTPServer"):
+        self.server = server
+    
+    def sendmail(self, from_email, recipients, message):
+        with self.server.lock:
+            if self.server.errors:
+                raise self.server.errors.pop(0)
+            self.server.sent.append((from_email, recipients[0], message))
+        # Deja que otro worker avance mientras este "envía"
+        time.sleep(0.001)
+    
+    def noop(self):
+        return (250, b"OK")
+    
+    def quit(self):
+        pass
+
+
+class FakeSMTPServer:
+    """Transporte simulado compartido por las outbox de un test"""
+    
+    def __init__(self):
+        self.sent = []
+        self.errors = []
+        self.connections = 0
+        self.lock = threading.Lock()
+    
+    def __call__(self, settings: SMTPSettings) -> FakeSMTP:
+        self.connections += 1
+        return FakeSMTP(self)
+    
+    def recipients(self):
+        """Destinatarios de los mensajes enviados, en orden"""
+        return [recipient for _, recipient, _ in self.sent]
+
+
+@pytest.fixture(autouse=True)
+def no_background_worker(monkeypatch):
+    """Sin worker en background: los tests procesan la cola de forma explícita"""
+    monkeypatch.setattr(EmailOutbox, "_ensure_worker", lambda self: None)
+
+
+@pytest.fixture
+def transport():
+    """Servidor SMTP simulado"""
+    return FakeSMTPServer()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Base SQLite temporal de la outbox"""
+    return str(tmp_path / "outbox.db")
+
+
+def make_outbox(db_path, transport, **kwargs) -> EmailOutbox:
+    """Outbox sobre la base del test con el transporte simulado"""
+    options = {"batch_size": 5, "max_attempts": 3, "retry_backoff": 3600, "idle_timeout": 60}
+    options.update(kwargs)
+    return EmailOutbox(SMTPSettings(server="smtp.test", port=25), db_path=db_path, transport=transport, **options)
+
+
+def enqueue(outbox: EmailOutbox, count: int):
+    """Encolar `count` mensajes con destinatarios distintos"""
+    ids = []
+    for i in range(count):
+        msg = MIMEText(f"Mensaje {i}")
+        msg["From"] = "agente@test"
+        msg["Subject"] = f"Test {i}"
+        ids.append(outbox.enqueue(msg, f"user{i}@test"))
+    return ids
+
+
+def status_of(db_path, message_id):
+    """Estado, intentos, último error y reclamo de un mensaje"""
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(
+            "SELECT status, attempts, last_error, claimed_by FROM email_outbox WHERE id = ?", (message_id,)
+        ).fetchone()
+
+
+def test_flush_delivers_with_one_session(db_path, transport):
+    """Los mensajes encolados se entregan reutilizando una única sesión SMTP"""
+    results = []
+    outbox = make_outbox(db_path, transport, on_result=lambda *args: results.append(args))
+    ids = enqueue(outbox, 7)
+    
+    assert outbox.pending_count() == 7
+    assert outbox.flush(timeout=5)
+    
+    assert sorted(transport.recipients()) == sorted(f"user{i}@test" for i in range(7))
+    assert transport.connections == 1
+    assert all(status_of(db_path, message_id)[0] == "sent" for message_id in ids)
+    assert sorted(results) == sorted((message_id, True, None) for message_id in ids)
+    assert outbox.get_stats()["sent"] == 7
+
+
+def test_transient_error_is_retried_with_backoff(db_path, transport):
+    """Un error transitorio reprograma el mensaje con backoff y un intento más"""
+    outbox = make_outbox(db_path, transport)
+    [message_id] = enqueue(outbox, 1)
+    transport.errors.append(smtplib.SMTPException("451 try again"))
+    
+    outbox._process_batch()
+    status, attempts, last_error, claimed_by = status_of(db_path, message_id)
+    assert (status, attempts, claimed_by) == ("pending", 1, None)
+    assert "451" in last_error
+    assert outbox.stats["retried"] == 1
+    
+    # El backoff aún no ha vencido: el worker no lo vuelve a intentar
+    assert outbox._process_batch() is False
+    assert transport.sent == []
+    
+    # flush ignora el backoff
+    assert outbox.flush(timeout=5)
+    assert status_of(db_path, message_id)[0] == "sent"
+    assert transport.recipients() == ["user0@test"]
+
+
+def test_permanent_error_goes_to_dead_letter(db_path, transport):
+    """Un destinatario rechazado se descarta sin reintentos y se notifica el fallo"""
+    results = []
+    outbox = make_outbox(db_path, transport, on_result=lambda *args: results.append(args))
+    [message_id] = enqueue(outbox, 1)
+    transport.errors.append(smtplib.SMTPRecipientsRefused({"user0@test": (550, b"no such user")}))
+    
+    outbox.flush(timeout=5)
+    
+    status, attempts, _, _ = status_of(db_path, message_id)
+    assert (status, attempts) == ("failed", 1)
+    assert results and results[0][:2] == (message_id, False)
+    assert outbox.pending_count() == 0
+    assert outbox.stats["failed"] == 1
+
+
+def test_max_attempts_goes_to_dead_letter(db_path, transport):
+    """Tras max_attempts errores transitorios el mensaje queda como fallido"""
+    outbox = make_outbox(db_path, transport, max_attempts=3)
+    [message_id] = enqueue(outbox, 1)
+    transport.errors.extend(smtplib.SMTPException("451 try again") for _ in range(3))
+    
+    for _ in range(3):
+        outbox._process_batch(ignore_schedule=True)
+    
+    status, attempts, _, _ = status_of(db_path, message_id)
+    assert (status, attempts) == ("failed", 3)
+    assert outbox.stats["retried"] == 2
+    assert outbox._process_batch(ignore_schedule=True) is False
+    assert transport.sent == []
+
+
+def test_concurrent_workers_claim_disjoint_rows(db_path, transport):
+    """Dos outbox sobre la misma base no reclaman la misma fila"""
+    first = make_outbox(db_path, transport, batch_size=4)
+    second = make_outbox(db_path, transport, batch_size=4)
+    enqueue(first, 6)
+    
+    claimed_first = [row[0] for row in first._claim_rows(ignore_schedule=True)]
+    claimed_second = [row[0] for row in second._claim_rows(ignore_schedule=True)]
+    
+    assert len(claimed_first) == 4
+    assert len(claimed_second) == 2
+    assert not set(claimed_first) & set(claimed_second)
+    assert second._claim_rows(ignore_schedule=True) == []
+
+
+def test_concurrent_workers_send_each_message_once(db_path, transport):
+    """Con dos workers vaciando la cola a la vez cada mensaje se envía exactamente una vez"""
+    workers = [make_outbox(db_path, transport, batch_size=3) for _ in range(2)]
+    enqueue(workers[0], 40)
+    start = threading.Barrier(len(workers))
+    
+    def drain(outbox):
+        start.wait()
+        while outbox._process_batch(ignore_schedule=True):
+            pass
+    
+    threads = [threading.Thread(target=drain, args=(outbox,)) for outbox in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    
+    recipients = transport.recipients()
+    assert len(recipients) == 40
+    assert len(set(recipients)) == 40
+    assert workers[0].pending_count() == 0
+    assert sum(outbox.stats["sent"] for outbox in workers) == 40
+
+
+def test_abandoned_claim_returns_to_queue(db_path, transport):
+    """Un lote reclamado por un worker que no terminó vuelve a la cola tras claim_timeout"""
+    crashed = make_outbox(db_path, transport, claim_timeout=0.05)
+    survivor = make_outbox(db_path, transport, claim_timeout=0.05)
+    [message_id] = enqueue(crashed, 1)
+    
+    assert len(crashed._claim_rows(ignore_schedule=True)) == 1
+    assert status_of(db_path, message_id)[0] == "sending"
+    assert survivor._claim_rows(ignore_schedule=True) == []
+    
+    time.sleep(0.1)
+    assert survivor.flush(timeout=5)
+    assert status_of(db_path, message_id)[0] == "sent"
+    assert transport.recipients() == ["user0@test"]
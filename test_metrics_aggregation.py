@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Tests de la agregación multiproceso de métricas (tools/metrics.py): los
+totales no retroceden al terminar o reiniciar un worker, un proceso parado
+que vuelve no se cuenta dos veces y un PID reutilizado no pisa el snapshot
+de otro proceso.
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from tools.metrics import MetricsRegistry, RETIRED_KEY
+from tools.state_backend import SQLiteBackend
+
+
+@pytest.fixture(autouse=True)
+def no_heartbeat(monkeypatch):
+    """Sin volcado periódico en background: los tests vuelcan y retiran de forma explícita"""
+    monkeypatch.setattr(MetricsRegistry, "_ensure_heartbeat", lambda self: None)
+
+
+@pytest.fixture
+def backend(tmp_path):
+    """Backend SQLite compartido por los registros de un test"""
+    return SQLiteBackend(str(tmp_path / "state.db"))
+
+
+def make_worker(backend) -> MetricsRegistry:
+    """Registro de un worker sobre el backend compartido"""
+    return MetricsRegistry(shared_backend=backend, flush_interval=0.01, snapshot_ttl=60, stale_after=0.05)
+
+
+def queries(registry: MetricsRegistry) -> dict:
+    """Totales agregados de consultas por resultado"""
+    return registry.totals(registry.requests, "status")
+
+
+def test_dead_worker_counters_are_retired(backend):
+    """Los contadores de un worker terminado pasan a retirados y el total no retrocede"""
+    dead, alive = make_worker(backend), make_worker(backend)
+    for _ in range(3):
+        dead.observe_request(0.1, success=True)
+    alive.observe_request(0.2, success=False)
+    dead.flush()
+    alive.flush()
+    assert queries(alive) == {"success": 3, "error": 1}
+    
+    time.sleep(0.1)
+    assert alive.retire_stale() == 1
+    assert backend.get(f"metrics:{dead.process_id}") is None
+    assert backend.get_json(RETIRED_KEY) is not None
+    assert queries(alive) == {"success": 3, "error": 1}
+    assert alive.request_latency.name in alive.render_prometheus()
+    
+    # El worker que lo sustituye suma sobre los retirados
+    replacement = make_worker(backend)
+    replacement.observe_request(0.1, success=True)
+    replacement.flush()
+    assert queries(alive) == {"success": 4, "error": 1}
+    assert alive.retire_stale() == 0
+
+
+def test_stalled_worker_is_not_counted_twice(backend):
+    """Un worker retirado mientras estaba parado continúa con otra identidad sin duplicar sus contadores"""
+    stalled, alive = make_worker(backend), make_worker(backend)
+    stalled.observe_request(0.1, success=True)
+    stalled.flush()
+    old_id = stalled.process_id
+    
+    time.sleep(0.1)
+    assert alive.retire_stale() == 1
+    
+    stalled.observe_request(0.1, success=True)
+    stalled.flush()
+    assert stalled.process_id != old_id
+    assert queries(alive) == {"success": 2}
+    assert queries(stalled) == {"success": 2}
+
+
+def test_reused_pid_does_not_overwrite_snapshot(tmp_path):
+    """En modo directorio dos procesos con el mismo PID escriben snapshots distintos"""
+    directory = str(tmp_path / "metrics")
+    first = MetricsRegistry(multiproc_dir=directory)
+    first.observe_request(0.1, success=True)
+    first.flush()
+    
+    second = MetricsRegistry(multiproc_dir=directory)
+    second.observe_request(0.1, success=True)
+    second.flush()
+    
+    assert first.process_id != second.process_id
+    assert len(list((tmp_path / "metrics").glob("metrics_*.json"))) == 2
+    assert queries(second) == {"success": 2}
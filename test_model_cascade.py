@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Tests de la cascada de modelos (agent/utils/model_cascade.py) con
+proveedores simulados: respuesta rápida aceptada, escalada al modelo
+principal, consultas directas al principal y estadísticas de la cascada.
+"""
+
+import sys
+import os
+import types
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from agent.utils.model_cascade import ModelCascade, FAST, STRONG
+from agent.utils.multi_llm_client import LLMResponse
+from agent.core.orchestrator import CVOrchestrator
+from agent.core.response_evaluator import EvaluationResult, EvaluationScores
+
+
+class StubLLMClient:
+    """MultiLLMClient simulado: responde siempre lo mismo y registra las llamadas"""
+    
+    def __init__(self, model: str, content: str):
+        self.config = types.SimpleNamespace(model=model, provider="stub")
+        self.content = content
+        self.calls = []
+    
+    def generate(self, messages, temperature=None, max_tokens=None, stage="generation", **kwargs):
+        self.calls.append(messages)
+        return LLMResponse(content=self.content, provider="stub", model=self.config.model, tokens_used=10)
+
+
+class StubEvaluator:
+    """Evaluador simulado con la puntuación que se le indique"""
+    
+    def __init__(self, score: float):
+        self.score = score
+        self.calls = []
+    
+    def evaluate_response(self, query, response, context, metadata=None):
+        self.calls.append(response)
+        return evaluation(self.score)
+
+
+def evaluation(score: float) -> EvaluationResult:
+    """Evaluación con la misma puntuación en todos los criterios"""
+    scores = EvaluationScores(score, score, score, score, score)
+    return EvaluationResult(scores=scores, confidence=80, strengths=[], weaknesses=[], suggestions=[])
+
+
+def make_orchestrator(cascade: ModelCascade, evaluator_score: float = 9.0, min_score: float = 7.0) -> CVOrchestrator:
+    """Orquestador con solo las piezas que usa _apply_cascade (sin índices ni proveedores reales)"""
+    orchestrator = object.__new__(CVOrchestrator)
+    orchestrator.cascade = cascade
+    orchestrator.config = types.SimpleNamespace(
+        evaluation_min_score=min_score,
+        openai=types.SimpleNamespace(temperature=0.3, max_tokens=200)
+    )
+    orchestrator.logger = types.SimpleNamespace(info=lambda *args, **kwargs: None, error=lambda *args, **kwargs: None)
+    orchestrator.prompt_manager = types.SimpleNamespace(format_system_prompt=lambda sources: "system")
+    orchestrator.context_packer = types.SimpleNamespace(counter=types.SimpleNamespace(count=len))
+    orchestrator.response_evaluator = StubEvaluator(evaluator_score)
+    orchestrator._last_llm_metadata = {}
+    orchestrator._last_context_stats = {}
+    return orchestrator
+
+
+def fast_response(tier: str = FAST) -> dict:
+    """Resultado de una generación del nivel indicado"""
+    return {
+        "response": "respuesta rápida",
+        "context": "contexto del CV",
+        "source": "RAG",
+        "metadata": {"model": "fast-model", "model_tier": tier}
+    }
+
+
+@pytest.fixture
+def clients():
+    """Clientes simulados (principal, rápido)"""
+    return StubLLMClient("strong-model", "respuesta principal"), StubLLMClient("fast-model", "respuesta rápida")
+
+
+def test_initial_tier_sends_high_complexity_to_strong(clients):
+    """Las consultas de complejidad alta van directamente al modelo principal"""
+    strong, fast = clients
+    cascade = ModelCascade(strong, fast)
+    
+    assert cascade.initial_tier("LOW") == FAST
+    assert cascade.initial_tier("MEDIUM") == FAST
+    assert cascade.initial_tier("HIGH") == STRONG
+    assert ModelCascade(strong).initial_tier("LOW") == STRONG
+    assert cascade.client(FAST) is fast
+    assert cascade.client(STRONG) is strong
+
+
+def test_fast_answer_above_threshold_is_accepted(clients):
+    """Una respuesta rápida que alcanza el mínimo se devuelve sin regenerar"""
+    strong, fast = clients
+    orchestrator = make_orchestrator(ModelCascade(strong, fast))
+    response_data = fast_response()
+    
+    result, result_evaluation = orchestrator._apply_cascade("¿Qué idiomas hablas?", response_data, evaluation(8.0))
+    
+    assert result is response_data
+    assert result_evaluation.scores.overall_score == pytest.approx(8.0)
+    assert strong.calls == []
+    assert orchestrator.cascade.get_stats()["accepted"] == 1
+
+
+def test_fast_answer_below_threshold_is_escalated(clients):
+    """Una respuesta rápida por debajo del mínimo se regenera con el modelo principal y se reevalúa"""
+    strong, fast = clients
+    orchestrator = make_orchestrator(ModelCascade(strong, fast), evaluator_score=9.0)
+    
+    result, result_evaluation = orchestrator._apply_cascade("¿Qué idiomas hablas?", fast_response(), evaluation(4.0))
+    
+    assert len(strong.calls) == 1
+    assert fast.calls == []
+    assert result["response"] == "respuesta principal"
+    assert result["metadata"]["model"] == "strong-model"
+    assert result["metadata"]["model_tier"] == STRONG
+    assert result["metadata"]["escalated_from"] == {"model": "fast-model", "score": pytest.approx(4.0)}
+    assert orchestrator.response_evaluator.calls == ["respuesta principal"]
+    assert result_evaluation.scores.overall_score == pytest.approx(9.0)
+    assert orchestrator.cascade.get_stats()["escalated"] == 1
+
+
+def test_strong_tier_is_direct(clients):
+    """Las respuestas generadas ya con el modelo principal cuentan como directas"""
+    strong, fast = clients
+    orchestrator = make_orchestrator(ModelCascade(strong, fast))
+    response_data = fast_response(tier=STRONG)
+    
+    result, _ = orchestrator._apply_cascade("Compara tus dos últimos proyectos", response_data, evaluation(3.0))
+    
+    assert result is response_data
+    assert strong.calls == []
+    assert orchestrator.cascade.get_stats()["direct"] == 1
+
+
+def test_disabled_cascade_and_non_llm_answers_are_not_counted(clients):
+    """Sin modelo rápido, o sin generación LLM (FAQ, aclaración), la cascada no interviene"""
+    strong, fast = clients
+    disabled = make_orchestrator(ModelCascade(strong))
+    disabled._apply_cascade("hola", fast_response(), evaluation(2.0))
+    
+    enabled = make_orchestrator(ModelCascade(strong, fast))
+    faq = {"response": "faq", "source": "FAQ", "metadata": {}}
+    result, _ = enabled._apply_cascade("hola", faq, evaluation(2.0))
+    
+    assert result is faq
+    assert strong.calls == []
+    for orchestrator in (disabled, enabled):
+        stats = orchestrator.cascade.get_stats()
+        assert (stats["accepted"], stats["escalated"], stats["direct"]) == (0, 0, 0)
+
+
+def test_stats_escalation_rate_and_latency_saving(clients):
+    """Tasa de escalado sobre las consultas en cascada y ahorro estimado de latencia"""
+    strong, fast = clients
+    cascade = ModelCascade(strong, fast)
+    for outcome in ("accepted", "accepted", "accepted", "escalated", "direct"):
+        cascade.record_outcome(outcome)
+    for latency in (0.5, 0.5, 0.5, 0.5):
+        cascade.record_generation(FAST, latency)
+    for latency in (2.0, 2.0):
+        cascade.record_generation(STRONG, latency)
+    
+    stats = cascade.get_stats()
+    
+    assert stats["enabled"] is True
+    assert stats["fast_model"] == "fast-model"
+    assert stats["strong_model"] == "strong-model"
+    assert stats["escalation_rate"] == pytest.approx(25.0)
+    assert stats["mean_latency_s"] == {FAST: 0.5, STRONG: 2.0}
+    # 3 aceptadas ahorran 1.5s cada una; la escalada pierde los 0.5s de la rápida
+    assert stats["estimated_latency_saved_s"] == pytest.approx(3 * 1.5 - 0.5)
+
+
+def test_stats_without_generations(clients):
+    """Sin generaciones no hay ahorro estimado ni tasa de escalado"""
+    strong, _ = clients
+    stats = ModelCascade(strong).get_stats()
+    
+    assert stats["enabled"] is False
+    assert stats["escalation_rate"] == 0.0
+    assert stats["estimated_latency_saved_s"] is None
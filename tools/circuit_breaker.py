@@ -0,0 +1,196 @@
+"""
+Circuit Breaker Tool
+
+Circuit breaker para el proveedor LLM: tras varios fallos (o llamadas
+demasiado lentas) seguidos el circuito se abre y las consultas dejan de
+esperar al proveedor durante un tiempo de recuperación. Pasado ese tiempo
+se deja pasar una única llamada de prueba: si va bien el circuito se
+cierra, si falla vuelve a abrirse. Los timeouts impuestos por quien llama
+(deadline de la petición, desconexión) no cuentan salvo que la llamada ya
+superase el umbral de lentitud del propio circuito.
+"""
+
+import os
+import time
+import threading
+from typing import Dict, Any, Optional
+import logging
+from dotenv import load_dotenv
+
+from tools.metrics import metrics
+from tools.deadline import DeadlineExceeded
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Valor del gauge por estado
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class CircuitBreaker:
+    """Circuit breaker por fallos consecutivos (thread-safe)"""
+    
+    def __init__(self,
+                 name: str = "default",
+                 failure_threshold: int = 5,
+                 recovery_timeout: float = 30.0,
+                 slow_call_threshold: Optional[float] = None):
+        """
+        Inicializar circuit breaker
+        
+        Args:
+            name: Nombre del circuito (logs y métricas)
+            failure_threshold: Fallos consecutivos que abren el circuito (0 = nunca se abre)
+            recovery_timeout: Segundos abierto antes de la llamada de prueba
+            slow_call_threshold: Segundos a partir de los que una llamada
+                correcta cuenta como fallo (None = sin límite)
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.slow_call_threshold = slow_call_threshold
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.counts = {
+            "successes": 0, "failures": 0, "slow_calls": 0, "opened": 0, "rejected": 0, "caller_timeouts": 0
+        }
+        self._state = CLOSED
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_env(cls, name: str) -> 'CircuitBreaker':
+        """Crear circuit breaker desde variables de entorno"""
+        slow = float(os.getenv("CIRCUIT_SLOW_CALL_THRESHOLD", "15"))
+        return cls(
+            name,
+            failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+            recovery_timeout=float(os.getenv("CIRCUIT_RECOVERY_TIMEOUT", "30")),
+            slow_call_threshold=slow if slow > 0 else None
+        )
+    
+    @property
+    def state(self) -> str:
+        """Estado actual (un circuito abierto pasa a half_open al cumplirse la recuperación)"""
+        with self._lock:
+            return self._current_state()
+    
+    def allow(self) -> bool:
+        """
+        Indica si se puede llamar al proveedor
+        
+        Con el circuito half_open solo se permite una llamada de prueba a la vez
+        (una prueba sin resultado tras recovery_timeout deja paso a otra).
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            now = time.monotonic()
+            if state == HALF_OPEN and (not self._probe_in_flight or now - self._probe_started >= self.recovery_timeout):
+                self._probe_in_flight = True
+                self._probe_started = now
+                return True
+            self.counts["rejected"] += 1
+            return False
+    
+    def record_success(self, latency: Optional[float] = None) -> None:
+        """Registrar una llamada correcta (las lentas cuentan como fallo)"""
+        if latency is not None and self.slow_call_threshold and latency > self.slow_call_threshold:
+            with self._lock:
+                self.counts["slow_calls"] += 1
+            self.record_failure()
+            return
+        
+        with self._lock:
+            self.counts["successes"] += 1
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+            if self._state != CLOSED:
+                logger.info(f"Circuito '{self.name}' cerrado")
+                self._set_state(CLOSED)
+    
+    def record_failure(self) -> None:
+        """Registrar una llamada fallida"""
+        with self._lock:
+            self.counts["failures"] += 1
+            self.consecutive_failures += 1
+            probe_failed = self._probe_in_flight
+            self._probe_in_flight = False
+            threshold_reached = self.failure_threshold > 0 and self.consecutive_failures >= self.failure_threshold
+            if probe_failed or (self._state == CLOSED and threshold_reached):
+                self.opened_at = time.monotonic()
+                self.counts["opened"] += 1
+                self._set_state(OPEN)
+                logger.warning(
+                    f"Circuito '{self.name}' abierto tras {self.consecutive_failures} fallos, "
+                    f"reintento en {self.recovery_timeout:.0f}s"
+                )
+    
+    def record_error(self, error: Exception, latency: Optional[float] = None) -> None:
+        """
+        Registrar una excepción de la llamada
+        
+        No indican un fallo del proveedor los errores de la petición (4xx
+        salvo 429) ni los timeouts impuestos por quien llama (DeadlineExceeded)
+        antes de alcanzar slow_call_threshold: un cliente lento o un
+        presupuesto ajustado no deben abrir el circuito para todos.
+        
+        Args:
+            error: Excepción de la llamada
+            latency: Segundos que llevaba la llamada al fallar
+        """
+        status = getattr(error, "status_code", None)
+        if status is not None and 400 <= status < 500 and status != 429:
+            with self._lock:
+                self._probe_in_flight = False
+            return
+        
+        if isinstance(error, DeadlineExceeded):
+            if latency is None or not self.slow_call_threshold or latency < self.slow_call_threshold:
+                with self._lock:
+                    self.counts["caller_timeouts"] += 1
+                    self._probe_in_flight = False
+                return
+            with self._lock:
+                self.counts["slow_calls"] += 1
+        self.record_failure()
+    
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+            self._set_state(HALF_OPEN)
+        return self._state
+    
+    def _set_state(self, state: str) -> None:
+        self._state = state
+        metrics.set_gauge(metrics.circuit_state, STATE_VALUES[state], circuit=self.name)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas del circuito"""
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self.consecutive_failures,
+                **self.counts
+            }
+
+def main():
+    """Función principal para testing"""
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=0.2)
+    for _ in range(2):
+        breaker.record_failure()
+    print(f"Tras 2 fallos: {breaker.state}, allow={breaker.allow()}")
+    time.sleep(0.25)
+    print(f"Tras la recuperación: {breaker.state}, allow={breaker.allow()}, segunda={breaker.allow()}")
+    breaker.record_success(0.1)
+    print(f"Tras la prueba correcta: {breaker.state}")
+    print(f"Estadísticas: {breaker.get_stats()}")
+
+if __name__ == "__main__":
+    main()
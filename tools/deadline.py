@@ -0,0 +1,217 @@
+"""
+Deadline Tool
+
+Presupuesto de tiempo por petición: el deadline se fija al llegar la
+petición, se reparte entre las etapas del pipeline (clasificación,
+búsqueda, generación, evaluación) y viaja en un contextvar, de modo que el
+orquestador, las herramientas y el cliente LLM consultan el mismo. Cuando se
+agota, o cuando el cliente HTTP se desconecta, las etapas pendientes no
+arrancan y cada llamada LLM queda limitada al tiempo de su etapa; el
+timeout del SDK provocado por ese límite se convierte en DeadlineExceeded.
+"""
+
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+import logging
+from dotenv import load_dotenv
+
+from tools.metrics import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Reparto del presupuesto por etapa, en orden de ejecución. Cada etapa recibe
+# su parte del tiempo que queda frente a ella y las siguientes, así que lo que
+# no consume una etapa pasa a las posteriores.
+STAGE_SHARES = (
+    ("classification", 0.2),
+    ("retrieval", 0.1),
+    ("generation", 0.5),
+    ("evaluation", 0.2),
+)
+
+# Excepciones de timeout del SDK de OpenAI y de httpx (por nombre de clase)
+TIMEOUT_ERRORS = ("APITimeoutError", "TimeoutException")
+
+# Fracción del timeout de la etapa a partir de la que un timeout del SDK se
+# atribuye al deadline (margen para la resolución del reloj)
+TIMEOUT_SLACK = 0.9
+
+class DeadlineExceeded(Exception):
+    """La petición agotó su presupuesto o el cliente se desconectó"""
+    
+    def __init__(self, stage: str, reason: str):
+        super().__init__(f"Deadline agotado en '{stage}' ({reason})")
+        self.stage = stage
+        self.reason = reason  # timeout o disconnected
+
+class Deadline:
+    """Deadline de una petición (thread-safe)"""
+    
+    def __init__(self, budget: float, start: Optional[float] = None):
+        """
+        Inicializar deadline
+        
+        Args:
+            budget: Segundos totales de la petición
+            start: Instante de llegada (time.monotonic); por defecto, ahora
+        """
+        self.budget = budget
+        self.start = time.monotonic() if start is None else start
+        self.expires_at = self.start + budget
+        self.reason: Optional[str] = None
+        self._cancelled = threading.Event()
+        self._reported = False
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_env(cls, start: Optional[float] = None) -> Optional['Deadline']:
+        """Deadline con el presupuesto REQUEST_DEADLINE (None si es 0)"""
+        budget = float(os.getenv("REQUEST_DEADLINE", "25"))
+        return cls(budget, start) if budget > 0 else None
+    
+    def remaining(self) -> float:
+        """Segundos restantes"""
+        return max(0.0, self.expires_at - time.monotonic())
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+    
+    @property
+    def done(self) -> bool:
+        """Cancelado o agotado: no debe empezar más trabajo"""
+        return self.cancelled or self.remaining() <= 0
+    
+    def cancel(self, reason: str = "disconnected") -> None:
+        """Cancelar el trabajo pendiente de la petición"""
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self.reason = reason
+            self._cancelled.set()
+        logger.info(f"Petición cancelada ({reason}) tras {time.monotonic() - self.start:.2f}s")
+    
+    def check(self, stage: str) -> None:
+        """
+        Verificar que la etapa puede empezar
+        
+        Raises:
+            DeadlineExceeded: Si la petición está cancelada o sin tiempo
+        """
+        if not self.done:
+            return
+        raise self.exceeded(stage)
+    
+    def exceeded(self, stage: str) -> DeadlineExceeded:
+        """Excepción para la etapa (la métrica se cuenta una vez por petición)"""
+        reason = self.reason if self.cancelled else "timeout"
+        with self._lock:
+            report, self._reported = not self._reported, True
+        if report:
+            metrics.inc(metrics.deadline_exceeded, stage=stage, reason=reason)
+        return DeadlineExceeded(stage, reason)
+    
+    def stage_timeout(self, stage: str) -> float:
+        """
+        Timeout de una etapa: su parte del tiempo restante (todo lo que
+        queda si la etapa no está en STAGE_SHARES)
+        
+        Raises:
+            DeadlineExceeded: Si la petición está cancelada o sin tiempo
+        """
+        self.check(stage)
+        remaining = self.remaining()
+        stages = [name for name, _ in STAGE_SHARES]
+        if stage not in stages:
+            return remaining
+        pending = STAGE_SHARES[stages.index(stage):]
+        return remaining * pending[0][1] / sum(share for _, share in pending)
+
+_current: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("deadline", default=None)
+
+def current_deadline() -> Optional[Deadline]:
+    """Deadline de la petición en curso (None fuera de una petición con deadline)"""
+    return _current.get()
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """Establecer el deadline de la petición para el código que se ejecuta dentro"""
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+def check_deadline(stage: str) -> None:
+    """Verificar el deadline en curso antes de empezar una etapa (sin deadline no hace nada)"""
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.check(stage)
+
+def is_timeout_error(error: BaseException) -> bool:
+    """Indica si la excepción es un timeout de la llamada HTTP (SDK, httpx o socket)"""
+    return isinstance(error, TimeoutError) or any(
+        cls.__name__ in TIMEOUT_ERRORS for cls in type(error).__mro__
+    )
+
+def bounded_client(client: Any, stage: str) -> Any:
+    """
+    Cliente OpenAI (síncrono o asíncrono) limitado al timeout de la etapa
+    
+    Los reintentos internos del SDK se desactivan: con deadline, una llamada
+    no puede reintentarse más allá del presupuesto de la petición.
+    
+    Raises:
+        DeadlineExceeded: Si la petición está cancelada o sin tiempo
+    """
+    deadline = _current.get()
+    if deadline is None:
+        return client
+    return client.with_options(timeout=deadline.stage_timeout(stage), max_retries=0)
+
+@contextmanager
+def bounded_call(client: Any, stage: str) -> Iterator[Any]:
+    """
+    Como bounded_client, para una llamada dentro del bloque: un timeout del
+    SDK con la petición cancelada o tras consumir el tiempo de la etapa es
+    del deadline, no del proveedor, y se relanza como DeadlineExceeded
+    
+    Raises:
+        DeadlineExceeded: Si la petición está cancelada o sin tiempo
+    """
+    deadline = _current.get()
+    if deadline is None:
+        yield client
+        return
+    
+    timeout = deadline.stage_timeout(stage)
+    start = time.monotonic()
+    try:
+        yield client.with_options(timeout=timeout, max_retries=0)
+    except Exception as e:
+        if is_timeout_error(e) and (deadline.cancelled or time.monotonic() - start >= timeout * TIMEOUT_SLACK):
+            raise deadline.exceeded(stage) from e
+        raise
+
+def main():
+    """Función principal para testing"""
+    deadline = Deadline(budget=2.0)
+    with deadline_scope(deadline):
+        for stage, _ in STAGE_SHARES:
+            print(f"{stage}: timeout {deadline.stage_timeout(stage):.2f}s")
+            time.sleep(0.3)
+        deadline.cancel("disconnected")
+        try:
+            check_deadline("notification")
+        except DeadlineExceeded as e:
+            print(f"Cancelado: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,460 @@
+"""
+Email Outbox Tool
+
+Cola persistente (SQLite) de correos salientes con un worker en background
+que reutiliza una sesión SMTP autenticada entre mensajes, reconecta tras el
+timeout de inactividad y reintenta los envíos fallidos con backoff. Varias
+outbox pueden compartir la base (workers, réplicas): cada lote se reclama
+de forma atómica antes de enviarlo y los mensajes reclamados por un proceso
+que no terminó vuelven a la cola tras EMAIL_CLAIM_TIMEOUT segundos.
+"""
+
+import os
+import time
+import uuid
+import sqlite3
+import smtplib
+import threading
+from email.message import Message
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Callable, Tuple
+import logging
+from dotenv import load_dotenv
+from dataclasses import dataclass
+
+from tools.tracing import traced
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+@dataclass
+class SMTPSettings:
+    """Parámetros de conexión SMTP"""
+    server: str
+    port: int
+    username: str = ""
+    password: str = ""
+    starttls: bool = True
+    timeout: float = 30.0
+    
+    @classmethod
+    def from_env(cls) -> 'SMTPSettings':
+        """Crear configuración desde variables de entorno"""
+        return cls(
+            server=os.getenv("SMTP_SERVER", "smtp.gmail.com"),
+            port=int(os.getenv("SMTP_PORT", "587")),
+            username=os.getenv("SMTP_USERNAME", ""),
+            password=os.getenv("SMTP_PASSWORD", ""),
+            starttls=os.getenv("SMTP_STARTTLS", "true").lower() == "true",
+            timeout=float(os.getenv("SMTP_TIMEOUT", "30"))
+        )
+
+# Errores que no se resuelven reintentando
+_PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+def connect_smtp(settings: SMTPSettings) -> smtplib.SMTP:
+    """Abrir una sesión SMTP autenticada (transporte por defecto de la outbox)"""
+    server = smtplib.SMTP(settings.server, settings.port, timeout=settings.timeout)
+    if settings.starttls:
+        server.starttls()
+    if settings.username:
+        server.login(settings.username, settings.password)
+    return server
+
+class EmailOutbox:
+    """Outbox persistente con envío en background por una sesión SMTP reutilizada"""
+    
+    def __init__(self,
+                 settings: SMTPSettings,
+                 db_path: Optional[str] = None,
+                 name: str = "default",
+                 batch_size: Optional[int] = None,
+                 max_attempts: Optional[int] = None,
+                 retry_backoff: Optional[float] = None,
+                 idle_timeout: Optional[float] = None,
+                 claim_timeout: Optional[float] = None,
+                 on_result: Optional[Callable[[int, bool, Optional[str]], None]] = None,
+                 transport: Optional[Callable[[SMTPSettings], smtplib.SMTP]] = None):
+        """
+        Inicializar outbox
+        
+        Args:
+            settings: Parámetros SMTP
+            db_path: Base de datos SQLite de la cola (EMAIL_OUTBOX_PATH)
+            name: Nombre de la cola (permite varias outbox en la misma base)
+            batch_size: Mensajes procesados por lote (EMAIL_BATCH_SIZE)
+            max_attempts: Intentos antes de marcar como fallido (EMAIL_MAX_ATTEMPTS)
+            retry_backoff: Segundos base del backoff exponencial (EMAIL_RETRY_BACKOFF)
+            idle_timeout: Segundos de inactividad tras los que se cierra la sesión SMTP
+            claim_timeout: Segundos tras los que un lote reclamado y no resuelto
+                vuelve a pendiente (EMAIL_CLAIM_TIMEOUT)
+            on_result: Callback (id, éxito, error) al entregar o descartar un mensaje
+            transport: Función que abre la sesión SMTP (por defecto connect_smtp;
+                en tests, un servidor simulado)
+        """
+        self.settings = settings
+        self.db_path = db_path or os.getenv("EMAIL_OUTBOX_PATH", "./storage/sqlite/outbox.db")
+        self.name = name
+        self.batch_size = batch_size or int(os.getenv("EMAIL_BATCH_SIZE", "20"))
+        self.max_attempts = max_attempts or int(os.getenv("EMAIL_MAX_ATTEMPTS", "5"))
+        self.retry_backoff = retry_backoff if retry_backoff is not None else float(os.getenv("EMAIL_RETRY_BACKOFF", "30"))
+        self.idle_timeout = idle_timeout if idle_timeout is not None else float(os.getenv("SMTP_IDLE_TIMEOUT", "60"))
+        self.claim_timeout = claim_timeout if claim_timeout is not None else float(os.getenv("EMAIL_CLAIM_TIMEOUT", "600"))
+        self.on_result = on_result
+        self.transport = transport or connect_smtp
+        
+        # Identificador de esta instancia en las filas que reclama
+        self.worker_id = uuid.uuid4().hex
+        
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._smtp_last_used = 0.0
+        self._smtp_lock = threading.Lock()
+        
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+        self._batch_lock = threading.Lock()
+        
+        self.stats = {"queued": 0, "sent": 0, "failed": 0, "retried": 0, "connections": 0}
+        
+        self._ensure_database()
+        
+        # Retomar mensajes pendientes de una ejecución anterior
+        if self.pending_count():
+            self._ensure_worker()
+    
+    def _ensure_database(self) -> None:
+        """Crear la tabla de la cola si no existe"""
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS email_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    queue TEXT NOT NULL,
+                    from_email TEXT NOT NULL,
+                    recipient TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    claimed_by TEXT,
+                    claimed_at REAL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    sent_at TIMESTAMP
+                )
+            """)
+            # Bases creadas antes de reclamar los lotes
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(email_outbox)")}
+            for column, column_type in (("claimed_by", "TEXT"), ("claimed_at", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE email_outbox ADD COLUMN {column} {column_type}")
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_outbox_pending
+                ON email_outbox (queue, status, next_attempt_at)
+            """)
+    
+    def enqueue(self, msg: Message, recipient: str, from_email: Optional[str] = None) -> int:
+        """
+        Encolar un mensaje para envío en background
+        
+        Args:
+            msg: Mensaje MIME ya construido
+            recipient: Destinatario
+            from_email: Remitente del sobre (por defecto la cabecera From)
+        
+        Returns:
+            ID del mensaje en la outbox
+        """
+        sender = from_email or msg.get("From") or self.settings.username
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                """
+                INSERT INTO email_outbox (queue, from_email, recipient, message, next_attempt_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (self.name, sender, recipient, msg.as_string(), time.time())
+            )
+            message_id = cursor.lastrowid
+        
+        self.stats["queued"] += 1
+        self._ensure_worker()
+        self._wakeup.set()
+        return message_id
+    
+    def send_now(self, msg: Message, recipient: str, from_email: Optional[str] = None) -> bool:
+        """Enviar de forma síncrona reutilizando la sesión SMTP (sin cola)"""
+        sender = from_email or msg.get("From") or self.settings.username
+        try:
+            self._deliver(sender, recipient, msg.as_string())
+            self.stats["sent"] += 1
+            return True
+        except Exception as e:
+            logger.error(f"Error enviando email a {recipient}: {e}")
+            self.stats["failed"] += 1
+            return False
+    
+    def pending_count(self) -> int:
+        """Mensajes pendientes de envío (incluidos los reclamados por un worker)"""
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM email_outbox WHERE queue = ? AND status IN ('pending', 'sending')",
+                (self.name,)
+            ).fetchone()
+        return row[0]
+    
+    def flush(self, timeout: float = 30.0) -> bool:
+        """
+        Procesar la cola hasta vaciarla (ignora el backoff pendiente)
+        
+        Returns:
+            True si no quedan mensajes pendientes
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self._process_batch(ignore_schedule=True):
+                break
+        with self._smtp_lock:
+            self._close_smtp()
+        return self.pending_count() == 0
+    
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Detener el worker (los pendientes se conservan en la base)"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._worker is not None:
+            self._worker.join(timeout=timeout)
+        with self._smtp_lock:
+            self._close_smtp()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas de la outbox"""
+        return {**self.stats, "pending": self.pending_count()}
+    
+    def _ensure_worker(self) -> None:
+        """Arrancar el worker la primera vez que se necesita"""
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._stopping.clear()
+                self._worker = threading.Thread(target=self._run, name=f"email-outbox-{self.name}", daemon=True)
+                self._worker.start()
+    
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                processed = self._process_batch()
+            except Exception as e:
+                logger.error(f"Error en worker de outbox: {e}")
+                processed = False
+            
+            if processed:
+                continue
+            
+            # Cerrar la sesión si lleva demasiado tiempo inactiva
+            if self._smtp is not None and time.monotonic() - self._smtp_last_used > self.idle_timeout:
+                with self._smtp_lock:
+                    self._close_smtp()
+            
+            self._wakeup.wait(timeout=min(self._seconds_to_next_attempt(), 5.0))
+            self._wakeup.clear()
+    
+    def _seconds_to_next_attempt(self) -> float:
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT MIN(next_attempt_at) FROM email_outbox WHERE queue = ? AND status = 'pending'",
+                (self.name,)
+            ).fetchone()
+        if row[0] is None:
+            return float("inf")
+        return max(0.0, row[0] - time.time())
+    
+    def _process_batch(self, ignore_schedule: bool = False) -> bool:
+        """
+        Enviar un lote de mensajes pendientes
+        
+        Returns:
+            True si se procesó al menos un mensaje
+        """
+        with self._batch_lock:
+            return self._process_rows(ignore_schedule)
+    
+    def _process_rows(self, ignore_schedule: bool) -> bool:
+        rows = self._claim_rows(ignore_schedule)
+        
+        for position, (message_id, from_email, recipient, message, attempts) in enumerate(rows):
+            if self._stopping.is_set() and not ignore_schedule:
+                # Devolver a la cola lo reclamado y no enviado
+                self._release([row[0] for row in rows[position:]])
+                break
+            try:
+                self._deliver(from_email, recipient, message)
+            except Exception as e:
+                self._mark_failure(message_id, attempts + 1, e)
+            else:
+                self._mark_sent(message_id)
+        
+        return bool(rows)
+    
+    def _claim_rows(self, ignore_schedule: bool) -> List[Tuple]:
+        """
+        Reclamar un lote de mensajes pendientes para esta instancia
+        
+        En una única transacción (BEGIN IMMEDIATE) se devuelven a pendiente
+        los lotes reclamados hace más de claim_timeout y se marcan como
+        'sending' los siguientes mensajes; otra outbox sobre la misma base
+        no puede reclamarlos hasta que esta los resuelva o caduque el plazo.
+        """
+        now = time.time()
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                released = conn.execute(
+                    """
+                    UPDATE email_outbox SET status = 'pending', claimed_by = NULL, claimed_at = NULL
+                    WHERE queue = ? AND status = 'sending' AND claimed_at < ?
+                    """,
+                    (self.name, now - self.claim_timeout)
+                ).rowcount
+                conn.execute(
+                    f"""
+                    UPDATE email_outbox SET status = 'sending', claimed_by = ?, claimed_at = ?
+                    WHERE id IN (
+                        SELECT id FROM email_outbox
+                        WHERE queue = ? AND status = 'pending' {'' if ignore_schedule else 'AND next_attempt_at <= ?'}
+                        ORDER BY id LIMIT ?
+                    )
+                    """,
+                    (self.worker_id, now, self.name, self.batch_size) if ignore_schedule
+                    else (self.worker_id, now, self.name, now, self.batch_size)
+                )
+                rows = conn.execute(
+                    """
+                    SELECT id, from_email, recipient, message, attempts FROM email_outbox
+                    WHERE status = 'sending' AND claimed_by = ? AND claimed_at = ?
+                    ORDER BY id
+                    """,
+                    (self.worker_id, now)
+                ).fetchall()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+        
+        if released > 0:
+            logger.warning(f"{released} emails reclamados sin resolver vuelven a la cola '{self.name}'")
+        return rows
+    
+    def _release(self, message_ids: List[int]) -> None:
+        """Devolver a pendiente mensajes reclamados por esta instancia"""
+        if not message_ids:
+            return
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany(
+                """
+                UPDATE email_outbox SET status = 'pending', claimed_by = NULL, claimed_at = NULL
+                WHERE id = ? AND claimed_by = ?
+                """,
+                [(message_id, self.worker_id) for message_id in message_ids]
+            )
+    
+    @traced("notify.email")
+    def _deliver(self, from_email: str, recipient: str, message: str) -> None:
+        """Enviar un mensaje por la sesión SMTP, reconectando una vez si se cayó"""
+        with self._smtp_lock:
+            for attempt in range(2):
+                server = self._get_smtp()
+                try:
+                    server.sendmail(from_email, [recipient], message.encode("utf-8"))
+                    self._smtp_last_used = time.monotonic()
+                    return
+                except smtplib.SMTPServerDisconnected:
+                    self._smtp = None
+                    if attempt == 1:
+                        raise
+    
+    def _get_smtp(self) -> smtplib.SMTP:
+        """Obtener la sesión SMTP abierta o abrir una nueva"""
+        if self._smtp is not None and time.monotonic() - self._smtp_last_used > self.idle_timeout:
+            # El servidor probablemente cerró la conexión por inactividad
+            try:
+                if self._smtp.noop()[0] != 250:
+                    self._close_smtp()
+            except smtplib.SMTPException:
+                self._smtp = None
+        
+        if self._smtp is None:
+            self._smtp = self.transport(self.settings)
+            self._smtp_last_used = time.monotonic()
+            self.stats["connections"] += 1
+        return self._smtp
+    
+    def _close_smtp(self) -> None:
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._smtp = None
+    
+    def _mark_sent(self, message_id: int) -> None:
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                """
+                UPDATE email_outbox SET status = 'sent', sent_at = CURRENT_TIMESTAMP,
+                    claimed_by = NULL, claimed_at = NULL
+                WHERE id = ?
+                """,
+                (message_id,)
+            )
+        self.stats["sent"] += 1
+        logger.info(f"Email {message_id} enviado")
+        self._notify(message_id, True, None)
+    
+    def _mark_failure(self, message_id: int, attempts: int, error: Exception) -> None:
+        """Reprogramar con backoff exponencial o marcar como fallido"""
+        permanent = isinstance(error, _PERMANENT_ERRORS) or attempts >= self.max_attempts
+        if isinstance(error, smtplib.SMTPAuthenticationError):
+            # Sesión inválida: forzar reconexión en el siguiente intento
+            self._smtp = None
+        
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                """
+                UPDATE email_outbox
+                SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?,
+                    claimed_by = NULL, claimed_at = NULL
+                WHERE id = ?
+                """,
+                (
+                    "failed" if permanent else "pending",
+                    attempts,
+                    time.time() + self.retry_backoff * (2 ** (attempts - 1)),
+                    str(error),
+                    message_id
+                )
+            )
+        
+        if permanent:
+            self.stats["failed"] += 1
+            logger.error(f"Email {message_id} descartado tras {attempts} intentos: {error}")
+            self._notify(message_id, False, str(error))
+        else:
+            self.stats["retried"] += 1
+            logger.warning(f"Email {message_id} falló (intento {attempts}), se reintentará: {error}")
+    
+    def _notify(self, message_id: int, success: bool, error: Optional[str]) -> None:
+        if self.on_result is None:
+            return
+        try:
+            self.on_result(message_id, success, error)
+        except Exception as e:
+            logger.debug(f"Error en callback de outbox: {e}")
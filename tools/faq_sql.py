@@ -7,11 +7,14 @@ sobre el CV y la experiencia profesional.
 
 import os
 import sqlite3
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import logging
 from dotenv import load_dotenv
 from dataclasses import dataclass
 
+from tools.tracing import traced
+from tools.deadline import check_deadline
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -25,6 +28,7 @@ class FAQResult:
     category: str
     tags: List[str]
     confidence: float
+    faq_id: Optional[int] = None
 
 class FAQSQLTool:
     """Herramienta para consultas SQL a base de FAQs"""
@@ -160,11 +164,13 @@ class FAQSQLTool:
             conn.commit()
             logger.info(f"Insertadas {len(sample_faqs)} FAQs de ejemplo")
     
+    @traced("faq_search", result_attributes=lambda r: {"results": len(r)})
     def search_faqs(
         self, 
         query: str, 
         category: Optional[str] = None,
-        limit: int = 5
+        limit: int = 5,
+        log_analytics: bool = True
     ) -> List[FAQResult]:
         """
         Buscar FAQs que coincidan con la consulta
@@ -173,7 +179,10 @@ class FAQSQLTool:
             query: Texto de búsqueda
             category: Filtrar por categoría específica
             limit: Número máximo de resultados
+            log_analytics: Registrar los resultados en analytics (las búsquedas
+                especulativas lo hacen con record_analytics solo si se usan)
         """
+        check_deadline("retrieval")
         with sqlite3.connect(self.db_path) as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
@@ -220,12 +229,14 @@ class FAQSQLTool:
                     answer=row['answer'],
                     category=row['category'],
                     tags=tags,
-                    confidence=confidence
+                    confidence=confidence,
+                    faq_id=row['id']
                 )
                 results.append(result)
                 
                 # Registrar analíticas
-                self._log_query_analytics(row['id'], query)
+                if log_analytics:
+                    self._log_query_analytics(row['id'], query)
             
             logger.info(f"FAQ search: '{query}' -> {len(results)} resultados")
             return results
@@ -271,6 +282,12 @@ class FAQSQLTool:
         except Exception as e:
             logger.warning(f"Error registrando analytics: {e}")
     
+    def record_analytics(self, query: str, results: List[FAQResult]) -> None:
+        """Registrar en analytics resultados obtenidos con log_analytics=False"""
+        for result in results:
+            if result.faq_id is not None:
+                self._log_query_analytics(result.faq_id, query)
+    
     def get_categories(self) -> List[str]:
         """Obtener todas las categorías disponibles"""
         with sqlite3.connect(self.db_path) as conn:
@@ -300,7 +317,8 @@ class FAQSQLTool:
                     answer=row['answer'],
                     category=row['category'],
                     tags=tags,
-                    confidence=1.0
+                    confidence=1.0,
+                    faq_id=faq_id
                 )
         return None
     
@@ -331,6 +349,37 @@ class FAQSQLTool:
             logger.info(f"Nueva FAQ agregada con ID: {faq_id}")
             return faq_id
     
+    def get_frequent_queries(self, limit: int = 50, since_days: Optional[int] = None) -> List[Tuple[str, int]]:
+        """
+        Consultas más frecuentes registradas en analytics
+        
+        Cada búsqueda registra una fila por FAQ encontrada, así que las veces
+        que se hizo una consulta son sus filas entre las FAQs distintas que devolvió.
+        
+        Args:
+            limit: Número máximo de consultas
+            since_days: Solo consultas de los últimos N días (None = todas)
+            
+        Returns:
+            Lista de (consulta, veces) de la más a la menos frecuente
+        """
+        where = "WHERE query IS NOT NULL AND TRIM(query) != ''"
+        params: List[Any] = []
+        if since_days:
+            where += " AND timestamp >= datetime('now', ?)"
+            params.append(f"-{int(since_days)} days")
+        
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute(f"""
+                SELECT MIN(query), CAST(ROUND(CAST(COUNT(*) AS REAL) / COUNT(DISTINCT faq_id)) AS INTEGER) AS hits
+                FROM faq_analytics
+                {where}
+                GROUP BY LOWER(TRIM(query))
+                ORDER BY hits DESC
+                LIMIT ?
+            """, params + [limit]).fetchall()
+        return [(query, hits) for query, hits in rows]
+    
     def get_analytics_summary(self) -> Dict[str, Any]:
         """Obtener resumen de analytics"""
         with sqlite3.connect(self.db_path) as conn:
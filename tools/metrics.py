@@ -0,0 +1,719 @@
+"""
+Metrics Tool
+
+Registro de métricas (contadores e histogramas de buckets fijos) por etapa
+del pipeline, herramienta y proveedor LLM. Se alimenta de los spans del
+tracer y se expone en formato texto de Prometheus. Con
+PROMETHEUS_MULTIPROC_DIR (o un backend de estado compartido) cada worker
+vuelca su estado a un snapshot propio y la exposición agrega los de todos
+los procesos y réplicas: contadores e histogramas se suman y los gauges se
+exponen por proceso (etiqueta process), solo de los procesos vivos. En
+el backend compartido los contadores de un proceso terminado se traspasan a
+un snapshot de retirados antes de borrar el suyo, para que los totales no
+retrocedan al reiniciar un worker.
+"""
+
+import os
+import json
+import time
+import socket
+import bisect
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+import logging
+from dotenv import load_dotenv
+
+from tools.tracing import tracer, Span
+from tools.state_backend import StateBackend, get_state_backend, is_shared_backend
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Buckets de latencia en segundos (LLM incluido)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Etapas que corresponden a una herramienta concreta
+TOOL_STAGES = {
+    "retrieve": "rag",
+    "retrieve_batch": "rag",
+    "faq_search": "faq",
+    "notify.pushover": "pushover",
+    "notify.email": "email"
+}
+
+# Snapshot acumulado de los procesos retirados (backend compartido)
+RETIRED_KEY = "metrics_retired"
+# Cerrojo que serializa la actualización del snapshot de retirados
+RETIRE_LOCK_KEY = "metrics_retire_lock"
+RETIRE_LOCK_TTL = 30.0
+# Marca del snapshot traspasado de un proceso, por si estaba parado y vuelve
+RETIRED_MARK_TTL = 24 * 3600.0
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    """Clave ordenada e inmutable de un conjunto de etiquetas"""
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    """Formatear etiquetas en sintaxis Prometheus"""
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = (
+        k + '="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in items
+    )
+    return "{" + ",".join(escaped) + "}"
+
+class Counter:
+    """Contador monotónico con etiquetas"""
+    
+    kind = "counter"
+    
+    def __init__(self, name: str, description: str):
+        """Inicializar contador"""
+        self.name = name
+        self.description = description
+        self.values: Dict[LabelKey, float] = {}
+    
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        """Incrementar el contador"""
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado serializable"""
+        return {"kind": self.kind, "values": [[list(map(list, k)), v] for k, v in self.values.items()]}
+    
+    def merge(self, data: Dict[str, Any]) -> None:
+        """Sumar el estado de otro proceso"""
+        for key, value in data["values"]:
+            key = tuple(tuple(item) for item in key)
+            self.values[key] = self.values.get(key, 0.0) + value
+    
+    def render(self) -> List[str]:
+        """Líneas en formato Prometheus"""
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+class Gauge(Counter):
+    """Valor instantáneo con etiquetas (en multiproceso, una serie por proceso)"""
+    
+    kind = "gauge"
+    
+    def set(self, value: float, **labels) -> None:
+        """Fijar el valor"""
+        self.values[_label_key(labels)] = float(value)
+    
+    def merge(self, data: Dict[str, Any], process: Optional[str] = None) -> None:
+        """
+        Copiar el estado de otro proceso sin sumarlo
+        
+        Args:
+            data: Snapshot del gauge
+            process: Proceso de origen, añadido como etiqueta process
+        """
+        for key, value in data["values"]:
+            key = tuple(tuple(item) for item in key)
+            if process is not None:
+                key = tuple(sorted(key + (("process", process),)))
+            self.values[key] = value
+
+class Histogram:
+    """Histograma de buckets fijos con etiquetas"""
+    
+    kind = "histogram"
+    
+    def __init__(self, name: str, description: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        """Inicializar histograma"""
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        # Por etiqueta: conteos por bucket (último = +Inf), suma y total
+        self.values: Dict[LabelKey, Dict[str, Any]] = {}
+    
+    def observe(self, value: float, **labels) -> None:
+        """Registrar una observación"""
+        key = _label_key(labels)
+        series = self.values.get(key)
+        if series is None:
+            series = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            self.values[key] = series
+        series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+        series["sum"] += value
+        series["count"] += 1
+    
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """
+        Estimar un percentil por interpolación lineal dentro del bucket
+        
+        Args:
+            q: Cuantil entre 0 y 1 (0.95 = p95)
+            **labels: Serie a consultar (sin etiquetas agrega todas)
+        """
+        series = self._series(labels)
+        if series is None or series["count"] == 0:
+            return None
+        
+        rank = q * series["count"]
+        cumulative = 0
+        for i, count in enumerate(series["counts"]):
+            if cumulative + count >= rank and count > 0:
+                if i == len(self.buckets):
+                    # Por encima del último bucket finito
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i]
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+    
+    def summary(self, **labels) -> Dict[str, Any]:
+        """Conteo, media y percentiles p50/p95/p99"""
+        series = self._series(labels)
+        if series is None or series["count"] == 0:
+            return {"count": 0}
+        return {
+            "count": series["count"],
+            "mean": series["sum"] / series["count"],
+            "p50": self.quantile(0.50, **labels),
+            "p95": self.quantile(0.95, **labels),
+            "p99": self.quantile(0.99, **labels)
+        }
+    
+    def _series(self, labels: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Serie de unas etiquetas, o la agregación de todas si no se indican"""
+        if labels:
+            return self.values.get(_label_key(labels))
+        if not self.values:
+            return None
+        merged = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+        for series in self.values.values():
+            merged["counts"] = [a + b for a, b in zip(merged["counts"], series["counts"])]
+            merged["sum"] += series["sum"]
+            merged["count"] += series["count"]
+        return merged
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado serializable"""
+        return {
+            "kind": self.kind,
+            "buckets": list(self.buckets),
+            "values": [[list(map(list, k)), v] for k, v in self.values.items()]
+        }
+    
+    def merge(self, data: Dict[str, Any]) -> None:
+        """Sumar el estado de otro proceso"""
+        if tuple(data.get("buckets", ())) != self.buckets:
+            logger.warning(f"Buckets incompatibles para {self.name}, se ignora el snapshot")
+            return
+        for key, other in data["values"]:
+            key = tuple(tuple(item) for item in key)
+            series = self.values.setdefault(
+                key, {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            )
+            series["counts"] = [a + b for a, b in zip(series["counts"], other["counts"])]
+            series["sum"] += other["sum"]
+            series["count"] += other["count"]
+    
+    def render(self) -> List[str]:
+        """Líneas en formato Prometheus"""
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', repr(float(bound))))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {series['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+class MetricsRegistry:
+    """Registro de métricas del proceso con agregación multiproceso opcional"""
+    
+    def __init__(self,
+                 multiproc_dir: Optional[str] = None,
+                 flush_interval: float = 1.0,
+                 shared_backend: Optional[StateBackend] = None,
+                 snapshot_ttl: Optional[float] = None,
+                 stale_after: Optional[float] = None):
+        """
+        Inicializar registro
+        
+        Args:
+            multiproc_dir: Directorio compartido entre workers (PROMETHEUS_MULTIPROC_DIR)
+            flush_interval: Segundos mínimos entre volcados
+            shared_backend: Backend de estado compartido entre réplicas
+            snapshot_ttl: TTL del snapshot en el backend compartido (por
+                defecto 1 hora): solo caduca si ningún proceso vivo lo retira
+            stale_after: Antigüedad a partir de la cual un snapshot es de un
+                proceso terminado: sus gauges se ignoran y sus contadores se
+                traspasan a los retirados (por defecto 5 intervalos de
+                volcado, mínimo 5s; como mucho la mitad de snapshot_ttl)
+        """
+        self.multiproc_dir = multiproc_dir
+        self.flush_interval = flush_interval
+        self.shared_backend = None if multiproc_dir else shared_backend
+        self.snapshot_ttl = snapshot_ttl if snapshot_ttl is not None else 3600.0
+        self.stale_after = stale_after if stale_after is not None else max(5.0, flush_interval * 5)
+        if self.shared_backend is not None and self.stale_after > self.snapshot_ttl / 2:
+            # El snapshot debe poder retirarse antes de caducar
+            logger.warning(f"stale_after ({self.stale_after}s) limitado a la mitad de snapshot_ttl")
+            self.stale_after = self.snapshot_ttl / 2
+        self._pid = os.getpid()
+        self.process_id = self._new_process_id()
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        self._last_retire = 0.0
+        # Últimos snapshots volcados, por si otro proceso traspasa uno a los retirados
+        self._flushed: deque = deque(maxlen=3)
+        self._heartbeat: Optional[threading.Thread] = None
+        
+        if self.multiproc_dir:
+            Path(self.multiproc_dir).mkdir(parents=True, exist_ok=True)
+        
+        self.requests = self.counter(
+            "agent_requests_total", "Consultas procesadas por resultado")
+        self.request_latency = self.histogram(
+            "agent_request_duration_seconds", "Latencia total de la consulta")
+        self.stage_latency = self.histogram(
+            "agent_stage_duration_seconds", "Latencia por etapa del pipeline")
+        self.stage_errors = self.counter(
+            "agent_stage_errors_total", "Errores por etapa del pipeline")
+        self.tool_latency = self.histogram(
+            "agent_tool_duration_seconds", "Latencia por herramienta")
+        self.llm_latency = self.histogram(
+            "agent_llm_duration_seconds", "Latencia de generación por proveedor LLM")
+        self.llm_tokens = self.counter(
+            "agent_llm_tokens_total", "Tokens consumidos por proveedor LLM")
+        self.cache_events = self.counter(
+            "agent_cache_events_total", "Aciertos y fallos de caché por etapa")
+        self.coalesced_requests = self.counter(
+            "agent_coalesced_requests_total", "Consultas servidas por una ejecución idéntica en curso")
+        self.batch_queries = self.counter(
+            "agent_batch_queries_total", "Consultas de lotes por origen del resultado")
+        self.speculative_lookups = self.counter(
+            "agent_speculative_lookups_total", "Búsquedas especulativas por herramienta y resultado")
+        self.structured_outputs = self.counter(
+            "agent_structured_output_total", "Respuestas JSON de clasificación/evaluación por resultado")
+        self.model_cascade = self.counter(
+            "agent_model_cascade_total", "Respuestas por resultado de la cascada de modelos")
+        self.deadline_exceeded = self.counter(
+            "agent_deadline_exceeded_total", "Peticiones abandonadas por deadline o desconexión, por etapa")
+        self.circuit_state = self.gauge(
+            "agent_circuit_state", "Estado del circuit breaker (0 cerrado, 1 semiabierto, 2 abierto)")
+        self.degraded_answers = self.counter(
+            "agent_degraded_answers_total", "Respuestas en modo degradado (sin LLM) por motivo y origen")
+        self.extractive_answers = self.counter(
+            "agent_extractive_answers_total", "Consultas evaluadas por el motor extractivo por resultado")
+        self.cache_warmup = self.counter(
+            "agent_cache_warmup_total", "Respuestas precalculadas por resultado (stored, rejected, failed, preloaded)")
+        self.session_memory = self.counter(
+            "agent_session_memory_total", "Eventos de la memoria de sesión (follow_up, chunks_reused, summarized, evicted...)")
+        self.admission_in_flight = self.gauge(
+            "agent_admission_in_flight", "Peticiones en ejecución bajo control de admisión")
+        self.admission_queue_depth = self.gauge(
+            "agent_admission_queue_depth", "Peticiones esperando turno por carril de prioridad")
+        self.admission_wait = self.histogram(
+            "agent_admission_wait_seconds", "Espera en cola antes de ejecutar la petición")
+        self.admission_rejected = self.counter(
+            "agent_admission_rejected_total", "Peticiones rechazadas (429) por motivo")
+        self.admission_bypassed = self.counter(
+            "agent_admission_bypassed_total", "Peticiones que no pasan por la cola por motivo")
+        self.orchestrator_events = self.counter(
+            "agent_orchestrator_events_total", "Eventos del orquestador por tipo (total_queries, rag_searches, errors...)")
+    
+    @classmethod
+    def from_env(cls) -> 'MetricsRegistry':
+        """Crear registro desde variables de entorno"""
+        return cls(
+            multiproc_dir=os.getenv("PROMETHEUS_MULTIPROC_DIR") or None,
+            flush_interval=float(os.getenv("METRICS_FLUSH_INTERVAL", "1.0")),
+            shared_backend=get_state_backend() if is_shared_backend() else None,
+            snapshot_ttl=float(os.getenv("METRICS_SNAPSHOT_TTL")) if os.getenv("METRICS_SNAPSHOT_TTL") else None,
+            stale_after=float(os.getenv("METRICS_STALE_AFTER")) if os.getenv("METRICS_STALE_AFTER") else None
+        )
+    
+    def counter(self, name: str, description: str) -> Counter:
+        """Obtener o crear un contador"""
+        return self._register(name, lambda: Counter(name, description))
+    
+    def gauge(self, name: str, description: str) -> Gauge:
+        """Obtener o crear un gauge"""
+        return self._register(name, lambda: Gauge(name, description))
+    
+    def set_gauge(self, metric: Gauge, value: float, **labels) -> None:
+        """Fijar un gauge de forma thread-safe"""
+        with self._lock:
+            metric.set(value, **labels)
+        self._maybe_flush()
+    
+    def histogram(self, name: str, description: str,
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        """Obtener o crear un histograma"""
+        return self._register(name, lambda: Histogram(name, description, buckets))
+    
+    def inc(self, metric: Counter, amount: float = 1.0, **labels) -> None:
+        """Incrementar un contador de forma thread-safe"""
+        with self._lock:
+            metric.inc(amount, **labels)
+        self._maybe_flush()
+    
+    def observe(self, metric: Histogram, value: float, **labels) -> None:
+        """Registrar una observación de forma thread-safe"""
+        with self._lock:
+            metric.observe(value, **labels)
+        self._maybe_flush()
+    
+    def observe_request(self, duration: float, success: bool) -> None:
+        """Registrar una consulta completa"""
+        with self._lock:
+            self.request_latency.observe(duration)
+            self.requests.inc(status="success" if success else "error")
+        self._maybe_flush()
+    
+    def observe_span(self, span: Span) -> None:
+        """Listener del tracer: traducir un span cerrado a métricas"""
+        attributes = span.attributes
+        with self._lock:
+            self.stage_latency.observe(span.duration, stage=span.name)
+            if span.status == "error":
+                self.stage_errors.inc(stage=span.name)
+            
+            tool = TOOL_STAGES.get(span.name)
+            if tool:
+                self.tool_latency.observe(span.duration, tool=tool)
+            
+            if "provider" in attributes:
+                provider = attributes["provider"]
+                model = attributes.get("model", "unknown")
+                self.llm_latency.observe(span.duration, provider=provider, model=model)
+                if attributes.get("prompt_tokens"):
+                    self.llm_tokens.inc(attributes["prompt_tokens"], provider=provider, model=model, kind="prompt")
+                if attributes.get("tokens"):
+                    self.llm_tokens.inc(attributes["tokens"], provider=provider, model=model, kind="total")
+            
+            for result in ("hits", "misses"):
+                if attributes.get(f"cache_{result}"):
+                    self.cache_events.inc(attributes[f"cache_{result}"], stage=span.name, result=result)
+        self._maybe_flush()
+    
+    def latency_summary(self) -> Dict[str, Any]:
+        """Percentiles p50/p95/p99 de la consulta y de cada etapa"""
+        with self._lock:
+            registry = self._collect()
+        request_latency = registry[self.request_latency.name]
+        stage_latency = registry[self.stage_latency.name]
+        return {
+            "request": request_latency.summary(),
+            "stages": {
+                dict(key)["stage"]: stage_latency.summary(**dict(key))
+                for key in sorted(stage_latency.values)
+            }
+        }
+    
+    def totals(self, metric: Counter, label: str) -> Dict[str, float]:
+        """
+        Valores de un contador agregados por una etiqueta (todos los workers)
+        
+        Args:
+            metric: Contador a consultar
+            label: Etiqueta por la que agrupar
+        """
+        with self._lock:
+            registry = self._collect()
+        totals: Dict[str, float] = {}
+        for key, value in registry[metric.name].values.items():
+            group = dict(key).get(label)
+            if group is not None:
+                totals[group] = totals.get(group, 0.0) + value
+        return totals
+    
+    def render_prometheus(self) -> str:
+        """Exposición en formato texto de Prometheus (todos los workers)"""
+        with self._lock:
+            registry = self._collect()
+        lines: List[str] = []
+        for name in sorted(registry):
+            lines.extend(registry[name].render())
+        return "\n".join(lines) + "\n"
+    
+    @property
+    def is_aggregated(self) -> bool:
+        """Indica si las métricas se agregan entre procesos"""
+        return bool(self.multiproc_dir or self.shared_backend)
+    
+    @staticmethod
+    def _new_process_id() -> str:
+        """Identificador único del proceso (host, PID y arranque): un PID reutilizado no pisa al anterior"""
+        return f"{socket.gethostname()}:{os.getpid()}:{int(time.time() * 1000):x}{os.urandom(2).hex()}"
+    
+    def _snapshot_path(self) -> Path:
+        """Archivo del snapshot del proceso en el directorio multiproceso"""
+        safe_id = "".join(c if c.isalnum() or c in "-." else "_" for c in self.process_id)
+        return Path(self.multiproc_dir) / f"metrics_{safe_id}.json"
+    
+    def flush(self) -> None:
+        """Volcar el estado del proceso al directorio o backend compartido"""
+        if not self.is_aggregated:
+            return
+        if os.getpid() != self._pid:
+            # Proceso hijo tras un fork: identidad propia
+            self._pid = os.getpid()
+            self.process_id = self._new_process_id()
+            self._flushed.clear()
+        if self.shared_backend is not None:
+            try:
+                self._resume_if_retired()
+            except Exception as e:
+                logger.warning(f"Error comprobando el retiro de métricas: {e}")
+        
+        with self._lock:
+            flushed_at = time.time()
+            snapshot = {name: metric.snapshot() for name, metric in self._metrics.items()}
+            payload = json.dumps({"process": self.process_id, "flushed_at": flushed_at, "metrics": snapshot})
+            self._flushed.append((flushed_at, snapshot))
+            self._last_flush = time.monotonic()
+        
+        try:
+            if self.shared_backend is not None:
+                self.shared_backend.set(f"metrics:{self.process_id}", payload, ttl=self.snapshot_ttl)
+                return
+            path = self._snapshot_path()
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_text(payload, encoding="utf-8")
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Error volcando métricas: {e}")
+    
+    def _register(self, name: str, factory):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = factory()
+                self._metrics[name] = metric
+            return metric
+    
+    def _maybe_flush(self) -> None:
+        if not self.is_aggregated:
+            return
+        self._ensure_heartbeat()
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+    
+    def _ensure_heartbeat(self) -> None:
+        """
+        Volcado periódico en un thread: un proceso sin actividad sigue
+        renovando su snapshot, que solo caduca cuando el proceso termina
+        """
+        if self._heartbeat is not None and self._heartbeat.is_alive():
+            return
+        with self._lock:
+            if self._heartbeat is None or not self._heartbeat.is_alive():
+                self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="metrics-flush", daemon=True)
+                self._heartbeat.start()
+    
+    def _heartbeat_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+            if self.shared_backend is not None and time.monotonic() - self._last_retire >= self.stale_after:
+                self._last_retire = time.monotonic()
+                try:
+                    self.retire_stale()
+                except Exception as e:
+                    logger.warning(f"Error retirando métricas de procesos terminados: {e}")
+    
+    def retire_stale(self) -> int:
+        """
+        Traspasar al snapshot de retirados los contadores e histogramas de
+        los procesos que llevan más de stale_after sin volcar, y borrar su
+        snapshot antes de que caduque
+        
+        Returns:
+            Número de procesos retirados (0 si otro proceso tiene el cerrojo)
+        """
+        backend = self.shared_backend
+        if backend is None:
+            return 0
+        cutoff = time.time() - self.stale_after
+        own_key = f"metrics:{self.process_id}"
+        stale = [
+            key for key in backend.keys("metrics:")
+            if key != own_key and (backend.get_json(key) or {}).get("flushed_at", 0.0) < cutoff
+        ]
+        if not stale:
+            return 0
+        
+        if backend.incr(RETIRE_LOCK_KEY) != 1:
+            return 0
+        retired_count = 0
+        try:
+            backend.set(RETIRE_LOCK_KEY, "1", ttl=RETIRE_LOCK_TTL)
+            retired = (backend.get_json(RETIRED_KEY) or {}).get("metrics", {})
+            for key in stale:
+                # Releído con el cerrojo: otro proceso pudo retirarlo o volver a volcar
+                payload = backend.get_json(key)
+                if not payload or payload.get("flushed_at", 0.0) >= cutoff:
+                    continue
+                process = payload.get("process") or key[len("metrics:"):]
+                backend.set(f"metrics_retired_from:{process}", repr(payload["flushed_at"]), ttl=RETIRED_MARK_TTL)
+                retired = self._fold(retired, payload.get("metrics", {}))
+                backend.set_json(RETIRED_KEY, {"process": "retired", "metrics": retired})
+                backend.delete(key)
+                retired_count += 1
+        finally:
+            backend.delete(RETIRE_LOCK_KEY)
+        if retired_count:
+            logger.info(f"Métricas de {retired_count} proceso(s) terminado(s) traspasadas a retirados")
+        return retired_count
+    
+    def _fold(self, retired: Dict[str, Any], snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        """Sumar los contadores e histogramas de un snapshot a los de retirados (sin gauges)"""
+        folded = {}
+        for name, metric in self._metrics.items():
+            if metric.kind == "gauge" or (name not in retired and name not in snapshot):
+                continue
+            fresh = self._blank(metric)
+            for source in (retired, snapshot):
+                if name in source:
+                    fresh.merge(source[name])
+            folded[name] = fresh.snapshot()
+        for name, data in retired.items():
+            # Métricas que este proceso ya no define
+            folded.setdefault(name, data)
+        return folded
+    
+    def _resume_if_retired(self) -> None:
+        """
+        Un proceso parado más de stale_after puede haber sido retirado por
+        otro: sigue con una identidad nueva y descuenta de su estado lo ya
+        traspasado, para no contarlo dos veces
+        """
+        mark = self.shared_backend.get(f"metrics_retired_from:{self.process_id}")
+        if mark is None:
+            return
+        retired_at = float(mark)
+        folded = next((snapshot for flushed_at, snapshot in self._flushed if flushed_at == retired_at), None)
+        if folded is None and self._flushed:
+            folded = self._flushed[-1][1]
+        
+        with self._lock:
+            for name, data in (folded or {}).items():
+                metric = self._metrics.get(name)
+                if metric is None or metric.kind == "gauge":
+                    continue
+                for key, value in data["values"]:
+                    key = tuple(tuple(item) for item in key)
+                    if metric.kind == "histogram":
+                        series = metric.values.get(key)
+                        if series is not None:
+                            series["counts"] = [a - b for a, b in zip(series["counts"], value["counts"])]
+                            series["sum"] -= value["sum"]
+                            series["count"] -= value["count"]
+                    else:
+                        metric.values[key] = metric.values.get(key, 0.0) - value
+            old_id = self.process_id
+            self.process_id = self._new_process_id()
+            self._flushed.clear()
+        logger.warning(f"Métricas de {old_id} retiradas por otro proceso; se continúa como {self.process_id}")
+    
+    @staticmethod
+    def _blank(metric):
+        """Métrica vacía del mismo tipo y definición"""
+        if metric.kind == "histogram":
+            return Histogram(metric.name, metric.description, metric.buckets)
+        if metric.kind == "gauge":
+            return Gauge(metric.name, metric.description)
+        return Counter(metric.name, metric.description)
+    
+    def _collect(self) -> Dict[str, Any]:
+        """
+        Métricas a exponer
+        
+        En modo multiproceso se suman los contadores e histogramas de los
+        snapshots de todos los workers (incluidos los de procesos ya
+        terminados, para que sigan siendo monotónicos); el proceso actual usa
+        su estado en memoria. Los gauges se exponen por proceso y solo de los
+        snapshots volcados hace menos de stale_after. En el backend
+        compartido los procesos terminados se suman a través del snapshot de
+        retirados.
+        """
+        if not self.is_aggregated:
+            return self._metrics
+        
+        merged: Dict[str, Any] = {}
+        for name, metric in self._metrics.items():
+            fresh = self._blank(metric)
+            if metric.kind == "gauge":
+                fresh.merge(metric.snapshot(), process=self.process_id)
+            else:
+                fresh.merge(metric.snapshot())
+            merged[name] = fresh
+        
+        cutoff = time.time() - self.stale_after
+        for payload in self._read_snapshots():
+            live = payload.get("flushed_at", 0.0) >= cutoff
+            for name, data in payload.get("metrics", {}).items():
+                metric = merged.get(name)
+                if metric is None:
+                    continue
+                if metric.kind == "gauge":
+                    if live:
+                        metric.merge(data, process=payload.get("process"))
+                else:
+                    metric.merge(data)
+        return merged
+    
+    def _read_snapshots(self) -> List[Dict[str, Any]]:
+        """Snapshots del resto de procesos (y el de retirados en el backend compartido)"""
+        snapshots = []
+        
+        if self.shared_backend is not None:
+            own_key = f"metrics:{self.process_id}"
+            for key in self.shared_backend.keys("metrics:") + [RETIRED_KEY]:
+                if key == own_key:
+                    continue
+                payload = self.shared_backend.get_json(key)
+                if payload:
+                    snapshots.append(payload)
+            return snapshots
+        
+        own_file = self._snapshot_path().name
+        for path in Path(self.multiproc_dir).glob("metrics_*.json"):
+            if path.name == own_file:
+                continue
+            try:
+                snapshots.append(json.loads(path.read_text(encoding="utf-8")))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Snapshot de métricas ilegible {path}: {e}")
+        return snapshots
+
+# Instancia global del registro, alimentada por el tracer
+metrics = MetricsRegistry.from_env()
+tracer.add_listener(metrics.observe_span)
+
+def main():
+    """Función de test para las métricas"""
+    try:
+        for duration in (0.02, 0.04, 0.3, 1.2, 4.0):
+            metrics.observe_request(duration, success=True)
+        print(json.dumps(metrics.latency_summary(), indent=2))
+        print(metrics.render_prometheus())
+    
+    except Exception as e:
+        logger.error(f"Error en test de métricas: {e}")
+        raise
+
+if __name__ == "__main__":
+    main()
@@ -2,16 +2,25 @@
 Notification Tool
 
 Herramienta para enviar notificaciones push usando Pushover u otros servicios.
+Los envíos se encolan y un dispatcher en background los agrupa en digests y
+respeta un rate limit, para no bloquear los requests de usuario.
 """
 
 import os
+import time
+import queue
+import threading
 import requests
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import logging
 from dotenv import load_dotenv
 from dataclasses import dataclass
 from datetime import datetime
 
+from tools.tracing import traced
+from tools.ring_log import RingLog
+from tools.state_backend import TokenBucket
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -32,11 +41,16 @@ class PushoverNotifier:
         """Inicializar cliente Pushover"""
         self.api_token = os.getenv("PUSHOVER_TOKEN")
         self.user_key = os.getenv("PUSHOVER_USER")
-        self.api_url = "https://api.pushover.net/1/messages.json"
+        self.api_url = os.getenv("PUSHOVER_API_URL", "https://api.pushover.net/1/messages.json")
+        self.timeout = float(os.getenv("PUSHOVER_TIMEOUT", "10"))
+        
+        # Sesión HTTP reutilizable (pool de conexiones keep-alive)
+        self.session = requests.Session()
         
         if not self.api_token or not self.user_key:
             logger.warning("Pushover credentials no configuradas")
     
+    @traced("notify.pushover", result_attributes=lambda r: {"success": r.success})
     def send_notification(
         self,
         message: str,
@@ -78,7 +92,7 @@ class PushoverNotifier:
                 payload["url"] = url
                 payload["url_title"] = url_title or url
             
-            response = requests.post(self.api_url, data=payload, timeout=10)
+            response = self.session.post(self.api_url, data=payload, timeout=self.timeout)
             response.raise_for_status()
             
             result_data = response.json()
@@ -100,7 +114,7 @@ class PushoverNotifier:
                     message=f"Error de Pushover: {error_msg}",
                     timestamp=datetime.now()
                 )
-                
+        
         except requests.exceptions.RequestException as e:
             logger.error(f"Error de red en Pushover: {e}")
             return NotificationResult(
@@ -116,13 +130,279 @@ class PushoverNotifier:
                 timestamp=datetime.now()
             )
 
+@dataclass
+class _QueuedNotification:
+    """Notificación pendiente de envío"""
+    message: str
+    title: str
+    priority: int
+    sound: str
+    kwargs: Dict[str, Any]
+    queued_at: float
+
+class NotificationDispatcher:
+    """
+    Dispatcher en background para Pushover
+    
+    Las notificaciones se encolan sin bloquear al llamador. Un thread las
+    envía respetando un token bucket; las que llegan en ráfaga (dentro de
+    la ventana de coalescing o mientras se espera rate limit) se agrupan en
+    un único mensaje digest. Si la cola se llena se aplica la política de
+    overflow: drop_newest descarta la nueva y drop_oldest la más antigua.
+    """
+    
+    # Límites de Pushover
+    MAX_MESSAGE_LENGTH = 1024
+    MAX_TITLE_LENGTH = 250
+    
+    def __init__(self,
+                 notifier: PushoverNotifier,
+                 max_queue: int = 100,
+                 overflow_policy: str = "drop_oldest",
+                 rate_per_minute: float = 6.0,
+                 burst: int = 3,
+                 coalesce_window: float = 2.0,
+                 max_batch: int = 10):
+        """
+        Inicializar dispatcher
+        
+        Args:
+            notifier: Cliente Pushover usado para el envío
+            max_queue: Tamaño máximo de la cola
+            overflow_policy: "drop_oldest" o "drop_newest"
+            rate_per_minute: Mensajes por minuto permitidos (cuota de Pushover)
+            burst: Mensajes permitidos en ráfaga
+            coalesce_window: Segundos que se espera para agrupar una ráfaga
+            max_batch: Máximo de notificaciones por digest
+        """
+        if overflow_policy not in ("drop_oldest", "drop_newest"):
+            raise ValueError(f"Invalid overflow policy: {overflow_policy}")
+        
+        self.notifier = notifier
+        self.overflow_policy = overflow_policy
+        self.coalesce_window = coalesce_window
+        self.max_batch = max_batch
+        # Cuota compartida entre workers/réplicas a través del backend de estado
+        self.bucket = TokenBucket(rate_per_minute / 60.0, burst, key="ratelimit:pushover")
+        
+        self._queue: "queue.Queue[_QueuedNotification]" = queue.Queue(maxsize=max_queue)
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._idle = threading.Condition()
+        self._in_flight = 0
+        
+        self.stats = {
+            "queued": 0,
+            "sent": 0,
+            "failed": 0,
+            "dropped": 0,
+            "digests": 0,
+            "coalesced": 0
+        }
+    
+    @classmethod
+    def from_env(cls, notifier: PushoverNotifier) -> 'NotificationDispatcher':
+        """Crear dispatcher desde variables de entorno"""
+        return cls(
+            notifier,
+            max_queue=int(os.getenv("NOTIFY_QUEUE_SIZE", "100")),
+            overflow_policy=os.getenv("NOTIFY_OVERFLOW_POLICY", "drop_oldest"),
+            rate_per_minute=float(os.getenv("NOTIFY_RATE_PER_MINUTE", "6")),
+            burst=int(os.getenv("NOTIFY_BURST", "3")),
+            coalesce_window=float(os.getenv("NOTIFY_COALESCE_WINDOW", "2.0")),
+            max_batch=int(os.getenv("NOTIFY_MAX_BATCH", "10"))
+        )
+    
+    def submit(
+        self,
+        message: str,
+        title: str = "CV Agent",
+        priority: int = 0,
+        sound: str = "default",
+        **kwargs
+    ) -> NotificationResult:
+        """
+        Encolar una notificación (no bloquea)
+        
+        Returns:
+            Resultado del encolado (success=False si se descartó)
+        """
+        item = _QueuedNotification(message, title, priority, sound, kwargs, time.monotonic())
+        self._ensure_worker()
+        
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            if self.overflow_policy == "drop_newest":
+                self.stats["dropped"] += 1
+                logger.warning(f"Cola de notificaciones llena, descartada: {title}")
+                return NotificationResult(
+                    success=False,
+                    message="Cola de notificaciones llena, notificación descartada",
+                    timestamp=datetime.now()
+                )
+            
+            # drop_oldest: liberar un hueco descartando la más antigua
+            try:
+                self._queue.get_nowait()
+                self._queue.task_done()
+                self.stats["dropped"] += 1
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self.stats["dropped"] += 1
+                return NotificationResult(
+                    success=False,
+                    message="Cola de notificaciones llena, notificación descartada",
+                    timestamp=datetime.now()
+                )
+        
+        self.stats["queued"] += 1
+        return NotificationResult(
+            success=True,
+            message="Notificación encolada",
+            timestamp=datetime.now()
+        )
+    
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        Esperar a que la cola se vacíe
+        
+        Returns:
+            True si se vació antes del timeout
+        """
+        deadline = time.monotonic() + timeout
+        with self._idle:
+            while self._queue.unfinished_tasks or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(min(remaining, 0.1))
+        return True
+    
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """Enviar lo pendiente y detener el worker"""
+        self.flush(timeout)
+        self._stopping.set()
+        if self._worker is not None:
+            self._worker.join(timeout=1.0)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas del dispatcher"""
+        return {**self.stats, "pending": self._queue.qsize()}
+    
+    def _ensure_worker(self) -> None:
+        """Arrancar el thread de envío la primera vez que se necesita"""
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._stopping.clear()
+                self._worker = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+                self._worker.start()
+    
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            
+            batch = [first]
+            with self._idle:
+                self._in_flight = 1
+            
+            # Agrupar lo que llegue durante la ventana y, si no hay cuota,
+            # seguir agrupando mientras se espera el siguiente token
+            self._collect(batch, time.monotonic() + self.coalesce_window)
+            while not self.bucket.try_acquire():
+                self._collect(batch, time.monotonic() + min(self.bucket.wait_time(), 1.0))
+            
+            try:
+                self._send(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+                with self._idle:
+                    self._in_flight = 0
+                    self._idle.notify_all()
+    
+    def _collect(self, batch: List[_QueuedNotification], deadline: float) -> None:
+        """Añadir al lote lo que llegue antes del deadline (hasta max_batch)"""
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if len(batch) >= self.max_batch:
+                time.sleep(remaining)
+                return
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                return
+    
+    def _send(self, batch: List[_QueuedNotification]) -> None:
+        """Enviar una notificación o un digest de varias"""
+        if len(batch) == 1:
+            item = batch[0]
+            result = self.notifier.send_notification(
+                message=item.message[:self.MAX_MESSAGE_LENGTH],
+                title=item.title[:self.MAX_TITLE_LENGTH],
+                priority=item.priority,
+                sound=item.sound,
+                **item.kwargs
+            )
+        else:
+            result = self.notifier.send_notification(**self._build_digest(batch))
+            self.stats["digests"] += 1
+            self.stats["coalesced"] += len(batch)
+        
+        if result.success:
+            self.stats["sent"] += 1
+        else:
+            self.stats["failed"] += 1
+            logger.warning(f"Fallo en envío de notificación: {result.message}")
+    
+    def _build_digest(self, batch: List[_QueuedNotification]) -> Dict[str, Any]:
+        """Combinar varias notificaciones en un único mensaje"""
+        top = max(batch, key=lambda item: item.priority)
+        lines = []
+        for item in batch:
+            first_line = item.message.strip().splitlines()[0] if item.message.strip() else ""
+            lines.append(f"• {item.title}: {first_line[:120]}")
+        
+        message = "\n".join(lines)
+        if len(message) > self.MAX_MESSAGE_LENGTH:
+            message = message[:self.MAX_MESSAGE_LENGTH - 3] + "..."
+        
+        return {
+            "message": message,
+            "title": f"CV Agent: {len(batch)} notificaciones",
+            "priority": top.priority,
+            "sound": top.sound
+        }
+
 class NotificationManager:
     """Manager para múltiples canales de notificación"""
     
     def __init__(self):
         """Inicializar manager de notificaciones"""
         self.pushover = PushoverNotifier()
-        self.notification_log = []
+        
+        # Envío en background salvo que se desactive explícitamente
+        self.dispatcher = None
+        if os.getenv("NOTIFY_ASYNC", "true").lower() == "true":
+            self.dispatcher = NotificationDispatcher.from_env(self.pushover)
+        self.notification_log = RingLog.from_env(
+            "notification_log",
+            fields=("type", "timestamp", "success", "session_id", "query", "error", "context", "title", "message"),
+            default_capacity=500
+        )
+        # Contadores acumulados (el log solo conserva las últimas entradas)
+        self._counters = {"total": 0, "successful": 0, "types": {}}
     
     def send_query_notification(
         self,
@@ -148,7 +428,7 @@ class NotificationManager:
 ⏰ {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
         """.strip()
         
-        result = self.pushover.send_notification(
+        result = self._dispatch(
             message=message,
             title=title,
             priority=0,
@@ -156,7 +436,7 @@ class NotificationManager:
         )
         
         # Log interno
-        self.notification_log.append({
+        self._record({
             "type": "query",
             "query": user_query,
             "session_id": session_id,
@@ -187,7 +467,7 @@ Contexto: {context or 'N/A'}
 Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
         """.strip()
         
-        result = self.pushover.send_notification(
+        result = self._dispatch(
             message=message,
             title=title,
             priority=1,  # Prioridad alta para errores
@@ -195,7 +475,7 @@ Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
         )
         
         # Log interno
-        self.notification_log.append({
+        self._record({
             "type": "error",
             "error": error_message,
             "context": context,
@@ -224,7 +504,7 @@ Top Query: {stats.get('top_query', 'N/A')}
 Fecha: {datetime.now().strftime('%Y-%m-%d')}
         """.strip()
         
-        result = self.pushover.send_notification(
+        result = self._dispatch(
             message=message,
             title=title,
             priority=0,
@@ -241,7 +521,7 @@ Fecha: {datetime.now().strftime('%Y-%m-%d')}
         **kwargs
     ) -> NotificationResult:
         """Enviar notificación personalizada"""
-        result = self.pushover.send_notification(
+        result = self._dispatch(
             message=message,
             title=title,
             priority=priority,
@@ -249,7 +529,7 @@ Fecha: {datetime.now().strftime('%Y-%m-%d')}
         )
         
         # Log interno
-        self.notification_log.append({
+        self._record({
             "type": "custom",
             "title": title,
             "message": message,
@@ -259,26 +539,45 @@ Fecha: {datetime.now().strftime('%Y-%m-%d')}
         
         return result
     
+    def _dispatch(self, **kwargs) -> NotificationResult:
+        """Encolar en el dispatcher o enviar de forma síncrona si está desactivado"""
+        if self.dispatcher is not None:
+            return self.dispatcher.submit(**kwargs)
+        return self.pushover.send_notification(**kwargs)
+    
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """Enviar notificaciones pendientes y detener el dispatcher"""
+        if self.dispatcher is not None:
+            self.dispatcher.shutdown(timeout)
+        self.notification_log.flush()
+    
+    def _record(self, entry: Dict[str, Any]) -> None:
+        """Registrar una notificación en el log y en los contadores"""
+        self.notification_log.append(entry)
+        self._counters["total"] += 1
+        if entry["success"]:
+            self._counters["successful"] += 1
+        types = self._counters["types"]
+        types[entry["type"]] = types.get(entry["type"], 0) + 1
+    
     def get_notification_stats(self) -> Dict[str, Any]:
         """Obtener estadísticas de notificaciones"""
-        if not self.notification_log:
+        dispatcher_stats = self.dispatcher.get_stats() if self.dispatcher else None
+        
+        if not self._counters["total"]:
             return {
                 "total_notifications": 0,
                 "successful_notifications": 0,
                 "failed_notifications": 0,
                 "success_rate": 0.0,
-                "notification_types": {}
+                "notification_types": {},
+                "dispatcher": dispatcher_stats
             }
         
-        total = len(self.notification_log)
-        successful = sum(1 for log in self.notification_log if log["success"])
+        total = self._counters["total"]
+        successful = self._counters["successful"]
         failed = total - successful
-        
-        # Contar por tipo
-        types_count = {}
-        for log in self.notification_log:
-            notification_type = log.get("type", "unknown")
-            types_count[notification_type] = types_count.get(notification_type, 0) + 1
+        types_count = dict(self._counters["types"])
         
         return {
             "total_notifications": total,
@@ -286,12 +585,14 @@ Fecha: {datetime.now().strftime('%Y-%m-%d')}
             "failed_notifications": failed,
             "success_rate": (successful / total) * 100 if total > 0 else 0.0,
             "notification_types": types_count,
+            "dispatcher": dispatcher_stats,
             "last_notification": self.notification_log[-1]["timestamp"] if self.notification_log else None
         }
     
     def clear_log(self):
         """Limpiar log de notificaciones"""
         self.notification_log.clear()
+        self._counters = {"total": 0, "successful": 0, "types": {}}
         logger.info("Log de notificaciones limpiado")
 
 # Instancia global del manager
@@ -350,6 +651,9 @@ def main():
         print(f"- Tasa de éxito: {stats['success_rate']:.1f}%")
         print(f"- Tipos: {stats['notification_types']}")
         
+        manager.shutdown()
+        print(f"- Dispatcher: {manager.dispatcher.get_stats() if manager.dispatcher else 'síncrono'}")
+    
     except Exception as e:
         logger.error(f"Error en test de notificaciones: {e}")
         raise
@@ -0,0 +1,275 @@
+"""
+Ring Log Tool
+
+Logs en memoria de capacidad fija (buffer circular) con registros compactos
+en tuplas de campos fijos. Las entradas expulsadas pueden volcarse a un log
+append-only en JSON lines o SQLite con rotación, de modo que la memoria
+usada no crece con el uptime del proceso.
+"""
+
+import os
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Sequence, Iterator, Union
+import logging
+from dotenv import load_dotenv
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+class JSONLSpill:
+    """Log append-only en JSON lines con rotación por tamaño"""
+    
+    def __init__(self, file_path: str, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5):
+        """
+        Inicializar spill
+        
+        Args:
+            file_path: Archivo destino
+            max_bytes: Tamaño a partir del cual se rota el archivo
+            backup_count: Número de archivos rotados a conservar (.1, .2, ...)
+        """
+        self.file_path = Path(file_path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+    
+    def write(self, entries: List[Dict[str, Any]]) -> None:
+        """Añadir entradas al log"""
+        lines = "".join(json.dumps(entry, ensure_ascii=False, default=str) + "\n" for entry in entries)
+        with self._lock:
+            if self._should_rotate(len(lines)):
+                self._rotate()
+            with open(self.file_path, "a", encoding="utf-8") as file:
+                file.write(lines)
+    
+    def read(self) -> Iterator[Dict[str, Any]]:
+        """Entradas volcadas, de la más antigua a la más reciente (incluye los archivos rotados)"""
+        paths = [self.file_path.with_name(f"{self.file_path.name}.{i}") for i in range(self.backup_count, 0, -1)]
+        for path in paths + [self.file_path]:
+            try:
+                with open(path, "r", encoding="utf-8") as file:
+                    for line in file:
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            continue
+            except FileNotFoundError:
+                continue
+    
+    def _should_rotate(self, incoming: int) -> bool:
+        try:
+            return self.file_path.stat().st_size + incoming > self.max_bytes
+        except FileNotFoundError:
+            return False
+    
+    def _rotate(self) -> None:
+        """Rotar archivos: log -> log.1 -> log.2 ... (se descarta el más antiguo)"""
+        for i in range(self.backup_count - 1, 0, -1):
+            source = self.file_path.with_name(f"{self.file_path.name}.{i}")
+            if source.exists():
+                os.replace(source, self.file_path.with_name(f"{self.file_path.name}.{i + 1}"))
+        if self.backup_count > 0:
+            os.replace(self.file_path, self.file_path.with_name(f"{self.file_path.name}.1"))
+        else:
+            self.file_path.unlink()
+
+class SQLiteSpill:
+    """Log append-only en SQLite con rotación por número de filas"""
+    
+    def __init__(self, db_path: str, table: str, max_rows: int = 100000):
+        """
+        Inicializar spill
+        
+        Args:
+            db_path: Base de datos SQLite
+            table: Tabla destino (una por log)
+            max_rows: Filas máximas; se eliminan las más antiguas al superarlas
+        """
+        self.db_path = db_path
+        self.table = table
+        self.max_rows = max_rows
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    logged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    entry TEXT NOT NULL
+                )
+            """)
+    
+    def write(self, entries: List[Dict[str, Any]]) -> None:
+        """Añadir entradas al log"""
+        rows = [(json.dumps(entry, ensure_ascii=False, default=str),) for entry in entries]
+        with self._lock, sqlite3.connect(self.db_path) as conn:
+            conn.executemany(f"INSERT INTO {self.table} (entry) VALUES (?)", rows)
+            conn.execute(
+                f"DELETE FROM {self.table} WHERE id <= (SELECT MAX(id) FROM {self.table}) - ?",
+                (self.max_rows,)
+            )
+    
+    def read(self) -> Iterator[Dict[str, Any]]:
+        """Entradas volcadas, de la más antigua a la más reciente"""
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute(f"SELECT entry FROM {self.table} ORDER BY id").fetchall()
+        for (entry,) in rows:
+            try:
+                yield json.loads(entry)
+            except ValueError:
+                continue
+
+class RingLog:
+    """
+    Buffer circular de capacidad fija con registros compactos
+    
+    Cada entrada se guarda como una tupla con los campos declarados (los
+    campos no declarados van a un diccionario opcional al final). Al leer se
+    materializan como diccionarios, por lo que el uso es compatible con las
+    listas de diccionarios que reemplaza (append, len, iteración, [-5:]).
+    """
+    
+    def __init__(self,
+                 fields: Sequence[str],
+                 capacity: int = 1000,
+                 spill: Optional[Union[JSONLSpill, SQLiteSpill]] = None,
+                 spill_batch: int = 50):
+        """
+        Inicializar log
+        
+        Args:
+            fields: Campos de cada registro
+            capacity: Número máximo de entradas en memoria
+            spill: Destino opcional de las entradas expulsadas
+            spill_batch: Entradas expulsadas acumuladas antes de escribir
+        """
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self.spill = spill
+        self.spill_batch = max(1, spill_batch)
+        self.total_appended = 0
+        
+        self._slots: List[Optional[tuple]] = [None] * capacity
+        self._start = 0
+        self._size = 0
+        self._evicted: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_env(cls, name: str, fields: Sequence[str], default_capacity: int = 1000) -> 'RingLog':
+        """
+        Crear log desde variables de entorno
+        
+        Args:
+            name: Nombre del log (prefijo de variables y archivo/tabla de spill)
+            fields: Campos de cada registro
+            default_capacity: Capacidad si no se define {NAME}_CAPACITY
+        """
+        capacity = int(os.getenv(f"{name.upper()}_CAPACITY", str(default_capacity)))
+        spill_type = os.getenv("LOG_SPILL", "none").lower()
+        spill_dir = os.getenv("LOG_SPILL_PATH", "./logs")
+        
+        spill = None
+        if spill_type == "jsonl":
+            spill = JSONLSpill(
+                os.path.join(spill_dir, f"{name}.jsonl"),
+                max_bytes=int(os.getenv("LOG_SPILL_MAX_BYTES", str(10 * 1024 * 1024))),
+                backup_count=int(os.getenv("LOG_SPILL_BACKUPS", "5"))
+            )
+        elif spill_type == "sqlite":
+            spill = SQLiteSpill(
+                os.path.join(spill_dir, "logs.db"),
+                table=name,
+                max_rows=int(os.getenv("LOG_SPILL_MAX_ROWS", "100000"))
+            )
+        
+        return cls(fields, capacity=capacity, spill=spill)
+    
+    def append(self, entry: Dict[str, Any]) -> None:
+        """Añadir una entrada (expulsa la más antigua si está lleno)"""
+        record = self._pack(entry)
+        to_spill = None
+        
+        with self._lock:
+            index = (self._start + self._size) % self.capacity
+            if self._size == self.capacity:
+                if self.spill is not None:
+                    self._evicted.append(self._unpack(self._slots[index]))
+                    if len(self._evicted) >= self.spill_batch:
+                        to_spill, self._evicted = self._evicted, []
+                self._start = (self._start + 1) % self.capacity
+            else:
+                self._size += 1
+            self._slots[index] = record
+            self.total_appended += 1
+        
+        if to_spill:
+            self._write_spill(to_spill)
+    
+    def flush(self) -> None:
+        """Escribir las entradas expulsadas pendientes"""
+        with self._lock:
+            to_spill, self._evicted = self._evicted, []
+        if to_spill:
+            self._write_spill(to_spill)
+    
+    def clear(self) -> None:
+        """Vaciar el buffer (las entradas descartadas no se vuelcan)"""
+        with self._lock:
+            self._slots = [None] * self.capacity
+            self._start = 0
+            self._size = 0
+    
+    def to_list(self) -> List[Dict[str, Any]]:
+        """Entradas en orden cronológico"""
+        with self._lock:
+            records = [self._slots[(self._start + i) % self.capacity] for i in range(self._size)]
+        return [self._unpack(record) for record in records]
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def __bool__(self) -> bool:
+        return self._size > 0
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.to_list())
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.to_list()[index]
+        with self._lock:
+            if index < 0:
+                index += self._size
+            if not 0 <= index < self._size:
+                raise IndexError("RingLog index out of range")
+            record = self._slots[(self._start + index) % self.capacity]
+        return self._unpack(record)
+    
+    def _pack(self, entry: Dict[str, Any]) -> tuple:
+        """Convertir una entrada a tupla compacta"""
+        extra = {k: v for k, v in entry.items() if k not in self.fields}
+        return tuple(entry.get(field) for field in self.fields) + ((extra,) if extra else ())
+    
+    def _unpack(self, record: tuple) -> Dict[str, Any]:
+        """Materializar una tupla como diccionario"""
+        entry = {field: value for field, value in zip(self.fields, record) if value is not None}
+        if len(record) > len(self.fields):
+            entry.update(record[-1])
+        return entry
+    
+    def _write_spill(self, entries: List[Dict[str, Any]]) -> None:
+        try:
+            self.spill.write(entries)
+        except Exception as e:
+            logger.warning(f"Error volcando {len(entries)} entradas del log: {e}")
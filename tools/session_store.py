@@ -0,0 +1,232 @@
+"""
+Session Store Tool
+
+Almacén del estado de conversación por session_id (turnos recientes,
+resumen acumulado y última recuperación RAG). Implementaciones: LRU en
+memoria del proceso y archivo SQLite compartido por los workers de un host.
+Las sesiones caducan tras SESSION_TTL segundos sin actividad y, al superar
+SESSION_MAX_SESSIONS, se descartan las usadas hace más tiempo.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+import logging
+from dotenv import load_dotenv
+
+from tools.metrics import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+class SessionStore:
+    """Interfaz del almacén de sesiones (estado JSON serializable)"""
+    
+    def __init__(self, max_sessions: int = 1000, ttl: float = 1800.0):
+        """
+        Inicializar almacén
+        
+        Args:
+            max_sessions: Máximo de sesiones guardadas (se descartan las menos recientes)
+            ttl: Segundos sin actividad tras los que una sesión caduca (0 = sin caducidad)
+        """
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.counts = {"hits": 0, "misses": 0, "evicted": 0, "expired": 0}
+        self._lock = threading.Lock()
+    
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Estado de la sesión (None si no existe o caducó)"""
+        raise NotImplementedError
+    
+    def set(self, session_id: str, state: Dict[str, Any]) -> None:
+        """Guardar el estado de la sesión (renueva su caducidad)"""
+        raise NotImplementedError
+    
+    def delete(self, session_id: str) -> None:
+        """Eliminar la sesión"""
+        raise NotImplementedError
+    
+    def __len__(self) -> int:
+        raise NotImplementedError
+    
+    def _expired(self, updated_at: float) -> bool:
+        return self.ttl > 0 and time.time() - updated_at > self.ttl
+    
+    def _count(self, event: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counts[event] += amount
+        if event in ("evicted", "expired") and amount:
+            metrics.inc(metrics.session_memory, amount, event=event)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas del almacén"""
+        with self._lock:
+            counts = dict(self.counts)
+        return {
+            "backend": type(self).__name__,
+            "sessions": len(self),
+            "max_sessions": self.max_sessions,
+            "ttl": self.ttl,
+            **counts
+        }
+
+class InMemorySessionStore(SessionStore):
+    """Sesiones en memoria del proceso con política LRU"""
+    
+    def __init__(self, max_sessions: int = 1000, ttl: float = 1800.0):
+        super().__init__(max_sessions, ttl)
+        self._data: 'OrderedDict[str, Tuple[str, float]]' = OrderedDict()
+    
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._data.get(session_id)
+            if entry is not None and self._expired(entry[1]):
+                del self._data[session_id]
+                expired, entry = True, None
+            else:
+                expired = False
+                if entry is not None:
+                    self._data.move_to_end(session_id)
+        if expired:
+            self._count("expired")
+        self._count("hits" if entry is not None else "misses")
+        # Copia independiente: el llamador puede modificar el estado sin bloquear
+        return json.loads(entry[0]) if entry is not None else None
+    
+    def set(self, session_id: str, state: Dict[str, Any]) -> None:
+        value = json.dumps(state, ensure_ascii=False, default=str)
+        with self._lock:
+            self._data[session_id] = (value, time.time())
+            self._data.move_to_end(session_id)
+            evicted = 0
+            while self.max_sessions > 0 and len(self._data) > self.max_sessions:
+                self._data.popitem(last=False)
+                evicted += 1
+        self._count("evicted", evicted)
+    
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._data.pop(session_id, None)
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+class SQLiteSessionStore(SessionStore):
+    """Sesiones en archivo SQLite compartido por los workers de un host"""
+    
+    def __init__(self, db_path: str, max_sessions: int = 1000, ttl: float = 1800.0):
+        """
+        Inicializar almacén
+        
+        Args:
+            db_path: Archivo SQLite
+            max_sessions: Máximo de sesiones guardadas (se descartan las menos recientes)
+            ttl: Segundos sin actividad tras los que una sesión caduca (0 = sin caducidad)
+        """
+        super().__init__(max_sessions, ttl)
+        self.db_path = db_path
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+        
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions(updated_at)")
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Conexión por thread (sqlite3 no comparte conexiones entre threads)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            self._local.conn = conn
+        return conn
+    
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            "SELECT state, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is not None and self._expired(row[1]):
+            self.delete(session_id)
+            self._count("expired")
+            row = None
+        self._count("hits" if row is not None else "misses")
+        return json.loads(row[0]) if row is not None else None
+    
+    def set(self, session_id: str, state: Dict[str, Any]) -> None:
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, state, updated_at) VALUES (?, ?, ?)",
+            (session_id, json.dumps(state, ensure_ascii=False, default=str), time.time())
+        )
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % 100 == 1
+        if prune:
+            self._prune(conn)
+    
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        """Borrar sesiones caducadas y las menos recientes por encima del máximo"""
+        if self.ttl > 0:
+            expired = conn.execute(
+                "DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl,)
+            ).rowcount
+            self._count("expired", max(expired, 0))
+        if self.max_sessions > 0:
+            evicted = conn.execute(
+                """
+                DELETE FROM sessions WHERE session_id IN (
+                    SELECT session_id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_sessions,)
+            ).rowcount
+            self._count("evicted", max(evicted, 0))
+    
+    def delete(self, session_id: str) -> None:
+        self._connection().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+    
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+def create_session_store() -> SessionStore:
+    """Crear almacén según SESSION_STORE (memory, sqlite)"""
+    store_type = os.getenv("SESSION_STORE", "memory").lower()
+    max_sessions = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+    ttl = float(os.getenv("SESSION_TTL", "1800"))
+    
+    if store_type == "sqlite":
+        return SQLiteSessionStore(
+            os.getenv("SESSION_SQLITE_PATH", "./storage/sqlite/sessions.db"), max_sessions, ttl
+        )
+    if store_type != "memory":
+        logger.warning(f"SESSION_STORE desconocido '{store_type}', usando memoria")
+    return InMemorySessionStore(max_sessions, ttl)
+
+def main():
+    """Función principal para testing"""
+    store = InMemorySessionStore(max_sessions=2, ttl=60)
+    for session_id in ("a", "b"):
+        store.set(session_id, {"turns": [{"query": f"hola {session_id}"}]})
+    store.get("a")
+    store.set("c", {"turns": []})
+    print(f"Sesiones tras superar el máximo: a={store.get('a') is not None}, b={store.get('b') is not None}")
+    print(f"Estadísticas: {store.get_stats()}")
+
+if __name__ == "__main__":
+    main()
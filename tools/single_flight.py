@@ -0,0 +1,137 @@
+"""
+Single Flight Tool
+
+Deduplicación de ejecuciones concurrentes idénticas: mientras una llamada
+con una clave está en curso, las llamadas con la misma clave esperan su
+resultado en lugar de repetir el trabajo.
+"""
+
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Any, Callable, Optional, Tuple
+import logging
+from dotenv import load_dotenv
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+@dataclass
+class _Call:
+    """Ejecución en curso para una clave"""
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Any = None
+    error: Optional[BaseException] = None
+    waiters: int = 0
+
+class SingleFlight:
+    """Grupo de ejecuciones deduplicadas por clave (thread-safe)"""
+    
+    def __init__(self, name: str = "default", wait_timeout: Optional[float] = None):
+        """
+        Inicializar grupo
+        
+        Args:
+            name: Nombre del grupo (para logs)
+            wait_timeout: Segundos máximos esperando a otra ejecución; al
+                superarse la llamada se ejecuta por su cuenta (None = sin límite)
+        """
+        self.name = name
+        self.wait_timeout = wait_timeout
+        self.executions = 0
+        self.coalesced = 0
+        self.wait_timeouts = 0
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_env(cls, name: str) -> 'SingleFlight':
+        """Crear grupo desde variables de entorno"""
+        timeout = float(os.getenv("SINGLE_FLIGHT_TIMEOUT", "60"))
+        return cls(name, wait_timeout=timeout if timeout > 0 else None)
+    
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Ejecutar fn una sola vez para todas las llamadas concurrentes con la misma clave
+        
+        Args:
+            key: Clave de deduplicación
+            fn: Función a ejecutar
+        
+        Returns:
+            (resultado, compartido) donde compartido indica que el resultado
+            proviene de la ejecución de otra llamada. Las excepciones de la
+            ejecución se propagan a todas las llamadas que esperaban.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+            else:
+                call.waiters += 1
+        
+        if not leader:
+            if call.done.wait(self.wait_timeout):
+                with self._lock:
+                    self.coalesced += 1
+                if call.error is not None:
+                    raise call.error
+                return call.result, True
+            
+            logger.warning(f"Timeout esperando ejecución en curso ({self.name}), ejecutando por separado")
+            with self._lock:
+                self.wait_timeouts += 1
+            return fn(), False
+        
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+    
+    def in_flight(self) -> int:
+        """Número de claves en ejecución"""
+        with self._lock:
+            return len(self._calls)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas del grupo"""
+        with self._lock:
+            total = self.executions + self.coalesced
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "wait_timeouts": self.wait_timeouts,
+                "in_flight": len(self._calls),
+                "coalesced_rate": (self.coalesced / total) * 100 if total else 0.0
+            }
+
+def main():
+    """Función principal para testing"""
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    
+    group = SingleFlight("test")
+    
+    def slow_square():
+        time.sleep(0.2)
+        return 7 * 7
+    
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        results = list(pool.map(lambda _: group.do("square", slow_square), range(5)))
+    
+    print(f"Resultados: {results}")
+    print(f"Estadísticas: {group.get_stats()}")
+
+if __name__ == "__main__":
+    main()
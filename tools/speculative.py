@@ -0,0 +1,165 @@
+"""
+Speculative Retrieval Tool
+
+Búsquedas especulativas: la búsqueda RAG (embedding incluido) y la consulta
+FAQ se lanzan en el mismo momento que la clasificación LLM de la consulta,
+de modo que su latencia queda oculta tras la del LLM. Si la estrategia
+elegida usa esas búsquedas se reutilizan sus resultados; si no, se descartan.
+"""
+
+import os
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Any, List, Callable, Optional, Set, Tuple
+import logging
+from dotenv import load_dotenv
+
+from tools.metrics import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+OUTCOMES = ("used", "wasted", "failed")
+
+class Speculation:
+    """Búsquedas especulativas de una consulta"""
+    
+    def __init__(self, retrieval: 'SpeculativeRetrieval'):
+        self._retrieval = retrieval
+        self._lookups: Dict[str, Tuple[Future, int]] = {}
+        self._used: Set[str] = set()
+        self._failed: Set[str] = set()
+    
+    def launch(self, name: str, size: int, fn: Callable[..., List[Any]], *args, **kwargs) -> None:
+        """
+        Lanzar una búsqueda en segundo plano (no hace nada si el modo está desactivado)
+        
+        Args:
+            name: Nombre de la búsqueda ("rag", "faq")
+            size: Número de resultados pedidos; take() solo reutiliza la
+                búsqueda para tamaños menores o iguales
+            fn: Función de búsqueda, que debe devolver una lista ordenada por relevancia
+        """
+        if not self._retrieval.enabled or name in self._lookups:
+            return
+        self._lookups[name] = (self._retrieval.submit(fn, *args, **kwargs), size)
+    
+    def take(self, name: str, size: int) -> Optional[List[Any]]:
+        """
+        Resultados especulativos de una búsqueda si cubren lo pedido
+        
+        Returns:
+            Los primeros `size` resultados, o None si la búsqueda no se lanzó,
+            se lanzó con menos resultados, falló o todavía no había empezado
+            (en ese caso se cancela); el llamador busca entonces por su cuenta.
+        """
+        entry = self._lookups.get(name)
+        if entry is None:
+            return None
+        future, launched = entry
+        if size > launched:
+            return None
+        
+        # Si sigue en cola (pool saturado) es más rápido buscar directamente
+        if future.cancel():
+            return None
+        try:
+            results = future.result()
+        except Exception as e:
+            logger.warning(f"Búsqueda especulativa '{name}' fallida: {e}")
+            self._failed.add(name)
+            return None
+        
+        self._used.add(name)
+        return list(results[:size])
+    
+    def finish(self) -> Dict[str, str]:
+        """Descartar las búsquedas no usadas y registrar el resultado de cada una"""
+        outcomes = {}
+        for name, (future, _) in self._lookups.items():
+            if name in self._used:
+                outcomes[name] = "used"
+            elif name in self._failed:
+                outcomes[name] = "failed"
+            else:
+                future.cancel()
+                outcomes[name] = "wasted"
+        self._lookups.clear()
+        self._retrieval.record(outcomes)
+        return outcomes
+    
+    def __enter__(self) -> 'Speculation':
+        return self
+    
+    def __exit__(self, *exc) -> None:
+        self.finish()
+
+class SpeculativeRetrieval:
+    """Pool compartido de búsquedas especulativas (thread-safe)"""
+    
+    def __init__(self, name: str = "default", enabled: bool = True, max_workers: int = 4):
+        """
+        Inicializar pool
+        
+        Args:
+            name: Nombre del pool (para logs y nombres de thread)
+            enabled: Si False, begin() devuelve especulaciones vacías
+            max_workers: Threads dedicados a búsquedas especulativas
+        """
+        self.name = name
+        self.enabled = enabled
+        self.max_workers = max_workers
+        self.counts = {outcome: 0 for outcome in OUTCOMES}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_env(cls, name: str) -> 'SpeculativeRetrieval':
+        """Crear pool desde variables de entorno"""
+        return cls(
+            name,
+            enabled=os.getenv("SPECULATIVE_RETRIEVAL", "true").lower() == "true",
+            max_workers=int(os.getenv("SPECULATIVE_WORKERS", "4"))
+        )
+    
+    def begin(self) -> Speculation:
+        """Nueva especulación para una consulta (usar como context manager)"""
+        return Speculation(self)
+    
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Ejecutar fn en el pool conservando el contexto (traza en curso)"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix=f"speculative-{self.name}"
+                )
+        return self._executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+    
+    def record(self, outcomes: Dict[str, str]) -> None:
+        """Registrar el resultado de las búsquedas de una especulación"""
+        with self._lock:
+            for outcome in outcomes.values():
+                self.counts[outcome] += 1
+        for lookup, outcome in outcomes.items():
+            metrics.inc(metrics.speculative_lookups, lookup=lookup, outcome=outcome)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas del pool"""
+        with self._lock:
+            total = sum(self.counts.values())
+            return {
+                "enabled": self.enabled,
+                "launched": total,
+                **self.counts,
+                "used_rate": (self.counts["used"] / total) * 100 if total else 0.0
+            }
+    
+    def shutdown(self) -> None:
+        """Detener el pool"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
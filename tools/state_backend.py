@@ -0,0 +1,495 @@
+"""
+State Backend Tool
+
+Backend de estado compartido entre workers/réplicas para cachés, rate
+limiters y agregación de métricas. Implementaciones intercambiables:
+memoria del proceso, archivo SQLite (varios workers en el mismo host) y
+protocolo Redis (varias réplicas).
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+import logging
+from dotenv import load_dotenv
+
+try:
+    import redis
+except ImportError:
+    # redis es opcional, solo necesario con STATE_BACKEND=redis
+    redis = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+class StateBackend:
+    """Interfaz de almacenamiento clave-valor con TTL"""
+    
+    def get(self, key: str) -> Optional[str]:
+        """Obtener valor (None si no existe o expiró)"""
+        raise NotImplementedError
+    
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        """Guardar valor con TTL opcional en segundos"""
+        raise NotImplementedError
+    
+    def delete(self, key: str) -> None:
+        """Eliminar clave"""
+        raise NotImplementedError
+    
+    def incr(self, key: str, amount: float = 1.0) -> float:
+        """Incrementar atómicamente un contador numérico"""
+        raise NotImplementedError
+    
+    def keys(self, prefix: str) -> List[str]:
+        """Claves vigentes con un prefijo"""
+        raise NotImplementedError
+    
+    def take_token(self, key: str, rate: float, capacity: float) -> Tuple[bool, float]:
+        """
+        Consumir atómicamente un token de un token bucket compartido
+        
+        Args:
+            key: Clave del bucket
+            rate: Tokens repuestos por segundo
+            capacity: Tokens máximos
+        
+        Returns:
+            (consumido, segundos hasta el próximo token)
+        """
+        raise NotImplementedError
+    
+    def get_json(self, key: str) -> Optional[Any]:
+        """Obtener un valor JSON"""
+        value = self.get(key)
+        if value is None:
+            return None
+        try:
+            return json.loads(value)
+        except ValueError:
+            logger.warning(f"Valor no JSON en clave {key}")
+            return None
+    
+    def set_json(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Guardar un valor como JSON"""
+        self.set(key, json.dumps(value, ensure_ascii=False, default=str), ttl)
+    
+    @staticmethod
+    def _refill(tokens: float, updated: float, now: float, rate: float, capacity: float) -> Tuple[bool, float, float]:
+        """Lógica común del token bucket: (consumido, tokens restantes, espera)"""
+        tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+        if tokens >= 1:
+            return True, tokens - 1, 0.0
+        wait = (1 - tokens) / rate if rate > 0 else float("inf")
+        return False, tokens, wait
+
+class InMemoryBackend(StateBackend):
+    """Backend en memoria del proceso (no compartido), acotado con política LRU"""
+    
+    def __init__(self, max_entries: int = 10000, sweep_interval: float = 60.0):
+        """
+        Inicializar backend
+        
+        Args:
+            max_entries: Máximo de claves; al superarlo se descartan las usadas
+                hace más tiempo (0 = sin límite)
+            sweep_interval: Segundos mínimos entre barridos de claves caducadas
+        """
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self.evicted = 0
+        self._data: 'OrderedDict[str, Tuple[str, Optional[float]]]' = OrderedDict()
+        self._last_sweep = time.time()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        with self._lock:
+            self._data[key] = (value, now + ttl if ttl else None)
+            self._data.move_to_end(key)
+            self._evict(now)
+    
+    def _evict(self, now: float) -> None:
+        """Barrer las claves caducadas (periódicamente) y aplicar el límite LRU"""
+        if now - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = now
+            for key in [key for key, (_, expires_at) in self._data.items()
+                        if expires_at is not None and expires_at <= now]:
+                del self._data[key]
+        while self.max_entries > 0 and len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evicted += 1
+    
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def incr(self, key: str, amount: float = 1.0) -> float:
+        with self._lock:
+            value, expires_at = self._data.get(key, ("0", None))
+            new_value = float(value) + amount
+            self._data[key] = (repr(new_value), expires_at)
+            self._data.move_to_end(key)
+            self._evict(time.time())
+            return new_value
+    
+    def keys(self, prefix: str) -> List[str]:
+        now = time.time()
+        with self._lock:
+            return [
+                key for key, (_, expires_at) in self._data.items()
+                if key.startswith(prefix) and (expires_at is None or expires_at > now)
+            ]
+    
+    def take_token(self, key: str, rate: float, capacity: float) -> Tuple[bool, float]:
+        now = time.time()
+        with self._lock:
+            value, _ = self._data.get(key, (None, None))
+            tokens, updated = json.loads(value) if value else (capacity, now)
+            taken, tokens, wait = self._refill(tokens, updated, now, rate, capacity)
+            self._data[key] = (json.dumps([tokens, now]), None)
+            self._data.move_to_end(key)
+            self._evict(now)
+        return taken, wait
+
+class SQLiteBackend(StateBackend):
+    """Backend en archivo SQLite compartido por los workers de un host"""
+    
+    def __init__(self, db_path: str, sweep_interval: float = 60.0):
+        """
+        Inicializar backend
+        
+        Args:
+            db_path: Archivo SQLite compartido
+            sweep_interval: Segundos mínimos entre borrados de filas caducadas
+        """
+        self.db_path = db_path
+        self.sweep_interval = sweep_interval
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._last_sweep = time.time()
+        self._sweep_lock = threading.Lock()
+        
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS shared_state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL
+            )
+        """)
+        conn.commit()
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Conexión por thread (sqlite3 no comparte conexiones entre threads)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            self._local.conn = conn
+        return conn
+    
+    def get(self, key: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT value, expires_at FROM shared_state WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] <= time.time():
+            self.delete(key)
+            return None
+        return row[0]
+    
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, now + ttl if ttl else None)
+        )
+        with self._sweep_lock:
+            sweep = now - self._last_sweep >= self.sweep_interval
+            if sweep:
+                self._last_sweep = now
+        if sweep:
+            # Las filas caducadas solo se borraban al volver a leerlas
+            conn.execute("DELETE FROM shared_state WHERE expires_at IS NOT NULL AND expires_at < ?", (now,))
+    
+    def delete(self, key: str) -> None:
+        self._connection().execute("DELETE FROM shared_state WHERE key = ?", (key,))
+    
+    def incr(self, key: str, amount: float = 1.0) -> float:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM shared_state WHERE key = ?", (key,)).fetchone()
+            new_value = float(row[0] if row else 0) + amount
+            conn.execute(
+                "INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, NULL)",
+                (key, repr(new_value))
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return new_value
+    
+    def keys(self, prefix: str) -> List[str]:
+        rows = self._connection().execute(
+            """
+            SELECT key FROM shared_state
+            WHERE substr(key, 1, ?) = ? AND (expires_at IS NULL OR expires_at > ?)
+            """,
+            (len(prefix), prefix, time.time())
+        ).fetchall()
+        return [row[0] for row in rows]
+    
+    def take_token(self, key: str, rate: float, capacity: float) -> Tuple[bool, float]:
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM shared_state WHERE key = ?", (key,)).fetchone()
+            tokens, updated = json.loads(row[0]) if row else (capacity, now)
+            taken, tokens, wait = self._refill(tokens, updated, now, rate, capacity)
+            conn.execute(
+                "INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, NULL)",
+                (key, json.dumps([tokens, now]))
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return taken, wait
+
+class RedisBackend(StateBackend):
+    """Backend sobre protocolo Redis (Redis, Valkey, KeyDB o fakeredis en tests)"""
+    
+    def __init__(self, url: Optional[str] = None, client: Optional[Any] = None, prefix: str = "agente-cv:"):
+        """
+        Inicializar backend
+        
+        Args:
+            url: URL de conexión (REDIS_URL)
+            client: Cliente ya creado (por ejemplo fakeredis.FakeRedis)
+            prefix: Prefijo de todas las claves
+        """
+        if client is None:
+            if redis is None:
+                raise ImportError("redis package is required for STATE_BACKEND=redis")
+            client = redis.Redis.from_url(url or "redis://localhost:6379/0", decode_responses=True)
+        self.client = client
+        self.prefix = prefix
+    
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+    
+    @staticmethod
+    def _decode(value: Any) -> Optional[str]:
+        if isinstance(value, bytes):
+            return value.decode("utf-8")
+        return value
+    
+    def get(self, key: str) -> Optional[str]:
+        return self._decode(self.client.get(self._key(key)))
+    
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        if ttl:
+            self.client.set(self._key(key), value, px=int(ttl * 1000))
+        else:
+            self.client.set(self._key(key), value)
+    
+    def delete(self, key: str) -> None:
+        self.client.delete(self._key(key))
+    
+    def incr(self, key: str, amount: float = 1.0) -> float:
+        return float(self.client.incrbyfloat(self._key(key), amount))
+    
+    def keys(self, prefix: str) -> List[str]:
+        offset = len(self.prefix)
+        return [
+            self._decode(key)[offset:]
+            for key in self.client.scan_iter(match=self._key(prefix) + "*")
+        ]
+    
+    def take_token(self, key: str, rate: float, capacity: float) -> Tuple[bool, float]:
+        redis_key = self._key(key)
+        result: Dict[str, Any] = {}
+        
+        def update(pipe):
+            now = time.time()
+            value = self._decode(pipe.get(redis_key))
+            tokens, updated = json.loads(value) if value else (capacity, now)
+            taken, tokens, wait = self._refill(tokens, updated, now, rate, capacity)
+            pipe.multi()
+            pipe.set(redis_key, json.dumps([tokens, now]))
+            result["taken"], result["wait"] = taken, wait
+        
+        # Transacción optimista (WATCH/MULTI), se reintenta si otra réplica escribe
+        self.client.transaction(update, redis_key)
+        return result["taken"], result["wait"]
+
+class SharedCache:
+    """Caché con espacio de nombres y TTL sobre el backend de estado"""
+    
+    def __init__(self, backend: StateBackend, namespace: str, ttl: Optional[float] = None):
+        """
+        Inicializar caché
+        
+        Args:
+            backend: Backend de estado
+            namespace: Prefijo de las claves
+            ttl: Tiempo de vida por defecto en segundos (0 deshabilita la caché)
+        """
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self.enabled = ttl is None or ttl > 0
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def query_key(query: str, *parts: Any) -> str:
+        """Clave para una consulta normalizada (minúsculas, espacios compactados)"""
+        return SharedCache.make_key(" ".join(query.lower().split()), *parts)
+    
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Clave estable a partir de varias partes (hash SHA-1)"""
+        raw = "\x1f".join(str(part) for part in parts)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Obtener valor cacheado"""
+        if not self.enabled:
+            return None
+        try:
+            value = self.backend.get_json(f"{self.namespace}:{key}")
+        except Exception as e:
+            logger.warning(f"Error leyendo caché {self.namespace}: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+    
+    def contains(self, key: str) -> bool:
+        """Comprobar si hay un valor vigente (no cuenta como acierto ni fallo)"""
+        if not self.enabled:
+            return False
+        try:
+            return self.backend.get(f"{self.namespace}:{key}") is not None
+        except Exception:
+            return False
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Guardar valor (los errores del backend no interrumpen el flujo)"""
+        if not self.enabled:
+            return
+        try:
+            self.backend.set_json(f"{self.namespace}:{key}", value, ttl or self.ttl)
+        except Exception as e:
+            logger.warning(f"Error escribiendo caché {self.namespace}: {e}")
+    
+    def delete(self, key: str) -> None:
+        """Eliminar valor (los errores del backend no interrumpen el flujo)"""
+        if not self.enabled:
+            return
+        try:
+            self.backend.delete(f"{self.namespace}:{key}")
+        except Exception as e:
+            logger.warning(f"Error borrando caché {self.namespace}: {e}")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas de aciertos de este proceso"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) * 100 if total else 0.0
+        }
+
+class TokenBucket:
+    """Rate limiter token bucket sobre el backend de estado (compartido entre réplicas)"""
+    
+    def __init__(self, rate: float, capacity: float,
+                 backend: Optional[StateBackend] = None, key: str = "ratelimit:default"):
+        """
+        Inicializar bucket
+        
+        Args:
+            rate: Tokens repuestos por segundo
+            capacity: Máximo de tokens acumulables (ráfaga)
+            backend: Backend de estado (por defecto el global)
+            key: Clave del bucket en el backend
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.backend = backend or get_state_backend()
+        self.key = key
+        self._wait = 0.0
+    
+    def try_acquire(self) -> bool:
+        """Consumir un token si hay disponible"""
+        taken, self._wait = self.backend.take_token(self.key, self.rate, self.capacity)
+        return taken
+    
+    def wait_time(self) -> float:
+        """Segundos estimados hasta el próximo token (según el último intento)"""
+        return self._wait
+
+def create_state_backend() -> StateBackend:
+    """Crear backend según STATE_BACKEND (memory, sqlite, redis)"""
+    backend_type = os.getenv("STATE_BACKEND", "memory").lower()
+    
+    sweep_interval = float(os.getenv("STATE_SWEEP_INTERVAL", "60"))
+    
+    if backend_type == "sqlite":
+        return SQLiteBackend(os.getenv("STATE_SQLITE_PATH", "./storage/sqlite/state.db"), sweep_interval)
+    if backend_type == "redis":
+        return RedisBackend(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    if backend_type != "memory":
+        logger.warning(f"STATE_BACKEND desconocido '{backend_type}', usando memoria")
+    return InMemoryBackend(int(os.getenv("STATE_MEMORY_MAX_ENTRIES", "10000")), sweep_interval)
+
+_state_backend: Optional[StateBackend] = None
+_state_backend_lock = threading.Lock()
+
+def get_state_backend() -> StateBackend:
+    """Obtener el backend global (creado en el primer uso)"""
+    global _state_backend
+    if _state_backend is None:
+        with _state_backend_lock:
+            if _state_backend is None:
+                _state_backend = create_state_backend()
+    return _state_backend
+
+def set_state_backend(backend: StateBackend) -> None:
+    """Reemplazar el backend global (por ejemplo, con fakeredis en tests)"""
+    global _state_backend
+    _state_backend = backend
+
+def is_shared_backend() -> bool:
+    """Indica si el backend global es compartido entre procesos"""
+    return not isinstance(get_state_backend(), InMemoryBackend)
@@ -0,0 +1,477 @@
+"""
+Tracing Tool
+
+Capa ligera de trazas por request: spans anidados (context manager y
+decorador) que registran duración, tokens y aciertos de caché por etapa
+(classify, retrieve, generate, evaluate, notify) y se exportan a un
+archivo JSON lines local (con rotación por tamaño) o a un colector
+OTLP/HTTP local. Los spans que cierran después de su raíz se exportan
+sueltos y las trazas cuya raíz no llega a cerrar se vuelcan por antigüedad.
+"""
+
+import os
+import json
+import time
+import queue
+import secrets
+import threading
+import functools
+import inspect
+import contextvars
+import urllib.request
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Callable
+import logging
+from dotenv import load_dotenv
+from dataclasses import dataclass, field
+from contextlib import contextmanager
+
+from tools.ring_log import JSONLSpill
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+@dataclass
+class Span:
+    """Span de una etapa dentro de una traza"""
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    start_time: float = field(default_factory=time.time)
+    end_time: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status: str = "ok"
+    error: Optional[str] = None
+    
+    def __post_init__(self):
+        self._start_perf = time.perf_counter()
+        self.duration = 0.0
+    
+    def set_attribute(self, key: str, value: Any) -> None:
+        """Registrar un atributo del span"""
+        self.attributes[key] = value
+    
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        """Registrar varios atributos (se ignoran los valores None)"""
+        for key, value in attributes.items():
+            if value is not None:
+                self.attributes[key] = value
+    
+    def add_tokens(self, tokens: Optional[int], prompt_tokens: Optional[int] = None) -> None:
+        """Acumular tokens consumidos en esta etapa"""
+        if tokens:
+            self.attributes["tokens"] = self.attributes.get("tokens", 0) + tokens
+        if prompt_tokens:
+            self.attributes["prompt_tokens"] = self.attributes.get("prompt_tokens", 0) + prompt_tokens
+    
+    def record_cache(self, hit: bool) -> None:
+        """Registrar acierto/fallo de caché"""
+        key = "cache_hits" if hit else "cache_misses"
+        self.attributes[key] = self.attributes.get(key, 0) + 1
+    
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        """Cerrar el span"""
+        self.duration = time.perf_counter() - self._start_perf
+        self.end_time = self.start_time + self.duration
+        if error is not None:
+            self.status = "error"
+            self.error = f"{type(error).__name__}: {error}"
+    
+    @property
+    def is_root(self) -> bool:
+        """Indica si es el span raíz de la traza"""
+        return self.parent_id is None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convertir a diccionario"""
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+class JSONLinesExporter:
+    """Exportador de spans a un archivo JSON lines local con rotación por tamaño"""
+    
+    def __init__(self, file_path: str, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5):
+        """
+        Inicializar exportador
+        
+        Args:
+            file_path: Archivo destino
+            max_bytes: Tamaño a partir del cual se rota el archivo
+            backup_count: Número de archivos rotados a conservar (.1, .2, ...)
+        """
+        self.file_path = file_path
+        self._spill = JSONLSpill(file_path, max_bytes=max_bytes, backup_count=backup_count)
+    
+    def export(self, spans: List[Span]) -> None:
+        """Escribir spans (una línea JSON por span)"""
+        self._spill.write([span.to_dict() for span in spans])
+    
+    def shutdown(self) -> None:
+        """Nada que liberar"""
+
+class OTLPHttpExporter:
+    """Exportador OTLP/HTTP (JSON) hacia un colector local, en background"""
+    
+    def __init__(self, endpoint: str, service_name: str = "agente-cv", timeout: float = 2.0):
+        """Inicializar exportador"""
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+        self._queue: "queue.Queue[Optional[List[Span]]]" = queue.Queue(maxsize=1000)
+        self._worker = threading.Thread(target=self._run, name="otlp-exporter", daemon=True)
+        self._worker.start()
+    
+    def export(self, spans: List[Span]) -> None:
+        """Encolar spans sin bloquear el request"""
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            logger.warning("Cola OTLP llena, spans descartados")
+    
+    def shutdown(self) -> None:
+        """Detener el worker"""
+        self._queue.put(None)
+        self._worker.join(timeout=self.timeout)
+    
+    def _run(self) -> None:
+        while True:
+            spans = self._queue.get()
+            if spans is None:
+                return
+            try:
+                self._post(spans)
+            except Exception as e:
+                logger.warning(f"Error exportando spans OTLP: {e}")
+    
+    def _post(self, spans: List[Span]) -> None:
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "agente-cv.tracing"},
+                    "spans": [self._to_otlp(span) for span in spans]
+                }]
+            }]
+        }
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(payload, default=str).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+    
+    def _to_otlp(self, span: Span) -> Dict[str, Any]:
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(int(span.start_time * 1e9)),
+            "endTimeUnixNano": str(int((span.end_time or span.start_time) * 1e9)),
+            "attributes": [_otlp_attribute(k, v) for k, v in span.attributes.items()],
+            "status": {"code": 2, "message": span.error} if span.status == "error" else {"code": 1}
+        }
+        if span.parent_id:
+            otlp_span["parentSpanId"] = span.parent_id
+        return otlp_span
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    """Convertir un atributo al formato OTLP JSON"""
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+class Tracer:
+    """Tracer con spans anidados por contexto (threads y asyncio)"""
+    
+    def __init__(self, exporter: Optional[Any] = None, enabled: bool = True,
+                 pending_ttl: float = 300.0, max_closed: int = 10000):
+        """
+        Inicializar tracer
+        
+        Args:
+            exporter: Exportador de spans (JSONLinesExporter, OTLPHttpExporter)
+            enabled: Si se registran spans
+            pending_ttl: Segundos tras los que se vuelca una traza cuya raíz no ha cerrado
+            max_closed: Trazas cerradas recordadas para exportar spans tardíos
+        """
+        self.exporter = exporter
+        self.enabled = enabled
+        self.pending_ttl = pending_ttl
+        self.max_closed = max_closed
+        self._listeners: List[Callable[[Span], None]] = []
+        self._pending: Dict[str, List[Span]] = {}
+        self._pending_since: Dict[str, float] = {}
+        self._closed: 'OrderedDict[str, None]' = OrderedDict()
+        self._last_sweep = time.monotonic()
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_env(cls) -> 'Tracer':
+        """Crear tracer desde variables de entorno"""
+        enabled = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+        exporter_name = os.getenv("TRACING_EXPORTER", "jsonl").lower()
+        
+        exporter = None
+        if enabled and exporter_name == "jsonl":
+            exporter = JSONLinesExporter(
+                os.getenv("TRACING_FILE_PATH", "logs/traces.jsonl"),
+                max_bytes=int(os.getenv("TRACING_FILE_MAX_BYTES", str(10 * 1024 * 1024))),
+                backup_count=int(os.getenv("TRACING_FILE_BACKUPS", "5"))
+            )
+        elif enabled and exporter_name == "otlp":
+            exporter = OTLPHttpExporter(os.getenv("OTLP_ENDPOINT", "http://localhost:4318/v1/traces"))
+        
+        return cls(
+            exporter=exporter,
+            enabled=enabled,
+            pending_ttl=float(os.getenv("TRACING_PENDING_TTL", "300"))
+        )
+    
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Abrir un span como context manager
+        
+        Args:
+            name: Nombre de la etapa
+            **attributes: Atributos iniciales del span
+        """
+        if not self.enabled and not self._listeners:
+            yield _NOOP_SPAN
+            return
+        
+        parent = _current_span.get()
+        span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent else secrets.token_hex(16),
+            span_id=secrets.token_hex(8),
+            parent_id=parent.span_id if parent else None
+        )
+        span.set_attributes(attributes)
+        token = _current_span.set(span)
+        
+        try:
+            yield span
+        except BaseException as e:
+            span.finish(error=e)
+            raise
+        else:
+            span.finish()
+        finally:
+            _current_span.reset(token)
+            self._on_finish(span)
+    
+    def trace(self, name: Optional[str] = None,
+              result_attributes: Optional[Callable[[Any], Dict[str, Any]]] = None):
+        """
+        Decorador que envuelve una función (sync o async) en un span
+        
+        Args:
+            name: Nombre del span (por defecto el nombre calificado de la función)
+            result_attributes: Función que extrae atributos del resultado
+        """
+        def decorator(func):
+            span_name = name or func.__qualname__
+            
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(span_name) as span:
+                        result = await func(*args, **kwargs)
+                        _apply_result_attributes(span, result, result_attributes)
+                        return result
+                return async_wrapper
+            
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name) as span:
+                    result = func(*args, **kwargs)
+                    _apply_result_attributes(span, result, result_attributes)
+                    return result
+            return wrapper
+        
+        return decorator
+    
+    def current_span(self) -> Optional[Span]:
+        """Obtener el span activo en el contexto actual"""
+        return _current_span.get()
+    
+    def current_trace_id(self) -> Optional[str]:
+        """Obtener el trace_id activo"""
+        span = _current_span.get()
+        return span.trace_id if span else None
+    
+    def add_listener(self, listener: Callable[[Span], None]) -> None:
+        """
+        Registrar un callback invocado al cerrar cada span
+        
+        Los listeners se ejecutan aunque no haya exportador configurado
+        (por ejemplo, para alimentar métricas).
+        """
+        self._listeners.append(listener)
+    
+    def _on_finish(self, span: Span) -> None:
+        """
+        Notificar listeners y exportar la traza al cerrar la raíz
+        
+        Los spans hijos esperan en memoria hasta que cierra su raíz. Los que
+        cierran después (miembros cancelados de un ensemble, búsquedas
+        especulativas descartadas, el resumen en background) se exportan
+        sueltos, y las trazas pendientes más antiguas que pending_ttl se
+        vuelcan sin raíz para no retenerlas indefinidamente.
+        """
+        for listener in self._listeners:
+            try:
+                listener(span)
+            except Exception as e:
+                logger.debug(f"Error en listener de tracing: {e}")
+        
+        if self.exporter is None or not self.enabled:
+            return
+        
+        with self._lock:
+            batches = self._sweep_pending()
+            if span.trace_id in self._closed:
+                batches.append([span])
+            else:
+                if span.trace_id not in self._pending:
+                    self._pending[span.trace_id] = []
+                    self._pending_since[span.trace_id] = time.monotonic()
+                self._pending[span.trace_id].append(span)
+                if span.is_root:
+                    batches.append(self._pending.pop(span.trace_id))
+                    del self._pending_since[span.trace_id]
+                    self._closed[span.trace_id] = None
+                    while len(self._closed) > self.max_closed:
+                        self._closed.popitem(last=False)
+        
+        for spans in batches:
+            try:
+                self.exporter.export(spans)
+            except Exception as e:
+                logger.warning(f"Error exportando traza {spans[0].trace_id}: {e}")
+    
+    def _sweep_pending(self) -> List[List[Span]]:
+        """Sacar las trazas pendientes más antiguas que pending_ttl (con el lock tomado)"""
+        now = time.monotonic()
+        if self.pending_ttl <= 0 or now - self._last_sweep < min(self.pending_ttl, 60.0):
+            return []
+        self._last_sweep = now
+        
+        stale = [trace_id for trace_id, since in self._pending_since.items()
+                 if now - since > self.pending_ttl]
+        batches = []
+        for trace_id in stale:
+            batches.append(self._pending.pop(trace_id))
+            del self._pending_since[trace_id]
+        if stale:
+            logger.debug(f"Volcadas {len(stale)} trazas sin raíz cerrada")
+        return batches
+    
+    def shutdown(self) -> None:
+        """Volcar las trazas pendientes y liberar el exportador"""
+        if self.exporter is not None:
+            with self._lock:
+                batches = list(self._pending.values())
+                self._pending.clear()
+                self._pending_since.clear()
+            for spans in batches:
+                try:
+                    self.exporter.export(spans)
+                except Exception as e:
+                    logger.warning(f"Error exportando traza {spans[0].trace_id}: {e}")
+            self.exporter.shutdown()
+
+def _apply_result_attributes(span: Any, result: Any,
+                             result_attributes: Optional[Callable[[Any], Dict[str, Any]]]) -> None:
+    """Extraer atributos del resultado sin afectar al flujo si fallan"""
+    if result_attributes is None or span is _NOOP_SPAN:
+        return
+    try:
+        span.set_attributes(result_attributes(result) or {})
+    except Exception as e:
+        logger.debug(f"No se pudieron extraer atributos del span: {e}")
+
+class _NoopSpan:
+    """Span vacío usado cuando el tracing está deshabilitado"""
+    trace_id = None
+    span_id = None
+    
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+    
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        pass
+    
+    def add_tokens(self, tokens: Optional[int], prompt_tokens: Optional[int] = None) -> None:
+        pass
+    
+    def record_cache(self, hit: bool) -> None:
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+# Instancia global del tracer
+tracer = Tracer.from_env()
+
+def traced(name: Optional[str] = None,
+           result_attributes: Optional[Callable[[Any], Dict[str, Any]]] = None):
+    """Helper decorator sobre el tracer global"""
+    return tracer.trace(name, result_attributes)
+
+def span(name: str, **attributes):
+    """Helper context manager sobre el tracer global"""
+    return tracer.span(name, **attributes)
+
+def current_span() -> Any:
+    """Span activo o un span vacío si no hay traza en curso"""
+    return tracer.current_span() or _NOOP_SPAN
+
+def record_llm_usage(response: Any) -> None:
+    """Registrar en el span activo los tokens de una respuesta de OpenAI"""
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        current_span().add_tokens(getattr(usage, "total_tokens", None), getattr(usage, "prompt_tokens", None))
+
+def main():
+    """Función de test para el tracing"""
+    try:
+        @traced("demo.stage", result_attributes=lambda r: {"results": len(r)})
+        def stage():
+            time.sleep(0.01)
+            current_span().record_cache(False)
+            return [1, 2, 3]
+        
+        with span("demo.request", query_length=42) as root:
+            stage()
+            print(f"Trace ID: {root.trace_id}")
+        
+        print(f"Spans exportados en: {os.getenv('TRACING_FILE_PATH', 'logs/traces.jsonl')}")
+    
+    except Exception as e:
+        logger.error(f"Error en test de tracing: {e}")
+        raise
+
+if __name__ == "__main__":
+    main()